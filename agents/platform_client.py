@@ -158,11 +158,15 @@ class PlatformClient:
         return data.get('seller', {})
 
     def list_products(self, seller_id: int, page: int = 1,
-                      per_page: int = 50, status: str = None) -> dict:
-        params = f'?page={page}&per_page={per_page}'
+                      per_page: int = 50, status: str = None,
+                      cursor: str = None) -> dict:
+        """Страница товаров; следующая — по cursor=ответ['next_cursor']."""
+        params = {'page': page, 'per_page': per_page}
         if status:
-            params += f'&status={status}'
-        return self._request('GET', f'/sellers/{seller_id}/products{params}')
+            params['status'] = status
+        if cursor:
+            params['cursor'] = cursor
+        return self._request('GET', f'/sellers/{seller_id}/products', params=params)
 
     def get_product(self, seller_id: int, product_id: int) -> dict:
         data = self._request('GET', f'/sellers/{seller_id}/products/{product_id}')
@@ -175,11 +179,12 @@ class PlatformClient:
                              json=updates)
 
     def list_imported_products(self, seller_id: int, page: int = 1,
-                               per_page: int = 50) -> dict:
-        return self._request(
-            'GET',
-            f'/sellers/{seller_id}/imported-products?page={page}&per_page={per_page}'
-        )
+                               per_page: int = 50, cursor: str = None) -> dict:
+        """Страница импортированных товаров; следующая — по cursor=ответ['next_cursor']."""
+        params = {'page': page, 'per_page': per_page}
+        if cursor:
+            params['cursor'] = cursor
+        return self._request('GET', f'/sellers/{seller_id}/imported-products', params=params)
 
     def get_imported_product(self, product_id: int) -> dict:
         return self._request('GET', f'/imported-products/{product_id}')
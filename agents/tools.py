@@ -117,11 +117,12 @@ def create_platform_tools(platform_client) -> ToolRegistry:
                 'page': {'type': 'integer', 'description': 'Номер страницы (default: 1)'},
                 'per_page': {'type': 'integer', 'description': 'Товаров на странице (default: 20, max: 20)'},
                 'status': {'type': 'string', 'description': 'Фильтр по статусу WB'},
+                'cursor': {'type': 'string', 'description': 'next_cursor из предыдущего ответа (следующая страница)'},
             },
             'required': ['seller_id'],
         },
-        handler=lambda seller_id, page=1, per_page=20, status=None:
-            platform_client.list_products(seller_id, page, min(int(per_page), 20), status),
+        handler=lambda seller_id, page=1, per_page=20, status=None, cursor=None:
+            platform_client.list_products(seller_id, page, min(int(per_page), 20), status, cursor),
     )
 
     registry.register(
@@ -167,11 +168,12 @@ def create_platform_tools(platform_client) -> ToolRegistry:
                 'seller_id': {'type': 'integer', 'description': 'ID продавца'},
                 'page': {'type': 'integer', 'description': 'Номер страницы (default: 1)'},
                 'per_page': {'type': 'integer', 'description': 'Товаров на странице (default: 20, max: 20)'},
+                'cursor': {'type': 'string', 'description': 'next_cursor из предыдущего ответа (следующая страница)'},
             },
             'required': ['seller_id'],
         },
-        handler=lambda seller_id, page=1, per_page=20:
-            platform_client.list_imported_products(seller_id, page, min(int(per_page), 20)),
+        handler=lambda seller_id, page=1, per_page=20, cursor=None:
+            platform_client.list_imported_products(seller_id, page, min(int(per_page), 20), cursor),
     )
 
     registry.register(
@@ -38,15 +38,16 @@ with app.app_context():
     _run_startup_migrations()
     print("✅ Базовая структура БД создана")
 
-    # Включаем WAL mode для лучшей поддержки конкурентного доступа
-    try:
-        db.session.execute(db.text("PRAGMA journal_mode=WAL;"))
-        db.session.execute(db.text("PRAGMA synchronous=NORMAL;"))
-        db.session.execute(db.text("PRAGMA busy_timeout=30000;"))  # 30 секунд
-        db.session.commit()
-        print("✅ SQLite настроен: WAL mode включен, busy_timeout=30s")
-    except Exception as e:
-        print(f"⚠️  Не удалось настроить SQLite WAL mode: {e}")
+    # Включаем WAL mode для лучшей поддержки конкурентного доступа (только SQLite)
+    if db.engine.dialect.name == 'sqlite':
+        try:
+            db.session.execute(db.text("PRAGMA journal_mode=WAL;"))
+            db.session.execute(db.text("PRAGMA synchronous=NORMAL;"))
+            db.session.execute(db.text("PRAGMA busy_timeout=30000;"))  # 30 секунд
+            db.session.commit()
+            print("✅ SQLite настроен: WAL mode включен, busy_timeout=30s")
+        except Exception as e:
+            print(f"⚠️  Не удалось настроить SQLite WAL mode: {e}")
 
     # Проверяем, есть ли администратор
     username = os.environ.get('ADMIN_USERNAME', 'admin')
@@ -105,6 +106,13 @@ PYCODE
 
 # Теперь применяем миграции для добавления новых колонок
 # SKIP_SCHEDULER=1 чтобы APScheduler не запускался и не зависал
+# Скрипты migrations/ работают с файлом SQLite; схему PostgreSQL целиком
+# создают db.create_all() и _run_startup_migrations() выше
+case "${DATABASE_URL:-}" in
+postgres://*|postgresql*)
+echo "🐘 PostgreSQL: миграции файла SQLite пропущены"
+;;
+*)
 echo "📦 Применение миграций базы данных..."
 export SKIP_SCHEDULER=1
 python migrations/migrate_db.py --db-path /app/data/seller_platform.db
@@ -129,6 +137,8 @@ python migrations/run_all_migrations.py /app/data/seller_platform.db || echo "
 python migrations/migrate_add_sexopt_supplier.py /app/data/seller_platform.db || echo "⚠️ Sexopt supplier migration skipped (already applied or error)"
 DATABASE_PATH=/app/data/seller_platform.db python migrations/migrate_add_competitor_monitoring.py || echo "⚠️ Competitor monitoring migration skipped (already applied or error)"
 unset SKIP_SCHEDULER
+;;
+esac
 
 echo "✅ Инициализация seller-platform завершена"
 fi
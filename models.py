@@ -12,6 +12,55 @@ from cryptography.fernet import Fernet
 
 db = SQLAlchemy()
 
+# Группы тяжёлых текстовых колонок, отложенных при загрузке строки (db.deferred).
+# Списки и массовые операции читают только лёгкие колонки; где данные нужны,
+# группа загружается явно: query.options(db.undefer_group(DEFERRED_DETAILS)).
+# Обращение к отложенной колонке загруженного объекта догружает всю её группу
+# одним SELECT.
+DEFERRED_DETAILS = 'details'  # Описание, характеристики, размеры, габариты
+DEFERRED_AI = 'ai'            # Результаты AI-обработки
+DEFERRED_RAW = 'raw'          # Исходные данные поставщика
+
+
+class CachedJSON:
+    """
+    Разобранное значение JSON-колонки, кэшируется на экземпляре модели
+
+        characteristics = CachedJSON('characteristics_json', list)
+
+    json.loads выполняется один раз, пока значение колонки не изменится
+    (присвоение, expire/refresh). Результат общий для всех читателей:
+    не изменяйте его на месте — присвойте колонке новый JSON.
+
+    Args:
+        column: Имя текстовой колонки с JSON
+        default: Фабрика значения для пустой колонки или битого JSON
+    """
+
+    def __init__(self, column: str, default=list):
+        self.column = column
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.cache_key = f'_cached_json_{name}'
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        raw = getattr(obj, self.column)
+        cached = obj.__dict__.get(self.cache_key)
+        if cached is not None and cached[0] is raw:
+            return cached[1]
+        if not raw:
+            value = self.default()
+        else:
+            try:
+                value = json.loads(raw)
+            except (ValueError, TypeError):
+                value = self.default()
+        obj.__dict__[self.cache_key] = (raw, value)
+        return value
+
 
 class User(UserMixin, db.Model):
     """Модель пользователя системы (админы и продавцы)"""
@@ -198,12 +247,12 @@ class Product(db.Model):
     video_url = db.Column(db.String(500))  # URL видео
 
     # Размеры и баркоды
-    sizes_json = db.Column(db.Text)  # JSON с размерами и баркодами
+    sizes_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # JSON с размерами и баркодами
 
     # Характеристики и описание
-    characteristics_json = db.Column(db.Text)  # JSON с характеристиками товара
-    description = db.Column(db.Text)  # Описание товара
-    dimensions_json = db.Column(db.Text)  # JSON с габаритами (длина, ширина, высота)
+    characteristics_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # JSON с характеристиками товара
+    description = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Описание товара
+    dimensions_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # JSON с габаритами (длина, ширина, высота)
     tags_json = db.Column(db.Text)  # JSON список ключевых слов/тегов (хранится локально, не в WB)
 
     # Рейтинг карточки WB (из Analytics API)
@@ -214,6 +263,7 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_sync = db.Column(db.DateTime)  # Последняя синхронизация данных
+    content_hash = db.Column(db.String(64))  # Отпечаток карточки WB при последней записи (sha256)
 
     # Индексы для быстрых запросов
     __table_args__ = (
@@ -243,15 +293,12 @@ class Product(db.Model):
             'last_sync': self.last_sync.isoformat() if self.last_sync else None
         }
 
+    # Разобранные JSON-колонки (кэш на экземпляре, только для чтения)
+    characteristics = CachedJSON('characteristics_json', list)
+
     def get_characteristics(self):
-        """Получить характеристики товара как список словарей"""
-        if not self.characteristics_json:
-            return []
-        try:
-            import json
-            return json.loads(self.characteristics_json)
-        except:
-            return []
+        """Получить характеристики товара как список словарей (общий кэш — не изменять на месте)"""
+        return self.characteristics
 
     def set_characteristics(self, characteristics):
         """Установить характеристики товара из списка словарей"""
@@ -364,6 +411,14 @@ class APILog(db.Model):
         db.session.commit()
         return log
 
+    @staticmethod
+    def log_requests(records: list):
+        """Создать записи лога одной транзакцией (dict с полями log_request и created_at)"""
+        if not records:
+            return
+        db.session.execute(APILog.__table__.insert(), records)
+        db.session.commit()
+
 
 class BulkEditHistory(db.Model):
     """История массовых изменений карточек"""
@@ -645,6 +700,9 @@ class ProductSyncSettings(db.Model):
     products_synced = db.Column(db.Integer, default=0)  # Количество синхронизированных товаров
     products_added = db.Column(db.Integer, default=0)  # Количество добавленных товаров
     products_updated = db.Column(db.Integer, default=0)  # Количество обновленных товаров
+    products_deactivated = db.Column(db.Integer, default=0)  # Снято с активных (удалены/в корзине на WB)
+    products_unchanged = db.Column(db.Integer, default=0)  # Карточки без изменений (не перезаписывались)
+    last_sync_mode = db.Column(db.String(20))  # 'full' или 'incremental'
 
     # Метаданные
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -672,11 +730,71 @@ class ProductSyncSettings(db.Model):
             'products_synced': self.products_synced,
             'products_added': self.products_added,
             'products_updated': self.products_updated,
+            'products_deactivated': self.products_deactivated,
+            'products_unchanged': self.products_unchanged,
+            'last_sync_mode': self.last_sync_mode,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+class CardSyncCheckpoint(db.Model):
+    """
+    Чекпоинт постраничного обхода карточек WB (cursor updatedAt + nmID)
+
+    Сохраняется после каждой обработанной страницы. Если обход прервался
+    (рестарт, 429, таймаут), следующий запуск продолжает с этого курсора.
+    После успешного завершения обхода курсор сбрасывается.
+
+    Здесь же хранится водяной знак updatedAt для инкрементальной синхронизации
+    и время последнего завершённого полного обхода.
+    """
+    __tablename__ = 'card_sync_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    seller_id = db.Column(db.Integer, db.ForeignKey('sellers.id'), nullable=False, index=True)
+    scope = db.Column(db.String(50), nullable=False)  # 'product_sync', 'price_monitoring'
+
+    cursor_updated_at = db.Column(db.String(50))  # updatedAt курсора следующей страницы
+    cursor_nm_id = db.Column(db.BigInteger)  # nmID курсора следующей страницы
+    cards_processed = db.Column(db.Integer, default=0, nullable=False)  # Обработано карточек до курсора
+    started_at = db.Column(db.DateTime)  # Начало текущего обхода
+
+    # Последний завершённый полный обход
+    last_pass_started_at = db.Column(db.DateTime)
+    last_pass_completed_at = db.Column(db.DateTime)
+
+    # Максимальный updatedAt карточки, обработанной успешной синхронизацией
+    watermark_updated_at = db.Column(db.String(50))
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('seller_id', 'scope', name='uq_card_sync_checkpoint'),
+    )
+
+    @property
+    def has_cursor(self) -> bool:
+        """Есть ли незавершённый обход"""
+        return bool(self.cursor_updated_at and self.cursor_nm_id)
+
+    def complete_pass(self) -> None:
+        """Отметить полный обход завершённым и сбросить курсор"""
+        self.last_pass_started_at = self.started_at
+        self.last_pass_completed_at = datetime.utcnow()
+        self.reset()
+
+    def reset(self) -> None:
+        """Сбросить курсор"""
+        self.cursor_updated_at = None
+        self.cursor_nm_id = None
+        self.cards_processed = 0
+        self.started_at = None
+
+    def __repr__(self) -> str:
+        return f'<CardSyncCheckpoint seller_id={self.seller_id} scope={self.scope} nm_id={self.cursor_nm_id}>'
+
+
 class AutoImportSettings(db.Model):
     """Настройки автоимпорта товаров из внешних источников"""
     __tablename__ = 'auto_import_settings'
@@ -987,7 +1105,7 @@ class ImportedProduct(db.Model):
     # Данные товара
     title = db.Column(db.String(500))  # Название
     category = db.Column(db.String(200))  # Категория из источника
-    all_categories = db.Column(db.Text)  # Все категории из цепочки (JSON)
+    all_categories = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Все категории из цепочки (JSON)
     mapped_wb_category = db.Column(db.String(200))  # Маппированная категория WB
     wb_subject_id = db.Column(db.Integer)  # ID предмета WB
     category_confidence = db.Column(db.Float, default=0.0)  # Уверенность в определении категории (0-1)
@@ -1007,9 +1125,9 @@ class ImportedProduct(db.Model):
 
     # Характеристики
     barcodes = db.Column(db.Text)  # Баркоды (JSON)
-    characteristics = db.Column(db.Text)  # Полные характеристики (JSON)
-    description = db.Column(db.Text)  # Описание
-    original_data = db.Column(db.Text)  # Оригинальные данные от поставщика (JSON) - для отката AI изменений
+    characteristics = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Полные характеристики (JSON)
+    description = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Описание
+    original_data = db.deferred(db.Column(db.Text), group=DEFERRED_RAW)  # Оригинальные данные от поставщика (JSON) - для отката AI изменений
 
     # Цена поставщика и рассчитанные цены
     supplier_price = db.Column(db.Float, nullable=True)  # Закупочная цена из CSV поставщика
@@ -1024,21 +1142,21 @@ class ImportedProduct(db.Model):
     import_error = db.Column(db.Text)  # Ошибка импорта
 
     # AI-оптимизация (кэшированные результаты)
-    ai_keywords = db.Column(db.Text)  # Ключевые слова (JSON)
-    ai_bullets = db.Column(db.Text)  # Преимущества/буллиты (JSON)
-    ai_rich_content = db.Column(db.Text)  # Rich контент (JSON)
+    ai_keywords = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Ключевые слова (JSON)
+    ai_bullets = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Преимущества/буллиты (JSON)
+    ai_rich_content = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Rich контент (JSON)
     ai_seo_title = db.Column(db.String(500))  # SEO заголовок
-    ai_analysis = db.Column(db.Text)  # Последний анализ карточки (JSON)
+    ai_analysis = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Последний анализ карточки (JSON)
     ai_analysis_at = db.Column(db.DateTime)  # Когда был сделан анализ
     content_hash = db.Column(db.String(64))  # Хеш контента для отслеживания изменений
 
     # Новые AI поля для расширенного анализа
-    ai_dimensions = db.Column(db.Text)  # Габариты (JSON) - length, width, height, weight
-    ai_clothing_sizes = db.Column(db.Text)  # Размеры одежды (JSON) - стандартизированные
+    ai_dimensions = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Габариты (JSON) - length, width, height, weight
+    ai_clothing_sizes = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Размеры одежды (JSON) - стандартизированные
     ai_detected_brand = db.Column(db.Text)  # Определенный AI бренд (JSON)
-    ai_materials = db.Column(db.Text)  # Материалы и состав (JSON)
-    ai_colors = db.Column(db.Text)  # Цвета товара (JSON)
-    ai_attributes = db.Column(db.Text)  # Полный набор атрибутов (JSON)
+    ai_materials = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Материалы и состав (JSON)
+    ai_colors = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Цвета товара (JSON)
+    ai_attributes = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Полный набор атрибутов (JSON)
     ai_gender = db.Column(db.String(20))  # Пол: male/female/unisex
     ai_age_group = db.Column(db.String(20))  # Возрастная группа
     ai_season = db.Column(db.String(20))  # Сезон: all_season/summer/winter/demi
@@ -1623,7 +1741,7 @@ class PriceChangeBatch(db.Model):
     # 'draft' - черновик, можно редактировать
     # 'pending_review' - ожидает подтверждения (есть опасные изменения)
     # 'confirmed' - подтверждено, готово к применению
-    # 'applying' - применяется к WB
+    # 'applying' - применяется к WB (ожидаются результаты загрузок WB)
     # 'applied' - успешно применено
     # 'partially_applied' - частично применено (были ошибки)
     # 'failed' - ошибка применения
@@ -1775,6 +1893,7 @@ class PriceChangeItem(db.Model):
 
     # Статус элемента
     # 'pending' - ожидает применения
+    # 'processing' - принято WB, ожидается результат загрузки
     # 'applied' - успешно применено
     # 'failed' - ошибка применения
     # 'skipped' - пропущено
@@ -1838,6 +1957,61 @@ class PriceChangeItem(db.Model):
         }
 
 
+class PriceUploadTask(db.Model):
+    """Задача загрузки цен в WB (uploadID), результат которой ещё отслеживается"""
+    __tablename__ = 'price_upload_tasks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    seller_id = db.Column(db.Integer, db.ForeignKey('sellers.id'), nullable=False, index=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('price_change_batches.id', ondelete='CASCADE'), index=True)
+
+    upload_id = db.Column(db.BigInteger, nullable=False, index=True)  # data.id ответа /api/v2/upload/task
+    nm_ids = db.Column(db.JSON)  # nmID товаров в загрузке
+
+    # Статус
+    # 'pending' - WB ещё обрабатывает загрузку
+    # 'completed' - обработана без ошибок
+    # 'partial' - обработана, часть товаров с ошибками
+    # 'failed' - все товары с ошибками
+    # 'cancelled' - загрузка отменена WB
+    # 'expired' - результат не получен за PRICE_UPLOAD_TASK_TTL
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    wb_status = db.Column(db.Integer)  # Статус загрузки от WB (3, 4, 5, 6)
+    total_goods = db.Column(db.Integer)
+    success_goods = db.Column(db.Integer)
+
+    # Опрос
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_check_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime)
+
+    batch = db.relationship('PriceChangeBatch', backref=db.backref('upload_tasks', lazy='dynamic'))
+
+    __table_args__ = (
+        db.Index('idx_price_upload_status_next', 'status', 'next_check_at'),
+    )
+
+    def __repr__(self) -> str:
+        return f'<PriceUploadTask upload_id={self.upload_id} status={self.status}>'
+
+    def to_dict(self) -> dict:
+        """Конвертировать в словарь для JSON"""
+        return {
+            'upload_id': self.upload_id,
+            'status': self.status,
+            'wb_status': self.wb_status,
+            'total_goods': self.total_goods,
+            'success_goods': self.success_goods,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
 class SystemSettings(db.Model):
     """Глобальные настройки системы"""
     __tablename__ = 'system_settings'
@@ -2383,11 +2557,11 @@ class SupplierProduct(db.Model):
 
     # Основные данные (нормализованные)
     title = db.Column(db.String(500))
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)
     brand = db.Column(db.String(200))
     resolved_brand_id = db.Column(db.Integer, db.ForeignKey('brands.id'), nullable=True, index=True)
     category = db.Column(db.String(200))  # Категория поставщика
-    all_categories = db.Column(db.Text)  # Все категории из цепочки (JSON)
+    all_categories = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Все категории из цепочки (JSON)
 
     # WB маппинг
     wb_category_name = db.Column(db.String(200))
@@ -2409,11 +2583,11 @@ class SupplierProduct(db.Model):
     previous_price = db.Column(db.Float)               # Предыдущая цена (для трекинга)
 
     # Характеристики (нормализованные JSON)
-    characteristics_json = db.Column(db.Text)  # [{name, value}, ...]
-    sizes_json = db.Column(db.Text)  # Размеры
-    colors_json = db.Column(db.Text)  # Цвета
-    materials_json = db.Column(db.Text)  # Материалы
-    dimensions_json = db.Column(db.Text)  # Габариты (д/ш/в/вес)
+    characteristics_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # [{name, value}, ...]
+    sizes_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Размеры
+    colors_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Цвета
+    materials_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Материалы
+    dimensions_json = db.deferred(db.Column(db.Text), group=DEFERRED_DETAILS)  # Габариты (д/ш/в/вес)
     gender = db.Column(db.String(50))
     country = db.Column(db.String(100))
     season = db.Column(db.String(50))
@@ -2426,26 +2600,26 @@ class SupplierProduct(db.Model):
 
     # AI-обогащённые данные
     ai_seo_title = db.Column(db.String(500))
-    ai_description = db.Column(db.Text)
-    ai_keywords_json = db.Column(db.Text)
-    ai_bullets_json = db.Column(db.Text)
-    ai_rich_content_json = db.Column(db.Text)
-    ai_analysis_json = db.Column(db.Text)
+    ai_description = db.deferred(db.Column(db.Text), group=DEFERRED_AI)
+    ai_keywords_json = db.deferred(db.Column(db.Text), group=DEFERRED_AI)
+    ai_bullets_json = db.deferred(db.Column(db.Text), group=DEFERRED_AI)
+    ai_rich_content_json = db.deferred(db.Column(db.Text), group=DEFERRED_AI)
+    ai_analysis_json = db.deferred(db.Column(db.Text), group=DEFERRED_AI)
     ai_validated = db.Column(db.Boolean, default=False)
     ai_validated_at = db.Column(db.DateTime)
     ai_validation_score = db.Column(db.Float)  # Оценка качества 0-100
     content_hash = db.Column(db.String(64))
 
     # AI полный парсинг — результаты комплексного AI-извлечения
-    ai_parsed_data_json = db.Column(db.Text)  # Полный JSON со всеми извлечёнными характеристиками
+    ai_parsed_data_json = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Полный JSON со всеми извлечёнными характеристиками
     ai_parsed_at = db.Column(db.DateTime)     # Когда был выполнен парсинг
     ai_model_used = db.Column(db.String(100)) # Какой AI моделью спарсено (e.g. "openai/gpt-oss-120b")
-    ai_marketplace_json = db.Column(db.Text)  # Данные форматированные для маркетплейса (WB)
+    ai_marketplace_json = db.deferred(db.Column(db.Text), group=DEFERRED_AI)  # Данные форматированные для маркетплейса (WB)
     ai_fill_pct = db.Column(db.Float)          # Процент заполнения из AI парсинга (0-100)
     description_source = db.Column(db.String(50))  # csv/ai/manual — откуда описание
 
     # Оригинальные данные для отката
-    original_data_json = db.Column(db.Text)
+    original_data_json = db.deferred(db.Column(db.Text), group=DEFERRED_RAW)
 
     # Качество парсинга
     parsing_confidence = db.Column(db.Float)  # 0.0-1.0 оценка качества парсинга
@@ -2472,58 +2646,39 @@ class SupplierProduct(db.Model):
         db.Index('idx_supplier_product_brand', 'supplier_id', 'brand'),
     )
 
+    # Разобранные JSON-колонки (кэш на экземпляре, только для чтения: get_* возвращают их же)
+    photos = CachedJSON('photo_urls_json', list)
+    processed_photos = CachedJSON('processed_photos_json', list)
+    characteristics = CachedJSON('characteristics_json', list)
+    sizes = CachedJSON('sizes_json', list)
+    validation_errors = CachedJSON('validation_errors_json', list)
+    ai_parsed_data = CachedJSON('ai_parsed_data_json', dict)
+    ai_marketplace_data = CachedJSON('ai_marketplace_json', dict)
+    original_data = CachedJSON('original_data_json', dict)
+    marketplace_fields = CachedJSON('marketplace_fields_json', dict)
+
     def __repr__(self) -> str:
         return f'<SupplierProduct {self.external_id} ({self.title[:30] if self.title else "N/A"})>'
 
     def get_photos(self) -> list:
         """Получить список URL фотографий"""
-        if not self.photo_urls_json:
-            return []
-        try:
-            import json
-            return json.loads(self.photo_urls_json)
-        except Exception:
-            return []
+        return self.photos
 
     def get_processed_photos(self) -> list:
         """Получить обработанные фотографии"""
-        if not self.processed_photos_json:
-            return []
-        try:
-            import json
-            return json.loads(self.processed_photos_json)
-        except Exception:
-            return []
+        return self.processed_photos
 
     def get_characteristics(self) -> list:
         """Получить характеристики"""
-        if not self.characteristics_json:
-            return []
-        try:
-            import json
-            return json.loads(self.characteristics_json)
-        except Exception:
-            return []
+        return self.characteristics
 
     def get_sizes(self) -> list:
         """Получить размеры"""
-        if not self.sizes_json:
-            return []
-        try:
-            import json
-            return json.loads(self.sizes_json)
-        except Exception:
-            return []
+        return self.sizes
 
     def get_validation_errors(self) -> list:
         """Получить ошибки валидации"""
-        if not self.validation_errors_json:
-            return []
-        try:
-            import json
-            return json.loads(self.validation_errors_json)
-        except Exception:
-            return []
+        return self.validation_errors
 
     def to_dict(self, include_ai: bool = False) -> dict:
         """Конвертировать в словарь для JSON"""
@@ -2574,23 +2729,11 @@ class SupplierProduct(db.Model):
 
     def get_ai_parsed_data(self) -> dict:
         """Получить AI-извлечённые данные"""
-        if not self.ai_parsed_data_json:
-            return {}
-        try:
-            import json
-            return json.loads(self.ai_parsed_data_json)
-        except Exception:
-            return {}
+        return self.ai_parsed_data
 
     def get_ai_marketplace_data(self) -> dict:
         """Получить данные в формате маркетплейса"""
-        if not self.ai_marketplace_json:
-            return {}
-        try:
-            import json
-            return json.loads(self.ai_marketplace_json)
-        except Exception:
-            return {}
+        return self.ai_marketplace_data
 
     def get_all_data_for_parsing(self) -> dict:
         """Собрать все данные товара для AI парсинга"""
@@ -2641,23 +2784,11 @@ class SupplierProduct(db.Model):
 
     def get_original_data(self) -> dict:
         """Получить оригинальные данные товара (для AI парсинга)"""
-        if not self.original_data_json:
-            return {}
-        try:
-            import json
-            return json.loads(self.original_data_json)
-        except Exception:
-            return {}
+        return self.original_data
 
     def get_marketplace_fields(self) -> dict:
         """Получить валидированные поля маркетплейса"""
-        if not self.marketplace_fields_json:
-            return {}
-        try:
-            import json
-            return json.loads(self.marketplace_fields_json)
-        except Exception:
-            return {}
+        return self.marketplace_fields
 
 
 class SellerSupplier(db.Model):
@@ -3193,6 +3324,33 @@ class BrandCategoryLink(db.Model):
         return f'<BrandCategoryLink MPBrand#{self.marketplace_brand_id} -> Cat#{self.category_id}>'
 
 
+class BrandHarvestCheckpoint(db.Model):
+    """
+    Выполненный запрос сбора брендов маркетплейса (категория × pattern)
+
+    Бренды запроса сохраняются в той же транзакции, что и строка чекпоинта,
+    поэтому прерванный сбор продолжается с невыполненных запросов. После
+    полного сбора без ошибок строки маркетплейса удаляются.
+    """
+    __tablename__ = 'brand_harvest_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    marketplace_id = db.Column(db.Integer, db.ForeignKey('marketplaces.id'), nullable=False, index=True)
+    subject_id = db.Column(db.Integer, nullable=False)
+    pattern = db.Column(db.String(10), nullable=False)
+    brands_found = db.Column(db.Integer, default=0, nullable=False)  # Брендов в ответе
+    new_brands = db.Column(db.Integer, default=0, nullable=False)  # Из них новых для категории
+    hit_top = db.Column(db.Boolean, default=False, nullable=False)  # Ответ упёрся в top — pattern расширялся
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('marketplace_id', 'subject_id', 'pattern', name='uq_brand_harvest_query'),
+    )
+
+    def __repr__(self):
+        return f'<BrandHarvestCheckpoint MP#{self.marketplace_id} subject={self.subject_id} "{self.pattern}">'
+
+
 # ============================================================================
 # Запрещённые слова WB
 # ============================================================================
@@ -32,7 +32,7 @@ def register_blocked_cards_routes(app):
         """Создать WB API клиент для продавца"""
         return WildberriesAPIClient(
             api_key=seller.wb_api_key,
-            db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+            db_logger_callback=APILog.log_request
         )
 
     # ==================== ЗАБЛОКИРОВАННЫЕ КАРТОЧКИ ====================
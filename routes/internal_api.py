@@ -16,13 +16,14 @@ from flask import request, jsonify, abort, Blueprint
 from werkzeug.security import check_password_hash
 
 from models import (
-    db, ServiceAgent, Product, ImportedProduct, SupplierProduct, Seller,
+    db, DEFERRED_DETAILS, ServiceAgent, Product, ImportedProduct, SupplierProduct, Seller,
     MarketplaceCategory, MarketplaceCategoryCharacteristic,
     MarketplaceDirectory, PricingSettings, ProhibitedWord,
     Brand, BrandAlias, MarketplaceBrand, BrandCategoryLink,
     AgentChangeSnapshot,
 )
 from services import agent_service
+from services.keyset import InvalidCursor, keyset_paginate
 
 logger = logging.getLogger(__name__)
 
@@ -165,29 +166,44 @@ def internal_get_steps(task_id):
 
 # ── Данные: товары ──────────────────────────────────────────────
 
-@internal_api_bp.route('/sellers/<int:seller_id>/products', methods=['GET'])
-@_authenticate_agent
-def internal_list_products(seller_id):
-    """Получить товары продавца."""
+def _keyset_page(query, model, key, to_dict):
+    """Страница списка по id: ?cursor= (keyset) или ?page= (OFFSET, для старых клиентов)."""
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 50, type=int), 200)
-    status = request.args.get('status')
-
-    q = Product.query.filter_by(seller_id=seller_id)
-    if status:
-        q = q.filter_by(wb_status=status)
+    cursor = request.args.get('cursor') or None
 
-    total = q.count()
-    products = q.offset((page - 1) * per_page).limit(per_page).all()
+    try:
+        pagination = keyset_paginate(query, [(model.id, False)], cursor=cursor,
+                                     page=page, per_page=per_page, count=cursor is None)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify({
-        'products': [_product_to_dict(p) for p in products],
-        'total': total,
+        key: [to_dict(p) for p in pagination.items],
+        'total': pagination.total,
         'page': page,
         'per_page': per_page,
+        'next_cursor': pagination.next_cursor,
     })
 
 
+@internal_api_bp.route('/sellers/<int:seller_id>/products', methods=['GET'])
+@_authenticate_agent
+def internal_list_products(seller_id):
+    """Получить товары продавца.
+
+    Следующая страница — по ?cursor=<next_cursor> из ответа (без OFFSET);
+    total считается только для первой страницы.
+    """
+    status = request.args.get('status')
+
+    q = Product.query.options(db.undefer(Product.description)).filter_by(seller_id=seller_id)
+    if status:
+        q = q.filter_by(wb_status=status)
+
+    return _keyset_page(q, Product, 'products', _product_to_dict)
+
+
 @internal_api_bp.route('/sellers/<int:seller_id>/products/<int:product_id>', methods=['GET'])
 @_authenticate_agent
 def internal_get_product(seller_id, product_id):
@@ -234,20 +250,12 @@ def internal_update_product(seller_id, product_id):
 @internal_api_bp.route('/sellers/<int:seller_id>/imported-products', methods=['GET'])
 @_authenticate_agent
 def internal_list_imported_products(seller_id):
-    """Получить импортированные товары (от поставщика)."""
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 50, type=int), 200)
-
-    q = ImportedProduct.query.filter_by(seller_id=seller_id)
-    total = q.count()
-    products = q.offset((page - 1) * per_page).limit(per_page).all()
+    """Получить импортированные товары (от поставщика).
 
-    return jsonify({
-        'products': [_imported_product_to_dict(p) for p in products],
-        'total': total,
-        'page': page,
-        'per_page': per_page,
-    })
+    Пагинация — как у internal_list_products (?cursor=<next_cursor>).
+    """
+    q = ImportedProduct.query.options(db.undefer_group(DEFERRED_DETAILS)).filter_by(seller_id=seller_id)
+    return _keyset_page(q, ImportedProduct, 'products', _imported_product_to_dict)
 
 
 @internal_api_bp.route('/imported-products/<int:product_id>', methods=['GET'])
@@ -16,7 +16,7 @@ def _get_wb_client(seller):
     """Создать WB API клиент с логированием для merge-операций."""
     return WildberriesAPIClient(
         api_key=seller.wb_api_key,
-        db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+        db_logger_callback=APILog.log_request
     )
 
 
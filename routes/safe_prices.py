@@ -35,9 +35,10 @@ from flask_login import login_required, current_user
 
 from models import (
     db, Product, Seller, SafePriceChangeSettings,
-    PriceChangeBatch, PriceChangeItem, PriceHistory
+    PriceChangeBatch, PriceChangeItem
 )
 from services.wb_api_client import WildberriesAPIClient, WBAPIException
+from services.price_upload_tracker import apply_item_result, finalize_batch, register_upload_tasks
 
 logger = logging.getLogger(__name__)
 
@@ -646,7 +647,7 @@ def batch_confirm(batch_id: int):
 @prices_bp.route('/batch/<int:batch_id>/apply', methods=['POST'])
 @login_required
 def batch_apply(batch_id: int):
-    """Применить изменения к WB"""
+    """Применить изменения к WB (итог загрузок WB отслеживается в фоне)"""
     seller = get_current_seller()
     if not seller:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -702,7 +703,7 @@ def batch_apply(batch_id: int):
             )
 
         # Отправляем в WB только валидные элементы
-        result = {'total': 0, 'success': 0, 'failed': 0, 'errors': []}
+        result = {'total': 0, 'success': 0, 'failed': 0, 'errors': [], 'items': {}}
         if prices_data:
             result = api_client.upload_prices_batch(
                 prices_data,
@@ -710,64 +711,38 @@ def batch_apply(batch_id: int):
                 seller_id=seller.id
             )
 
-        # Обновляем статусы элементов
-        applied_count = 0
-        failed_count = skipped_count  # Считаем пропущенные как failed
-
-        # Собираем множество всех nmID, которые попали в ошибки
-        failed_nm_ids = set()
-        error_by_nm_id = {}
-        for error in result.get('errors', []):
-            for nm_id in error.get('nm_ids', []):
-                failed_nm_ids.add(nm_id)
-                error_by_nm_id[nm_id] = error.get('error', 'Неизвестная ошибка')
+        # Результат WB по каждому nmID (отклонённые пачки делятся до конкретных товаров).
+        # Принятые товары WB применяет асинхронно: итог по загрузкам (tasks)
+        # получает services/price_upload_tracker.py, запрос сразу завершается
+        item_results = result.get('items', {})
+        tracked_nm_ids = {nm_id for task in result.get('tasks', []) for nm_id in task['nm_ids']}
+        processing_count = 0
 
         for item in valid_items:
-            if item.nm_id in failed_nm_ids:
-                item.status = 'failed'
-                item.error_message = error_by_nm_id.get(item.nm_id, 'Ошибка WB API')
-                failed_count += 1
+            item_result = item_results.get(item.nm_id)
+            if item_result is not None and not item_result['success']:
+                apply_item_result(item, seller.id, item_result['error'] or 'Ошибка WB API')
+            elif item.nm_id in tracked_nm_ids:
+                item.status = 'processing'
+                processing_count += 1
             else:
-                item.status = 'applied'
-                item.wb_applied_at = datetime.utcnow()
-                applied_count += 1
-
-                # Сохраняем в историю цен
-                price_history = PriceHistory(
-                    product_id=item.product_id,
-                    seller_id=seller.id,
-                    old_price=item.old_price,
-                    new_price=item.new_price,
-                    price_change_percent=item.price_change_percent
-                )
-                db.session.add(price_history)
-
-                # Обновляем цену в Product
-                product = Product.query.get(item.product_id)
-                if product:
-                    product.price = item.new_price
-
-        # Обновляем статус батча
-        batch.applied_count = applied_count
-        batch.failed_count = failed_count
-        batch.applied_at = datetime.utcnow()
-
-        if failed_count == 0:
-            batch.status = 'applied'
-        elif applied_count > 0:
-            batch.status = 'partially_applied'
-        else:
-            batch.status = 'failed'
+                apply_item_result(item, seller.id)
 
         batch.apply_errors = result.get('errors')
+        upload_tasks = register_upload_tasks(seller.id, batch.id, result.get('tasks', []))
+        if upload_tasks:
+            batch.wb_task_id = ','.join(str(task.upload_id) for task in upload_tasks)[:100]
+        db.session.flush()
+        finalize_batch(batch, notify=False)
         db.session.commit()
 
         api_client.close()
 
         return jsonify({
             'success': True,
-            'applied': applied_count,
-            'failed': failed_count,
+            'applied': batch.items.filter_by(status='applied').count(),
+            'processing': processing_count,
+            'failed': batch.items.filter(PriceChangeItem.status.in_(('failed', 'skipped'))).count(),
             'status': batch.status
         })
 
@@ -1070,7 +1045,9 @@ def api_batch_status(batch_id: int):
         seller_id=seller.id
     ).first_or_404()
 
-    return jsonify(batch.to_dict())
+    result = batch.to_dict()
+    result['upload_tasks'] = [task.to_dict() for task in batch.upload_tasks.all()]
+    return jsonify(result)
 
 
 @prices_bp.route('/api/products/all-ids')
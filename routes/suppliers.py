@@ -18,6 +18,7 @@ from models import (
     db, Supplier, SupplierProduct, SellerSupplier,
     ImportedProduct, Seller, AIHistory, log_admin_action, Product,
     BackgroundJob, Notification, AgentChangeSnapshot,
+    DEFERRED_AI, DEFERRED_DETAILS,
 )
 from services.supplier_service import SupplierService
 
@@ -325,7 +326,7 @@ def register_supplier_routes(app):
         category = request.args.get('category', '').strip()
         ai_validated = request.args.get('ai_validated')
         stock_status = request.args.get('stock_status', '').strip()
-        sort_by = request.args.get('sort_by', 'created_at')
+        sort_by = request.args.get('sort_by') or ('relevance' if search else 'created_at')
         sort_dir = request.args.get('sort_dir', 'desc')
 
         ai_val = None
@@ -339,7 +340,8 @@ def register_supplier_routes(app):
             search=search, status=status or None,
             category=category or None, brand=brand or None,
             ai_validated=ai_val, stock_status=stock_status or None,
-            sort_by=sort_by, sort_dir=sort_dir
+            sort_by=sort_by, sort_dir=sort_dir,
+            cursor=request.args.get('cursor')
         )
 
         stats = SupplierService.get_product_stats(supplier_id)
@@ -1159,7 +1161,7 @@ def register_supplier_routes(app):
 
         # Ленивый backfill ai_fill_pct для товаров спарсенных до добавления колонки
         try:
-            stale = SupplierProduct.query.filter(
+            stale = SupplierProduct.query.options(db.undefer(SupplierProduct.ai_parsed_data_json)).filter(
                 SupplierProduct.supplier_id == supplier_id,
                 SupplierProduct.ai_parsed_data_json.isnot(None),
                 SupplierProduct.ai_fill_pct.is_(None)
@@ -1197,7 +1199,8 @@ def register_supplier_routes(app):
         price_min = request.args.get('price_min', '', type=str).strip()
         price_max = request.args.get('price_max', '', type=str).strip()
 
-        query = SupplierProduct.query.filter_by(supplier_id=supplier_id)
+        # Список показывает наличие описания — грузим его вместе со строками
+        query = SupplierProduct.query.options(db.undefer(SupplierProduct.description)).filter_by(supplier_id=supplier_id)
         if search:
             search_term = f'%{search}%'
             query = query.filter(
@@ -2913,7 +2916,9 @@ def register_supplier_routes(app):
 
         # Маркетплейсовые характеристики — считаем из БД
         marketplace_fill = {}
-        all_sp = SupplierProduct.query.filter_by(supplier_id=supplier_id).limit(5000).all()
+        all_sp = SupplierProduct.query.options(
+            db.undefer_group(DEFERRED_DETAILS), db.undefer_group(DEFERRED_AI),
+        ).filter_by(supplier_id=supplier_id).limit(5000).all()
         if all_sp:
             total = len(all_sp)
             # WB категория
@@ -3144,7 +3149,7 @@ def register_supplier_routes(app):
                 elif scope == 'draft':
                     query = query.filter_by(status='draft')
 
-                product_ids = [p.id for p in query.all()]
+                product_ids = [row.id for row in query.with_entities(SupplierProduct.id)]
 
             if not product_ids:
                 return jsonify({'error': 'Нет товаров для парсинга'}), 400
@@ -3256,7 +3261,7 @@ def register_supplier_routes(app):
                     SupplierProduct.supplier_id == supplier_id,
                     SupplierProduct.ai_marketplace_json.isnot(None),
                 )
-                product_ids = [p.id for p in query.all()]
+                product_ids = [row.id for row in query.with_entities(SupplierProduct.id)]
 
             if not product_ids:
                 return jsonify({'error': 'Нет товаров для валидации'}), 400
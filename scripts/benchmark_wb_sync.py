@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Повторяемый замер синхронизации с WB на локальном стенде WB API
+
+Поднимает services/wb_fake_server.py (сгенерированный каталог или
+записанные ответы), направляет на него клиентов WB (WB_API_BASE_URL),
+создаёт временную БД с продавцом и по очереди замеряет:
+
+- sync: _perform_product_sync_task (полный обход, затем инкрементальный);
+- monitoring: perform_price_monitoring_sync;
+- import: WBProductImporter.import_multiple_products.
+
+Лимиты клиента (WB_RATE_LIMITS) по умолчанию сняты, чтобы замер показывал
+нашу сторону: задержку WB и ответы 429 задаёт стенд (--latency,
+--rate-limit-every). С --wb-limits клиент соблюдает настоящие лимиты WB.
+
+Импорт ждёт асинхронного создания карточки фиксированными паузами;
+--sleep-scale сокращает все паузы time.sleep в процессе (например, 0.01).
+
+Примеры:
+    python scripts/benchmark_wb_sync.py --cards 5000 --latency 0.05
+    python scripts/benchmark_wb_sync.py --fixtures data/wb_fixtures --flows sync,monitoring
+    python scripts/benchmark_wb_sync.py --flows import --import-products 20 --sleep-scale 0.01
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FLOWS = ('sync', 'monitoring', 'import')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Замер синхронизации с WB на локальном стенде')
+    parser.add_argument('--flows', default=','.join(FLOWS), help='Сценарии через запятую: ' + ', '.join(FLOWS))
+    parser.add_argument('--fixtures', help='Каталог с записанными ответами (scripts/record_wb_fixtures.py)')
+    parser.add_argument('--cards', type=int, default=2000, help='Карточек в сгенерированном каталоге')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа стенда, сек')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Случайная добавка к задержке, сек')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='429 на каждый N-й запрос')
+    parser.add_argument('--rate-limit-probability', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--rate-limit-retry', type=float, default=0.1, help='X-Ratelimit-Retry в ответе 429, сек')
+    parser.add_argument('--import-products', type=int, default=10, help='Товаров для сценария import')
+    parser.add_argument('--import-workers', type=int, default=3)
+    parser.add_argument('--sleep-scale', type=float, default=1.0, help='Множитель пауз time.sleep')
+    parser.add_argument('--wb-limits', action='store_true', help='Соблюдать настоящие лимиты WB на клиенте')
+    parser.add_argument('--database', help='DATABASE_URL (по умолчанию — временная SQLite)')
+    parser.add_argument('--json', action='store_true', help='Итог в JSON')
+    return parser.parse_args(argv)
+
+
+def _prepare_environment(args, workdir: str) -> None:
+    """Переменные окружения до импорта приложения"""
+    os.environ['SKIP_SCHEDULER'] = '1'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['DATABASE_URL'] = args.database or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['WB_RATE_LIMIT_DB'] = os.path.join(workdir, 'wb_rate_limits.db')
+    os.environ['CATALOG_SNAPSHOT_DIR'] = os.path.join(workdir, 'catalog_snapshots')
+
+    if args.sleep_scale != 1.0:
+        real_sleep = time.sleep
+        time.sleep = lambda seconds: real_sleep(max(0.0, seconds) * args.sleep_scale)
+
+
+def _lift_client_limits() -> None:
+    from services import wb_rate_limiter
+
+    for name in list(wb_rate_limiter.WB_RATE_LIMITS):
+        wb_rate_limiter.WB_RATE_LIMITS[name] = wb_rate_limiter.RateLimitRule(per_minute=10 ** 7, burst=10 ** 6)
+
+
+def _create_seller(db, dataset):
+    from models import PriceMonitorSettings, Seller, User
+
+    user = User(username='benchmark', email='benchmark@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    seller = Seller(user_id=user.id, company_name='Benchmark')
+    seller.wb_api_key = 'benchmark-key'
+    db.session.add(seller)
+    db.session.flush()
+    settings = PriceMonitorSettings(seller_id=seller.id, is_enabled=True)
+    db.session.add(settings)
+    db.session.commit()
+    return seller, settings
+
+
+def _create_imported_products(db, seller, dataset, count: int) -> list:
+    from models import ImportedProduct
+
+    subject = dataset.subjects[0] if dataset.subjects else {'subjectID': 1, 'subjectName': ''}
+    brand = dataset.brands[0]['name'] if dataset.brands else 'Benchmark'
+    ids = []
+    for n in range(count):
+        product = ImportedProduct(
+            seller_id=seller.id,
+            external_id=f'bench-{n}',
+            external_vendor_code=f'BENCH-{n:05d}',
+            source_type='benchmark',
+            title=f"{subject.get('subjectName') or 'Товар'} {n}",
+            description='Товар для замера импорта. ' * 20,
+            wb_subject_id=subject.get('subjectID'),
+            mapped_wb_category=subject.get('subjectName'),
+            brand=brand,
+            country='Россия',
+            colors=json.dumps(['белый'], ensure_ascii=False),
+            barcodes=json.dumps([str(2990000000000 + n)]),
+            photo_urls=json.dumps([]),
+            import_status='validated',
+        )
+        db.session.add(product)
+        db.session.flush()
+        ids.append(product.id)
+    db.session.commit()
+    return ids
+
+
+def _timed(results: dict, name: str, server, func):
+    before = server.get_stats()
+    started = time.perf_counter()
+    try:
+        outcome = func()
+        error = None
+    except Exception as e:  # замер продолжается со следующим сценарием
+        outcome, error = None, f'{type(e).__name__}: {e}'
+    elapsed = time.perf_counter() - started
+    after = server.get_stats()
+    results[name] = {
+        'seconds': round(elapsed, 3),
+        'requests': after['requests'] - before['requests'],
+        'throttled': after['throttled'] - before['throttled'],
+        'error': error,
+        'result': outcome if isinstance(outcome, (dict, list, int, float, str, type(None))) else str(outcome),
+    }
+    print(f"⏱️ {name}: {elapsed:.2f}s, {results[name]['requests']} requests "
+          f"({results[name]['throttled']} throttled)" + (f" — {error}" if error else ''), flush=True)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    flows = [f.strip() for f in args.flows.split(',') if f.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        print(f"❌ Unknown flows: {', '.join(sorted(unknown))}")
+        return 2
+
+    workdir = tempfile.mkdtemp(prefix='wb_benchmark_')
+    from services.wb_fake_server import FakeWBConfig, FakeWBDataset, FakeWBServer
+
+    config = FakeWBConfig(
+        latency=args.latency, latency_jitter=args.jitter, rate_limit_every=args.rate_limit_every,
+        rate_limit_probability=args.rate_limit_probability, rate_limit_retry=args.rate_limit_retry,
+        seed=args.seed,
+    )
+    dataset = FakeWBDataset.load(args.fixtures) if args.fixtures else FakeWBDataset.generate(args.cards, args.seed)
+    server = FakeWBServer(dataset, config).start()
+    os.environ['WB_API_BASE_URL'] = server.url
+    _prepare_environment(args, workdir)
+
+    try:
+        # Приложение импортируется после настройки окружения
+        from seller_platform import _perform_product_sync_task, app, perform_price_monitoring_sync
+        from models import Product, db
+        if not args.wb_limits:
+            _lift_client_limits()
+
+        results = {}
+        with app.app_context():
+            db.create_all()
+            seller, settings = _create_seller(db, dataset)
+            seller_id = seller.id
+
+            if 'sync' in flows:
+                _timed(results, 'sync_full', server,
+                       lambda: _perform_product_sync_task(seller_id, app, full_sync=True))
+                _timed(results, 'sync_incremental', server,
+                       lambda: _perform_product_sync_task(seller_id, app, full_sync=False))
+                results['sync_full']['products'] = Product.query.filter_by(seller_id=seller_id).count()
+
+            if 'monitoring' in flows:
+                _timed(results, 'price_monitoring', server,
+                       lambda: perform_price_monitoring_sync(db.session.get(type(seller), seller_id), settings))
+
+            if 'import' in flows:
+                from services.wb_product_importer import WBProductImporter
+
+                ids = _create_imported_products(db, seller, dataset, args.import_products)
+                _timed(results, 'import', server,
+                       lambda: WBProductImporter(db.session.get(type(seller), seller_id))
+                       .import_multiple_products(ids, max_workers=args.import_workers))
+
+        summary = {'server': server.get_stats(), 'flows': results, 'config': vars(args)}
+        if args.json:
+            print(json.dumps(summary, ensure_ascii=False, indent=2, default=str))
+        else:
+            print(f"📊 Fake WB server: {summary['server']['requests']} requests, "
+                  f"{summary['server']['throttled']} throttled")
+            for endpoint, counter in summary['server']['endpoints'].items():
+                print(f"   {endpoint}: {counter['requests']} ({counter['throttled']} throttled)")
+        return 0 if all(r['error'] is None for r in results.values()) else 1
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
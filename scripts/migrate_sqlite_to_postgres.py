@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Перенос данных из файла SQLite в PostgreSQL
+
+Создаёт схему моделей в целевой БД (db.create_all), переносит таблицы
+в порядке внешних ключей пачками (в PostgreSQL — COPY), выставляет
+последовательности id на максимум и сверяет число строк:
+
+    python scripts/migrate_sqlite_to_postgres.py \\
+        --source sqlite:////app/data/seller_platform.db \\
+        --target postgresql://seller:secret@db:5432/seller_platform
+
+После переноса задайте DATABASE_URL=postgresql://... и перезапустите
+приложение. Переносятся колонки моделей, которые есть в исходной таблице;
+таблицы без моделей и устаревшие колонки пропускаются.
+
+SQLite не проверяет внешние ключи, поэтому в старой БД бывают строки-сироты.
+Если перенос падает на внешнем ключе, запустите с --disable-triggers
+(нужны права суперпользователя: проверки ключей отключаются на время загрузки).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import JSON, Integer, create_engine, func, inspect, select  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Перенос данных из SQLite в PostgreSQL')
+    parser.add_argument('--source', required=True, help='URL исходной БД (sqlite:///...)')
+    parser.add_argument('--target', required=True, help='URL целевой БД (postgresql://...)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Строк на пачку')
+    parser.add_argument('--tables', help='Только эти таблицы (через запятую)')
+    parser.add_argument('--truncate', action='store_true', help='Очистить непустые целевые таблицы')
+    parser.add_argument('--disable-triggers', action='store_true',
+                        help='PostgreSQL: не проверять внешние ключи при загрузке (суперпользователь)')
+    return parser.parse_args(argv)
+
+
+def _load_metadata():
+    """Метаданные всех моделей (включая модели, объявленные в routes/)"""
+    from models import db
+    import routes.telegram_alerts  # noqa: F401  TelegramAlertConfig
+
+    return db.metadata
+
+
+def _prepare_row(row: dict, json_columns: set) -> dict:
+    # JSON-колонки приходят разобранными; для COPY их нужно сериализовать обратно
+    for name in json_columns:
+        if row.get(name) is not None:
+            row[name] = json.dumps(row[name], ensure_ascii=False)
+    return row
+
+
+def copy_table(table, source, target, batch_size: int, disable_triggers: bool = False) -> int:
+    """Перенести одну таблицу; returns число перенесённых строк"""
+    from services.db_dialect import copy_rows
+
+    source_columns = {c['name'] for c in inspect(source).get_columns(table.name)}
+    columns = [c for c in table.columns if c.name in source_columns]
+    json_columns = {c.name for c in columns if isinstance(c.type, JSON)}
+    names = [c.name for c in columns]
+    order_by = list(table.primary_key.columns) or columns[:1]
+
+    copied = 0
+    with source.connect() as src, target.begin() as dst:
+        if target.dialect.name == 'postgresql' and disable_triggers:
+            dst.exec_driver_sql('SET session_replication_role = replica')
+        result = src.execution_options(stream_results=True).execute(
+            select(*columns).order_by(*order_by)
+        )
+        for partition in result.mappings().partitions(batch_size):
+            if target.dialect.name == 'postgresql':
+                rows = [_prepare_row(dict(row), json_columns) for row in partition]
+                copy_rows(dst, table.name, names, rows)
+            else:
+                dst.execute(table.insert(), [dict(row) for row in partition])
+            copied += len(partition)
+    return copied
+
+
+def reset_sequence(table, target) -> None:
+    """PostgreSQL: следующая вставка получит id больше перенесённых"""
+    keys = list(table.primary_key.columns)
+    if target.dialect.name != 'postgresql' or len(keys) != 1 or not isinstance(keys[0].type, Integer):
+        return
+    key = keys[0].name
+    with target.begin() as conn:
+        conn.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', '{key}'), "
+            f"COALESCE(MAX({key}), 1), MAX({key}) IS NOT NULL) FROM {table.name}"
+        )
+
+
+def _count(engine, table) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    from services.db_dialect import normalize_database_url
+
+    metadata = _load_metadata()
+    source = create_engine(args.source)
+    target = create_engine(normalize_database_url(args.target))
+    print(f"📂 {source.url.render_as_string(hide_password=True)} -> "
+          f"{target.url.render_as_string(hide_password=True)}")
+
+    metadata.create_all(target)
+    source_tables = set(inspect(source).get_table_names())
+    only = {t.strip() for t in args.tables.split(',')} if args.tables else None
+    tables = [t for t in metadata.sorted_tables
+              if t.name in source_tables and (only is None or t.name in only)]
+
+    non_empty = [t for t in tables if _count(target, t)]
+    if non_empty and not args.truncate:
+        print(f"❌ Target tables are not empty: {', '.join(t.name for t in non_empty)} (use --truncate)")
+        return 2
+    with target.begin() as conn:
+        for table in reversed(non_empty):
+            conn.execute(table.delete())
+
+    mismatched = []
+    for table in tables:
+        started = time.perf_counter()
+        try:
+            copied = copy_table(table, source, target, args.batch_size, args.disable_triggers)
+        except Exception as e:
+            print(f"❌ {table.name}: {e}")
+            return 1
+        reset_sequence(table, target)
+        expected = _count(source, table)
+        status = '✅' if copied == expected == _count(target, table) else '⚠️'
+        if status != '✅':
+            mismatched.append(table.name)
+        print(f"{status} {table.name}: {copied}/{expected} rows in {time.perf_counter() - started:.1f}s", flush=True)
+
+    skipped = sorted(source_tables - {t.name for t in metadata.sorted_tables})
+    if skipped:
+        print(f"ℹ️ Tables without models skipped: {', '.join(skipped)}")
+    if mismatched:
+        print(f"⚠️ Row counts differ: {', '.join(mismatched)}")
+        return 1
+    print(f"✅ Migrated {len(tables)} tables")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Записать ответы WB API продавца для локального стенда (services/wb_fake_server.py)
+
+Сохраняет в каталог разделы FakeWBDataset (<раздел>.json): карточки,
+цены, остатки, заказы, продажи, отчёт реализации, предметы, характеристики
+предметов из каталога, справочники и бренды. Дальше стенд отдаёт эти данные
+вместо сгенерированных:
+
+    python scripts/record_wb_fixtures.py --api-key "$WB_API_KEY" --out data/wb_fixtures
+    python scripts/benchmark_wb_sync.py --fixtures data/wb_fixtures
+
+Каталог содержит данные продавца — не коммитьте его в репозиторий.
+Statistics API допускает один запрос в минуту на метод, поэтому запись
+отчётов занимает несколько минут (ожидание выдерживает общий rate limiter).
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.wb_api_client import WildberriesAPIClient  # noqa: E402
+from services.wb_fake_server import FakeWBDataset  # noqa: E402
+
+DIRECTORIES = ('colors', 'countries', 'kinds', 'seasons', 'vat', 'tnved')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Запись ответов WB API для локального стенда')
+    parser.add_argument('--api-key', default=os.environ.get('WB_API_KEY'), help='API ключ (или WB_API_KEY)')
+    parser.add_argument('--out', required=True, help='Каталог для записанных ответов')
+    parser.add_argument('--max-cards', type=int, default=0, help='Ограничить число карточек (0 — все)')
+    parser.add_argument('--days', type=int, default=30, help='Глубина заказов, продаж и отчёта реализации (дни)')
+    parser.add_argument('--skip-statistics', action='store_true', help='Не записывать Statistics API')
+    return parser.parse_args(argv)
+
+
+def _safe(what: str, func, default):
+    try:
+        return func()
+    except Exception as e:
+        print(f"⚠️ {what}: {e}")
+        return default
+
+
+def record(client: WildberriesAPIClient, args) -> FakeWBDataset:
+    """Собрать набор данных стенда из ответов WB"""
+    cards = []
+    for page, _ in client.iter_cards():
+        cards.extend(page)
+        print(f"📦 Cards: {len(cards)}", flush=True)
+        if args.max_cards and len(cards) >= args.max_cards:
+            cards = cards[:args.max_cards]
+            break
+    nm_ids = {card['nmID'] for card in cards}
+
+    prices = [p for p in client.get_all_goods_prices(batch_size=1000) if p.get('nmID') in nm_ids]
+    print(f"💰 Prices: {len(prices)}", flush=True)
+
+    subject_ids = sorted({card.get('subjectID') for card in cards if card.get('subjectID')})
+    subjects = _safe('subjects', lambda: client.get_subjects_list(limit=1000).get('data') or [], [])
+    charcs = {
+        sid: _safe(f'charcs {sid}', lambda sid=sid: client.get_card_characteristics_config(sid).get('data') or [], [])
+        for sid in subject_ids
+    }
+    brands = {}
+    for sid in subject_ids:
+        result = _safe(f'brands {sid}', lambda sid=sid: client.get_brands_by_subject_quick(sid), {})
+        for brand in result.get('brands') or []:
+            brands.setdefault(brand.get('id'), brand)
+
+    dataset = FakeWBDataset(
+        cards=cards, prices=prices, subjects=subjects, charcs=charcs, brands=list(brands.values()),
+        parents=_safe('parents', lambda: client.get_parent_categories().get('data') or [], []),
+        directories={
+            name: _safe(name, lambda name=name: getattr(client, f'get_directory_{name}')().get('data') or [], [])
+            for name in DIRECTORIES
+        },
+    )
+
+    if not args.skip_statistics:
+        date_from = (datetime.utcnow() - timedelta(days=args.days)).strftime('%Y-%m-%d')
+        dataset.stocks = [s for s in _safe('stocks', lambda: client.get_stocks('2019-06-20'), [])
+                          if not nm_ids or s.get('nmId') in nm_ids]
+        dataset.orders = _safe('orders', lambda: client.get_orders(date_from), [])
+        dataset.sales = _safe('sales', lambda: client._make_request(
+            'GET', 'statistics', '/api/v1/supplier/sales', params={'dateFrom': date_from}).json(), [])
+        dataset.realization = _safe('realization', lambda: client.get_sales_report(date_from), [])
+        print(f"📊 Stocks: {len(dataset.stocks)}, orders: {len(dataset.orders)}, "
+              f"sales: {len(dataset.sales)}, realization: {len(dataset.realization)}", flush=True)
+    return dataset
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.api_key:
+        print("❌ API key required (--api-key or WB_API_KEY)")
+        return 2
+
+    with WildberriesAPIClient(args.api_key, response_cache=False) as client:
+        dataset = record(client, args)
+    dataset.save(args.out)
+    print(f"✅ Saved {len(dataset.cards)} cards to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
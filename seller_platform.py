@@ -9,15 +9,16 @@ from functools import wraps
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+import click
 from flask import Flask, render_template, redirect, url_for, flash, request, abort, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy import or_
 
 from models import (
-    db, User, Seller, Product, APILog, ProductStock,
+    db, DEFERRED_DETAILS, User, Seller, Product, APILog, ProductStock,
     CardEditHistory, BulkEditHistory, PriceMonitorSettings,
-    PriceHistory, SuspiciousPriceChange, ProductSyncSettings,
+    PriceHistory, SuspiciousPriceChange, ProductSyncSettings, CardSyncCheckpoint,
     UserActivity, AdminAuditLog, SystemSettings,
     SafePriceChangeSettings, PriceChangeBatch, PriceChangeItem,
     PricingSettings, AutoImportSettings,
@@ -42,10 +43,14 @@ from models import (
 from services.wildberries_api import WildberriesAPIError, list_cards
 import json
 import time
-import threading
 import logging
 from logging.handlers import RotatingFileHandler
 from services.wb_api_client import WildberriesAPIClient, WBAPIException, WBAuthException
+from services import wb_reference_cache
+from services.db_dialect import dialect_name, engine_options, normalize_database_url, portable_ddl
+from services.db_writer import commit_session, install_write_lock
+from services.keyset import InvalidCursor, keyset_paginate
+from services.search_index import apply_search, ensure_search_indexes
 
 # Настройка приложения
 app = Flask(__name__)
@@ -68,7 +73,8 @@ DEFAULT_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 database_url_from_env = os.environ.get('DATABASE_URL')
 
 if database_url_from_env:
-    database_url = database_url_from_env
+    # postgres://... (Heroku, docker-образы) -> postgresql://...
+    database_url = normalize_database_url(database_url_from_env)
     app.logger.info("Using DATABASE_URL from environment")
 else:
     # Создаем URI с АБСОЛЮТНЫМ путем
@@ -92,18 +98,8 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 час
 # Если не задан — url_for(_external=True) генерит localhost, и WB не сможет забрать фото
 app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
 
-# SQLite конфигурация для лучшей поддержки конкурентного доступа
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'connect_args': {
-        'timeout': 30,  # Увеличенный timeout до 30 секунд
-        'check_same_thread': False,  # Разрешить использование из разных потоков
-    },
-    'pool_size': 20,        # Базовый размер пула соединений (дефолт 5 — мало для фоновых потоков)
-    'max_overflow': 30,     # Доп. соединения сверх pool_size при пиковой нагрузке
-    'pool_timeout': 60,     # Ждать свободное соединение до 60 сек (дефолт 30)
-    'pool_pre_ping': True,  # Проверка соединений перед использованием
-    'pool_recycle': 3600,   # Переиспользование соединений каждый час
-}
+# Параметры движка по диалекту: SQLite (timeout, check_same_thread) или PostgreSQL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
 
 # Настройка логирования
 if not app.debug:
@@ -218,6 +214,9 @@ app.jinja_env.filters['format_char_value'] = format_characteristic_value
 
 # Инициализация расширений
 db.init_app(app)
+# Писатели SQLite (потоки и процессы) ждут блокировку записи вместо «database is locked»
+with app.app_context():
+    install_write_lock(db.engine)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -962,6 +961,51 @@ def admin_system_settings():
     return render_template('admin_system_settings.html', settings=settings, agents_summary=agents_summary)
 
 
+# ============= МЕТРИКИ ВНЕШНИХ ЗАПРОСОВ =============
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Метрики внешних запросов в формате Prometheus
+
+    Доступ: администратор (сессия) или заголовок Authorization: Bearer <METRICS_TOKEN>.
+    """
+    from services.metrics import get_metrics
+    import hmac
+
+    token = os.environ.get('METRICS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(token) and hmac.compare_digest(auth.encode(), f'Bearer {token}'.encode())
+    if not token_ok and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+
+    return app.response_class(get_metrics().render_prometheus(),
+                              mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admin/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    """Задержки, ошибки, ретраи и ожидание rate limiter по эндпоинтам"""
+    from services.metrics import get_metrics
+
+    api_type = request.args.get('api_type', '')
+    rows = get_metrics().snapshot()
+    api_types = sorted({row['api_type'] for row in rows})
+    if api_type:
+        rows = [row for row in rows if row['api_type'] == api_type]
+
+    totals = {
+        'count': sum(row['count'] for row in rows),
+        'errors': sum(row['errors'] for row in rows),
+        'retries': sum(row['retries'] for row in rows),
+        'limiter_wait': round(sum(row['limiter_wait'] for row in rows), 1),
+    }
+    return render_template('admin_metrics.html', rows=rows, totals=totals,
+                           api_types=api_types, current_api_type=api_type)
+
+
 # ============= API DEBUG CONSOLE =============
 
 @app.route('/admin/api-debug')
@@ -1309,7 +1353,8 @@ def products_list():
         filter_rating_max = request.args.get('rating_max', '', type=str).strip()
 
         # Сортировка
-        sort_by = request.args.get('sort', 'updated_at')  # по умолчанию по дате обновления
+        # по умолчанию по дате обновления, при поиске — по релевантности
+        sort_by = request.args.get('sort') or ('relevance' if search else 'updated_at')
         sort_order = request.args.get('order', 'desc')  # 'asc' или 'desc'
 
         # Построение запроса
@@ -1318,15 +1363,10 @@ def products_list():
         if active_only:
             query = query.filter_by(is_active=True)
 
+        search_rank = None
         if search:
-            # Поиск по артикулу, названию или бренду
-            search_filter = or_(
-                Product.vendor_code.ilike(f'%{search}%'),
-                Product.title.ilike(f'%{search}%'),
-                Product.brand.ilike(f'%{search}%'),
-                Product.nm_id.cast(db.String).ilike(f'%{search}%')
-            )
-            query = query.filter(search_filter)
+            # Полнотекстовый поиск по артикулу, названию, бренду, nm_id и баркодам
+            query, search_rank = apply_search(query, Product, search)
 
         # Фильтр по бренду
         if filter_brand:
@@ -1414,17 +1454,23 @@ def products_list():
             'nm_rating': Product.nm_rating,
         }.get(sort_by, Product.updated_at)
 
-        if sort_order == 'asc':
-            query = query.order_by(sort_column.asc())
+        # Пагинация: результаты поиска по релевантности — по номеру страницы,
+        # остальные сортировки — по курсору (sort_column, id) без OFFSET
+        if sort_by == 'relevance' and search_rank is not None:
+            pagination = query.order_by(search_rank, Product.id.desc()).paginate(
+                page=page,
+                per_page=per_page,
+                error_out=False
+            )
         else:
-            query = query.order_by(sort_column.desc())
-
-        # Пагинация
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+            descending = sort_order != 'asc'
+            order = [(sort_column, descending), (Product.id, descending)]
+            try:
+                pagination = keyset_paginate(query, order, cursor=request.args.get('cursor'),
+                                             page=page, per_page=per_page)
+            except InvalidCursor:
+                # Курсор от другой сортировки — открываем страницу по номеру
+                pagination = keyset_paginate(query, order, page=page, per_page=per_page)
 
         products = pagination.items
 
@@ -1620,55 +1666,347 @@ def bulk_products_action():
     return redirect(url_for('products_list'))
 
 
-def db_commit_with_retry(session, max_retries=3, initial_delay=0.5):
+def _get_card_checkpoint(seller_id: int, scope: str) -> CardSyncCheckpoint:
+    """Получить (или создать) чекпоинт обхода карточек продавца"""
+    checkpoint = CardSyncCheckpoint.query.filter_by(seller_id=seller_id, scope=scope).first()
+    if not checkpoint:
+        checkpoint = CardSyncCheckpoint(seller_id=seller_id, scope=scope, cards_processed=0)
+        db.session.add(checkpoint)
+        commit_session(db.session)
+    return checkpoint
+
+
+def _begin_checkpoint_pass(checkpoint: CardSyncCheckpoint) -> None:
+    """Начать обход по чекпоинту: продолжить незавершённый или начать новый"""
+    if checkpoint.has_cursor:
+        app.logger.info(
+            f"⏩ Resuming {checkpoint.scope} for seller_id={checkpoint.seller_id} "
+            f"from nmID={checkpoint.cursor_nm_id} ({checkpoint.cards_processed} cards already processed)"
+        )
+    else:
+        checkpoint.reset()
+        checkpoint.started_at = datetime.utcnow()
+        commit_session(db.session)
+
+
+def _iter_cards_checkpointed(client: WildberriesAPIClient, checkpoint: CardSyncCheckpoint, batch_size: int = 100):
     """
-    Выполняет commit с retry логикой для SQLite database locked ошибок
+    Обойти карточки WB по одной, сохраняя курсор после каждой страницы
+
+    Следующая страница запрашивается только когда вызывающий обработал
+    все карточки текущей, поэтому коммит перед запросом фиксирует изменения
+    страницы вместе с курсором. Если в чекпоинте есть незавершённый курсор,
+    обход продолжается с него; после последней страницы курсор сбрасывается.
 
     Args:
-        session: SQLAlchemy session
-        max_retries: Максимальное количество попыток
-        initial_delay: Начальная задержка в секундах
+        client: Клиент WB API
+        checkpoint: Чекпоинт (см. _get_card_checkpoint)
+        batch_size: Размер страницы (макс 100)
 
-    Raises:
-        Exception: После исчерпания всех попыток
+    Yields:
+        Данные карточки из Content API
     """
-    import sqlite3
-    from sqlalchemy.exc import OperationalError
+    _begin_checkpoint_pass(checkpoint)
 
-    for attempt in range(max_retries):
-        try:
-            session.commit()
-            return  # Success
-        except OperationalError as e:
-            # Проверяем что это именно database locked error
-            if 'database is locked' in str(e).lower():
-                if attempt < max_retries - 1:
-                    delay = initial_delay * (2 ** attempt)  # Экспоненциальная задержка
-                    app.logger.warning(f"Database locked, retry {attempt + 1}/{max_retries} after {delay}s")
-                    time.sleep(delay)
-                    try:
-                        session.rollback()
-                    except Exception:
-                        session.remove()
-                else:
-                    app.logger.error(f"Database locked after {max_retries} retries")
-                    try:
-                        session.rollback()
-                    except Exception:
-                        session.remove()
-                    raise
-            else:
-                # Другая ошибка - пробрасываем сразу
-                raise
+    pages = client.iter_cards(
+        batch_size=batch_size,
+        cursor_updated_at=checkpoint.cursor_updated_at,
+        cursor_nm_id=checkpoint.cursor_nm_id
+    )
+    for page_cards, next_cursor in pages:
+        yield from page_cards
+
+        # Страница обработана — фиксируем её изменения вместе с курсором
+        _advance_checkpoint(checkpoint, len(page_cards), next_cursor)
+        commit_session(db.session)
+        app.logger.info(f"💾 {checkpoint.scope}: {checkpoint.cards_processed} cards processed (seller_id={checkpoint.seller_id})")
+
+    checkpoint.complete_pass()
+    commit_session(db.session)
+
+
+def _advance_checkpoint(checkpoint: CardSyncCheckpoint, cards_count: int, next_cursor: Optional[Dict]) -> None:
+    """Учесть обработанную страницу в чекпоинте (коммит — за вызывающим)"""
+    checkpoint.cards_processed = (checkpoint.cards_processed or 0) + cards_count
+    if next_cursor:
+        checkpoint.cursor_updated_at = next_cursor['updatedAt']
+        checkpoint.cursor_nm_id = next_cursor['nmID']
+
+# Как часто инкрементальная синхронизация товаров дополняется полным обходом каталога
+PRODUCT_FULL_SYNC_INTERVAL_HOURS = int(os.environ.get('PRODUCT_FULL_SYNC_INTERVAL_HOURS', '24'))
+
+def _parse_wb_datetime(value) -> Optional[datetime]:
+    """Разобрать дату WB API ('2023-12-06T11:17:00.96577Z'); None если не удалось"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
 
 
-def _perform_product_sync_task(seller_id: int, flask_app):
+def _iter_card_pages(client: WildberriesAPIClient, cursor_updated_at: Optional[str] = None,
+                     cursor_nm_id: Optional[int] = None, since: Optional[datetime] = None,
+                     batch_size: int = 100):
+    """
+    Страницы карточек WB для конвейера синхронизации (без обращений к БД)
+
+    Полный обход идёт по курсору (при продолжении — с сохранённого).
+    Инкрементальный (since задан) запрашивает карточки от недавно
+    изменённых к старым и прекращается на первой карточке старше since.
+
+    Args:
+        client: Клиент WB API
+        cursor_updated_at: Курсор продолжения полного обхода
+        cursor_nm_id: Курсор продолжения полного обхода
+        since: Водяной знак updatedAt для инкрементального обхода
+        batch_size: Размер страницы (макс 100)
+
+    Yields:
+        {'cards': [...], 'cursor': курсор следующей страницы или None, 'size': N}
+    """
+    if since is None:
+        pages = client.iter_cards(
+            batch_size=batch_size, cursor_updated_at=cursor_updated_at, cursor_nm_id=cursor_nm_id
+        )
+        for page_cards, next_cursor in pages:
+            yield {'cards': page_cards, 'cursor': next_cursor, 'size': len(page_cards)}
+        return
+
+    for page_cards, _ in client.iter_cards(batch_size=batch_size, ascending=False):
+        fresh = []
+        for card in page_cards:
+            card_updated_at = _parse_wb_datetime(card.get('updatedAt'))
+            if card_updated_at and card_updated_at < since:
+                if fresh:
+                    yield {'cards': fresh, 'cursor': None, 'size': len(fresh)}
+                return
+            fresh.append(card)
+        yield {'cards': fresh, 'cursor': None, 'size': len(fresh)}
+
+
+def _prices_by_nm_id(all_prices: List[Dict[str, Any]]) -> Dict[int, tuple]:
+    """Словарь цен по nmID из Prices API (берем первый размер для базовой цены)"""
+    prices = {}
+    for price_item in all_prices:
+        nm_id = price_item.get('nmID')
+        sizes = price_item.get('sizes', [])
+        if nm_id and sizes:
+            prices[nm_id] = (sizes[0].get('price'), sizes[0].get('discountedPrice'))
+    return prices
+
+
+def _product_row_from_card(card_data: Dict[str, Any], seller_id: int, synced_at: datetime) -> Dict[str, Any]:
+    """
+    Преобразовать карточку Content API в строку таблицы products
+
+    Args:
+        card_data: Данные карточки WB
+        seller_id: ID продавца
+        synced_at: Время синхронизации (last_sync)
+
+    Returns:
+        dict с колонками Product (для BulkUpserter)
+    """
+    nm_id = card_data.get('nmID')
+    object_name = (
+        card_data.get('subjectName') or
+        card_data.get('objectName') or
+        card_data.get('object') or
+        ''
+    )
+
+    # Характеристики
+    characteristics = card_data.get('characteristics', [])
+    characteristics_json = json.dumps(characteristics, ensure_ascii=False) if characteristics else None
+
+    # Габариты
+    dimensions = card_data.get('dimensions', {})
+    dimensions_json = json.dumps(dimensions, ensure_ascii=False) if dimensions else None
+
+    # Медиа
+    media = card_data.get('mediaFiles', [])
+    photo_count_v1 = len([m for m in media if m.get('big') and m.get('mediaType') != 'video'])
+    photo_count_v2 = len([m for m in media if m.get('mediaType') != 'video'])
+    photos_field = card_data.get('photos', [])
+    photo_count_v3 = len(photos_field) if photos_field else 0
+    photo_count = max(photo_count_v1, photo_count_v2, photo_count_v3)
+    if photo_count == 0 and card_data.get('mediaFiles'):
+        photo_count = len(media) if media else 0
+    # Если photo_count все еще 0, но есть nmID - предполагаем что есть хотя бы 1 фото
+    # WB обычно требует минимум 1 фото для товара
+    if photo_count == 0 and nm_id:
+        photo_count = 5  # Предполагаем стандартное количество фото
+    photo_indices = list(range(1, photo_count + 1)) if photo_count > 0 else []
+    photos_json = json.dumps(photo_indices) if photo_indices else None
+
+    # Видео
+    video_media = next((m for m in media if m.get('mediaType') == 'video'), None)
+    video = video_media.get('big') if video_media else None
+
+    # Размеры
+    sizes = card_data.get('sizes', [])
+    sizes_json = json.dumps(sizes, ensure_ascii=False) if sizes else None
+
+    return {
+        'seller_id': seller_id,
+        'nm_id': nm_id,
+        'imt_id': card_data.get('imtID'),
+        'supplier_vendor_code': card_data.get('supplierVendorCode', ''),
+        'vendor_code': card_data.get('vendorCode', ''),
+        'title': card_data.get('title', ''),
+        'brand': card_data.get('brand', ''),
+        'object_name': object_name,
+        'subject_id': card_data.get('subjectID'),
+        'description': card_data.get('description', ''),
+        'characteristics_json': characteristics_json,
+        'dimensions_json': dimensions_json,
+        'photos_json': photos_json,
+        'video_url': video,
+        'sizes_json': sizes_json,
+        'last_sync': synced_at,
+        'is_active': True,
+    }
+
+
+# Колонки Product, которые синхронизация пишет только при создании карточки
+PRODUCT_INSERT_ONLY_COLUMNS = ('seller_id', 'nm_id', 'imt_id', 'supplier_vendor_code')
+
+# Версия преобразования карточки в строку products: при изменении
+# _product_row_from_card увеличить, чтобы все карточки перезаписались
+PRODUCT_FINGERPRINT_VERSION = 1
+
+# Поля карточки, которые меняются без изменения содержимого
+_FINGERPRINT_VOLATILE_FIELDS = ('updatedAt', 'createdAt')
+
+
+def _card_fingerprint(card_data: Dict[str, Any], price: Optional[tuple] = None) -> str:
+    """
+    Стабильный отпечаток содержимого карточки WB и её цены
+
+    sha256 от канонического JSON карточки (ключи отсортированы, служебные
+    даты исключены) и цены из Prices API. Если отпечаток совпадает с
+    сохранённым в Product.content_hash, строку товара можно не перезаписывать.
+    """
+    content = {k: v for k, v in card_data.items() if k not in _FINGERPRINT_VOLATILE_FIELDS}
+    canonical = json.dumps(
+        [PRODUCT_FINGERPRINT_VERSION, content, price],
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _save_seller_stocks(seller_id: int, all_stocks: List[Dict[str, Any]]):
+    """
+    Сохранить остатки Statistics API и пересчитать Product.quantity
+
+    Остатки группируются по (nmId, склад) и записываются пакетно: товары
+    и существующие записи складов загружаются одним запросом каждые,
+    дубликаты записей склада удаляются. Коммит — за вызывающим.
+
+    Args:
+        seller_id: ID продавца
+        all_stocks: Ответ get_stocks
+
+    Returns:
+        (создано, обновлено, товаров с пересчитанным количеством)
+    """
+    from services.bulk_upsert import BulkUpserter, aggregate_stocks
+
+    stocks_by_product = aggregate_stocks(all_stocks)
+    app.logger.info(f"📊 Aggregated {len(stocks_by_product)} unique stock records")
+
+    product_ids = dict(
+        db.session.query(Product.nm_id, Product.id)
+        .filter(Product.seller_id == seller_id)
+        .order_by(Product.id.desc())
+    )
+    stock_upserter = BulkUpserter(
+        db.session, ProductStock, ('product_id', 'warehouse_name'),
+        filters=(ProductStock.product_id.in_(
+            db.session.query(Product.id).filter(Product.seller_id == seller_id)
+        ),),
+        insert_only=('product_id',)
+    )
+    stock_upserter.delete_duplicates()
+
+    now = datetime.utcnow()
+    rows = []
+    for (nm_id, warehouse_name), totals in stocks_by_product.items():
+        product_id = product_ids.get(nm_id)
+        if not product_id:
+            continue
+        rows.append({
+            'product_id': product_id,
+            # Стабильный warehouse_id из имени (hashlib вместо hash())
+            'warehouse_id': int(hashlib.md5(warehouse_name.encode('utf-8')).hexdigest(), 16) % 1000000,
+            'warehouse_name': warehouse_name,
+            'quantity': totals['quantity'],
+            'quantity_full': totals['quantity_full'],
+            'in_way_to_client': totals['in_way_to_client'],
+            'in_way_from_client': totals['in_way_from_client'],
+            'updated_at': now,
+        })
+    result = stock_upserter.upsert(rows)
+
+    # Product.quantity = сумма складских остатков (одним bulk update)
+    stock_totals = dict(
+        db.session.query(
+            ProductStock.product_id,
+            db.func.coalesce(db.func.sum(ProductStock.quantity), 0)
+        )
+        .filter(ProductStock.product_id.in_(set(product_ids.values())))
+        .group_by(ProductStock.product_id)
+        .all()
+    ) if product_ids else {}
+    quantity_updates = [
+        {'id': product_id, 'quantity': int(stock_totals.get(product_id, 0))}
+        for product_id, quantity in db.session.query(Product.id, Product.quantity)
+        .filter(Product.seller_id == seller_id)
+        if (quantity or 0) != int(stock_totals.get(product_id, 0))
+    ]
+    if quantity_updates:
+        db.session.bulk_update_mappings(Product, quantity_updates)
+
+    return result.created, result.updated, len(quantity_updates)
+
+def _fetch_catalog_part(seller_id: int, client: WildberriesAPIClient, part: str, method_name: str,
+                        kwargs: Dict[str, Any], max_age: Optional[float] = None):
+    """
+    Часть снимка каталога продавца (cards/prices/stocks) не старше max_age
+
+    Устаревший снимок загружается заново через асинхронный клиент.
+
+    Returns:
+        Данные WB API
+    """
+    from services.catalog_snapshot import get_catalog_snapshots
+    from services.wb_async_client import fetch_parallel
+
+    def fetch():
+        result = fetch_parallel(client, {part: (method_name, kwargs)})[part]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return get_catalog_snapshots().get(seller_id, part, fetch, max_age).data
+
+
+def _perform_product_sync_task(seller_id: int, flask_app, full_sync: bool = False):
     """
     Фоновая задача синхронизации товаров
 
+    По умолчанию синхронизация инкрементальная: загружаются только карточки,
+    изменённые после водяного знака updatedAt прошлой синхронизации. Полный
+    обход каталога выполняется при первом запуске, раз в
+    PRODUCT_FULL_SYNC_INTERVAL_HOURS и для продолжения прерванного полного
+    обхода; он же снимает с активных товары, которых больше нет на WB
+    (удалены или перенесены в корзину).
+
     Args:
         seller_id: ID продавца
         flask_app: Экземпляр Flask приложения для контекста
+        full_sync: Принудительно выполнить полный обход
     """
     with flask_app.app_context():
         try:
@@ -1679,40 +2017,29 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                 return
 
             seller.api_sync_status = 'syncing'
-            db_commit_with_retry(db.session)
+            commit_session(db.session)
 
             start_time = time.time()
 
             with WildberriesAPIClient(seller.wb_api_key) as client:
-                # Получаем все карточки
-                app.logger.info(f"🔄 Background sync: fetching cards for seller_id={seller_id}")
-                all_cards = client.get_all_cards(batch_size=100)
-                app.logger.info(f"✅ Background sync: got {len(all_cards)} cards from WB API")
-
-                # Получаем цены из Prices API (отдельный endpoint!)
-                app.logger.info(f"💰 Background sync: fetching prices from Prices API...")
-                try:
-                    all_prices = client.get_all_goods_prices(batch_size=1000)
-                    app.logger.info(f"✅ Background sync: got {len(all_prices)} price records from Prices API")
-
-                    # Создаем словарь цен по nmID для быстрого поиска
-                    prices_by_nm_id = {}
-                    for price_item in all_prices:
-                        nm_id = price_item.get('nmID')
-                        if nm_id:
-                            sizes = price_item.get('sizes', [])
-                            if sizes:
-                                # Берем первый размер для базовой цены
-                                first_size = sizes[0]
-                                prices_by_nm_id[nm_id] = {
-                                    'price': first_size.get('price'),
-                                    'discountedPrice': first_size.get('discountedPrice'),
-                                    'discount': price_item.get('discount', 0),
-                                    'sizes': sizes
-                                }
-                except Exception as price_error:
-                    app.logger.warning(f"⚠️ Failed to fetch prices from Prices API: {price_error}")
-                    prices_by_nm_id = {}
+                # Цены (Prices API) и остатки (Statistics API) загружаются в фоне,
+                # пока карточки (Content API) идут по конвейеру. Свежий снимок
+                # каталога (например, после мониторинга цен) используется без запросов к WB
+                from concurrent.futures import ThreadPoolExecutor
+                from datetime import timedelta
+                from services.catalog_snapshot import get_catalog_snapshots
+                app.logger.info(f"🔄 Background sync: fetching cards, prices and stocks for seller_id={seller_id}")
+                stocks_date_from = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
+                side_executor = ThreadPoolExecutor(max_workers=2)
+                prices_future = side_executor.submit(
+                    _fetch_catalog_part, seller_id, client, 'prices',
+                    'get_all_goods_prices', {'batch_size': 1000}
+                )
+                stocks_future = side_executor.submit(
+                    _fetch_catalog_part, seller_id, client, 'stocks',
+                    'get_stocks', {'date_from': stocks_date_from}
+                )
+                side_executor.shutdown(wait=False)
 
                 # Deduplicate existing products before sync
                 try:
@@ -1736,7 +2063,7 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                             # Keep the first (oldest), delete the rest
                             for dup in products[1:]:
                                 db.session.delete(dup)
-                        db_commit_with_retry(db.session)
+                        commit_session(db.session)
                         app.logger.info(f"✅ Deduplication complete, removed duplicates for {len(dupes)} nm_ids")
                 except Exception as dedup_err:
                     app.logger.warning(f"Deduplication failed (non-critical): {dedup_err}")
@@ -1745,278 +2072,242 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                     except Exception:
                         db.session.remove()
 
+                from services.bulk_upsert import BulkUpserter
+                from services.sync_pipeline import SyncPipeline
+
                 # Статистика
                 created_count = 0
                 updated_count = 0
-                batch_size = 100  # Commit каждые 100 карточек для больших датасетов
-                processed_in_batch = 0
+                unchanged_count = 0
                 # Track nm_ids seen in this sync to prevent duplicates
                 # (WB API can return the same nmID in multiple batches)
                 seen_nm_ids = set()
 
-                for card_data in all_cards:
-                    nm_id = card_data.get('nmID')
-                    if not nm_id:
-                        continue
-
-                    # Skip duplicate nmIDs from API response
-                    if nm_id in seen_nm_ids:
-                        continue
-                    seen_nm_ids.add(nm_id)
+                # Существующие карточки продавца (nm_id -> id, content_hash)
+                # загружаются одним запросом. Карточки, отпечаток которых
+                # совпадает с Product.content_hash, не пересобираются и не
+                # перезаписываются — им только обновляется last_sync/is_active
+                product_upserter = BulkUpserter(
+                    db.session, Product, ('nm_id',),
+                    filters=(Product.seller_id == seller.id,),
+                    insert_only=PRODUCT_INSERT_ONLY_COLUMNS,
+                    fingerprint_column='content_hash'
+                )
 
-                    # Ищем существующую карточку
-                    product = Product.query.filter_by(
-                        seller_id=seller.id,
-                        nm_id=nm_id
-                    ).first()
-
-                    # Извлекаем данные из API
-                    vendor_code = card_data.get('vendorCode', '')
-                    title = card_data.get('title', '')
-                    brand = card_data.get('brand', '')
-                    object_name = (
-                        card_data.get('subjectName') or
-                        card_data.get('objectName') or
-                        card_data.get('object') or
-                        ''
+                checkpoint = _get_card_checkpoint(seller.id, 'product_sync')
+                full_sync = full_sync or (
+                    checkpoint.has_cursor
+                    or not checkpoint.watermark_updated_at
+                    or not checkpoint.last_pass_completed_at
+                    or checkpoint.last_pass_completed_at
+                    < datetime.utcnow() - timedelta(hours=PRODUCT_FULL_SYNC_INTERVAL_HOURS)
+                )
+                resumed_cards = checkpoint.cards_processed if full_sync and checkpoint.has_cursor else 0
+                cards_synced = resumed_cards
+                newest_updated_at = None  # (datetime, исходная строка WB)
+
+                if full_sync:
+                    app.logger.info(f"🔁 Full catalog sync for seller_id={seller_id}")
+                    _begin_checkpoint_pass(checkpoint)
+                    card_pages = _iter_card_pages(
+                        client,
+                        cursor_updated_at=checkpoint.cursor_updated_at,
+                        cursor_nm_id=checkpoint.cursor_nm_id
                     )
-                    subject_id = card_data.get('subjectID')
-                    description = card_data.get('description', '')
-
-                    # Характеристики
-                    characteristics = card_data.get('characteristics', [])
-                    characteristics_json = json.dumps(characteristics, ensure_ascii=False) if characteristics else None
-
-                    # Габариты
-                    dimensions = card_data.get('dimensions', {})
-                    dimensions_json = json.dumps(dimensions, ensure_ascii=False) if dimensions else None
-
-                    # Медиа
-                    media = card_data.get('mediaFiles', [])
-                    photo_count_v1 = len([m for m in media if m.get('big') and m.get('mediaType') != 'video'])
-                    photo_count_v2 = len([m for m in media if m.get('mediaType') != 'video'])
-                    photos_field = card_data.get('photos', [])
-                    photo_count_v3 = len(photos_field) if photos_field else 0
-                    photo_count = max(photo_count_v1, photo_count_v2, photo_count_v3)
-                    if photo_count == 0 and card_data.get('mediaFiles'):
-                        photo_count = len(media) if media else 0
-                    # Если photo_count все еще 0, но есть nmID - предполагаем что есть хотя бы 1 фото
-                    # WB обычно требует минимум 1 фото для товара
-                    if photo_count == 0 and nm_id:
-                        photo_count = 5  # Предполагаем стандартное количество фото
-                    photo_indices = list(range(1, photo_count + 1)) if photo_count > 0 else []
-                    photos_json = json.dumps(photo_indices) if photo_indices else None
-
-                    # Видео
-                    video_media = next((m for m in media if m.get('mediaType') == 'video'), None)
-                    video = video_media.get('big') if video_media else None
-
-                    # Размеры
-                    sizes = card_data.get('sizes', [])
-                    sizes_json = json.dumps(sizes, ensure_ascii=False) if sizes else None
-
-                    # Получаем цены из словаря цен (из Prices API)
-                    price_data = prices_by_nm_id.get(nm_id, {})
-                    current_price = price_data.get('price')
-                    current_discounted_price = price_data.get('discountedPrice')
-
-                    if product:
-                        # Обновление существующей карточки
-                        product.vendor_code = vendor_code
-                        product.title = title
-                        product.brand = brand
-                        product.object_name = object_name
-                        product.subject_id = subject_id
-                        product.description = description
-                        product.characteristics_json = characteristics_json
-                        product.dimensions_json = dimensions_json
-                        product.photos_json = photos_json
-                        product.video_url = video
-                        product.sizes_json = sizes_json
-                        product.last_sync = datetime.utcnow()
-                        product.is_active = True
-                        # Обновляем цены если они есть
-                        if current_price is not None:
-                            product.price = current_price
-                        if current_discounted_price is not None:
-                            product.discount_price = current_discounted_price
-                        updated_count += 1
-                    else:
-                        # Создание новой карточки
-                        product = Product(
-                            seller_id=seller.id,
-                            nm_id=nm_id,
-                            imt_id=card_data.get('imtID'),
-                            vendor_code=vendor_code,
-                            title=title,
-                            brand=brand,
-                            object_name=object_name,
-                            subject_id=subject_id,
-                            description=description,
-                            supplier_vendor_code=card_data.get('supplierVendorCode', ''),
-                            characteristics_json=characteristics_json,
-                            dimensions_json=dimensions_json,
-                            photos_json=photos_json,
-                            video_url=video,
-                            sizes_json=sizes_json,
-                            last_sync=datetime.utcnow(),
-                            is_active=True,
-                            price=current_price,
-                            discount_price=current_discounted_price
+                else:
+                    app.logger.info(
+                        f"⚡ Incremental sync for seller_id={seller_id}: cards changed since {checkpoint.watermark_updated_at}"
+                    )
+                    card_pages = _iter_card_pages(client, since=_parse_wb_datetime(checkpoint.watermark_updated_at))
+
+                # Карточки этого обхода пишутся в снимок каталога постранично:
+                # полный обход заменяет снимок (карточек, которых в нём не было,
+                # в снимке не остаётся), инкрементальный — обновляет изменённые.
+                # Продолженный полный обход видит не весь каталог и снимок не пишет
+                snapshot_writer = None
+                if not (full_sync and resumed_cards):
+                    try:
+                        snapshot_writer = get_catalog_snapshots().writer(
+                            seller_id, 'cards', fetched_at=time.time(), key='nmID'
                         )
-                        db.session.add(product)
-                        created_count += 1
+                    except Exception as snapshot_error:
+                        app.logger.warning(f"⚠️ Failed to start catalog snapshot: {snapshot_error}")
 
-                    processed_in_batch += 1
+                prices = {}
 
-                    # Batch commit для избежания длинных транзакций
-                    if processed_in_batch >= batch_size:
+                def load_prices():
+                    """Цены из Prices API (ждём фоновую загрузку один раз)"""
+                    if 'by_nm_id' not in prices:
                         try:
-                            db_commit_with_retry(db.session)
-                            app.logger.info(f"💾 Batch saved: {processed_in_batch} products ({created_count} new, {updated_count} updated so far)")
-                            processed_in_batch = 0
-                        except Exception as commit_error:
-                            app.logger.warning(f"Batch commit failed, rolling back: {commit_error}")
-                            try:
-                                db.session.rollback()
-                            except Exception:
-                                db.session.remove()
-                            # Продолжаем со следующей batch
+                            fetched_prices = prices_future.result()
+                        except Exception as price_error:
+                            prices['error'] = price_error
+                            prices['by_nm_id'] = {}
+                        else:
+                            app.logger.info(f"✅ Background sync: got {len(fetched_prices)} price records from Prices API")
+                            prices['by_nm_id'] = _prices_by_nm_id(fetched_prices)
+                    return prices['by_nm_id']
+
+                def attach_prices(page):
+                    """Стадия цен: цена карточки, отпечаток и строка products"""
+                    prices_by_nm_id = load_prices()
+                    rows = []
+                    unchanged_nm_ids = []
+                    for card_data in page['cards']:
+                        nm_id = card_data.get('nmID')
+                        if not nm_id:
+                            continue
+
+                        # Skip duplicate nmIDs from API response
+                        if nm_id in seen_nm_ids:
+                            continue
+                        seen_nm_ids.add(nm_id)
+
+                        price = prices_by_nm_id.get(nm_id)
+                        fingerprint = _card_fingerprint(card_data, price)
+                        if product_upserter.is_unchanged(nm_id, fingerprint):
+                            unchanged_nm_ids.append(nm_id)
+                            continue
+                        # Стадия работает в своём потоке — без обращений к ORM-объектам
+                        row = _product_row_from_card(card_data, seller_id, datetime.utcnow())
+                        row['content_hash'] = fingerprint
+                        if price:
+                            if price[0] is not None:
+                                row['price'] = price[0]
+                            if price[1] is not None:
+                                row['discount_price'] = price[1]
+                        rows.append(row)
+                    return dict(page, rows=rows, unchanged_nm_ids=unchanged_nm_ids)
+
+                def write_page(page):
+                    """Стадия записи: пакетный upsert страницы и коммит (с курсором)"""
+                    nonlocal created_count, updated_count, unchanged_count, cards_synced, newest_updated_at
+                    if page['rows']:
+                        result = product_upserter.upsert(page['rows'])
+                        created_count += result.created
+                        updated_count += result.updated
+                    if page['unchanged_nm_ids']:
+                        product_upserter.touch(
+                            page['unchanged_nm_ids'], {'last_sync': datetime.utcnow(), 'is_active': True}
+                        )
+                        unchanged_count += len(page['unchanged_nm_ids'])
+
+                    cards_synced += page['size']
+                    if snapshot_writer is not None:
+                        snapshot_writer.extend(page['cards'])
+                    for card_data in page['cards']:
+                        card_updated_at = _parse_wb_datetime(card_data.get('updatedAt'))
+                        if card_updated_at and (newest_updated_at is None or card_updated_at > newest_updated_at[0]):
+                            newest_updated_at = (card_updated_at, card_data.get('updatedAt'))
+
+                    # При полном обходе страница коммитится вместе с курсором:
+                    # прерванный обход продолжится с него
+                    if full_sync:
+                        _advance_checkpoint(checkpoint, page['size'], page['cursor'])
+                    commit_session(db.session)
+                    app.logger.info(f"💾 product_sync: {cards_synced} cards processed (seller_id={seller_id})")
+
+                # Конвейер: загрузка страниц карточек -> цены и сборка строк -> запись в БД.
+                # Стадии связаны ограниченными очередями, сеть и запись в БД перекрываются
+                try:
+                    SyncPipeline(f"product_sync:{seller_id}") \
+                        .source('fetch_cards', card_pages) \
+                        .stage('prices', attach_prices) \
+                        .sink('db_write', write_page) \
+                        .run()
+                except Exception:
+                    if snapshot_writer is not None:
+                        snapshot_writer.discard()
+                    raise
+
+                if full_sync:
+                    checkpoint.complete_pass()
+                    commit_session(db.session)
 
-                # Сохраняем оставшиеся изменения
+                # Снимок каталога для мониторинга цен и других задач. После
+                # инкрементального обхода возраст снимка остаётся от последнего
+                # полного: удалённые на WB карточки видны только полному обходу
+                if snapshot_writer is not None:
+                    try:
+                        snapshot_writer.commit(merge_previous=not full_sync)
+                    except Exception as snapshot_error:
+                        snapshot_writer.discard()
+                        app.logger.warning(f"⚠️ Failed to update catalog snapshot: {snapshot_error}")
+
+                app.logger.info(
+                    f"💾 Background sync saved: {created_count} new, {updated_count} updated, {unchanged_count} unchanged"
+                    + (f" (resumed after {resumed_cards} cards)" if resumed_cards else "")
+                )
+
+                # Полный обход завершён: товары, которых в нём не было, удалены
+                # или перенесены в корзину на WB — снимаем их с активных
+                deactivated_count = 0
+                if full_sync and cards_synced and checkpoint.last_pass_started_at:
+                    deactivated_count = Product.query.filter(
+                        Product.seller_id == seller.id,
+                        Product.nm_id > 0,
+                        Product.is_active == True,
+                        Product.last_sync < checkpoint.last_pass_started_at,
+                    ).update({'is_active': False}, synchronize_session=False)
+                    if deactivated_count:
+                        app.logger.info(f"🗃️ {deactivated_count} products no longer on WB marked inactive")
+
+                # Водяной знак сдвигаем только после успешной обработки карточек
+                previous_watermark = _parse_wb_datetime(checkpoint.watermark_updated_at)
+                if newest_updated_at and (previous_watermark is None or newest_updated_at[0] > previous_watermark):
+                    checkpoint.watermark_updated_at = newest_updated_at[1]
+                commit_session(db.session)
+
+                # Цены из Prices API (отдельный endpoint!) для товаров, не прошедших
+                # через конвейер (инкрементальный режим, карточки без изменений)
                 try:
-                    db_commit_with_retry(db.session)
-                    if processed_in_batch > 0:
-                        app.logger.info(f"Final batch saved: {processed_in_batch} products")
-                except Exception as commit_error:
-                    app.logger.warning(f"Final commit failed: {commit_error}")
+                    prices_by_nm_id = load_prices()
+                    if 'error' in prices:
+                        raise prices['error']
+
+                    price_updates = []
+                    for product_id, nm_id, price, discount_price in db.session.query(
+                        Product.id, Product.nm_id, Product.price, Product.discount_price
+                    ).filter(Product.seller_id == seller.id):
+                        new_price, new_discount_price = prices_by_nm_id.get(nm_id, (None, None))
+                        update = {'id': product_id}
+                        if new_price is not None and new_price != price:
+                            update['price'] = new_price
+                        if new_discount_price is not None and new_discount_price != discount_price:
+                            update['discount_price'] = new_discount_price
+                        if len(update) > 1:
+                            price_updates.append(update)
+                    if price_updates:
+                        db.session.bulk_update_mappings(Product, price_updates)
+                        commit_session(db.session)
+                    app.logger.info(f"💰 Prices updated for {len(price_updates)} products")
+                except Exception as price_error:
+                    app.logger.warning(f"⚠️ Failed to update prices from Prices API: {price_error}")
                     try:
                         db.session.rollback()
                     except Exception:
                         db.session.remove()
 
-                app.logger.info(f"💾 Background sync saved: {created_count} new, {updated_count} updated")
-
                 # ============ СИНХРОНИЗАЦИЯ ОСТАТКОВ ============
-                # Загружаем остатки из Statistics API
-                app.logger.info(f"📦 Background sync: fetching stocks from Statistics API...")
+                # Остатки из Statistics API (загружены вместе с карточками)
                 stocks_created = 0
                 stocks_updated = 0
                 try:
-                    from datetime import timedelta
-                    date_from = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
-                    all_stocks = client.get_stocks(date_from=date_from)
+                    all_stocks = stocks_future.result()
                     app.logger.info(f"✅ Background sync: got {len(all_stocks)} stock records from Statistics API")
 
-                    # Группируем остатки по nmId и складу
-                    stocks_by_product = {}
-                    for stock_data in all_stocks:
-                        nm_id = stock_data.get('nmId')
-                        warehouse_name = stock_data.get('warehouseName', 'Неизвестный склад')
-
-                        if not nm_id:
-                            continue
-
-                        key = (nm_id, warehouse_name)
-                        if key not in stocks_by_product:
-                            stocks_by_product[key] = {
-                                'nm_id': nm_id,
-                                'warehouse_name': warehouse_name,
-                                'quantity': 0,
-                                'quantity_full': 0,
-                                'in_way_to_client': 0,
-                                'in_way_from_client': 0,
-                            }
-
-                        # Суммируем количества (могут быть разные размеры)
-                        stocks_by_product[key]['quantity'] += stock_data.get('quantity', 0)
-                        stocks_by_product[key]['quantity_full'] += stock_data.get('quantityFull', 0)
-                        stocks_by_product[key]['in_way_to_client'] += stock_data.get('inWayToClient', 0)
-                        stocks_by_product[key]['in_way_from_client'] += stock_data.get('inWayFromClient', 0)
-
-                    app.logger.info(f"📊 Aggregated {len(stocks_by_product)} unique stock records")
-
-                    # Сохраняем остатки в БД
-                    for key, stock_data in stocks_by_product.items():
-                        nm_id = stock_data['nm_id']
-                        warehouse_name = stock_data['warehouse_name']
-
-                        # Находим товар по nm_id
-                        product = Product.query.filter_by(
-                            seller_id=seller.id,
-                            nm_id=nm_id
-                        ).first()
-
-                        if not product:
-                            continue
-
-                        # Генерируем стабильный warehouse_id из имени (hashlib вместо hash())
-                        warehouse_id = int(hashlib.md5(warehouse_name.encode('utf-8')).hexdigest(), 16) % 1000000
-
-                        # Удаляем дубликаты по warehouse_name (оставляем только одну запись)
-                        duplicates = ProductStock.query.filter_by(
-                            product_id=product.id,
-                            warehouse_name=warehouse_name
-                        ).all()
-                        if len(duplicates) > 1:
-                            for dup in duplicates[1:]:
-                                db.session.delete(dup)
-                            stock = duplicates[0]
-                        elif duplicates:
-                            stock = duplicates[0]
-                        else:
-                            stock = None
-
-                        if stock:
-                            stock.warehouse_id = warehouse_id
-                            stock.warehouse_name = warehouse_name
-                            stock.quantity = stock_data['quantity']
-                            stock.quantity_full = stock_data['quantity_full']
-                            stock.in_way_to_client = stock_data['in_way_to_client']
-                            stock.in_way_from_client = stock_data['in_way_from_client']
-                            stock.updated_at = datetime.utcnow()
-                            stocks_updated += 1
-                        else:
-                            stock = ProductStock(
-                                product_id=product.id,
-                                warehouse_id=warehouse_id,
-                                warehouse_name=warehouse_name,
-                                quantity=stock_data['quantity'],
-                                quantity_full=stock_data['quantity_full'],
-                                in_way_to_client=stock_data['in_way_to_client'],
-                                in_way_from_client=stock_data['in_way_from_client']
-                            )
-                            db.session.add(stock)
-                            stocks_created += 1
-
-                    db_commit_with_retry(db.session)
+                    stocks_created, stocks_updated, quantities_updated = _save_seller_stocks(seller.id, all_stocks)
+                    commit_session(db.session)
                     app.logger.info(f"💾 Stocks saved: {stocks_created} new, {stocks_updated} updated")
-
-                    # Обновляем Product.quantity из суммы складских остатков
-                    try:
-                        seller_products = Product.query.filter_by(seller_id=seller.id).all()
-                        product_ids = [p.id for p in seller_products]
-                        if product_ids:
-                            stock_totals = (
-                                db.session.query(
-                                    ProductStock.product_id,
-                                    db.func.coalesce(db.func.sum(ProductStock.quantity), 0).label('total_qty')
-                                )
-                                .filter(ProductStock.product_id.in_(product_ids))
-                                .group_by(ProductStock.product_id)
-                                .all()
-                            )
-                            qty_map = {pid: int(total) for pid, total in stock_totals}
-                            for p in seller_products:
-                                p.quantity = qty_map.get(p.id, 0)
-                            db_commit_with_retry(db.session)
-                            app.logger.info(f"📦 Product.quantity updated for {len(qty_map)} products from stock totals")
-                    except Exception as qty_error:
-                        app.logger.warning(f"⚠️ Failed to update Product.quantity from stocks: {qty_error}")
+                    app.logger.info(f"📦 Product.quantity updated for {quantities_updated} products from stock totals")
 
                 except Exception as stock_error:
                     app.logger.warning(f"⚠️ Failed to fetch stocks from Statistics API: {stock_error}")
                     # Не прерываем синхронизацию из-за ошибки остатков
+                    try:
+                        db.session.rollback()
+                    except Exception:
+                        db.session.remove()
 
                 # Обновляем статус синхронизации
                 seller.api_last_sync = datetime.utcnow()
@@ -2030,12 +2321,15 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                     sync_settings.last_sync_at = datetime.utcnow()
                     sync_settings.last_sync_status = 'success'
                     sync_settings.last_sync_duration = elapsed
-                    sync_settings.products_synced = len(all_cards)
+                    sync_settings.products_synced = cards_synced
                     sync_settings.products_added = created_count
                     sync_settings.products_updated = updated_count
+                    sync_settings.products_deactivated = deactivated_count
+                    sync_settings.products_unchanged = unchanged_count
+                    sync_settings.last_sync_mode = 'full' if full_sync else 'incremental'
                     sync_settings.last_sync_error = None
 
-                db_commit_with_retry(db.session)
+                commit_session(db.session)
 
                 # Логируем успешный запрос
                 APILog.log_request(
@@ -2047,7 +2341,7 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                     success=True
                 )
 
-                app.logger.info(f"✅ Background sync completed in {elapsed:.1f}s: {created_count} new, {updated_count} updated")
+                app.logger.info(f"✅ Background sync completed in {elapsed:.1f}s: {created_count} new, {updated_count} updated, {unchanged_count} unchanged")
 
                 # Уведомляем только если появились НОВЫЕ товары (не рутинное обновление)
                 if created_count > 0:
@@ -2056,7 +2350,7 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                         category='success',
                         title=f'Синхронизация: +{created_count} новых товаров',
                         message=(
-                            f'Загружено {len(all_cards)} товаров с WB: '
+                            f'Загружено {cards_synced} товаров с WB: '
                             f'+{created_count} новых, ~{updated_count} обновлено.'
                         ),
                         link='/products',
@@ -2119,7 +2413,7 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                     if sync_settings:
                         sync_settings.last_sync_status = 'auth_error'
                         sync_settings.last_sync_error = str(e)
-                    db_commit_with_retry(db.session)
+                    commit_session(db.session)
                 app.logger.error(f"❌ Background sync auth error: {str(e)}")
 
         except WBAPIException as e:
@@ -2132,7 +2426,7 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                     if sync_settings:
                         sync_settings.last_sync_status = 'error'
                         sync_settings.last_sync_error = str(e)
-                    db_commit_with_retry(db.session)
+                    commit_session(db.session)
                 app.logger.error(f"❌ Background sync API error: {str(e)}")
 
         except Exception as e:
@@ -2145,7 +2439,7 @@ def _perform_product_sync_task(seller_id: int, flask_app):
                     if sync_settings:
                         sync_settings.last_sync_status = 'error'
                         sync_settings.last_sync_error = str(e)
-                    db_commit_with_retry(db.session)
+                    commit_session(db.session)
                 app.logger.exception(f"❌ Background sync unexpected error: {str(e)}")
 
 
@@ -2193,16 +2487,23 @@ def sync_products():
         current_user.seller.api_sync_status = 'syncing'
         db.session.commit()
 
-        # Запускаем синхронизацию в фоновом потоке
-        thread = threading.Thread(
-            target=_perform_product_sync_task,
+        # Ставим синхронизацию в очередь пула воркеров — ручной запуск идёт
+        # раньше запланированных (full=1 — принудительный полный обход каталога)
+        from services.sync_executor import get_sync_executor, PRIORITY_MANUAL
+        full_sync = request.form.get('full') in ('1', 'true', 'on')
+        queued = get_sync_executor().submit(
+            current_user.seller.id, _perform_product_sync_task,
             args=(current_user.seller.id, app),
-            daemon=True
+            kwargs={'full_sync': full_sync},
+            priority=PRIORITY_MANUAL
         )
-        thread.start()
 
-        flash('Синхронизация товаров запущена в фоновом режиме. Обновите страницу через минуту чтобы увидеть результаты.', 'info')
-        app.logger.info(f"✅ Background product sync started for seller_id={current_user.seller.id}")
+        if queued['state'] == 'queued' and queued['position'] and queued['position'] > 1:
+            flash(f'Синхронизация товаров поставлена в очередь (позиция {queued["position"]}). '
+                  f'Обновите страницу позже чтобы увидеть результаты.', 'info')
+        else:
+            flash('Синхронизация товаров запущена в фоновом режиме. Обновите страницу через минуту чтобы увидеть результаты.', 'info')
+        app.logger.info(f"✅ Background product sync queued for seller_id={current_user.seller.id}: {queued}")
 
     except Exception as e:
         app.logger.exception(f"❌ Failed to start background sync: {str(e)}")
@@ -2232,121 +2533,22 @@ def sync_warehouse_stocks():
             from datetime import timedelta
             date_from = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
 
+            # Statistics API допускает 1 запрос в минуту — остатки моложе минуты берём из снимка каталога
+            from services.catalog_snapshot import get_catalog_snapshots
             app.logger.info(f"🔄 Начинаем загрузку остатков для seller_id={current_user.seller.id}")
-            all_stocks = client.get_stocks(date_from=date_from)
+            all_stocks = get_catalog_snapshots().get(
+                current_user.seller.id, 'stocks',
+                fetch=lambda: client.get_stocks(date_from=date_from),
+                max_age=60
+            ).data
             app.logger.info(f"✅ Получено {len(all_stocks)} записей об остатках из WB API")
 
-            # Статистика
-            created_count = 0
-            updated_count = 0
-
-            # Группируем остатки по nmId и складу (Statistics API может возвращать несколько записей)
-            stocks_by_product = {}
-            for stock_data in all_stocks:
-                nm_id = stock_data.get('nmId')
-                warehouse_name = stock_data.get('warehouseName', 'Неизвестный склад')
-
-                if not nm_id:
-                    continue
-
-                key = (nm_id, warehouse_name)
-                if key not in stocks_by_product:
-                    stocks_by_product[key] = {
-                        'nm_id': nm_id,
-                        'warehouse_name': warehouse_name,
-                        'quantity': 0,
-                        'quantity_full': 0,
-                        'barcode': stock_data.get('barcode', ''),
-                        'subject': stock_data.get('subject', ''),
-                    }
-
-                # Суммируем количества (могут быть разные размеры)
-                stocks_by_product[key]['quantity'] += stock_data.get('quantity', 0)
-                stocks_by_product[key]['quantity_full'] += stock_data.get('quantityFull', 0)
-
-            app.logger.info(f"📊 Агрегировано {len(stocks_by_product)} уникальных записей остатков")
-
-            # Обрабатываем каждую агрегированную запись
-            for key, stock_data in stocks_by_product.items():
-                nm_id = stock_data['nm_id']
-                warehouse_name = stock_data['warehouse_name']
-
-                # Находим товар по nm_id
-                product = Product.query.filter_by(
-                    seller_id=current_user.seller.id,
-                    nm_id=nm_id
-                ).first()
-
-                if not product:
-                    # Товар не найден - пропускаем (возможно не синхронизированы карточки)
-                    continue
-
-                # Генерируем стабильный warehouse_id из имени (hashlib вместо hash())
-                warehouse_id = int(hashlib.md5(warehouse_name.encode('utf-8')).hexdigest(), 16) % 1000000
-
-                # Удаляем дубликаты по warehouse_name (оставляем только одну запись)
-                duplicates = ProductStock.query.filter_by(
-                    product_id=product.id,
-                    warehouse_name=warehouse_name
-                ).all()
-                if len(duplicates) > 1:
-                    for dup in duplicates[1:]:
-                        db.session.delete(dup)
-                    stock = duplicates[0]
-                elif duplicates:
-                    stock = duplicates[0]
-                else:
-                    stock = None
-
-                quantity = stock_data['quantity']
-                quantity_full = stock_data['quantity_full']
-
-                if stock:
-                    # Обновляем существующую запись
-                    stock.warehouse_id = warehouse_id
-                    stock.warehouse_name = warehouse_name
-                    stock.quantity = quantity
-                    stock.quantity_full = quantity_full
-                    stock.updated_at = datetime.utcnow()
-                    updated_count += 1
-                else:
-                    # Создаем новую запись
-                    stock = ProductStock(
-                        product_id=product.id,
-                        warehouse_id=warehouse_id,
-                        warehouse_name=warehouse_name,
-                        quantity=quantity,
-                        quantity_full=quantity_full,
-                        in_way_to_client=0,
-                        in_way_from_client=0
-                    )
-                    db.session.add(stock)
-                    created_count += 1
-
-            # Сохраняем все изменения
+            # Группируем остатки по nmId и складу и сохраняем пакетно
+            created_count, updated_count, quantities_updated = _save_seller_stocks(
+                current_user.seller.id, all_stocks
+            )
             db.session.commit()
-
-            # Обновляем Product.quantity из суммы складских остатков
-            try:
-                seller_products = Product.query.filter_by(seller_id=current_user.seller.id).all()
-                product_ids = [p.id for p in seller_products]
-                if product_ids:
-                    stock_totals = (
-                        db.session.query(
-                            ProductStock.product_id,
-                            db.func.coalesce(db.func.sum(ProductStock.quantity), 0).label('total_qty')
-                        )
-                        .filter(ProductStock.product_id.in_(product_ids))
-                        .group_by(ProductStock.product_id)
-                        .all()
-                    )
-                    qty_map = {pid: int(total) for pid, total in stock_totals}
-                    for p in seller_products:
-                        p.quantity = qty_map.get(p.id, 0)
-                    db.session.commit()
-                    app.logger.info(f"📦 Product.quantity updated for {len(qty_map)} products from stock totals")
-            except Exception as qty_error:
-                app.logger.warning(f"⚠️ Failed to update Product.quantity from stocks: {qty_error}")
+            app.logger.info(f"📦 Product.quantity updated for {quantities_updated} products from stock totals")
 
             app.logger.info(f"💾 Сохранено остатков в БД: {created_count} новых, {updated_count} обновлено")
 
@@ -2428,16 +2630,12 @@ def product_create():
         try:
             wb_client = WildberriesAPIClient(
                 api_key=seller.wb_api_key,
-                db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+                db_logger_callback=APILog.log_request
             )
 
-            # Получаем список родительских категорий
-            parent_categories_response = wb_client.get_parent_categories(locale='ru')
-            parent_categories = parent_categories_response.get('data', [])
-
-            # Получаем список предметов (subjects)
-            subjects_response = wb_client.get_subjects_list(limit=1000)
-            subjects = subjects_response.get('data', [])
+            # Родительские категории и предметы — из кэша справочников WB
+            parent_categories = wb_reference_cache.get_parent_categories(wb_client)
+            subjects = wb_reference_cache.get_subjects(wb_client)
 
             # Группируем subjects по родительским категориям
             subjects_by_category = {}
@@ -2551,7 +2749,7 @@ def product_create():
         # Создаем карточку через API
         wb_client = WildberriesAPIClient(
             api_key=seller.wb_api_key,
-            db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+            db_logger_callback=APILog.log_request
         )
 
         logger.info(f"Creating product card: subjectID={subject_id}, vendorCode={vendor_code}")
@@ -2580,16 +2778,15 @@ def product_create():
         # Запускаем синхронизацию товаров, чтобы получить созданную карточку
         try:
             seller.api_sync_status = 'syncing'
-            db_commit_with_retry(db.session)
-
-            # Запускаем синхронизацию в фоне
-            import threading
-            thread = threading.Thread(
-                target=_perform_product_sync_task,
-                args=(seller.id, app._get_current_object())
+            commit_session(db.session)
+
+            # Ставим синхронизацию в очередь (как ручной запуск)
+            from services.sync_executor import get_sync_executor, PRIORITY_MANUAL
+            get_sync_executor().submit(
+                seller.id, _perform_product_sync_task,
+                args=(seller.id, app._get_current_object()),
+                priority=PRIORITY_MANUAL
             )
-            thread.daemon = True
-            thread.start()
 
             flash('Запущена автоматическая синхронизация товаров', 'info')
         except Exception as e:
@@ -2868,8 +3065,11 @@ def products_bulk_edit():
     filter_type = None  # Тип фильтра для отображения
 
     # Если есть фильтры, получаем товары по фильтрам
+    # Операции читают описание и характеристики каждой карточки — грузим их сразу
     if filter_brand or filter_category:
-        query = Product.query.filter(Product.seller_id == current_user.seller.id)
+        query = Product.query.options(db.undefer_group(DEFERRED_DETAILS)).filter(
+            Product.seller_id == current_user.seller.id
+        )
 
         if filter_brand:
             query = query.filter(Product.brand == filter_brand)
@@ -2894,7 +3094,7 @@ def products_bulk_edit():
             return redirect(url_for('products_list'))
 
         # Получаем выбранные товары
-        products = Product.query.filter(
+        products = Product.query.options(db.undefer_group(DEFERRED_DETAILS)).filter(
             Product.id.in_(selected_ids),
             Product.seller_id == current_user.seller.id
         ).all()
@@ -3062,7 +3262,6 @@ def products_bulk_edit():
                                              products=[p.to_dict() for p in products],
                                              edit_operations=edit_operations)
 
-                    from services.wb_api_client import chunk_list
                     from services.wb_validators import prepare_batch_cards_safe
 
                     desc_map = {}  # nmID -> new_desc
@@ -3081,10 +3280,12 @@ def products_bulk_edit():
                         error_count += 1
                         errors.append(err)
 
-                    BATCH_SIZE = 100
-                    for batch_num, batch in enumerate(chunk_list(cards_to_update, BATCH_SIZE), 1):
+                    for batch_num, (batch, batch_error, _) in enumerate(client.iter_update_cards_batches(
+                            cards_to_update, log_to_db=True, seller_id=current_user.seller.id), 1):
                         try:
-                            client.update_cards_batch(batch, log_to_db=True, seller_id=current_user.seller.id)
+                            # Пачки собираются по размеру, отклонённые WB делятся до конкретных карточек
+                            if batch_error is not None:
+                                raise batch_error
 
                             for card in batch:
                                 nm_id = card['nmID']
@@ -3131,7 +3332,6 @@ def products_bulk_edit():
                                              products=[p.to_dict() for p in products],
                                              edit_operations=edit_operations)
 
-                    from services.wb_api_client import chunk_list
                     from services.wb_validators import prepare_batch_cards_safe
 
                     def _replace_desc_updates(product, full_card):
@@ -3145,10 +3345,12 @@ def products_bulk_edit():
                         error_count += 1
                         errors.append(err)
 
-                    BATCH_SIZE = 100
-                    for batch_num, batch in enumerate(chunk_list(cards_to_update, BATCH_SIZE), 1):
+                    for batch_num, (batch, batch_error, _) in enumerate(client.iter_update_cards_batches(
+                            cards_to_update, log_to_db=True, seller_id=current_user.seller.id), 1):
                         try:
-                            client.update_cards_batch(batch, log_to_db=True, seller_id=current_user.seller.id)
+                            # Пачки собираются по размеру, отклонённые WB делятся до конкретных карточек
+                            if batch_error is not None:
+                                raise batch_error
 
                             for card in batch:
                                 nm_id = card['nmID']
@@ -3244,7 +3446,6 @@ def products_bulk_edit():
                     # ==================== БАТЧИНГ ====================
                     app.logger.info(f"🔄 Preparing {len(products_to_update)} cards for batch update...")
 
-                    from services.wb_api_client import chunk_list
                     from services.wb_validators import prepare_batch_cards_safe
 
                     def _char_updates(product, full_card):
@@ -3282,22 +3483,13 @@ def products_bulk_edit():
                         db.session.commit()
                         return redirect(url_for('products_list'))
 
-                    # Разбиваем на батчи по 100 карточек
-                    BATCH_SIZE = 100
-                    batches = chunk_list(cards_to_update, BATCH_SIZE)
-
-                    app.logger.info(f"📦 Split into {len(batches)} batches (batch size: {BATCH_SIZE})")
-
-                    # Обновляем батчами
-                    for batch_num, batch in enumerate(batches, 1):
+                    # Обновляем пачками максимального допустимого размера (по числу карточек и байтам);
+                    # отклонённые WB пачки делятся до конкретных карточек
+                    for batch_num, (batch, batch_error, _) in enumerate(client.iter_update_cards_batches(
+                            cards_to_update, log_to_db=True, seller_id=current_user.seller.id), 1):
                         try:
-                            app.logger.info(f"📤 Batch {batch_num}/{len(batches)}: updating {len(batch)} cards...")
-
-                            result = client.update_cards_batch(
-                                batch,
-                                log_to_db=True,
-                                seller_id=current_user.seller.id
-                            )
+                            if batch_error is not None:
+                                raise batch_error
 
                             # Обновляем БД для успешно обновленных карточек
                             for card in batch:
@@ -3327,7 +3519,7 @@ def products_bulk_edit():
                                     success_count += 1
 
                             db.session.commit()
-                            app.logger.info(f"✅ Batch {batch_num}/{len(batches)} completed: {len(batch)} cards updated")
+                            app.logger.info(f"✅ Batch {batch_num} completed: {len(batch)} cards updated")
 
                         except Exception as e:
                             error_count += len(batch)
@@ -3414,7 +3606,7 @@ def products_bulk_edit():
                             snapshot_before = _create_product_snapshot(product)
 
                             # Получаем текущие характеристики
-                            current_characteristics = product.get_characteristics()
+                            current_characteristics = list(product.get_characteristics())
 
                             # Проверяем, нет ли уже такой характеристики
                             char_exists = any(str(char.get('id')) == characteristic_id for char in current_characteristics)
@@ -3471,7 +3663,6 @@ def products_bulk_edit():
 
                 elif operation in ('ai_seo_title', 'ai_enhance_description', 'ai_detect_brand'):
                     from services.ai_service import get_ai_service
-                    from services.wb_api_client import chunk_list
                     from services.wb_validators import prepare_card_for_update
 
                     ai_settings = AutoImportSettings.query.filter_by(seller_id=current_user.seller.id).first()
@@ -3576,10 +3767,12 @@ def products_bulk_edit():
 
                     app.logger.info(f"📦 AI operation '{operation}': prepared {len(cards_to_update)} cards")
 
-                    BATCH_SIZE = 100
-                    for batch_num, batch in enumerate(chunk_list(cards_to_update, BATCH_SIZE), 1):
+                    for batch_num, (batch, batch_error, _) in enumerate(client.iter_update_cards_batches(
+                            cards_to_update, log_to_db=True, seller_id=current_user.seller.id), 1):
                         try:
-                            client.update_cards_batch(batch, log_to_db=True, seller_id=current_user.seller.id)
+                            # Пачки собираются по размеру, отклонённые WB делятся до конкретных карточек
+                            if batch_error is not None:
+                                raise batch_error
 
                             for card in batch:
                                 nm_id = card['nmID']
@@ -3665,7 +3858,6 @@ def products_bulk_edit():
 
                 elif operation == 'ai_bulk':
                     from services.ai_service import get_ai_service
-                    from services.wb_api_client import chunk_list
                     from services.wb_validators import prepare_card_for_update
 
                     if not ai_operations_list:
@@ -3816,10 +4008,12 @@ def products_bulk_edit():
 
                     app.logger.info(f"📦 AI bulk: {len(cards_to_update)} cards for WB API update")
 
-                    BATCH_SIZE = 100
-                    for batch_num, batch in enumerate(chunk_list(cards_to_update, BATCH_SIZE), 1):
+                    for batch_num, (batch, batch_error, _) in enumerate(client.iter_update_cards_batches(
+                            cards_to_update, log_to_db=True, seller_id=current_user.seller.id), 1):
                         try:
-                            client.update_cards_batch(batch, log_to_db=True, seller_id=current_user.seller.id)
+                            # Пачки собираются по размеру, отклонённые WB делятся до конкретных карточек
+                            if batch_error is not None:
+                                raise batch_error
 
                             for card in batch:
                                 nm_id = card['nmID']
@@ -3871,7 +4065,6 @@ def products_bulk_edit():
                 if ai_operations_list and operation not in ('ai_bulk', '', None):
                     try:
                         from services.ai_service import get_ai_service
-                        from services.wb_api_client import chunk_list
                         from services.wb_validators import prepare_card_for_update
                         _ai_s_combined = AutoImportSettings.query.filter_by(seller_id=current_user.seller.id).first()
                         _ai_svc = get_ai_service(_ai_s_combined)
@@ -3959,9 +4152,11 @@ def products_bulk_edit():
                                 except Exception as _e:
                                     error_count += 1
                                     errors.append(f"{product.vendor_code} (AI пакет комбо): {str(_e)}")
-                            for _b in chunk_list(_cards_ai, 100):
+                            for _b, _b_error, _ in client.iter_update_cards_batches(
+                                    _cards_ai, log_to_db=True, seller_id=current_user.seller.id):
                                 try:
-                                    client.update_cards_batch(_b, log_to_db=True, seller_id=current_user.seller.id)
+                                    if _b_error is not None:
+                                        raise _b_error
                                     for _c in _b:
                                         _e = _pmap_ai.get(_c['nmID'])
                                         if not _e:
@@ -4322,7 +4517,6 @@ def revert_bulk_edit(bulk_id):
         error_count = 0
         errors = []
 
-        from services.wb_api_client import chunk_list
         from services.wb_validators import prepare_card_for_update, clean_characteristics_for_update
 
         # Готовим карточки для батч-обновления
@@ -4399,11 +4593,13 @@ def revert_bulk_edit(bulk_id):
                     errors.append(f"Товар {product.vendor_code}: ошибка подготовки - {str(e)}")
 
             app.logger.info(f"📦 Prepared {len(cards_to_update)} cards for batch revert")
-            BATCH_SIZE = 100
-            for batch_num, batch in enumerate(chunk_list(cards_to_update, BATCH_SIZE), 1):
+            for batch_num, (batch, batch_error, _) in enumerate(client.iter_update_cards_batches(
+                    cards_to_update, log_to_db=True, seller_id=current_user.seller.id), 1):
                 try:
+                    # Пачки собираются по размеру, отклонённые WB делятся до конкретных карточек
+                    if batch_error is not None:
+                        raise batch_error
                     app.logger.info(f"📤 Revert batch {batch_num}: {len(batch)} cards")
-                    client.update_cards_batch(batch, log_to_db=True, seller_id=current_user.seller.id)
 
                     for card in batch:
                         nm_id = card['nmID']
@@ -4512,7 +4708,7 @@ def api_logs():
 
 # ============= API ENDPOINTS =============
 
-# Кэш для характеристик и справочников WB API
+# Кэш собранных характеристик категорий (справочники WB — в services/wb_reference_cache.py)
 # Формат: {key: (data, timestamp)}
 _characteristics_cache = {}
 _CACHE_TTL = 3600  # 1 час
@@ -4641,26 +4837,13 @@ def api_characteristics_by_category(object_name):
                     app.logger.info(f"✓ Matched '{char_name}' to directory '{directory_type}'")
 
                     if directory_type not in directories:
-                        # Проверяем кэш справочника
-                        dir_cache_key = f"directory_{directory_type}"
-                        cached_dir = _get_from_cache(dir_cache_key)
-
-                        if cached_dir is not None:
-                            directories[directory_type] = cached_dir
-                            app.logger.info(f"💾 Using cached {directory_type} directory: {len(cached_dir)} items")
-                        else:
-                            try:
-                                method_name = f'get_directory_{directory_type}'
-                                method = getattr(client, method_name)
-                                dir_result = method()
-                                directories[directory_type] = dir_result.get('data', [])
-                                app.logger.info(f"✅ Loaded {directory_type} directory: {len(directories[directory_type])} items")
-
-                                # Сохраняем справочник в кэш
-                                _save_to_cache(dir_cache_key, directories[directory_type])
-                            except Exception as e:
-                                app.logger.warning(f"⚠️ Failed to load {directory_type} directory: {e}")
-                                directories[directory_type] = []
+                        # Справочники — из общего кэша справочников WB (на диске)
+                        try:
+                            directories[directory_type] = wb_reference_cache.get_directory(client, directory_type)
+                            app.logger.info(f"✅ Loaded {directory_type} directory: {len(directories[directory_type])} items")
+                        except Exception as e:
+                            app.logger.warning(f"⚠️ Failed to load {directory_type} directory: {e}")
+                            directories[directory_type] = []
                 else:
                     app.logger.debug(f"⊘ No directory mapping for '{char_name}'")
 
@@ -4817,10 +5000,7 @@ def api_characteristics_multi_category():
                         directory_type = get_directory_type(char_name)
                         if directory_type and directory_type not in directories:
                             try:
-                                method_name = f'get_directory_{directory_type}'
-                                method = getattr(client, method_name)
-                                dir_result = method()
-                                directories[directory_type] = dir_result.get('data', [])
+                                directories[directory_type] = wb_reference_cache.get_directory(client, directory_type)
                                 app.logger.info(f"✅ Loaded {directory_type} directory: {len(directories[directory_type])} items")
                             except Exception as e:
                                 app.logger.warning(f"⚠️ Failed to load {directory_type} directory: {e}")
@@ -4935,7 +5115,7 @@ def api_get_characteristics_by_subject(subject_id):
     try:
         wb_client = WildberriesAPIClient(
             api_key=seller.wb_api_key,
-            db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+            db_logger_callback=APILog.log_request
         )
 
         # Получаем конфигурацию характеристик для этой категории
@@ -5344,6 +5524,9 @@ def api_product_sync_status():
         'products_synced': sync_settings.products_synced,
         'products_added': sync_settings.products_added,
         'products_updated': sync_settings.products_updated,
+        'products_deactivated': sync_settings.products_deactivated,
+        'products_unchanged': sync_settings.products_unchanged,
+        'last_sync_mode': sync_settings.last_sync_mode,
         'last_sync_error': sync_settings.last_sync_error,
 
         # Общая статистика
@@ -5351,8 +5534,20 @@ def api_product_sync_status():
         'active_products': Product.query.filter_by(seller_id=seller.id, is_active=True).count(),
     }
 
+    # Свежесть снимка каталога (карточки, цены, остатки)
+    from services.catalog_snapshot import get_catalog_snapshots
+    status_info['catalog_snapshot'] = get_catalog_snapshots().get_info(seller.id)
+
+    # Место в очереди синхронизаций (None — не в очереди и не выполняется)
+    from services.sync_executor import get_sync_executor
+    queue_status = get_sync_executor().get_seller_status(seller.id)
+    status_info['queue'] = queue_status
+
     # Вычисляем прогресс если синхронизация идет
-    if seller.api_sync_status == 'syncing':
+    if queue_status and queue_status['state'] == 'queued':
+        status_info['status_message'] = f"В очереди на синхронизацию (позиция {queue_status['position']})"
+        status_info['can_start_sync'] = queue_status['priority'] != 'manual'
+    elif seller.api_sync_status == 'syncing':
         status_info['status_message'] = 'Синхронизация выполняется...'
         status_info['can_start_sync'] = False
     elif seller.api_sync_status == 'success':
@@ -5446,114 +5641,29 @@ def perform_price_monitoring_sync(seller: Seller, settings: PriceMonitorSettings
     settings.last_sync_at = datetime.utcnow()
     db.session.commit()
 
+    snapshot_writer = None
     try:
         # Создаем клиент API
         wb_client = WildberriesAPIClient(seller.wb_api_key)
 
-        # Получаем ВСЕ товары через cursor-based пагинацию с детальным логированием
-        app.logger.info(f"Starting to fetch all products for seller {seller.id} using cursor-based pagination...")
-
-        all_cards = []
-        cursor_updated_at = None
-        cursor_nm_id = None
-        page_num = 0
-
-        while True:
-            page_num += 1
-            msg = f"📄 Fetching page {page_num} (cursor: updatedAt={cursor_updated_at}, nmID={cursor_nm_id})..."
-            app.logger.info(msg)
-            print(msg, flush=True)  # Явный вывод в stdout для Docker
-
-            try:
-                # Получаем одну страницу
-                data = wb_client.get_cards_list(
-                    limit=100,
-                    cursor_updated_at=cursor_updated_at,
-                    cursor_nm_id=cursor_nm_id
-                )
-            except Exception as e:
-                err_msg = f"❌ Failed to fetch page {page_num}: {str(e)}"
-                app.logger.error(err_msg)
-                print(err_msg, flush=True)
-                raise Exception(f'Failed to fetch products from WB API on page {page_num}: {str(e)}')
-
-            # Получаем карточки из ответа
-            page_cards = data.get('cards', [])
-
-            if not page_cards:
-                msg = f"⏹ No more cards on page {page_num}. Pagination complete."
-                app.logger.info(msg)
-                print(msg, flush=True)
-                break
-
-            all_cards.extend(page_cards)
-            msg = f"✓ Page {page_num}: loaded {len(page_cards)} cards. Total so far: {len(all_cards)}"
-            app.logger.info(msg)
-            print(msg, flush=True)
-
-            # Получаем cursor для следующей страницы
-            cursor = data.get('cursor')
-            if not cursor:
-                msg = f"⏹ No cursor in response on page {page_num}. This is the last page."
-                app.logger.info(msg)
-                print(msg, flush=True)
-                break
-
-            # Логируем total если он есть (но НЕ используем для остановки пагинации)
-            # Причина: WB API v2 может возвращать total=limit (100) вместо реального количества товаров
-            total = cursor.get('total', 0)
-            if total > 0:
-                msg = f"📊 Cursor contains total field: {total} (current loaded: {len(all_cards)}) - continuing pagination..."
-                app.logger.info(msg)
-                print(msg, flush=True)
-
-            # Получаем данные для следующего cursor
-            next_updated_at = cursor.get('updatedAt')
-            next_nm_id = cursor.get('nmID')
-
-            if not next_updated_at or not next_nm_id:
-                msg = f"⏹ No cursor data (updatedAt={next_updated_at}, nmID={next_nm_id}). Last page reached."
-                app.logger.info(msg)
-                print(msg, flush=True)
-                break
-
-            # Проверка на зацикливание
-            if cursor_updated_at == next_updated_at and cursor_nm_id == next_nm_id:
-                msg = f"⚠️  Cursor not changing! Breaking to avoid infinite loop."
-                app.logger.warning(msg)
-                print(msg, flush=True)
-                break
-
-            cursor_updated_at = next_updated_at
-            cursor_nm_id = next_nm_id
-
-            # Ограничение на количество страниц для безопасности
-            if page_num >= 1000:
-                msg = f"⚠️  Reached max pages limit (1000). Stopping."
-                app.logger.warning(msg)
-                print(msg, flush=True)
-                break
-
-        cards = all_cards
-        msg = f"✅ Pagination complete! Fetched {len(cards)} cards in {page_num} pages for seller {seller.id}"
-        app.logger.info(msg)
-        print(msg, flush=True)
-
-        if not cards:
-            app.logger.warning(f"No cards returned from WB API for seller {seller.id}")
-
-        if not isinstance(cards, list):
-            raise Exception(f'Expected cards to be a list, got {type(cards).__name__}')
-
-        # Получаем цены из Prices API (важно! Content API НЕ возвращает цены)
+        # Цены из Prices API (важно! Content API НЕ возвращает цены).
+        # Загружаем их до карточек, чтобы обрабатывать карточки постранично
         msg = f"💰 Fetching prices from Prices API for seller {seller.id}..."
         app.logger.info(msg)
         print(msg, flush=True)
 
+        from services.catalog_snapshot import get_catalog_snapshots
+        catalog_snapshots = get_catalog_snapshots()
+
         prices_by_nm_id = {}
         try:
-            all_prices = wb_client.get_all_goods_prices(batch_size=1000)
-            msg = f"✅ Loaded {len(all_prices)} price records from Prices API"
+            prices_snapshot = catalog_snapshots.get(
+                seller.id, 'prices',
+                fetch=lambda: wb_client.get_all_goods_prices(batch_size=1000)
+            )
+            all_prices = prices_snapshot.data
+            msg = (f"✅ Loaded {len(all_prices)} price records from "
+                   + (f"catalog snapshot ({prices_snapshot.age_seconds:.0f}s old)" if prices_snapshot.from_cache else "Prices API"))
             app.logger.info(msg)
             print(msg, flush=True)
 
@@ -5598,7 +5708,33 @@ def perform_price_monitoring_sync(seller: Seller, settings: PriceMonitorSettings
         products_not_in_db = 0
         products_added = 0
 
-        for card in cards:
+        # Карточки берём из свежего снимка каталога; иначе обходим постранично
+        # (cursor-based пагинация) с сохранением курсора: прерванный мониторинг
+        # продолжится с последней страницы, а полный обход обновит снимок
+        checkpoint = _get_card_checkpoint(seller.id, 'price_monitoring')
+        cards_snapshot = None if checkpoint.has_cursor else catalog_snapshots.peek(seller.id, 'cards')
+        total_cards = 0
+        if cards_snapshot is not None:
+            app.logger.info(
+                f"Using catalog snapshot for seller {seller.id}: {len(cards_snapshot.data)} cards, "
+                f"{cards_snapshot.age_seconds:.0f}s old"
+            )
+            cards_iter = iter(cards_snapshot.data)
+        else:
+            total_cards = checkpoint.cards_processed if checkpoint.has_cursor else 0
+            if not checkpoint.has_cursor:
+                # Полный обход с начала пишет снимок карточек постранично
+                try:
+                    snapshot_writer = catalog_snapshots.writer(seller.id, 'cards', fetched_at=time.time(), key='nmID')
+                except Exception as snapshot_error:
+                    app.logger.warning(f"Failed to start catalog snapshot: {snapshot_error}")
+            app.logger.info(f"Starting to fetch all products for seller {seller.id} using cursor-based pagination...")
+            cards_iter = _iter_cards_checkpointed(wb_client, checkpoint)
+
+        for card in cards_iter:
+            total_cards += 1
+            if snapshot_writer is not None:
+                snapshot_writer.add(card)
             nm_id = card.get('nmID')
             if not nm_id:
                 continue
@@ -5790,6 +5926,15 @@ def perform_price_monitoring_sync(seller: Seller, settings: PriceMonitorSettings
         # Сохраняем все изменения
         db.session.commit()
 
+        if snapshot_writer is not None:
+            if total_cards:
+                snapshot_writer.commit()
+            else:
+                snapshot_writer.discard()
+
+        if not total_cards:
+            app.logger.warning(f"No cards returned from WB API for seller {seller.id}")
+
         # Обновляем статус синхронизации
         settings.last_sync_status = 'success'
         settings.last_sync_error = None
@@ -5799,7 +5944,7 @@ def perform_price_monitoring_sync(seller: Seller, settings: PriceMonitorSettings
 
         return {
             'status': 'success',
-            'total_cards_from_api': len(cards),
+            'total_cards_from_api': total_cards,
             'products_added': products_added,
             'products_checked': products_checked,
             'products_not_in_db': products_not_in_db - products_added,  # Не добавленные (были пропущены)
@@ -5809,6 +5954,9 @@ def perform_price_monitoring_sync(seller: Seller, settings: PriceMonitorSettings
         }
 
     except Exception as e:
+        if snapshot_writer is not None:
+            snapshot_writer.discard()
+
         # Откатываем транзакцию
         db.session.rollback()
 
@@ -5854,94 +6002,94 @@ def create_admin():
     print(f'Администратор {username} успешно создан')
 
 
+@app.cli.command('warmup-wb-reference')
+@click.option('--force', is_flag=True, help='Обновить и свежие справочники')
+def warmup_wb_reference(force):
+    """Заполнить кэш справочников WB (цвета, страны, сезоны, категории, предметы)"""
+    from services.product_sync_scheduler import refresh_wb_reference_cache
+
+    summary = refresh_wb_reference_cache(app, force=force)
+    if summary is None:
+        print('❌ Нет API ключа WB (маркетплейс или продавец) или загрузка не удалась')
+        return
+    print(f"📚 Обновлено: {len(summary['refreshed'])}, свежие: {len(summary['fresh'])}, "
+          f"ошибки: {len(summary['failed'])}")
+    for name, error in summary['failed'].items():
+        print(f"  ❌ {name}: {error}")
+
+
 @app.cli.command()
 def apply_migrations():
-    """Применить миграции базы данных"""
-    import sqlite3
-    from pathlib import Path
+    """Применить миграции базы данных (SQLite или PostgreSQL)"""
+    from sqlalchemy import inspect as sa_inspect
 
     print("🔄 Применение миграций...")
+    print(f"📂 База данных: {db.engine.url.render_as_string(hide_password=True)}")
 
-    # Получаем путь к БД из конфигурации
-    db_url = app.config['SQLALCHEMY_DATABASE_URI']
-    if db_url.startswith('sqlite:///'):
-        db_path = db_url.replace('sqlite:///', '')
-    else:
-        print(f"❌ Неподдерживаемый тип БД: {db_url}")
-        return
-
-    if not Path(db_path).exists():
-        print(f"❌ База данных не найдена: {db_path}")
-        return
+    dialect = dialect_name(db.engine)
+    insp = sa_inspect(db.engine)
+    tables = set(insp.get_table_names())
 
-    print(f"📂 База данных: {db_path}")
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    def columns_of(table):
+        return {c['name'] for c in insp.get_columns(table)} if table in tables else set()
 
     try:
-        # Проверяем существование subject_id
-        cursor.execute("PRAGMA table_info(products)")
-        columns = {row[1] for row in cursor.fetchall()}
+        with db.engine.begin() as conn:
+            def add_columns(table, definitions):
+                for definition in definitions:
+                    conn.exec_driver_sql(portable_ddl(f"ALTER TABLE {table} ADD COLUMN {definition}", dialect))
+
+            # Проверяем существование subject_id
+            columns = columns_of('products')
+            if 'subject_id' in columns:
+                print("  ✓ Колонка subject_id уже существует")
+            else:
+                print("  ➕ Добавление колонки subject_id...")
+                add_columns('products', ['subject_id INTEGER'])
+                print("  ✅ Колонка subject_id добавлена")
+
+            # Миграция: supplier_price для products
+            if 'supplier_price' not in columns:
+                print("  ➕ Добавление колонки supplier_price в products...")
+                add_columns('products', ['supplier_price FLOAT', 'supplier_price_updated_at DATETIME'])
+                print("  ✅ Колонки supplier_price добавлены")
+            else:
+                print("  ✓ Колонка supplier_price уже существует в products")
+
+            # Миграция: pricing поля для imported_products
+            ip_columns = columns_of('imported_products')
+            if ip_columns and 'supplier_price' not in ip_columns:
+                print("  ➕ Добавление колонок ценообразования в imported_products...")
+                add_columns('imported_products', [
+                    'supplier_price FLOAT', 'calculated_price FLOAT',
+                    'calculated_discount_price FLOAT', 'calculated_price_before_discount FLOAT',
+                ])
+                print("  ✅ Колонки ценообразования добавлены в imported_products")
+            elif ip_columns:
+                print("  ✓ Колонки ценообразования уже существуют в imported_products")
 
-        if 'subject_id' in columns:
-            print("  ✓ Колонка subject_id уже существует")
-        else:
-            print("  ➕ Добавление колонки subject_id...")
-            cursor.execute("ALTER TABLE products ADD COLUMN subject_id INTEGER")
-            conn.commit()
-            print("  ✅ Колонка subject_id добавлена")
-
-        # Миграция: supplier_price для products
-        if 'supplier_price' not in columns:
-            print("  ➕ Добавление колонки supplier_price в products...")
-            cursor.execute("ALTER TABLE products ADD COLUMN supplier_price FLOAT")
-            cursor.execute("ALTER TABLE products ADD COLUMN supplier_price_updated_at DATETIME")
-            conn.commit()
-            print("  ✅ Колонки supplier_price добавлены")
-        else:
-            print("  ✓ Колонка supplier_price уже существует в products")
-
-        # Миграция: pricing поля для imported_products
-        cursor.execute("PRAGMA table_info(imported_products)")
-        ip_columns = {row[1] for row in cursor.fetchall()}
-        if ip_columns and 'supplier_price' not in ip_columns:
-            print("  ➕ Добавление колонок ценообразования в imported_products...")
-            cursor.execute("ALTER TABLE imported_products ADD COLUMN supplier_price FLOAT")
-            cursor.execute("ALTER TABLE imported_products ADD COLUMN calculated_price FLOAT")
-            cursor.execute("ALTER TABLE imported_products ADD COLUMN calculated_discount_price FLOAT")
-            cursor.execute("ALTER TABLE imported_products ADD COLUMN calculated_price_before_discount FLOAT")
-            conn.commit()
-            print("  ✅ Колонки ценообразования добавлены в imported_products")
-        elif ip_columns:
-            print("  ✓ Колонки ценообразования уже существуют в imported_products")
-
-        # Создаём таблицу pricing_settings если не существует
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pricing_settings'")
-        if not cursor.fetchone():
-            print("  ➕ Таблица pricing_settings будет создана через db.create_all()")
-        else:
-            print("  ✓ Таблица pricing_settings уже существует")
-
-        # Миграция: image_gen поля для suppliers
-        cursor.execute("PRAGMA table_info(suppliers)")
-        sup_columns = {row[1] for row in cursor.fetchall()}
-        if sup_columns and 'image_gen_enabled' not in sup_columns:
-            print("  ➕ Добавление image_gen полей в suppliers...")
-            cursor.execute("ALTER TABLE suppliers ADD COLUMN image_gen_enabled BOOLEAN DEFAULT 0 NOT NULL")
-            cursor.execute("ALTER TABLE suppliers ADD COLUMN image_gen_provider VARCHAR(50) DEFAULT 'openrouter'")
-            conn.commit()
-            print("  ✅ image_gen поля добавлены в suppliers")
-        elif sup_columns:
-            print("  ✓ image_gen поля уже существуют в suppliers")
+            # Создаём таблицу pricing_settings если не существует
+            if 'pricing_settings' not in tables:
+                print("  ➕ Таблица pricing_settings будет создана через db.create_all()")
+            else:
+                print("  ✓ Таблица pricing_settings уже существует")
+
+            # Миграция: image_gen поля для suppliers
+            sup_columns = columns_of('suppliers')
+            if sup_columns and 'image_gen_enabled' not in sup_columns:
+                print("  ➕ Добавление image_gen полей в suppliers...")
+                add_columns('suppliers', [
+                    'image_gen_enabled BOOLEAN DEFAULT 0 NOT NULL',
+                    "image_gen_provider VARCHAR(50) DEFAULT 'openrouter'",
+                ])
+                print("  ✅ image_gen поля добавлены в suppliers")
+            elif sup_columns:
+                print("  ✓ image_gen поля уже существуют в suppliers")
 
         print("\n✅ Миграции успешно применены!")
 
     except Exception as e:
         print(f"❌ Ошибка при применении миграций: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
 
 
 # ============= АВТОИМПОРТ УДАЛЁН =============
@@ -6057,12 +6205,15 @@ csrf.exempt(internal_api_bp)
 
 
 def _run_startup_migrations():
-    """Безопасно добавляет новые колонки, которых нет в БД."""
-    import sqlite3 as _sqlite3
+    """Безопасно добавляет новые колонки, которых нет в БД.
+
+    DDL написан в синтаксисе SQLite; для PostgreSQL его переводит portable_ddl.
+    """
     from sqlalchemy import inspect as sa_inspect
 
     bind = db.engine
     insp = sa_inspect(bind)
+    dialect = dialect_name(bind)
 
     migrations = [
         # (таблица, колонка, тип)
@@ -6090,6 +6241,15 @@ def _run_startup_migrations():
         ('content_factories', 'ai_model', 'VARCHAR(100)'),
         # Competitor monitor proxy
         ('competitor_monitor_settings', 'proxy_url', 'VARCHAR(500)'),
+        # Incremental product sync
+        ('product_sync_settings', 'products_deactivated', 'INTEGER DEFAULT 0'),
+        ('product_sync_settings', 'last_sync_mode', 'VARCHAR(20)'),
+        ('card_sync_checkpoints', 'last_pass_started_at', 'DATETIME'),
+        ('card_sync_checkpoints', 'last_pass_completed_at', 'DATETIME'),
+        ('card_sync_checkpoints', 'watermark_updated_at', 'VARCHAR(50)'),
+        # Content fingerprint (skip unchanged cards)
+        ('products', 'content_hash', 'VARCHAR(64)'),
+        ('product_sync_settings', 'products_unchanged', 'INTEGER DEFAULT 0'),
     ]
 
     for table, column, col_type in migrations:
@@ -6098,9 +6258,9 @@ def _run_startup_migrations():
         existing = [c['name'] for c in insp.get_columns(table)]
         if column not in existing:
             try:
-                db.session.execute(db.text(
-                    f'ALTER TABLE {table} ADD COLUMN {column} {col_type}'
-                ))
+                db.session.execute(db.text(portable_ddl(
+                    f'ALTER TABLE {table} ADD COLUMN {column} {col_type}', dialect
+                )))
                 db.session.commit()
             except Exception:
                 db.session.rollback()
@@ -6140,7 +6300,7 @@ def _run_startup_migrations():
     # Создаём таблицу prohibited_words если её нет
     if 'prohibited_words' not in insp.get_table_names():
         try:
-            db.session.execute(db.text('''
+            db.session.execute(db.text(portable_ddl('''
                 CREATE TABLE prohibited_words (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     word VARCHAR(100) NOT NULL,
@@ -6152,7 +6312,7 @@ def _run_startup_migrations():
                     created_by_user_id INTEGER REFERENCES users(id),
                     UNIQUE (word, scope, seller_id)
                 )
-            '''))
+            ''', dialect)))
             db.session.execute(db.text('CREATE INDEX idx_prohibited_words_word ON prohibited_words(word)'))
             db.session.execute(db.text('CREATE INDEX idx_prohibited_words_scope ON prohibited_words(scope)'))
             db.session.execute(db.text('CREATE INDEX idx_prohibited_words_seller ON prohibited_words(seller_id)'))
@@ -6219,7 +6379,7 @@ def _run_startup_migrations():
     ]:
         if tbl_name not in insp.get_table_names():
             try:
-                db.session.execute(db.text(tbl_sql))
+                db.session.execute(db.text(portable_ddl(tbl_sql, dialect)))
                 db.session.commit()
                 logger.info(f"Created table '{tbl_name}'")
             except Exception as e:
@@ -6229,7 +6389,7 @@ def _run_startup_migrations():
     # Создаём таблицу finance_snapshots если её нет
     if 'finance_snapshots' not in insp.get_table_names():
         try:
-            db.session.execute(db.text('''
+            db.session.execute(db.text(portable_ddl('''
                 CREATE TABLE finance_snapshots (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     seller_id INTEGER NOT NULL REFERENCES sellers(id),
@@ -6250,7 +6410,7 @@ def _run_startup_migrations():
                     report_rows_count INTEGER DEFAULT 0,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
                 )
-            '''))
+            ''', dialect)))
             db.session.commit()
             logger.info("Created table 'finance_snapshots'")
         except Exception as e:
@@ -6316,7 +6476,7 @@ def _run_startup_migrations():
     ]:
         if tbl_name not in insp.get_table_names():
             try:
-                db.session.execute(db.text(tbl_sql))
+                db.session.execute(db.text(portable_ddl(tbl_sql, dialect)))
                 db.session.commit()
                 logger.info(f"Created table '{tbl_name}'")
             except Exception as e:
@@ -6354,6 +6514,9 @@ def _run_startup_migrations():
             except Exception:
                 db.session.rollback()
 
+    # Полнотекстовый поиск по товарам продавца и каталогу поставщика
+    ensure_search_indexes(bind)
+
 
 # ============= НОВЫЕ СТРАНИЦЫ: АНАЛИТИКА, ФИНАНСЫ, ПРОФИЛЬ, УВЕДОМЛЕНИЯ =============
 
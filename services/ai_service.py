@@ -1776,7 +1776,14 @@ class AIClient:
 
         headers = {'Authorization': auth_header}
 
+        from services.metrics import get_metrics
+        metrics = get_metrics()
+        metrics_endpoint = f"{self.config.provider.value}/chat/completions"
+
         for attempt in range(1, max_retries + 1):
+            if attempt > 1:
+                metrics.record_retry('ai', metrics_endpoint, None)
+            request_started = time.time()
             try:
                 if attempt == 1:
                     logger.info(f"🤖 AI запрос к {self.config.provider.value}: модель={self.config.model}")
@@ -1790,12 +1797,19 @@ class AIClient:
                 # на медленных моделях (GLM-4.7-Flash и др.)
                 connect_timeout = min(self.config.timeout, 30)
                 read_timeout = self.config.timeout
-                response = self._session.post(
-                    url,
-                    json=payload,
-                    headers=headers,
-                    timeout=(connect_timeout, read_timeout)
-                )
+                try:
+                    response = self._session.post(
+                        url,
+                        json=payload,
+                        headers=headers,
+                        timeout=(connect_timeout, read_timeout)
+                    )
+                except requests.exceptions.RequestException as e:
+                    status = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'error'
+                    metrics.observe_request('ai', metrics_endpoint, None, time.time() - request_started, status)
+                    raise
+                metrics.observe_request('ai', metrics_endpoint, None, time.time() - request_started,
+                                        response.status_code)
 
                 # Логируем ответ для отладки
                 if response.status_code != 200:
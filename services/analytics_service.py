@@ -24,7 +24,7 @@ class AnalyticsService:
     def _get_wb_client(seller: Seller) -> WildberriesAPIClient:
         return WildberriesAPIClient(
             api_key=seller.wb_api_key,
-            db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+            db_logger_callback=APILog.log_request
         )
 
     @staticmethod
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновая запись логов запросов к WB API (APILog)
+
+Раньше клиент на каждом запросе с log_to_db синхронно вызывал
+db_logger_callback: сериализовал тело запроса, декодировал ответ целиком
+и коммитил строку APILog — для больших списков карточек и цен это
+мегабайты и лишний коммит на пути запроса.
+
+Теперь клиент только кладёт запись в ограниченную очередь:
+- решение о сохранении (выборка успешных ответов по эндпоинтам,
+  API_LOG_RULES) принимается до сериализации;
+- тело запроса сериализуется, а ответ декодируется и обрезается в фоновом
+  потоке и только для сохраняемых записей;
+- записи вставляются пачками (до API_LOG_BATCH_SIZE) одной транзакцией;
+- при переполнении очереди записи отбрасываются (счётчик dropped),
+  запросы к WB не ждут БД.
+
+Ответы с ошибками (status >= 400, таймауты) сохраняются всегда.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger('wb_api')
+
+# Размер очереди записей (при переполнении новые записи отбрасываются)
+API_LOG_QUEUE_SIZE = int(os.environ.get('API_LOG_QUEUE_SIZE', '10000'))
+
+# Записей на одну транзакцию
+API_LOG_BATCH_SIZE = int(os.environ.get('API_LOG_BATCH_SIZE', '200'))
+
+# Сколько секунд копить пачку после первой записи
+API_LOG_FLUSH_INTERVAL = float(os.environ.get('API_LOG_FLUSH_INTERVAL', '0.5'))
+
+# Максимальная длина сохраняемого тела запроса/ответа (символов)
+API_LOG_MAX_BODY = int(os.environ.get('API_LOG_MAX_BODY', '16384'))
+
+
+class LogRule(NamedTuple):
+    """Правило логирования эндпоинта"""
+    max_body: int  # Максимальная длина тела (символов)
+    sample_rate: float  # Доля сохраняемых успешных ответов
+
+
+# Правила по префиксам эндпоинтов (выбирается самый длинный совпавший префикс)
+API_LOG_RULES: Dict[str, LogRule] = {
+    '/content/v2/get/cards/list': LogRule(max_body=4096, sample_rate=0.1),
+    '/api/v2/list/goods/filter': LogRule(max_body=4096, sample_rate=0.1),
+    '/api/v1/supplier/': LogRule(max_body=2048, sample_rate=0.2),
+    '/api/v2/upload/task': LogRule(max_body=8192, sample_rate=1.0),
+    '/content/v2/cards/update': LogRule(max_body=8192, sample_rate=1.0),
+}
+
+DEFAULT_LOG_RULE = LogRule(max_body=API_LOG_MAX_BODY, sample_rate=1.0)
+
+
+def resolve_log_rule(endpoint: str, rules: Optional[Dict[str, LogRule]] = None) -> LogRule:
+    """Правило логирования для эндпоинта"""
+    rules = API_LOG_RULES if rules is None else rules
+    best = None
+    for prefix in rules:
+        if endpoint.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return rules[best] if best is not None else DEFAULT_LOG_RULE
+
+
+def serialize_request_body(payload: Any) -> Optional[str]:
+    """Тело запроса (json=...) в строку"""
+    if not payload:
+        return None
+    try:
+        return json.dumps(payload, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return str(payload)
+
+
+def truncate_body(text: Optional[str], max_body: int) -> Optional[str]:
+    """Обрезать тело до max_body символов с пометкой об исходном размере"""
+    if text is None or len(text) <= max_body:
+        return text
+    return f"{text[:max_body]}... [truncated, {len(text)} chars total]"
+
+
+def decode_response_body(content: Optional[bytes], encoding: Optional[str], max_body: int) -> Optional[str]:
+    """Декодировать только начало ответа (не больше max_body символов)"""
+    if content is None:
+        return None
+    # В UTF-8 символ занимает до 4 байт — больше декодировать не нужно
+    head = content[:max_body * 4]
+    text = head.decode(encoding or 'utf-8', errors='replace')
+    if len(head) == len(content) and len(text) <= max_body:
+        return text
+    return f"{text[:max_body]}... [truncated, {len(content)} bytes total]"
+
+
+class APILogRecord:
+    """Запись лога до сериализации"""
+    __slots__ = ('callback', 'app', 'rule', 'created_at', 'seller_id', 'endpoint', 'method',
+                 'status_code', 'response_time', 'success', 'error_message',
+                 'request_json', 'response_content', 'response_encoding')
+
+    def to_kwargs(self) -> Dict[str, Any]:
+        """Аргументы APILog.log_request (с сериализацией и обрезкой тел)"""
+        return dict(
+            seller_id=self.seller_id,
+            endpoint=self.endpoint,
+            method=self.method,
+            status_code=self.status_code,
+            response_time=self.response_time,
+            success=self.success,
+            error_message=self.error_message,
+            request_body=truncate_body(serialize_request_body(self.request_json), self.rule.max_body),
+            response_body=decode_response_body(self.response_content, self.response_encoding,
+                                               self.rule.max_body),
+        )
+
+
+class APILogWriter:
+    """
+    Фоновый писатель логов API процесса
+
+    Пример:
+        get_api_log_writer().submit(APILog.log_request, seller_id=1, endpoint=endpoint,
+                                    method='POST', status_code=200, response_time=0.4,
+                                    request_json=payload, response=response)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(
+        self,
+        queue_size: int = API_LOG_QUEUE_SIZE,
+        batch_size: int = API_LOG_BATCH_SIZE,
+        flush_interval: float = API_LOG_FLUSH_INTERVAL,
+        rules: Optional[Dict[str, LogRule]] = None
+    ):
+        """
+        Args:
+            queue_size: Размер очереди записей
+            batch_size: Записей на одну транзакцию
+            flush_interval: Сколько секунд копить пачку
+            rules: Правила по эндпоинтам (вместо API_LOG_RULES)
+        """
+        if self._initialized:
+            return
+
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.rules = rules
+        self._queue: 'queue.Queue[APILogRecord]' = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'sampled_out': 0, 'dropped': 0,
+                       'written': 0, 'failed': 0, 'batches': 0}
+        self._last_drop_warning = 0.0
+        atexit.register(self.flush, 5)
+        self._initialized = True
+
+    def submit(
+        self,
+        callback: Callable,
+        seller_id: int,
+        endpoint: str,
+        method: str,
+        status_code: Optional[int],
+        response_time: float,
+        error_message: Optional[str] = None,
+        request_json: Any = None,
+        response: Any = None
+    ) -> bool:
+        """
+        Поставить запись в очередь
+
+        Args:
+            callback: db_logger_callback клиента (APILog.log_request — пакетная вставка)
+            seller_id: ID продавца
+            endpoint: Эндпоинт
+            method: HTTP метод
+            status_code: Код ответа (None — ответа нет)
+            response_time: Время ответа в секундах
+            error_message: Сообщение об ошибке
+            request_json: Тело запроса (сериализуется в фоне)
+            response: Ответ requests/httpx (сохраняются content и encoding)
+
+        Returns:
+            True если запись поставлена в очередь
+        """
+        success = status_code is not None and status_code < 400
+        rule = resolve_log_rule(endpoint, self.rules)
+        if success and rule.sample_rate < 1.0 and random.random() >= rule.sample_rate:
+            self._count('sampled_out')
+            return False
+
+        record = APILogRecord()
+        record.callback = callback
+        record.app = _current_app()
+        record.rule = rule
+        record.created_at = datetime.utcnow()
+        record.seller_id = seller_id
+        record.endpoint = endpoint
+        record.method = method
+        record.status_code = status_code
+        record.response_time = response_time
+        record.success = success
+        record.error_message = error_message
+        record.request_json = request_json
+        record.response_content = getattr(response, 'content', None) if response is not None else None
+        record.response_encoding = getattr(response, 'encoding', None) if response is not None else None
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            now = time.time()
+            if now - self._last_drop_warning > 60:
+                self._last_drop_warning = now
+                logger.warning(f"⚠️ API log queue is full ({self._queue.maxsize}), dropping records")
+            return False
+        self._count('submitted')
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Дождаться записи всех поставленных в очередь записей
+
+        Returns:
+            True если очередь опустела за timeout
+        """
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики записей и текущий размер очереди"""
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='api-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=max(remaining, 0)) if remaining > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning(f"Failed to write API logs: {e}")
+                self._count('failed', len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[APILogRecord]) -> None:
+        groups: Dict[Any, List[APILogRecord]] = {}
+        for record in batch:
+            groups.setdefault(record.app, []).append(record)
+
+        for app, records in groups.items():
+            if app is None:
+                self._write_records(records)
+            else:
+                with app.app_context():
+                    self._write_records(records)
+        self._count('batches')
+
+    def _write_records(self, records: List[APILogRecord]) -> None:
+        from models import APILog
+
+        rows = []
+        for record in records:
+            try:
+                kwargs = record.to_kwargs()
+            except Exception as e:
+                logger.warning(f"Failed to serialize API log record: {e}")
+                self._count('failed')
+                continue
+
+            if record.callback is APILog.log_request:
+                rows.append(dict(kwargs, created_at=record.created_at))
+                continue
+            try:
+                record.callback(**kwargs)
+                self._count('written')
+            except Exception as e:
+                logger.warning(f"Failed to log to DB: {e}")
+                self._count('failed')
+
+        if rows:
+            try:
+                APILog.log_requests(rows)
+                self._count('written', len(rows))
+            except Exception as e:
+                logger.warning(f"Failed to write {len(rows)} API logs: {e}")
+                self._count('failed', len(rows))
+
+
+def _current_app():
+    """Flask-приложение текущего контекста (для записи из фонового потока)"""
+    try:
+        from flask import current_app, has_app_context
+    except ImportError:
+        return None
+    return current_app._get_current_object() if has_app_context() else None
+
+
+def get_api_log_writer() -> APILogWriter:
+    """Получить писатель логов API процесса"""
+    return APILogWriter()
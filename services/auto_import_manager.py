@@ -1086,7 +1086,19 @@ class AutoImportManager:
 
     def _download_csv(self) -> str:
         """Скачивает CSV файл"""
-        response = requests.get(self.settings.csv_source_url, timeout=60)
+        from services.metrics import get_metrics
+        import time
+
+        metrics_endpoint = f"{self.settings.csv_source_type or 'csv'}/catalog_csv"
+        start = time.time()
+        try:
+            response = requests.get(self.settings.csv_source_url, timeout=60)
+        except requests.exceptions.RequestException as e:
+            status = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'error'
+            get_metrics().observe_request('supplier', metrics_endpoint, self.seller.id, time.time() - start, status)
+            raise
+        get_metrics().observe_request('supplier', metrics_endpoint, self.seller.id, time.time() - start,
+                                      response.status_code)
         response.raise_for_status()
 
         # Определяем кодировку
@@ -1378,7 +1390,8 @@ class AutoImportManager:
 
         # 2. Проверяем Product записи (sizes_json содержит skus с баркодами)
         try:
-            products = Product.query.filter(
+            # Только nm_id и sizes_json — без загрузки остальных колонок карточек
+            products = Product.query.with_entities(Product.nm_id, Product.sizes_json).filter(
                 Product.seller_id == self.seller.id,
                 Product.sizes_json.isnot(None),
             ).all()
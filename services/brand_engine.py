@@ -15,7 +15,7 @@ import threading
 import time
 import unicodedata
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from difflib import SequenceMatcher
 from typing import Dict, List, Optional, Tuple
 
@@ -665,10 +665,14 @@ class BrandEngine:
         """
         Синхронизация справочника брендов маркетплейса в БД.
 
-        Загружает бренды последовательно по включённым категориям,
-        сохраняет в БД батчами по 200 штук.
+        Загружает бренды параллельно по включённым категориям
+        (services/brand_harvest.py) и сохраняет по мере получения: бренды
+        каждого запроса (категория × pattern) коммитятся вместе с его
+        чекпоинтом (BrandHarvestCheckpoint), поэтому прерванная синхронизация
+        продолжается с невыполненных запросов.
         """
-        from models import db, Brand, BrandAlias, MarketplaceBrand, MarketplaceCategory
+        from models import db, BrandHarvestCheckpoint, MarketplaceCategory
+        from services.brand_harvest import BRAND_HARVEST_RESUME_MAX_AGE, BrandHarvester
 
         progress = self._sync_progress.get(marketplace_id)
         if not progress:
@@ -701,52 +705,74 @@ class BrandEngine:
         total_cats = len(subject_ids)
         logger.info(f"Found {total_cats} enabled categories for brand sync")
 
-        # --- Phase 2: Загрузка брендов по категориям ---
+        # --- Phase 2: Чекпоинты прерванной синхронизации ---
+        done = self._load_harvest_checkpoints(marketplace_id, BRAND_HARVEST_RESUME_MAX_AGE)
+        if done:
+            logger.info(f"Resuming brand sync for marketplace #{marketplace_id}: "
+                        f"{len(done)} queries already done")
+
+        # --- Phase 3: Загрузка и сохранение брендов по категориям ---
         # WB API: GET /api/content/v1/brands требует subjectId (обязателен) + pattern + top
-        # Перебираем категории, для каждой делаем запросы с ключевыми буквами алфавита.
         update_progress(
             phase='fetching',
             categories_total=total_cats,
+            resumed_queries=len(done),
             message=f'Загрузка брендов из {total_cats} категорий...',
         )
 
-        all_brands = {}  # ext_id -> name
+        saved_ids = set()  # ext_id брендов, сохранённых в этом запуске
 
-        def on_progress(done, total, brands_count):
+        def on_result(result):
+            fresh = [(b['id'], b.get('name', '')) for b in result.new_brands
+                     if b['id'] not in saved_ids and b.get('name')]
+            try:
+                for ext_id, name in fresh:
+                    try:
+                        self._save_marketplace_brand(marketplace_id, ext_id, name, stats)
+                    except Exception as e:
+                        logger.warning(f"Failed to save brand '{name}': {e}")
+                        stats['errors'] += 1
+                db.session.add(BrandHarvestCheckpoint(
+                    marketplace_id=marketplace_id,
+                    subject_id=result.subject_id,
+                    pattern=result.pattern,
+                    brands_found=len(result.brands),
+                    new_brands=len(result.new_brands),
+                    hit_top=result.hit_top,
+                ))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to commit brands of subjectId={result.subject_id} "
+                             f"pattern='{result.pattern}': {e}")
+                stats['errors'] += 1
+                return
+
+            saved_ids.update(ext_id for ext_id, _ in fresh)
+            update_progress(brands_saved=len(saved_ids), brands_total=len(saved_ids))
+
+        def on_subject_done(done_count, total, brands_count):
             update_progress(
-                categories_done=done,
+                categories_done=done_count,
                 categories_total=total,
                 brands_found=brands_count,
-                message=f'Категории: {done}/{total}, найдено брендов: {brands_count}',
+                message=f'Категории: {done_count}/{total}, найдено брендов: {brands_count}',
             )
 
+        harvester = BrandHarvester(marketplace_client, top=5000)
+        harvest_stats = {}
         try:
-            result = marketplace_client.fetch_all_brands(
-                subject_ids=subject_ids,
-                top=5000,
-                progress_callback=on_progress,
+            harvest_stats = harvester.run(
+                subject_ids, done=done, on_result=on_result, on_subject_done=on_subject_done,
             )
-            data = result.get('data', [])
-
-            # Диагностика
-            sample = []
-            if isinstance(data, list) and data:
-                sample = [{'id': b.get('id'), 'name': b.get('name')} for b in data[:3]]
             debug_info = {
-                'method': 'fetch_all_brands (per-category + key patterns)',
-                'total_brands': len(data) if isinstance(data, list) else 'N/A',
-                'sample': sample,
+                'method': 'BrandHarvester (parallel, adaptive patterns, checkpoints)',
+                'total_brands': len(saved_ids),
+                'harvest': harvest_stats,
             }
-            if hasattr(marketplace_client, '_fetch_debug') and marketplace_client._fetch_debug:
-                debug_info['first_request'] = marketplace_client._fetch_debug
+            if harvester.debug:
+                debug_info['first_request'] = harvester.debug
             update_progress(_debug_first_response=debug_info)
-
-            if isinstance(data, list):
-                for brand_data in data:
-                    ext_id = brand_data.get('id')
-                    name = brand_data.get('name', '')
-                    if ext_id and name:
-                        all_brands[ext_id] = name
         except Exception as e:
             logger.error(f"Failed to fetch brands: {e}", exc_info=True)
             stats['errors'] += 1
@@ -755,99 +781,19 @@ class BrandEngine:
                 'type': type(e).__name__,
             })
 
-        stats['total_fetched'] = len(all_brands)
-        logger.info(f"Fetched {len(all_brands)} unique brands from {total_cats} categories")
-
-        # --- Phase 3: Сохранение в БД батчами ---
-        update_progress(
-            phase='saving',
-            brands_total=len(all_brands),
-            brands_saved=0,
-            message=f'Сохранение {len(all_brands)} брендов...',
-        )
-
-        brand_items = list(all_brands.items())
-        save_batch_size = 200
-        saved = 0
-
-        for batch_start in range(0, len(brand_items), save_batch_size):
-            batch = brand_items[batch_start:batch_start + save_batch_size]
-
-            for ext_id, name in batch:
-                try:
-                    name_norm = normalize_for_comparison(name)
-
-                    # Глобальный бренд
-                    brand = Brand.query.filter_by(name_normalized=name_norm).first()
-                    if brand:
-                        if brand.status == 'pending':
-                            brand.status = 'verified'
-                        brand.updated_at = datetime.utcnow()
-                        stats['updated'] += 1
-                    else:
-                        brand = Brand(
-                            name=name,
-                            name_normalized=name_norm,
-                            status='verified',
-                        )
-                        db.session.add(brand)
-                        db.session.flush()
-
-                        existing = BrandAlias.query.filter_by(alias_normalized=name_norm).first()
-                        if not existing:
-                            alias = BrandAlias(
-                                brand_id=brand.id,
-                                alias=name,
-                                alias_normalized=name_norm,
-                                source='marketplace_sync',
-                                confidence=1.0,
-                            )
-                            db.session.add(alias)
-
-                        stats['created'] += 1
+        stats['total_fetched'] = len(saved_ids)
+        for key in ('queries', 'resumed_queries', 'expanded_patterns', 'skipped_patterns', 'failed_queries'):
+            stats[key] = harvest_stats.get(key, 0)
+        logger.info(f"Fetched {len(saved_ids)} unique brands from {total_cats} categories")
 
-                    # Привязка к маркетплейсу
-                    mp_brand = MarketplaceBrand.query.filter_by(
-                        brand_id=brand.id,
-                        marketplace_id=marketplace_id,
-                    ).first()
-
-                    if not mp_brand:
-                        mp_brand = MarketplaceBrand(
-                            brand_id=brand.id,
-                            marketplace_id=marketplace_id,
-                            marketplace_brand_name=name,
-                            marketplace_brand_id=ext_id,
-                            status='verified',
-                            verified_at=datetime.utcnow(),
-                        )
-                        db.session.add(mp_brand)
-                        stats['mp_created'] += 1
-                    else:
-                        if not mp_brand.marketplace_brand_id:
-                            mp_brand.marketplace_brand_id = ext_id
-                        mp_brand.marketplace_brand_name = name
-                        if mp_brand.status == 'pending':
-                            mp_brand.status = 'verified'
-                            mp_brand.verified_at = datetime.utcnow()
-
-                except Exception as e:
-                    logger.warning(f"Failed to save brand '{name}': {e}")
-                    stats['errors'] += 1
-
-            # Коммитим батч
+        # Полный сбор без ошибок — чекпоинты больше не нужны, следующий запуск начнётся заново
+        if harvest_stats and not harvest_stats.get('failed_queries') and not stats['errors']:
             try:
+                BrandHarvestCheckpoint.query.filter_by(marketplace_id=marketplace_id).delete()
                 db.session.commit()
             except Exception as e:
                 db.session.rollback()
-                logger.error(f"Failed to commit brand batch: {e}")
-                stats['errors'] += len(batch)
-
-            saved += len(batch)
-            update_progress(
-                brands_saved=saved,
-                message=f'Сохранено: {saved}/{len(all_brands)} брендов...',
-            )
+                logger.warning(f"Failed to clear brand harvest checkpoints: {e}")
 
         self.invalidate_cache()
 
@@ -862,6 +808,80 @@ class BrandEngine:
         logger.info(f"Brand sync for marketplace #{marketplace_id} complete: {stats}")
         return stats
 
+    def _load_harvest_checkpoints(self, marketplace_id: int, max_age: int) -> dict:
+        """Выполненные запросы прерванной синхронизации: (subject_id, pattern) -> DoneQuery."""
+        from models import db, BrandHarvestCheckpoint
+        from services.brand_harvest import DoneQuery
+
+        checkpoints = BrandHarvestCheckpoint.query.filter_by(marketplace_id=marketplace_id).all()
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+        if any(c.completed_at < cutoff for c in checkpoints):
+            # Прерванная синхронизация слишком старая — бренды могли измениться
+            BrandHarvestCheckpoint.query.filter_by(marketplace_id=marketplace_id).delete()
+            db.session.commit()
+            return {}
+        return {(c.subject_id, c.pattern): DoneQuery(c.new_brands, c.hit_top) for c in checkpoints}
+
+    def _save_marketplace_brand(self, marketplace_id: int, ext_id: int, name: str, stats: dict) -> None:
+        """Создать/обновить глобальный бренд, алиас и привязку к маркетплейсу (без коммита)."""
+        from models import db, Brand, BrandAlias, MarketplaceBrand
+
+        name_norm = normalize_for_comparison(name)
+
+        # Глобальный бренд
+        brand = Brand.query.filter_by(name_normalized=name_norm).first()
+        if brand:
+            if brand.status == 'pending':
+                brand.status = 'verified'
+            brand.updated_at = datetime.utcnow()
+            stats['updated'] += 1
+        else:
+            brand = Brand(
+                name=name,
+                name_normalized=name_norm,
+                status='verified',
+            )
+            db.session.add(brand)
+            db.session.flush()
+
+            existing = BrandAlias.query.filter_by(alias_normalized=name_norm).first()
+            if not existing:
+                alias = BrandAlias(
+                    brand_id=brand.id,
+                    alias=name,
+                    alias_normalized=name_norm,
+                    source='marketplace_sync',
+                    confidence=1.0,
+                )
+                db.session.add(alias)
+
+            stats['created'] += 1
+
+        # Привязка к маркетплейсу
+        mp_brand = MarketplaceBrand.query.filter_by(
+            brand_id=brand.id,
+            marketplace_id=marketplace_id,
+        ).first()
+
+        if not mp_brand:
+            mp_brand = MarketplaceBrand(
+                brand_id=brand.id,
+                marketplace_id=marketplace_id,
+                marketplace_brand_name=name,
+                marketplace_brand_id=ext_id,
+                status='verified',
+                verified_at=datetime.utcnow(),
+            )
+            db.session.add(mp_brand)
+            stats['mp_created'] += 1
+        else:
+            if not mp_brand.marketplace_brand_id:
+                mp_brand.marketplace_brand_id = ext_id
+            mp_brand.marketplace_brand_name = name
+            if mp_brand.status == 'pending':
+                mp_brand.status = 'verified'
+                mp_brand.verified_at = datetime.utcnow()
+
     # Backward-compatible alias
     def sync_wb_brands(self, wb_client) -> dict:
         """Обратная совместимость: синхронизация WB брендов."""
@@ -1057,8 +1077,6 @@ class BrandEngine:
                     mp_brand.status = 'needs_review'
                     stats['invalidated'] += 1
 
-                time.sleep(0.2)
-
             except Exception as e:
                 logger.warning(f"Revalidation failed for mp_brand '{mp_brand.marketplace_brand_name}': {e}")
                 stats['errors'] += 1
@@ -1116,8 +1134,6 @@ class BrandEngine:
                 else:
                     stats['still_pending'] += 1
 
-                time.sleep(0.3)
-
             except Exception as e:
                 logger.warning(f"Auto-resolve failed for brand '{brand.name}': {e}")
                 stats['errors'] += 1
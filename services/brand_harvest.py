@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельный сбор брендов WB по категориям (GET /api/content/v1/brands)
+
+API отдаёт бренды категории только по строке поиска (pattern) и не больше
+top штук на запрос, поэтому справочник собирается перебором pattern по
+каждой категории. Раньше перебор шёл последовательно со sleep между
+запросами и начинался заново после любого сбоя.
+
+Сборщик:
+- выполняет запросы (категория, pattern) в BRAND_HARVEST_WORKERS потоках;
+  темп задаёт общий rate limiter content API, фиксированных пауз нет;
+- адаптивно выбирает pattern: если ответ упёрся в top и принёс новые
+  бренды, pattern расширяется до двухбуквенных префиксов; если
+  BRAND_HARVEST_SATURATION запросов категории подряд не принесли новых
+  брендов, оставшиеся однобуквенные pattern категории пропускаются;
+- отдаёт результат каждого запроса вызывающему (в его потоке), чтобы тот
+  сохранил бренды и чекпоинт (см. BrandHarvestCheckpoint), и пропускает
+  запросы, выполненные в прерванном сборе.
+"""
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from services.wb_api_client import WBRateLimitException
+
+logger = logging.getLogger('wb_api')
+
+# Одновременных запросов сбора
+BRAND_HARVEST_WORKERS = int(os.environ.get('BRAND_HARVEST_WORKERS', '4'))
+
+# Сколько запросов категории подряд без новых брендов считаются насыщением
+BRAND_HARVEST_SATURATION = int(os.environ.get('BRAND_HARVEST_SATURATION', '4'))
+
+# Базовые pattern (гласные + частые согласные + цифра)
+BRAND_HARVEST_PATTERNS = 'аеиокстнрabcdemost1'
+
+# Попыток на запрос (429 и сетевые ошибки)
+BRAND_HARVEST_MAX_ATTEMPTS = 3
+
+# Чекпоинты старше (сек) не продолжаются — сбор начинается заново
+BRAND_HARVEST_RESUME_MAX_AGE = int(os.environ.get('BRAND_HARVEST_RESUME_MAX_AGE', str(3 * 24 * 3600)))
+
+# Максимальная длина pattern при расширении
+BRAND_HARVEST_MAX_PATTERN_LENGTH = 2
+
+_EXPANSION_ALPHABETS = (
+    'абвгдеёжзийклмнопрстуфхцчшщыэюя',
+    'abcdefghijklmnopqrstuvwxyz',
+    '0123456789',
+)
+
+
+class HarvestResult(NamedTuple):
+    """Результат запроса (категория, pattern)"""
+    subject_id: int
+    pattern: str
+    brands: List[Dict[str, Any]]  # все бренды ответа
+    new_brands: List[Dict[str, Any]]  # бренды, которых ещё не было в категории
+    hit_top: bool  # ответ упёрся в top
+
+
+class DoneQuery(NamedTuple):
+    """Запрос, выполненный в прерванном сборе (из чекпоинта)"""
+    new_brands: int
+    hit_top: bool
+
+
+def expand_pattern(pattern: str) -> List[str]:
+    """Двухбуквенные префиксы для pattern, ответ на который упёрся в top"""
+    last = pattern[-1:].lower()
+    for alphabet in _EXPANSION_ALPHABETS:
+        if last in alphabet:
+            return [pattern + letter for letter in alphabet]
+    return []
+
+
+class _SubjectState:
+    def __init__(self):
+        self.pending: Deque[Tuple[str, int]] = deque()  # (pattern, попытка)
+        self.seen: Set[Any] = set()
+        self.dry_streak = 0
+        self.in_flight = 0
+
+
+class BrandHarvester:
+    """
+    Сборщик брендов по категориям
+
+    Пример:
+        harvester = BrandHarvester(client, top=5000)
+        stats = harvester.run(subject_ids, on_result=save_result)
+    """
+
+    def __init__(
+        self,
+        client,
+        top: int = 5000,
+        workers: Optional[int] = None,
+        patterns: Optional[Iterable[str]] = None,
+        saturation: Optional[int] = None
+    ):
+        """
+        Args:
+            client: WildberriesAPIClient (get_brands_by_subject_quick)
+            top: Максимум брендов на запрос
+            workers: Одновременных запросов (по умолчанию BRAND_HARVEST_WORKERS)
+            patterns: Базовые pattern (по умолчанию BRAND_HARVEST_PATTERNS)
+            saturation: Запросов подряд без новых брендов до пропуска остальных
+                однобуквенных pattern категории (по умолчанию BRAND_HARVEST_SATURATION)
+        """
+        self.client = client
+        self.top = top
+        self.workers = max(1, workers or BRAND_HARVEST_WORKERS)
+        self.patterns = list(patterns or BRAND_HARVEST_PATTERNS)
+        self.saturation = max(1, saturation or BRAND_HARVEST_SATURATION)
+        self.debug: Optional[Dict[str, Any]] = None
+        self.stats = {
+            'queries': 0, 'resumed_queries': 0, 'expanded_patterns': 0,
+            'skipped_patterns': 0, 'retries': 0, 'failed_queries': 0, 'brands_found': 0,
+        }
+
+    def _fetch(self, subject_id: int, pattern: str) -> Dict[str, Any]:
+        # Большие ответы сбора не кэшируем — вытеснили бы полезные записи кэша ответов
+        return self.client.get_brands_by_subject_quick(
+            subject_id, pattern=pattern, top=self.top, use_cache=False
+        )
+
+    def run(
+        self,
+        subject_ids: Iterable[int],
+        done: Optional[Dict[Tuple[int, str], DoneQuery]] = None,
+        on_result: Optional[Callable[[HarvestResult], None]] = None,
+        on_subject_done: Optional[Callable[[int, int, int], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Собрать бренды категорий
+
+        Args:
+            subject_ids: ID предметов (subjectID)
+            done: Запросы, выполненные в прерванном сборе: (subject_id, pattern) -> DoneQuery
+            on_result: Вызывается для каждого выполненного запроса (в потоке вызывающего)
+            on_subject_done: callable(subjects_done, subjects_total, brands_found)
+
+        Returns:
+            Статистика сбора
+        """
+        done = done or {}
+        subject_ids = list(dict.fromkeys(subject_ids))
+        states: Dict[int, _SubjectState] = {}
+        for subject_id in subject_ids:
+            state = states[subject_id] = _SubjectState()
+            self._restore(state, subject_id, done)
+
+        subjects_done = 0
+        brand_ids: Set[Any] = set()
+
+        def finish_if_done(subject_id: int) -> None:
+            nonlocal subjects_done
+            state = states[subject_id]
+            if state.pending or state.in_flight:
+                return
+            states.pop(subject_id)
+            subjects_done += 1
+            if on_subject_done:
+                on_subject_done(subjects_done, len(subject_ids), len(brand_ids))
+
+        for subject_id in list(states):
+            finish_if_done(subject_id)
+
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='brand-harvest') as executor:
+            while True:
+                # Заполняем пул: сначала категории, начатые раньше (меньше открытых категорий)
+                for subject_id, state in list(states.items()):
+                    while state.pending and len(in_flight) < self.workers:
+                        pattern, attempt = state.pending.popleft()
+                        future = executor.submit(self._fetch, subject_id, pattern)
+                        in_flight[future] = (subject_id, pattern, attempt)
+                        state.in_flight += 1
+                    if len(in_flight) >= self.workers:
+                        break
+
+                if not in_flight:
+                    break
+
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    subject_id, pattern, attempt = in_flight.pop(future)
+                    state = states[subject_id]
+                    state.in_flight -= 1
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        self._handle_error(state, subject_id, pattern, attempt, e)
+                    else:
+                        result = self._handle_result(state, subject_id, pattern, response, done)
+                        brand_ids.update(b.get('id') for b in result.new_brands)
+                        if on_result:
+                            on_result(result)
+                    finish_if_done(subject_id)
+
+        self.stats['brands_found'] = len(brand_ids)
+        logger.info(f"🏷️ Brand harvest: {len(subject_ids)} categories, {self.stats}")
+        return dict(self.stats)
+
+    def _restore(self, state: _SubjectState, subject_id: int,
+                 done: Dict[Tuple[int, str], DoneQuery]) -> None:
+        """
+        Очередь pattern категории с учётом прерванного сбора
+
+        Выполненные запросы не повторяются, но их результаты воспроизводятся
+        по порядку pattern: расширения и насыщение категории те же, что были бы
+        при непрерывном сборе.
+        """
+        queue = list(self.patterns)
+        while queue:
+            pattern = queue.pop(0)
+            previous = done.get((subject_id, pattern))
+            if previous is None:
+                if len(pattern) == 1 and state.dry_streak >= self.saturation:
+                    self.stats['skipped_patterns'] += 1
+                else:
+                    state.pending.append((pattern, 1))
+                continue
+
+            self.stats['resumed_queries'] += 1
+            if previous.hit_top and previous.new_brands and len(pattern) < BRAND_HARVEST_MAX_PATTERN_LENGTH:
+                queue[0:0] = expand_pattern(pattern)
+            if previous.new_brands or previous.hit_top:
+                state.dry_streak = 0
+            else:
+                state.dry_streak += 1
+
+    def _handle_result(self, state: _SubjectState, subject_id: int, pattern: str,
+                       response: Dict[str, Any], done: Dict[Tuple[int, str], DoneQuery]) -> HarvestResult:
+        self.stats['queries'] += 1
+        brands = [b for b in (response.get('brands') or []) if b.get('id')]
+        new_brands = [b for b in brands if b['id'] not in state.seen]
+        state.seen.update(b['id'] for b in new_brands)
+        hit_top = len(brands) >= self.top
+
+        if hit_top and new_brands and len(pattern) < BRAND_HARVEST_MAX_PATTERN_LENGTH:
+            # Ответ обрезан — уточняем pattern (уточнения — в начало очереди категории)
+            expansions = [p for p in expand_pattern(pattern) if (subject_id, p) not in done]
+            state.pending.extendleft((p, 1) for p in reversed(expansions))
+            self.stats['expanded_patterns'] += len(expansions)
+
+        if new_brands or hit_top:
+            state.dry_streak = 0
+        else:
+            state.dry_streak += 1
+            if state.dry_streak >= self.saturation:
+                # Категория насыщена — однобуквенные pattern дальше ничего не дадут
+                skipped = [item for item in state.pending if len(item[0]) == 1]
+                if skipped:
+                    state.pending = deque(item for item in state.pending if len(item[0]) > 1)
+                    self.stats['skipped_patterns'] += len(skipped)
+
+        return HarvestResult(subject_id, pattern, brands, new_brands, hit_top)
+
+    def _handle_error(self, state: _SubjectState, subject_id: int, pattern: str,
+                      attempt: int, error: Exception) -> None:
+        if attempt < BRAND_HARVEST_MAX_ATTEMPTS:
+            # Повтор в конец очереди категории; темп повторов задаёт общий rate limiter
+            self.stats['retries'] += 1
+            state.pending.append((pattern, attempt + 1))
+            level = logging.INFO if isinstance(error, WBRateLimitException) else logging.WARNING
+            logger.log(level, f"Brands subjectId={subject_id} pattern='{pattern}' failed "
+                              f"(attempt {attempt}): {error}, retrying")
+            return
+
+        self.stats['failed_queries'] += 1
+        if not self.debug:
+            self.debug = {'error': f'{type(error).__name__}: {str(error)[:300]}',
+                          'pattern': pattern, 'subjectId': subject_id}
+        logger.warning(f"Failed brands subjectId={subject_id} pattern='{pattern}': {error}")
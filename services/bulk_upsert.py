@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетный upsert строк по естественному ключу
+
+Вместо SELECT на каждую строку (Model.query.filter_by(...).first()) существующие
+строки загружаются одним запросом (ключ -> id), после чего новые строки
+вставляются bulk_insert_mappings, а существующие обновляются
+bulk_update_mappings — пачками по BULK_UPSERT_BATCH_SIZE. Синхронизация
+каталога на тысячи карточек укладывается в несколько SQL-запросов.
+
+Используется фоновой синхронизацией товаров и остатков, а также синхронизацией
+заблокированных/скрытых карточек.
+"""
+import logging
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки для bulk insert/update
+BULK_UPSERT_BATCH_SIZE = int(os.environ.get('BULK_UPSERT_BATCH_SIZE', '500'))
+
+
+class UpsertResult(NamedTuple):
+    """Итог upsert: сколько строк вставлено и обновлено"""
+    created: int
+    updated: int
+
+
+class BulkUpserter:
+    """
+    Пакетный upsert строк модели по естественному ключу
+
+    Пример:
+        upserter = BulkUpserter(db.session, Product, ('nm_id',),
+                                filters=(Product.seller_id == seller_id,),
+                                insert_only=('seller_id', 'nm_id', 'imt_id'))
+        result = upserter.upsert(rows)
+
+    Строка — dict с именами колонок. Колонки из insert_only пишутся только
+    при вставке. Если по ключу в БД несколько строк, берётся строка
+    с наименьшим id, остальные доступны в duplicate_ids (см. delete_duplicates).
+    Коммит — за вызывающим.
+
+    С fingerprint_column вместе с id загружается отпечаток содержимого строки:
+    is_unchanged() позволяет не собирать и не перезаписывать строку, отпечаток
+    которой не изменился, а touch() — обновить у таких строк пару служебных
+    колонок одним UPDATE.
+    """
+
+    def __init__(
+        self,
+        session,
+        model,
+        key_columns: Sequence[str],
+        filters: Sequence[Any] = (),
+        insert_only: Sequence[str] = (),
+        batch_size: int = BULK_UPSERT_BATCH_SIZE,
+        fingerprint_column: Optional[str] = None
+    ):
+        """
+        Args:
+            session: SQLAlchemy session
+            model: Класс модели (с первичным ключом id)
+            key_columns: Колонки естественного ключа
+            filters: Условия, ограничивающие загружаемые строки (например, seller_id)
+            insert_only: Колонки, которые не перезаписываются при обновлении
+            batch_size: Размер пачки
+            fingerprint_column: Колонка с отпечатком содержимого строки
+        """
+        self.session = session
+        self.model = model
+        self.key_columns = tuple(key_columns)
+        self.insert_only = set(insert_only)
+        self.batch_size = max(1, batch_size)
+        self.fingerprint_column = fingerprint_column
+
+        self.key_map: Dict[Any, int] = {}
+        self.fingerprints: Dict[Any, Optional[str]] = {}
+        self.duplicate_ids: List[int] = []
+
+        columns = [getattr(model, name) for name in self.key_columns]
+        if fingerprint_column:
+            columns.append(getattr(model, fingerprint_column))
+        key_size = len(self.key_columns)
+        query = session.query(model.id, *columns).filter(*filters).order_by(model.id)
+        for row in query:
+            key = self._row_key(row[1:key_size + 1])
+            if key in self.key_map:
+                self.duplicate_ids.append(row[0])
+            else:
+                self.key_map[key] = row[0]
+                if fingerprint_column:
+                    self.fingerprints[key] = row[key_size + 1]
+
+    def _row_key(self, values: Sequence[Any]):
+        return values[0] if len(self.key_columns) == 1 else tuple(values)
+
+    def key_of(self, row: Dict[str, Any]):
+        """Ключ строки"""
+        return self._row_key([row[name] for name in self.key_columns])
+
+    def get_id(self, key) -> Any:
+        """id существующей строки по ключу (None если строки нет)"""
+        return self.key_map.get(key)
+
+    def is_unchanged(self, key, fingerprint: Optional[str]) -> bool:
+        """Строка с таким ключом уже есть и её отпечаток совпадает"""
+        return (
+            fingerprint is not None
+            and key in self.key_map
+            and self.fingerprints.get(key) == fingerprint
+        )
+
+    def touch(self, keys: Iterable[Any], values: Dict[str, Any]) -> int:
+        """
+        Обновить служебные колонки существующих строк (без остального содержимого)
+
+        Args:
+            keys: Ключи строк
+            values: Колонки и значения (одинаковые для всех строк)
+
+        Returns:
+            Количество обновлённых строк
+        """
+        ids = [self.key_map[key] for key in keys if key in self.key_map]
+        touched = 0
+        for chunk in _chunks(ids, self.batch_size):
+            touched += self.session.query(self.model).filter(
+                self.model.id.in_(chunk)
+            ).update(values, synchronize_session=False)
+        return touched
+
+    def upsert(self, rows: Iterable[Dict[str, Any]]) -> UpsertResult:
+        """
+        Вставить новые и обновить существующие строки
+
+        Returns:
+            UpsertResult(created, updated)
+        """
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        fingerprints: List[Tuple[Any, Optional[str]]] = []
+
+        for row in rows:
+            key = self.key_of(row)
+            if self.fingerprint_column:
+                fingerprints.append((key, row.get(self.fingerprint_column)))
+            existing_id = self.key_map.get(key)
+            if existing_id is None:
+                inserts.append(row)
+            else:
+                update = {k: v for k, v in row.items() if k not in self.insert_only}
+                update['id'] = existing_id
+                updates.append(update)
+
+        for chunk in _chunks(inserts, self.batch_size):
+            # return_defaults — чтобы получить id и учесть вставленные строки в key_map
+            self.session.bulk_insert_mappings(self.model, chunk, return_defaults=True)
+            for row in chunk:
+                self.key_map[self.key_of(row)] = row['id']
+
+        for chunk in _chunks(updates, self.batch_size):
+            self.session.bulk_update_mappings(self.model, chunk)
+
+        if self.fingerprint_column:
+            for key, fingerprint in fingerprints:
+                self.fingerprints[key] = fingerprint
+
+        return UpsertResult(created=len(inserts), updated=len(updates))
+
+    def delete_duplicates(self) -> int:
+        """Удалить строки-дубликаты по ключу (кроме строки с наименьшим id)"""
+        removed = 0
+        for chunk in _chunks(self.duplicate_ids, self.batch_size):
+            removed += self.session.query(self.model).filter(
+                self.model.id.in_(chunk)
+            ).delete(synchronize_session=False)
+        self.duplicate_ids = []
+        return removed
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def aggregate_stocks(all_stocks: Iterable[Dict[str, Any]]) -> Dict[Tuple[int, str], Dict[str, Any]]:
+    """
+    Сгруппировать остатки Statistics API по (nmId, склад)
+
+    Statistics API возвращает строку на каждый размер/баркод — суммируем.
+    """
+    stocks_by_product: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for stock_data in all_stocks:
+        nm_id = stock_data.get('nmId')
+        if not nm_id:
+            continue
+        warehouse_name = stock_data.get('warehouseName', 'Неизвестный склад')
+
+        key = (nm_id, warehouse_name)
+        totals = stocks_by_product.get(key)
+        if totals is None:
+            totals = stocks_by_product[key] = {
+                'quantity': 0,
+                'quantity_full': 0,
+                'in_way_to_client': 0,
+                'in_way_from_client': 0,
+            }
+        totals['quantity'] += stock_data.get('quantity', 0) or 0
+        totals['quantity_full'] += stock_data.get('quantityFull', 0) or 0
+        totals['in_way_to_client'] += stock_data.get('inWayToClient', 0) or 0
+        totals['in_way_from_client'] += stock_data.get('inWayFromClient', 0) or 0
+    return stocks_by_product
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+"""
+Снимок каталога продавца: карточки, цены и остатки WB с отметкой свежести
+
+Синхронизация товаров, мониторинг цен и синхронизация остатков читают
+каталог через этот сервис и задают допустимый возраст данных (max_age).
+Повторный запрос к WB выполняется только если снимок старше допуска —
+задачи, запущенные друг за другом, не выкачивают каталог заново.
+
+Каждая часть снимка (cards, prices, stocks) хранится и обновляется отдельно
+на диске (gzip JSON Lines в CATALOG_SNAPSHOT_DIR), так что снимком пользуются
+и другие gunicorn-воркеры, и процесс после перезапуска. Цены и остатки
+дополнительно держатся в памяти процесса (последние
+CATALOG_SNAPSHOT_MEMORY_ENTRIES частей).
+
+Карточки в память не загружаются: они пишутся на диск постранично
+(SnapshotWriter) и читаются построчно при каждом обходе, а от карточки
+сохраняются только поля из SNAPSHOT_FIELDS['cards']. Одновременные запросы
+одной устаревшей части выполняют один запрос к WB (остальные ждут его).
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Каталог со снимками на диске
+CATALOG_SNAPSHOT_DIR = os.environ.get(
+    'CATALOG_SNAPSHOT_DIR',
+    os.path.join(_PROJECT_ROOT, 'data', 'catalog_snapshots')
+)
+
+# Сколько частей снимков держать в памяти процесса
+CATALOG_SNAPSHOT_MEMORY_ENTRIES = int(os.environ.get('CATALOG_SNAPSHOT_MEMORY_ENTRIES', '8'))
+
+# Допустимый возраст частей снимка по умолчанию (секунды)
+SNAPSHOT_MAX_AGE = {
+    'cards': int(os.environ.get('CATALOG_SNAPSHOT_CARDS_MAX_AGE', str(6 * 3600))),
+    'prices': int(os.environ.get('CATALOG_SNAPSHOT_PRICES_MAX_AGE', '600')),
+    'stocks': int(os.environ.get('CATALOG_SNAPSHOT_STOCKS_MAX_AGE', '1800')),
+}
+
+SNAPSHOT_PARTS = tuple(SNAPSHOT_MAX_AGE)
+
+# Части, которые не держатся в памяти процесса и читаются с диска построчно
+STREAMED_PARTS = ('cards',)
+
+# Поля записей, которые сохраняются в снимок (остальные поля WB отбрасываются)
+SNAPSHOT_FIELDS = {
+    'cards': ('nmID', 'imtID', 'vendorCode', 'title', 'brand', 'object',
+              'subjectName', 'updatedAt', 'stocks'),
+}
+
+
+class SnapshotPart(NamedTuple):
+    """Часть снимка каталога"""
+    data: Any
+    fetched_at: float  # unix time загрузки из WB
+    from_cache: bool  # True — данные взяты из снимка, без запроса к WB
+
+    @property
+    def age_seconds(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class SnapshotRecords:
+    """
+    Записи части снимка на диске
+
+    Файл читается построчно при каждом обходе, в памяти держится только
+    текущая запись. Записи файла, заменённого во время обхода, дочитываются
+    из старой версии.
+    """
+
+    def __init__(self, path: str, count: int):
+        self.path = path
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Any]:
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class SnapshotWriter:
+    """
+    Постраничная запись части снимка
+
+    Записи пишутся во временный файл по мере поступления; commit() заменяет
+    им текущий снимок, discard() удаляет его. Если задан key, повторные
+    записи с тем же ключом пропускаются.
+
+    Пример:
+        writer = get_catalog_snapshots().writer(seller.id, 'cards', key='nmID')
+        for page_cards, _ in client.iter_cards():
+            writer.extend(page_cards)
+        writer.commit()
+    """
+
+    def __init__(self, service: 'CatalogSnapshotService', seller_id: int, part: str,
+                 fetched_at: Optional[float] = None, key: Optional[str] = None):
+        if part not in SNAPSHOT_PARTS:
+            raise ValueError(f"Unknown catalog snapshot part: {part}")
+        self.seller_id = seller_id
+        self.part = part
+        self.fetched_at = fetched_at or time.time()
+        self.key = key
+        self.count = 0
+        self._service = service
+        self._fields = SNAPSHOT_FIELDS.get(part)
+        self._keys: Set[Any] = set()
+        self._items = None if part in STREAMED_PARTS else []
+
+        self._path = service._path(seller_id, part)
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        self._tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = gzip.open(self._tmp_path, 'wt', encoding='utf-8')
+
+    def add(self, item: Any) -> None:
+        """Добавить запись (для cards сохраняются только поля SNAPSHOT_FIELDS)"""
+        if isinstance(item, dict):
+            if self.key:
+                item_key = item.get(self.key)
+                if item_key in self._keys:
+                    return
+                self._keys.add(item_key)
+            if self._fields:
+                item = {field: item[field] for field in self._fields if field in item}
+        self._file.write(json.dumps(item, ensure_ascii=False))
+        self._file.write('\n')
+        self.count += 1
+        if self._items is not None:
+            self._items.append(item)
+
+    def extend(self, items: Iterable[Any]) -> None:
+        for item in items:
+            self.add(item)
+
+    def commit(self, merge_previous: bool = False) -> bool:
+        """
+        Заменить текущий снимок записанными записями
+
+        Args:
+            merge_previous: Дописать записи текущего снимка, ключей которых
+                не было среди записанных (инкрементальное обновление). Время
+                загрузки остаётся от текущего снимка: удалённые на WB записи
+                он не отражает. Без текущего снимка ничего не сохраняется.
+
+        Returns:
+            True, если снимок сохранён
+        """
+        if merge_previous:
+            previous = self._service._load(self.seller_id, self.part)
+            if previous is None:
+                self.discard()
+                return False
+            key, self.key = self.key, None
+            for item in previous[0]:
+                if not (isinstance(item, dict) and key and item.get(key) in self._keys):
+                    self.add(item)
+            self.fetched_at = previous[1]
+
+        self._file.close()
+        try:
+            os.replace(self._tmp_path, self._path)
+            self._service._write_meta(self.seller_id, self.part, self.fetched_at, self.count)
+        except OSError as e:
+            logger.warning(f"Failed to persist catalog snapshot {self._path}: {e}")
+            self.discard()
+            return False
+
+        if self._items is not None:
+            self._service._remember((self.seller_id, self.part), (self._items, self.fetched_at))
+        else:
+            self._service._forget((self.seller_id, self.part))
+        return True
+
+    def discard(self) -> None:
+        """Отменить запись (текущий снимок не меняется)"""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove {self._tmp_path}: {e}")
+
+
+class CatalogSnapshotService:
+    """
+    Снимки каталога продавцов (карточки, цены, остатки)
+
+    Пример:
+        snapshot = get_catalog_snapshots().get(
+            seller.id, 'prices',
+            fetch=lambda: client.get_all_goods_prices(batch_size=1000),
+            max_age=600
+        )
+        all_prices = snapshot.data
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, base_dir: Optional[str] = None):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, base_dir: Optional[str] = None):
+        if self._initialized:
+            return
+
+        self.base_dir = base_dir or CATALOG_SNAPSHOT_DIR
+        self._memory: 'OrderedDict[Tuple[int, str], Tuple[Any, float]]' = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._fetch_locks: Dict[Tuple[int, str], threading.Lock] = {}
+        self._stats = {'hits': 0, 'misses': 0}
+        self._initialized = True
+
+    # ------------------------------------------------------------------
+    # Хранение
+    # ------------------------------------------------------------------
+
+    def _path(self, seller_id: int, part: str) -> str:
+        return os.path.join(self.base_dir, str(seller_id), f"{part}.jsonl.gz")
+
+    def _meta_path(self, seller_id: int, part: str) -> str:
+        return os.path.join(self.base_dir, str(seller_id), f"{part}.meta.json")
+
+    def _write_meta(self, seller_id: int, part: str, fetched_at: float, count: int) -> None:
+        path = self._meta_path(seller_id, part)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'items': count}, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, seller_id: int, part: str, from_disk: bool = False) -> Optional[Tuple[Any, float]]:
+        key = (seller_id, part)
+        if not from_disk:
+            with self._memory_lock:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    return entry
+
+        path = self._path(seller_id, part)
+        meta_path = self._meta_path(seller_id, part)
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            records = SnapshotRecords(path, int(meta['items']))
+            if part in STREAMED_PARTS:
+                return records, float(meta['fetched_at'])
+            entry = (list(records), float(meta['fetched_at']))
+        except Exception as e:
+            logger.warning(f"Catalog snapshot {path} unreadable ({e}), ignoring")
+            return None
+
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: Tuple[int, str], entry: Tuple[Any, float]) -> None:
+        with self._memory_lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > CATALOG_SNAPSHOT_MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def _forget(self, key: Tuple[int, str]) -> None:
+        with self._memory_lock:
+            self._memory.pop(key, None)
+
+    def writer(self, seller_id: int, part: str, fetched_at: Optional[float] = None,
+               key: Optional[str] = None) -> SnapshotWriter:
+        """
+        Начать постраничную запись части снимка (см. SnapshotWriter)
+
+        Args:
+            seller_id: ID продавца
+            part: 'cards', 'prices' или 'stocks'
+            fetched_at: Время начала загрузки (unix time), по умолчанию — сейчас
+            key: Поле-ключ записей (например, 'nmID') для пропуска дублей
+                и слияния с текущим снимком
+        """
+        return SnapshotWriter(self, seller_id, part, fetched_at, key)
+
+    def put(self, seller_id: int, part: str, data: Iterable[Any], fetched_at: Optional[float] = None) -> None:
+        """
+        Сохранить часть снимка (например, каталог, загруженный самой задачей)
+
+        Args:
+            seller_id: ID продавца
+            part: 'cards', 'prices' или 'stocks'
+            data: Записи WB API
+            fetched_at: Время загрузки (unix time), по умолчанию — сейчас
+        """
+        try:
+            writer = self.writer(seller_id, part, fetched_at)
+        except OSError as e:
+            logger.warning(f"Failed to persist catalog snapshot {seller_id}/{part}: {e}")
+            return
+        try:
+            writer.extend(data)
+        except Exception:
+            writer.discard()
+            raise
+        writer.commit()
+
+    def invalidate(self, seller_id: int, part: Optional[str] = None) -> None:
+        """Сбросить снимок продавца (целиком или одну часть)"""
+        for name in ([part] if part else SNAPSHOT_PARTS):
+            self._forget((seller_id, name))
+            for path in (self._meta_path(seller_id, name), self._path(seller_id, name)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Failed to remove catalog snapshot {path}: {e}")
+
+    # ------------------------------------------------------------------
+    # Чтение
+    # ------------------------------------------------------------------
+
+    def peek(self, seller_id: int, part: str, max_age: Optional[float] = None) -> Optional[SnapshotPart]:
+        """
+        Часть снимка, если она не старше max_age (без запроса к WB)
+
+        Returns:
+            SnapshotPart или None (для cards data — SnapshotRecords)
+        """
+        max_age = SNAPSHOT_MAX_AGE[part] if max_age is None else max_age
+        entry = self._load(seller_id, part)
+        if entry is not None and time.time() - entry[1] > max_age:
+            # Снимок в памяти устарел — его мог обновить другой процесс
+            entry = self._load(seller_id, part, from_disk=True)
+        if entry is None or time.time() - entry[1] > max_age:
+            return None
+        return SnapshotPart(entry[0], entry[1], True)
+
+    def get(self, seller_id: int, part: str, fetch: Callable[[], Any],
+            max_age: Optional[float] = None) -> SnapshotPart:
+        """
+        Часть снимка не старше max_age; при необходимости загрузить из WB
+
+        Args:
+            seller_id: ID продавца
+            part: 'cards', 'prices' или 'stocks'
+            fetch: Загрузка данных из WB API (вызывается только для устаревшего снимка)
+            max_age: Допустимый возраст в секундах (по умолчанию SNAPSHOT_MAX_AGE[part])
+
+        Returns:
+            SnapshotPart
+        """
+        cached = self.peek(seller_id, part, max_age)
+        if cached:
+            self._count('hits')
+            return cached
+
+        with self._memory_lock:
+            fetch_lock = self._fetch_locks.setdefault((seller_id, part), threading.Lock())
+        with fetch_lock:
+            # Пока ждали блокировку, снимок мог обновить другой поток
+            cached = self.peek(seller_id, part, max_age)
+            if cached:
+                self._count('hits')
+                return cached
+
+            self._count('misses')
+            data = fetch()
+            self.put(seller_id, part, data)
+            logger.info(f"📸 Catalog snapshot {part} refreshed for seller {seller_id}")
+            return SnapshotPart(data, time.time(), False)
+
+    def _count(self, name: str) -> None:
+        with self._memory_lock:
+            self._stats[name] += 1
+
+    def get_info(self, seller_id: int) -> Dict[str, Any]:
+        """Свежесть частей снимка продавца"""
+        info = {}
+        for part in SNAPSHOT_PARTS:
+            entry = self._load(seller_id, part)
+            if entry is None:
+                info[part] = None
+                continue
+            data, fetched_at = entry
+            info[part] = {
+                'fetched_at': fetched_at,
+                'age_seconds': round(time.time() - fetched_at, 1),
+                'items': len(data),
+                'fresh': time.time() - fetched_at <= SNAPSHOT_MAX_AGE[part],
+            }
+        return info
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._memory_lock:
+            return dict(self._stats)
+
+
+def get_catalog_snapshots() -> CatalogSnapshotService:
+    """Получить сервис снимков каталога"""
+    return CatalogSnapshotService()
@@ -23,6 +23,7 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 from services.wb_api_client import RateLimiter
+from services.wb_retry import parse_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -308,11 +309,12 @@ class CompetitorMonitorService:
                     if response.status_code in (403, 404):
                         continue
                     if response.status_code == 429:
+                        wait = parse_retry_after(response.headers) or 30
                         logger.warning(
                             f"Каталог продавца {supplier_id}: "
-                            f"rate limited (429), пауза 30с"
+                            f"rate limited (429), пауза {wait:.0f}с"
                         )
-                        time.sleep(30)
+                        time.sleep(wait)
                         return found
                     response.raise_for_status()
                     data = response.json()
@@ -384,8 +386,9 @@ class CompetitorMonitorService:
                     self.SEARCH_URL, params=params, timeout=30
                 )
                 if response.status_code == 429:
-                    logger.warning(f"Search API rate limited при поиске '{brand}', пауза 60с")
-                    time.sleep(60)
+                    wait = parse_retry_after(response.headers) or 60
+                    logger.warning(f"Search API rate limited при поиске '{brand}', пауза {wait:.0f}с")
+                    time.sleep(wait)
                     break
                 response.raise_for_status()
                 data = response.json()
@@ -587,7 +590,7 @@ class CompetitorMonitorService:
                         continue
                     if response.status_code == 429:
                         logger.warning(f"URL {url} rate limited (429)")
-                        time.sleep(3)
+                        time.sleep(parse_retry_after(response.headers) or 3)
                         return None  # Попробуем fallback
 
                     response.raise_for_status()
@@ -659,7 +662,7 @@ class CompetitorMonitorService:
                 )
                 if response.status_code == 429:
                     logger.warning("Search API rate limited")
-                    time.sleep(5)
+                    time.sleep(parse_retry_after(response.headers) or 5)
                     continue
 
                 response.raise_for_status()
@@ -976,7 +979,9 @@ class CompetitorMonitorService:
         - Старше days_hourly дней: оставляем 1 снимок в час
         - Старше days_daily дней: оставляем 1 снимок в день
         """
+        from sqlalchemy import and_, delete, func, select
         from models import db, CompetitorPriceSnapshot
+        from services.db_dialect import dialect_name, time_bucket
 
         with flask_app.app_context():
             now = datetime.utcnow()
@@ -984,25 +989,21 @@ class CompetitorMonitorService:
             hourly_cutoff = now - timedelta(days=days_hourly)
             daily_cutoff = now - timedelta(days=days_daily)
 
-            deleted_hourly = db.session.execute(db.text("""
-                DELETE FROM competitor_price_snapshots
-                WHERE id NOT IN (
-                    SELECT MAX(id) FROM competitor_price_snapshots
-                    WHERE created_at < :hourly_cutoff AND created_at >= :daily_cutoff
-                    GROUP BY product_id, strftime('%Y-%m-%d %H', created_at)
+            snapshots = CompetitorPriceSnapshot.__table__
+            dialect = dialect_name()
+
+            def compact(unit, window):
+                # В каждом бакете (товар + час/день) остаётся последний снимок
+                keep = select(func.max(snapshots.c.id)).where(window).group_by(
+                    snapshots.c.product_id, time_bucket(snapshots.c.created_at, unit, dialect)
                 )
-                AND created_at < :hourly_cutoff AND created_at >= :daily_cutoff
-            """), {'hourly_cutoff': hourly_cutoff, 'daily_cutoff': daily_cutoff})
-
-            deleted_daily = db.session.execute(db.text("""
-                DELETE FROM competitor_price_snapshots
-                WHERE id NOT IN (
-                    SELECT MAX(id) FROM competitor_price_snapshots
-                    WHERE created_at < :daily_cutoff
-                    GROUP BY product_id, strftime('%Y-%m-%d', created_at)
+                return db.session.execute(
+                    delete(snapshots).where(window, snapshots.c.id.not_in(keep))
                 )
-                AND created_at < :daily_cutoff
-            """), {'daily_cutoff': daily_cutoff})
+
+            deleted_hourly = compact('hour', and_(snapshots.c.created_at < hourly_cutoff,
+                                                  snapshots.c.created_at >= daily_cutoff))
+            deleted_daily = compact('day', snapshots.c.created_at < daily_cutoff)
 
             db.session.commit()
             logger.info(
@@ -16,7 +16,7 @@ import re
 import requests as _requests
 
 from models import (
-    db, Product, ProductStock, Seller, SupplierProduct, ImportedProduct,
+    db, DEFERRED_DETAILS, Product, ProductStock, Seller, SupplierProduct, ImportedProduct,
     ProductAnalytics, ContentFactory, ContentItem,
     ContentTemplate, ContentPlan, SocialAccount,
     CONTENT_PLATFORMS, CONTENT_TYPES, CONTENT_STATUSES,
@@ -736,6 +736,8 @@ class ContentFactoryService:
 
         Проверяет наличие через ProductStock (складские остатки),
         т.к. Product.quantity может быть не синхронизирован.
+        Из отложенных колонок грузится только sizes_json (доступные размеры):
+        подбор читает до 1000 карточек, описание и характеристики ему не нужны.
         """
         # Subquery: сумма остатков по всем складам
         stock_subquery = (
@@ -748,6 +750,7 @@ class ContentFactoryService:
         )
         return (
             Product.query
+            .options(db.undefer(Product.sizes_json))
             .outerjoin(stock_subquery, Product.id == stock_subquery.c.product_id)
             .filter(
                 Product.seller_id == seller_id,
@@ -783,7 +786,7 @@ class ContentFactoryService:
         if not products:
             # Fallback 2: ничего не найдено
             logger.warning(f"No products in stock for seller {seller_id}")
-        return [self._product_to_dict(p) for p in products]
+        return [self._product_to_dict(p, details=False) for p in products]
 
     def _select_new_arrivals(self, seller_id: int, limit: int) -> List[Dict]:
         """Выбирает недавно добавленные товары."""
@@ -791,7 +794,7 @@ class ContentFactoryService:
             Product.created_at.desc()
         ).limit(limit).all()
         # Фильтр наличия остаётся — товары без остатков не подбираем
-        return [self._product_to_dict(p) for p in products]
+        return [self._product_to_dict(p, details=False) for p in products]
 
     def _select_by_rules(self, factory: ContentFactory, limit: int) -> List[Dict]:
         """Выбирает товары по правилам фабрики."""
@@ -808,28 +811,28 @@ class ContentFactoryService:
             query = query.filter(Product.price <= rules['max_price'])
 
         products = query.order_by(Product.updated_at.desc()).limit(limit).all()
-        return [self._product_to_dict(p) for p in products]
+        return [self._product_to_dict(p, details=False) for p in products]
 
     def _select_all_products(self, seller_id: int, limit: int) -> List[Dict]:
         """Все товары продавца (в наличии) — для ручного выбора в UI."""
         products = self._base_product_query(seller_id).order_by(
             Product.updated_at.desc()
         ).limit(limit).all()
-        return [self._product_to_dict(p) for p in products]
+        return [self._product_to_dict(p, details=False) for p in products]
 
     def _select_all_products_raw(self, seller_id: int, limit: int) -> List[Dict]:
         """Все товары продавца (в наличии) — для автоматического подбора."""
         products = self._base_product_query(seller_id).order_by(
             Product.id.asc()
         ).limit(limit).all()
-        return [self._product_to_dict(p) for p in products]
+        return [self._product_to_dict(p, details=False) for p in products]
 
     def _collect_products_data(self, product_ids: List[int], seller_id: int) -> List[Dict]:
         """Загружает товары по ID и возвращает данные для промптов."""
         if not product_ids:
             return []
 
-        products = Product.query.filter(
+        products = Product.query.options(db.undefer_group(DEFERRED_DETAILS)).filter(
             Product.id.in_(product_ids),
             Product.seller_id == seller_id,
         ).all()
@@ -939,12 +942,16 @@ class ContentFactoryService:
         # Если кэширование не удалось — возвращаем source_urls как есть (крайний fallback)
         return source_urls
 
-    def _product_to_dict(self, product: Product, validate_photos: bool = False) -> Dict:
-        """Конвертирует Product в dict для промптов (с фото, ссылкой, рейтингом)."""
+    def _product_to_dict(self, product: Product, validate_photos: bool = False, details: bool = True) -> Dict:
+        """Конвертирует Product в dict для промптов (с фото, ссылкой, рейтингом).
+
+        details=False — без описания и характеристик (подбор товаров: не
+        загружает отложенные колонки карточки).
+        """
         photos = self._get_product_photos(product, validate_photos)
 
         characteristics = ''
-        if product.characteristics_json:
+        if details and product.characteristics_json:
             try:
                 chars = json.loads(product.characteristics_json)
                 if isinstance(chars, list):
@@ -981,7 +988,7 @@ class ContentFactoryService:
             'category': product.object_name or '',
             'price': price,
             'discount_price': discount_price,
-            'description': getattr(product, 'description', '') or '',
+            'description': (product.description or '') if details else '',
             'vendor_code': product.vendor_code or '',
             'photos': photos,
             'wb_url': wb_url,
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Поддержка SQLite и PostgreSQL в одном коде
+
+Приложение работает на SQLite (по умолчанию) или PostgreSQL
+(DATABASE_URL=postgresql://...). Здесь собраны места, где SQL диалектов
+расходится:
+
+- engine_options — параметры движка: connect_args SQLite (timeout,
+  check_same_thread) PostgreSQL не принимает, пул соединений нужен обоим;
+- upsert_rows — INSERT ... ON CONFLICT DO UPDATE/NOTHING для пачки строк
+  (SQLite >= 3.24 и PostgreSQL). В PostgreSQL большие пачки (от
+  DB_COPY_THRESHOLD строк) загружаются COPY во временную таблицу и
+  переносятся одним INSERT ... SELECT ... ON CONFLICT;
+- time_bucket — усечение даты до часа/дня (strftime / date_trunc);
+- portable_ddl — DDL стартовых миграций, написанный для SQLite
+  (AUTOINCREMENT, DATETIME, BOOLEAN DEFAULT 0), для PostgreSQL.
+
+Перенос данных из файла SQLite: scripts/migrate_sqlite_to_postgres.py.
+"""
+import io
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import func, select
+
+logger = logging.getLogger(__name__)
+
+# С какого размера пачки upsert в PostgreSQL идёт через COPY
+DB_COPY_THRESHOLD = int(os.environ.get('DB_COPY_THRESHOLD', '1000'))
+
+# Пул соединений (фоновые потоки синхронизации держат соединения параллельно)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '20'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '30'))
+
+# Формат strftime для усечения даты в SQLite
+_SQLITE_BUCKETS = {'hour': '%Y-%m-%d %H', 'day': '%Y-%m-%d'}
+
+UpdateSpec = Union[Sequence[str], Callable[[Any, Any], Dict[str, Any]], None]
+
+
+def normalize_database_url(url: str) -> str:
+    """postgres://... (Heroku, docker-образы) -> postgresql://... для SQLAlchemy"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite_url(url: str) -> bool:
+    return url.startswith('sqlite:')
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS для DATABASE_URL
+
+    Args:
+        url: DATABASE_URL
+
+    Returns:
+        dict: Параметры create_engine
+    """
+    options = {
+        'pool_size': DB_POOL_SIZE,        # Фоновые потоки держат соединения параллельно
+        'max_overflow': DB_MAX_OVERFLOW,  # Доп. соединения сверх pool_size при пиковой нагрузке
+        'pool_timeout': 60,               # Ждать свободное соединение до 60 сек (дефолт 30)
+        'pool_pre_ping': True,            # Проверка соединений перед использованием
+        'pool_recycle': 3600,             # Переиспользование соединений каждый час
+    }
+    if is_sqlite_url(url):
+        options['connect_args'] = {
+            'timeout': 30,                # Ожидание блокировки файла до 30 секунд
+            'check_same_thread': False,   # Разрешить использование из разных потоков
+        }
+    return options
+
+
+def dialect_name(bind=None) -> str:
+    """Имя диалекта ('sqlite', 'postgresql') движка или текущей сессии"""
+    if bind is None:
+        from models import db
+        bind = db.session.get_bind()
+    return bind.dialect.name
+
+
+def time_bucket(column, unit: str, dialect: str):
+    """
+    Выражение: дата, усечённая до часа или дня
+
+    Args:
+        column: Колонка DateTime
+        unit: 'hour' или 'day'
+        dialect: Имя диалекта
+    """
+    if unit not in _SQLITE_BUCKETS:
+        raise ValueError(f"Unsupported time bucket: {unit}")
+    if dialect == 'postgresql':
+        return func.date_trunc(unit, column)
+    return func.strftime(_SQLITE_BUCKETS[unit], column)
+
+
+def _insert_for(dialect: str):
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert is not supported for {dialect}")
+    return insert
+
+
+def _on_conflict(stmt, table, index_elements: Sequence[str], update: UpdateSpec, where):
+    if not update:
+        return stmt.on_conflict_do_nothing(index_elements=list(index_elements))
+    excluded = stmt.excluded
+    if callable(update):
+        set_ = update(table.c, excluded)
+    else:
+        set_ = {name: excluded[name] for name in update}
+    return stmt.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_=set_,
+        where=where(table.c, excluded) if where is not None else None,
+    )
+
+
+def _dedupe(rows: List[Dict[str, Any]], index_elements: Sequence[str]) -> List[Dict[str, Any]]:
+    # Одна команда ON CONFLICT не может изменить строку дважды (PostgreSQL) —
+    # из повторов ключа в пачке остаётся последний
+    unique = {}
+    for row in rows:
+        unique[tuple(row[name] for name in index_elements)] = row
+    return list(unique.values())
+
+
+def upsert_rows(
+    table,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+    update: UpdateSpec = None,
+    where: Optional[Callable[[Any, Any], Any]] = None,
+    session=None
+) -> int:
+    """
+    Вставить пачку строк с разрешением конфликтов по уникальному ключу
+
+    Args:
+        table: Таблица (Model.__table__)
+        rows: Строки (у всех одинаковый набор колонок)
+        index_elements: Колонки уникального ключа
+        update: Колонки, которые обновляются из новой строки, или
+            функция (колонки таблицы, excluded) -> {колонка: выражение};
+            None — существующие строки не трогаются (DO NOTHING)
+        where: Условие обновления (колонки таблицы, excluded) -> выражение
+        session: Сессия (по умолчанию db.session)
+
+    Returns:
+        Число вставленных и обновлённых строк
+    """
+    if not rows:
+        return 0
+    if session is None:
+        from models import db
+        session = db.session
+
+    rows = _dedupe(rows, index_elements)
+    dialect = dialect_name(session.get_bind())
+    insert = _insert_for(dialect)
+
+    if dialect == 'postgresql' and len(rows) >= DB_COPY_THRESHOLD:
+        return _copy_upsert(session, table, rows, index_elements, update, where)
+
+    key = list(table.primary_key.columns)[0]
+    stmt = _on_conflict(insert(table), table, index_elements, update, where).returning(key)
+    return len(session.execute(stmt, rows).all())
+
+
+def _copy_upsert(session, table, rows, index_elements, update, where) -> int:
+    """PostgreSQL: COPY пачки во временную таблицу и один INSERT ... SELECT ... ON CONFLICT"""
+    from sqlalchemy import column as sa_column, table as sa_table
+    from sqlalchemy.dialects.postgresql import insert
+
+    columns = list(rows[0].keys())
+    staging = f"_copy_{table.name}"
+    column_list = ', '.join(f'"{name}"' for name in columns)
+
+    connection = session.connection()
+    connection.exec_driver_sql(
+        f'CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS '
+        f'SELECT {column_list} FROM {table.name} WITH NO DATA'
+    )
+    connection.exec_driver_sql(f'TRUNCATE {staging}')
+    copy_rows(connection, staging, columns, rows)
+
+    source = sa_table(staging, *[sa_column(name) for name in columns])
+    stmt = insert(table).from_select(columns, select(*source.c))
+    result = connection.execute(_on_conflict(stmt, table, index_elements, update, where))
+    return result.rowcount
+
+
+def rows_to_csv(columns: Sequence[str], rows: List[Dict[str, Any]]) -> io.StringIO:
+    """
+    Строки в CSV для COPY ... FROM STDIN WITH (FORMAT csv)
+
+    None пишется пустым полем без кавычек (NULL), строки — в кавычках,
+    поэтому пустая строка остаётся пустой строкой.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(_csv_field(row.get(name)) for name in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def _csv_field(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_rows(connection, table_name: str, columns: Sequence[str], rows: List[Dict[str, Any]]) -> None:
+    """
+    COPY строк в таблицу PostgreSQL (psycopg2 или psycopg 3)
+
+    Args:
+        connection: SQLAlchemy Connection
+        table_name: Таблица
+        columns: Колонки
+        rows: Строки
+    """
+    column_list = ', '.join(f'"{name}"' for name in columns)
+    sql = f'COPY {table_name} ({column_list}) FROM STDIN WITH (FORMAT csv)'
+    buffer = rows_to_csv(columns, rows)
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):  # psycopg2
+            cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+_DDL_REPLACEMENTS = (
+    (re.compile(r'INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT', re.I), 'SERIAL PRIMARY KEY'),
+    (re.compile(r'\bDATETIME\b', re.I), 'TIMESTAMP'),
+    (re.compile(r'\bBOOLEAN(\s+NOT\s+NULL)?\s+DEFAULT\s+0\b', re.I), r'BOOLEAN\1 DEFAULT false'),
+    (re.compile(r'\bBOOLEAN(\s+NOT\s+NULL)?\s+DEFAULT\s+1\b', re.I), r'BOOLEAN\1 DEFAULT true'),
+)
+
+
+def portable_ddl(sql: str, dialect: str) -> str:
+    """
+    DDL, написанный для SQLite, в диалект БД
+
+    Args:
+        sql: CREATE TABLE / ADD COLUMN в синтаксисе SQLite
+        dialect: Имя диалекта
+
+    Returns:
+        DDL для диалекта (SQLite — без изменений)
+    """
+    if dialect != 'postgresql':
+        return sql
+    for pattern, replacement in _DDL_REPLACEMENTS:
+        sql = pattern.sub(replacement, sql)
+    return sql
@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+"""
+Единственный писатель SQLite: блокировка записи и очередь пакетной записи
+
+SQLite допускает одного писателя на файл. Раньше фоновые задачи (синхронизация,
+AI-парсинг, мониторинг цен, запросы пользователей) писали конкурентно и при
+столкновении получали «database is locked»: транзакции с отложенным BEGIN
+не ждут busy timeout при взаимной блокировке, поэтому коммиты оборачивались
+в повторы со sleep (db_commit_with_retry, _commit_with_retry).
+
+Теперь запись упорядочена:
+- блокировка записи (install_write_lock): первая изменяющая инструкция
+  соединения (INSERT/UPDATE/DELETE/DDL) берёт блокировку процесса и файловую
+  блокировку (fcntl.flock) рядом с файлом БД — писатели разных потоков
+  и процессов (gunicorn-воркеры, планировщик) ждут друг друга в очереди,
+  а не падают с «database is locked». Блокировка отпускается, когда
+  соединение возвращается в пул — после COMMIT/ROLLBACK;
+- commit_session — обычный commit с откатом при ошибке, без повторов и пауз;
+- DBWriter — фоновый поток процесса, который выполняет записи, поставленные
+  фоновыми задачами (прогресс, heartbeat), по порядку и объединяет их
+  в общие транзакции. submit возвращает Future — подтверждение записи.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows — только блокировка процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Файл межпроцессной блокировки записи (по умолчанию <файл БД>.write.lock)
+DB_WRITE_LOCK_FILE = os.environ.get('DB_WRITE_LOCK_FILE', '')
+
+# Сколько секунд ждать блокировку записи
+DB_WRITE_LOCK_TIMEOUT = float(os.environ.get('DB_WRITE_LOCK_TIMEOUT', '120'))
+
+# Размер очереди записей (при переполнении submit ждёт места)
+DB_WRITE_QUEUE_SIZE = int(os.environ.get('DB_WRITE_QUEUE_SIZE', '10000'))
+
+# Записей на одну транзакцию
+DB_WRITE_BATCH_SIZE = int(os.environ.get('DB_WRITE_BATCH_SIZE', '100'))
+
+# Сколько секунд копить пачку после первой записи
+DB_WRITE_FLUSH_INTERVAL = float(os.environ.get('DB_WRITE_FLUSH_INTERVAL', '0.05'))
+
+# Инструкции, которым нужна блокировка записи
+_WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+# Ключ в info соединения пула: время взятия блокировки записи
+_HELD_KEY = 'db_write_lock_acquired_at'
+
+
+class DBWriteLockTimeout(Exception):
+    """Блокировку записи не удалось получить за DB_WRITE_LOCK_TIMEOUT"""
+    pass
+
+
+class DBWriteLock:
+    """
+    Блокировка записи: блокировка процесса + файловая блокировка между процессами
+
+    Держит её одно соединение пула — от первой изменяющей инструкции до
+    возврата соединения в пул. Если поток, уже держащий блокировку через одно
+    соединение, начинает писать через другое, блокировка не берётся повторно
+    (иначе поток ждал бы сам себя) — такие случаи считаются в 'reentrant'.
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: float = DB_WRITE_LOCK_TIMEOUT):
+        """
+        Args:
+            path: Файл межпроцессной блокировки (None — только блокировка процесса)
+            timeout: Сколько секунд ждать блокировку
+        """
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._owner: Optional[int] = None
+        self._fd: Optional[int] = None
+        self._fd_pid: Optional[int] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'acquired': 0, 'contended': 0, 'timeouts': 0, 'reentrant': 0,
+                       'wait_total': 0.0, 'wait_max': 0.0, 'hold_total': 0.0, 'hold_max': 0.0}
+
+    def acquire(self) -> bool:
+        """
+        Взять блокировку для текущего потока
+
+        Returns:
+            True если блокировка взята (False — поток уже держит её)
+
+        Raises:
+            DBWriteLockTimeout: блокировка не получена за timeout
+        """
+        if self._owner == threading.get_ident():
+            self._count('reentrant')
+            return False
+
+        started = time.monotonic()
+        if not self._lock.acquire(timeout=self.timeout):
+            self._count('timeouts')
+            raise DBWriteLockTimeout(f"DB write lock not acquired in {self.timeout:.0f}s")
+        try:
+            self._acquire_file(started + self.timeout)
+        except BaseException:
+            self._lock.release()
+            raise
+        self._owner = threading.get_ident()
+
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._stats['acquired'] += 1
+            self._stats['wait_total'] += waited
+            self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+            if waited > 0.001:
+                self._stats['contended'] += 1
+        return True
+
+    def release(self, held: float = 0.0) -> None:
+        """
+        Отпустить блокировку
+
+        Args:
+            held: Сколько секунд блокировка удерживалась (для статистики)
+        """
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            except OSError as e:
+                logger.warning(f"⚠️ Failed to unlock {self.path}: {e}")
+        self._owner = None
+        self._lock.release()
+        with self._stats_lock:
+            self._stats['hold_total'] += held
+            self._stats['hold_max'] = max(self._stats['hold_max'], held)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики ожидания и удержания блокировки (время в мс)"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        acquired = stats['acquired'] or 1
+        return {
+            'path': self.path,
+            'acquired': stats['acquired'],
+            'contended': stats['contended'],
+            'timeouts': stats['timeouts'],
+            'reentrant': stats['reentrant'],
+            'avg_wait_ms': round(stats['wait_total'] / acquired * 1000, 2),
+            'max_wait_ms': round(stats['wait_max'] * 1000, 2),
+            'avg_hold_ms': round(stats['hold_total'] / acquired * 1000, 2),
+            'max_hold_ms': round(stats['hold_max'] * 1000, 2),
+        }
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _acquire_file(self, deadline: float) -> None:
+        if not self.path or fcntl is None:
+            return
+        # flock привязан к открытому файлу: после fork (gunicorn --preload)
+        # дескриптор родителя общий — каждый процесс открывает свой
+        if self._fd is None or self._fd_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._fd_pid = os.getpid()
+
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count('timeouts')
+                raise DBWriteLockTimeout(f"DB write lock {self.path} is held by another process")
+            # Ожидание освобождения файла другим процессом (не повтор коммита)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.02)
+
+
+_write_lock: Optional[DBWriteLock] = None
+
+
+def _sqlite_path(engine) -> Optional[str]:
+    """Путь к файлу SQLite (None — не SQLite или БД в памяти)"""
+    if engine.dialect.name != 'sqlite':
+        return None
+    database = engine.url.database
+    if not database or database == ':memory:' or database.startswith('file::memory:'):
+        return None
+    return os.path.abspath(database)
+
+
+def install_write_lock(engine) -> Optional[DBWriteLock]:
+    """
+    Подключить блокировку записи к движку SQLite
+
+    Args:
+        engine: SQLAlchemy Engine (db.engine)
+
+    Returns:
+        DBWriteLock или None (не файловая SQLite — блокировка не нужна)
+    """
+    global _write_lock
+    from sqlalchemy import event
+
+    database = _sqlite_path(engine)
+    if database is None:
+        return None
+    installed = getattr(engine.pool, '_db_write_lock', None)
+    if installed is not None:
+        return installed
+
+    lock = DBWriteLock(DB_WRITE_LOCK_FILE or f"{database}.write.lock")
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        info = conn.info
+        if _HELD_KEY in info or info.get('db_write_lock_reentrant'):
+            return
+        if not statement.lstrip()[:7].upper().startswith(_WRITE_STATEMENTS):
+            return
+        if lock.acquire():
+            info[_HELD_KEY] = time.monotonic()
+        else:
+            info['db_write_lock_reentrant'] = True
+
+    def release(dbapi_connection, connection_record, *args):
+        if connection_record is None:
+            return
+        info = connection_record.info
+        info.pop('db_write_lock_reentrant', None)
+        acquired_at = info.pop(_HELD_KEY, None)
+        if acquired_at is not None:
+            lock.release(time.monotonic() - acquired_at)
+
+    def reset(dbapi_connection, connection_record, reset_state):
+        release(dbapi_connection, connection_record)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    # reset срабатывает после COMMIT/ROLLBACK при возврате соединения в пул
+    event.listen(engine.pool, 'reset', reset)
+    for name in ('checkin', 'invalidate', 'close'):
+        event.listen(engine.pool, name, release)
+
+    engine.pool._db_write_lock = lock
+    _write_lock = lock
+    logger.info(f"🔒 SQLite write lock enabled ({lock.path})")
+    return lock
+
+
+def get_write_lock_stats() -> Optional[Dict[str, Any]]:
+    """Статистика блокировки записи (None — блокировка не подключена)"""
+    return _write_lock.get_stats() if _write_lock is not None else None
+
+
+def commit_session(session) -> None:
+    """
+    Коммит сессии; при ошибке — откат и raise
+
+    Повторов нет: конкурирующие писатели ждут блокировку записи,
+    поэтому «database is locked» больше не повод повторять коммит.
+    При сломанной сессии (откат не удался) — remove().
+    """
+    try:
+        session.commit()
+    except Exception:
+        try:
+            session.rollback()
+        except Exception:
+            session.remove()
+        raise
+
+
+class _WriteJob:
+    """Запись в очереди"""
+    __slots__ = ('fn', 'args', 'kwargs', 'app', 'future', 'queued_at')
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, app):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.app = app
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+
+
+class DBWriter:
+    """
+    Фоновый писатель БД процесса
+
+    Записи выполняются по одной в порядке постановки, в контексте приложения
+    вызывающего, через db.session; подряд идущие записи объединяются в одну
+    транзакцию (до batch_size). Если запись или коммит падает, транзакция
+    откатывается и записи пачки выполняются заново по одной — ошибка
+    достаётся только своей Future. Поэтому функция записи должна только
+    менять БД (без внешних побочных эффектов) и не коммитить сама.
+
+    Пример:
+        def save_progress(job_id, processed):
+            AIParseJob.query.get(job_id).processed = processed
+
+        get_db_writer().submit(save_progress, job_id, 10)     # Future
+        get_db_writer().write(save_progress, job_id, 20)      # дождаться записи
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(
+        self,
+        queue_size: int = DB_WRITE_QUEUE_SIZE,
+        batch_size: int = DB_WRITE_BATCH_SIZE,
+        flush_interval: float = DB_WRITE_FLUSH_INTERVAL
+    ):
+        """
+        Args:
+            queue_size: Размер очереди записей
+            batch_size: Записей на одну транзакцию
+            flush_interval: Сколько секунд копить пачку
+        """
+        if self._initialized:
+            return
+
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: 'queue.Queue[_WriteJob]' = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'transactions': 0,
+                       'rollbacks': 0, 'max_batch': 0, 'latency_total': 0.0, 'latency_max': 0.0,
+                       'commit_total': 0.0, 'commit_max': 0.0}
+        atexit.register(self.flush, 5)
+        self._initialized = True
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Поставить запись в очередь
+
+        Args:
+            fn: Функция записи (fn(*args, **kwargs) через db.session, без commit)
+
+        Returns:
+            Future с результатом fn после коммита (или с исключением)
+        """
+        job = _WriteJob(fn, args, kwargs, _current_app())
+        if threading.current_thread() is self._thread:
+            # Запись из функции записи — в той же транзакции
+            try:
+                job.future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                job.future.set_exception(e)
+            return job.future
+
+        self._ensure_thread()
+        self._queue.put(job)
+        self._count('submitted')
+        return job.future
+
+    def write(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Выполнить запись через очередь и дождаться коммита
+
+        Returns:
+            Результат fn
+
+        Raises:
+            Исключение fn или коммита; TimeoutError — не дождались timeout
+        """
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Дождаться выполнения всех поставленных записей
+
+        Returns:
+            True если очередь опустела за timeout
+        """
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики записей, размер пачек, задержка в очереди и время коммита (мс)"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        done = (stats['completed'] + stats['failed']) or 1
+        transactions = stats['transactions'] or 1
+        return {
+            'submitted': stats['submitted'],
+            'completed': stats['completed'],
+            'failed': stats['failed'],
+            'queued': self._queue.qsize(),
+            'transactions': stats['transactions'],
+            'rollbacks': stats['rollbacks'],
+            'avg_batch': round((stats['completed'] + stats['failed']) / transactions, 2),
+            'max_batch': stats['max_batch'],
+            'avg_queue_latency_ms': round(stats['latency_total'] / done * 1000, 2),
+            'max_queue_latency_ms': round(stats['latency_max'] * 1000, 2),
+            'avg_commit_ms': round(stats['commit_total'] / transactions * 1000, 2),
+            'max_commit_ms': round(stats['commit_max'] * 1000, 2),
+            'write_lock': get_write_lock_stats(),
+        }
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=max(remaining, 0)) if remaining > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"❌ DB writer failed: {e}")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[_WriteJob]) -> None:
+        # Подряд идущие записи одного приложения — одна транзакция (порядок сохраняется)
+        segment: List[_WriteJob] = []
+        for job in batch:
+            if segment and job.app is not segment[0].app:
+                self._write_segment(segment)
+                segment = []
+            segment.append(job)
+        if segment:
+            self._write_segment(segment)
+
+    def _write_segment(self, jobs: List[_WriteJob]) -> None:
+        if jobs[0].app is None:
+            self._write_jobs(jobs)
+        else:
+            with jobs[0].app.app_context():
+                self._write_jobs(jobs)
+
+    def _write_jobs(self, jobs: List[_WriteJob]) -> None:
+        from models import db
+
+        now = time.monotonic()
+        with self._stats_lock:
+            for job in jobs:
+                latency = now - job.queued_at
+                self._stats['latency_total'] += latency
+                self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(jobs))
+
+        try:
+            try:
+                results = [job.fn(*job.args, **job.kwargs) for job in jobs]
+                self._commit(db.session)
+            except Exception as e:
+                db.session.rollback()
+                self._count('rollbacks')
+                if len(jobs) == 1:
+                    self._fail(jobs[0], e)
+                    return
+                # Выделяем сломанную запись: остальные выполняются по одной
+                for job in jobs:
+                    try:
+                        result = job.fn(*job.args, **job.kwargs)
+                        self._commit(db.session)
+                    except Exception as job_error:
+                        db.session.rollback()
+                        self._fail(job, job_error)
+                    else:
+                        self._complete(job, result)
+                return
+            for job, result in zip(jobs, results):
+                self._complete(job, result)
+        finally:
+            db.session.remove()
+
+    def _commit(self, session) -> None:
+        started = time.monotonic()
+        session.commit()
+        elapsed = time.monotonic() - started
+        with self._stats_lock:
+            self._stats['transactions'] += 1
+            self._stats['commit_total'] += elapsed
+            self._stats['commit_max'] = max(self._stats['commit_max'], elapsed)
+
+    def _complete(self, job: _WriteJob, result: Any) -> None:
+        self._count('completed')
+        job.future.set_result(result)
+
+    def _fail(self, job: _WriteJob, error: Exception) -> None:
+        self._count('failed')
+        logger.warning(f"⚠️ DB write {getattr(job.fn, '__name__', job.fn)} failed: {error}")
+        job.future.set_exception(error)
+
+
+def _current_app():
+    """Flask-приложение текущего контекста (для записи из фонового потока)"""
+    try:
+        from flask import current_app, has_app_context
+    except ImportError:
+        return None
+    return current_app._get_current_object() if has_app_context() else None
+
+
+def get_db_writer() -> DBWriter:
+    """Получить писатель БД процесса"""
+    return DBWriter()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковое декодирование JSON-массивов из ответов WB API
+
+Отчёты Statistics API (продажи, заказы, реализация) приходят одним
+JSON-массивом на сотни тысяч строк. response.json() держит в памяти сразу
+весь текст ответа и все строки в виде словарей. iter_json_array разбирает
+массив по мере поступления чанков: в памяти — только текущий чанк и ещё
+не обработанные строки, а вызывающий может писать строки в БД пачками.
+
+Разбор:
+- если установлен orjson, строки декодируются пачками: буфер режется по
+  последней границе «},» и префикс разбирается orjson как массив. Граница
+  внутри строки или вложенного объекта даёт невалидный JSON — тогда
+  используется медленный путь;
+- медленный путь — json.JSONDecoder.raw_decode по одному элементу
+  (C-сканер стандартной библиотеки).
+
+loads() — декодирование целого документа (orjson, если установлен).
+"""
+import codecs
+import json
+import logging
+import os
+from typing import Any, Iterable, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson опционален
+    orjson = None
+
+logger = logging.getLogger('wb_api')
+
+# Размер чанка при чтении ответа (байт)
+JSON_STREAM_CHUNK_SIZE = int(os.environ.get('JSON_STREAM_CHUNK_SIZE', str(256 * 1024)))
+
+_WHITESPACE = ' \t\n\r'
+_VALUE_END = _WHITESPACE + ',]'
+_decoder = json.JSONDecoder()
+
+
+class NotJSONArrayError(ValueError):
+    """Документ — не JSON-массив (например, объект с ошибкой)"""
+
+
+def loads(data) -> Any:
+    """Декодировать JSON-документ (str или bytes)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _skip_whitespace(buf: str, pos: int) -> int:
+    while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+class _ArrayParser:
+    """Разбор элементов массива из растущего текстового буфера"""
+
+    def __init__(self):
+        self.buf = ''
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        # Ожидается значение (после '[' или ','), иначе — ',' или ']'
+        self.expect_value = True
+        self.first = True
+
+    def feed(self, text: str, final: bool = False) -> List[Any]:
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        if not self.started:
+            self.pos = _skip_whitespace(self.buf, 0)
+            if self.pos == len(self.buf):
+                return []
+            if self.buf[self.pos] != '[':
+                raise NotJSONArrayError(f"JSON array expected, got: {self.buf[self.pos:self.pos + 200]!r}")
+            self.pos += 1
+            self.started = True
+
+        items: List[Any] = []
+        if not self.finished:
+            self._take_batch(items)
+            self._take_items(items, final)
+        return items
+
+    def _take_batch(self, items: List[Any]) -> None:
+        """Быстрый путь: все целые объекты до последней границы '},' одним вызовом orjson"""
+        if orjson is None or not self.expect_value:
+            return
+        end = self.buf.rfind('},')
+        if end < self.pos:
+            return
+        try:
+            batch = orjson.loads('[' + self.buf[self.pos:end + 1] + ']')
+        except orjson.JSONDecodeError:
+            return
+        items.extend(batch)
+        self.pos = end + 2
+        self.first = False
+
+    def _take_items(self, items: List[Any], final: bool) -> None:
+        buf = self.buf
+        while True:
+            pos = _skip_whitespace(buf, self.pos)
+            if pos == len(buf):
+                break
+            char = buf[pos]
+            if not self.expect_value:
+                if char == ',':
+                    self.expect_value = True
+                elif char == ']':
+                    self.finished = True
+                else:
+                    raise ValueError(f"Invalid JSON array at char {pos}: {buf[pos:pos + 50]!r}")
+                self.pos = pos + 1
+                if self.finished:
+                    return
+                continue
+
+            if char == ']' and self.first:
+                self.finished = True
+                self.pos = pos + 1
+                return
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break  # Элемент ещё не пришёл целиком
+            if not final and (end == len(buf) or buf[end] not in _VALUE_END):
+                break  # Число могло оборваться на границе чанка («2» из «2.5»)
+            items.append(value)
+            self.pos = end
+            self.expect_value = False
+            self.first = False
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Элементы JSON-массива по мере поступления чанков
+
+    Пустой документ (ответ 204) — пустой массив.
+
+    Args:
+        chunks: Байтовые чанки документа (UTF-8)
+
+    Raises:
+        NotJSONArrayError: Документ не является массивом
+        ValueError: Документ оборван или невалиден
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parser = _ArrayParser()
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(decoder.decode(chunk))
+    yield from parser.feed(decoder.decode(b'', final=True), final=True)
+
+    if parser.started and not parser.finished:
+        raise ValueError("Incomplete JSON array")
+    if parser.finished and parser.buf[parser.pos:].strip(_WHITESPACE):
+        raise ValueError("Extra data after JSON array")
+
+
+def iter_response_array(response, chunk_size: Optional[int] = None) -> Iterator[Any]:
+    """
+    Элементы JSON-массива из ответа requests (запрос с stream=True)
+
+    Args:
+        response: requests.Response
+        chunk_size: Размер чанка (по умолчанию JSON_STREAM_CHUNK_SIZE)
+    """
+    try:
+        yield from iter_json_array(response.iter_content(chunk_size or JSON_STREAM_CHUNK_SIZE))
+    finally:
+        response.close()
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Разбить поток элементов на списки по size"""
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Keyset-пагинация (seek) списков товаров
+
+LIMIT/OFFSET заставляет БД прочитать и отбросить offset строк на каждой
+странице: агент или загрузчик фото, проходящий десятки тысяч строк,
+платит O(offset) за страницу. Keyset-пагинация продолжает выборку
+с последней строки страницы по условию на ключ сортировки:
+
+    WHERE (sort_key, id) < (:last_sort_key, :last_id) ORDER BY sort_key DESC, id DESC
+
+Позиция передаётся клиенту непрозрачным курсором (base64 от значений
+ключа последней/первой строки и сигнатуры сортировки). Курсор другой
+сортировки не принимается.
+
+KeysetPagination совместим с Pagination Flask-SQLAlchemy (items, total,
+page, pages, iter_pages...), поэтому шаблоны со списками страниц работают
+как раньше: «вперёд/назад» идут по курсору, переход на номер страницы —
+по OFFSET. NULL в ключе сортировки идут последними в обоих направлениях.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import and_, false, or_
+
+# (колонка, по убыванию); последняя колонка — уникальная (id)
+Order = Sequence[Tuple[Any, bool]]
+
+
+class InvalidCursor(ValueError):
+    """Курсор не разобран или выдан для другой сортировки"""
+
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    return value
+
+
+def _load(value):
+    if isinstance(value, dict):
+        if '$dt' in value:
+            return datetime.fromisoformat(value['$dt'])
+        if '$d' in value:
+            return date.fromisoformat(value['$d'])
+        if '$dec' in value:
+            return Decimal(value['$dec'])
+    return value
+
+
+def _signature(order: Order) -> str:
+    return ','.join(f"{getattr(column, 'key', str(column))}:{'desc' if desc else 'asc'}"
+                    for column, desc in order)
+
+
+def encode_cursor(values: Sequence[Any], order: Order, direction: str = 'next') -> str:
+    """
+    Непрозрачный курсор позиции в списке
+
+    Args:
+        values: Значения ключа сортировки строки (в порядке order)
+        order: Сортировка [(колонка, по убыванию), ...]
+        direction: 'next' — строки после, 'prev' — строки до этой строки
+    """
+    payload = {'k': [_dump(v) for v in values], 's': _signature(order), 'd': direction}
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, order: Order) -> Tuple[List[Any], str]:
+    """
+    Разобрать курсор
+
+    Returns:
+        (значения ключа, направление)
+
+    Raises:
+        InvalidCursor: Курсор повреждён или выдан для другой сортировки
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [_load(v) for v in payload['k']]
+        direction = payload['d']
+        signature = payload['s']
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}") from e
+    if signature != _signature(order) or len(values) != len(order) or direction not in ('next', 'prev'):
+        raise InvalidCursor("Cursor does not match the list ordering")
+    return values, direction
+
+
+def _nullable(column) -> bool:
+    return getattr(getattr(column, 'expression', column), 'nullable', True)
+
+
+def _after(column, value, desc: bool):
+    # Строго после value в порядке (NULL — последними)
+    if value is None:
+        return false()
+    after = column < value if desc else column > value
+    return or_(after, column.is_(None)) if _nullable(column) else after
+
+
+def _before(column, value, desc: bool):
+    if value is None:
+        return column.isnot(None)
+    return column > value if desc else column < value
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def seek_condition(order: Order, values: Sequence[Any], direction: str = 'next'):
+    """
+    Условие «строки после (или до) позиции values» для лексикографического order
+
+    (a, id) после (a0, id0): a после a0 ИЛИ (a = a0 И id после id0).
+    """
+    step = _after if direction == 'next' else _before
+    conditions = []
+    for i, (column, desc) in enumerate(order):
+        prefix = [_equal(order[j][0], values[j]) for j in range(i)]
+        conditions.append(and_(*prefix, step(column, values[i], desc)))
+    return or_(*conditions)
+
+
+def order_clauses(order: Order, reverse: bool = False) -> list:
+    """ORDER BY для order (reverse — обратный порядок для страницы «назад»)"""
+    clauses = []
+    for column, desc in order:
+        clause = column.asc() if desc == reverse else column.desc()
+        if _nullable(column):
+            clause = clause.nulls_first() if reverse else clause.nulls_last()
+        clauses.append(clause)
+    return clauses
+
+
+def _row_key(item, order: Order) -> list:
+    return [getattr(item, column.key) for column, _ in order]
+
+
+class KeysetPagination(Pagination):
+    """
+    Страница списка по курсору (см. keyset_paginate)
+
+    Помимо полей Pagination: next_cursor / prev_cursor — курсоры соседних
+    страниц (None, если страницы нет).
+    """
+
+    def _query_items(self) -> list:
+        query = self._query_args['query']
+        order = self._query_args['order']
+        cursor = self._query_args.get('cursor')
+
+        direction = 'next'
+        if cursor:
+            values, direction = decode_cursor(cursor, order)
+            query = query.filter(seek_condition(order, values, direction))
+        query = query.order_by(*order_clauses(order, reverse=direction == 'prev'))
+        if not cursor:
+            query = query.offset(self._query_offset)
+
+        items = query.limit(self.per_page + 1).all()
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == 'prev':
+            items.reverse()
+            self._has_next, self._has_prev = True, more
+        else:
+            self._has_next, self._has_prev = more, bool(cursor) or self.page > 1
+        return items
+
+    def _query_count(self) -> int:
+        return self._query_args['query'].order_by(None).count()
+
+    @property
+    def has_next(self) -> bool:
+        return self._has_next
+
+    @property
+    def has_prev(self) -> bool:
+        return self._has_prev
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self.has_next or not self.items:
+            return None
+        order = self._query_args['order']
+        return encode_cursor(_row_key(self.items[-1], order), order, 'next')
+
+    @property
+    def prev_cursor(self) -> Optional[str]:
+        if not self.has_prev or not self.items:
+            return None
+        order = self._query_args['order']
+        return encode_cursor(_row_key(self.items[0], order), order, 'prev')
+
+
+def keyset_paginate(
+    query,
+    order: Order,
+    cursor: Optional[str] = None,
+    page: int = 1,
+    per_page: int = 50,
+    count: bool = True
+) -> KeysetPagination:
+    """
+    Страница запроса: по курсору (seek) или, без курсора, по номеру страницы
+
+    Args:
+        query: Запрос (без order_by)
+        order: Сортировка [(колонка, по убыванию), ...]; последняя колонка
+            уникальна (id) и делает порядок строк полным
+        cursor: next_cursor / prev_cursor предыдущей страницы
+        page: Номер страницы (при переходе по курсору — только для отображения)
+        per_page: Строк на странице
+        count: Считать total (COUNT(*) по всему запросу)
+
+    Raises:
+        InvalidCursor: Курсор повреждён или выдан для другой сортировки
+    """
+    return KeysetPagination(query=query, order=order, cursor=cursor, page=max(page, 1),
+                            per_page=per_page, max_per_page=None, error_out=False, count=count)
+
+
+def iterate_batches(query, id_column, batch_size: int = 500) -> Iterator[list]:
+    """
+    Пройти запрос пачками по возрастанию id (WHERE id > :last_id LIMIT n)
+
+    Args:
+        query: Запрос по модели
+        id_column: Колонка первичного ключа (Model.id)
+        batch_size: Строк в пачке
+    """
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.filter(id_column > last_id)
+        batch = batch_query.order_by(id_column.asc()).limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        last_id = getattr(batch[-1], id_column.key)
+        if len(batch) < batch_size:
+            return
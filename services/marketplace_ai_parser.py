@@ -17,7 +17,7 @@ import re
 from typing import Dict, Any, List, Optional, Tuple
 from difflib import SequenceMatcher
 
-from models import MarketplaceCategoryCharacteristic, SupplierProduct
+from models import MarketplaceCategoryCharacteristic, SupplierProduct, db
 from services.ai_service import AITask
 
 logger = logging.getLogger('marketplace_ai_parser')
@@ -199,7 +199,7 @@ class MarketplaceAwareParsingTask(AITask):
 
         try:
             examples = []
-            products = SupplierProduct.query.filter(
+            products = SupplierProduct.query.options(db.undefer(SupplierProduct.ai_marketplace_json)).filter(
                 SupplierProduct.wb_subject_id == self.category_id,
                 SupplierProduct.marketplace_validation_status == 'valid',
                 SupplierProduct.ai_marketplace_json.isnot(None),
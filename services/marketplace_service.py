@@ -16,6 +16,7 @@ from models import (
     MarketplaceDirectory, MarketplaceConnection, SupplierProduct
 )
 from services.wb_api_client import WildberriesAPIClient
+from services.wb_reference_cache import directory_name, get_wb_reference_cache
 
 logger = logging.getLogger('marketplace_service')
 
@@ -390,6 +391,8 @@ class MarketplaceService:
             try:
                 res = fetcher()
                 items = res.get('data', [])
+                # Свежий справочник — и в общий кэш справочников WB
+                get_wb_reference_cache().put(directory_name(d_type), items)
 
                 directory = MarketplaceDirectory.query.filter_by(
                     marketplace_id=marketplace_id,
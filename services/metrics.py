@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики внешних HTTP-запросов (WB API, AI-провайдеры, файлы поставщиков)
+
+Для каждой серии (api_type, endpoint, seller) собираются:
+- гистограмма длительности запросов;
+- счётчики ответов по статусам (HTTP-код, timeout, error);
+- число повторов (ретраев);
+- время ожидания в rate limiter.
+
+Метрики хранятся в памяти процесса. render_prometheus() отдаёт их в текстовом
+формате Prometheus (роут /metrics), snapshot() — сводку для админ-панели.
+Идентификаторы в путях (/content/v2/object/charcs/123) заменяются на {id},
+число серий ограничено METRICS_MAX_SERIES.
+"""
+import bisect
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from services.wb_request_coalescer import endpoint_label
+
+# Максимум серий (лишние эндпоинты попадают в endpoint="other")
+METRICS_MAX_SERIES = int(os.environ.get('METRICS_MAX_SERIES', '5000'))
+
+# Границы корзин гистограммы длительности (секунды)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+SeriesKey = Tuple[str, str, str]  # (api_type, endpoint, seller)
+
+
+class _Series:
+    """Метрики одной серии"""
+    __slots__ = ('buckets', 'count', 'sum', 'statuses', 'retries', 'limiter_wait', 'limiter_waits')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.statuses: Dict[str, int] = {}
+        self.retries = 0
+        self.limiter_wait = 0.0
+        self.limiter_waits = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+
+def _is_error(status: str) -> bool:
+    return not status.isdigit() or int(status) >= 400
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Метрики внешних запросов процесса
+
+    Пример:
+        metrics = get_metrics()
+        metrics.observe_request('content', '/content/v2/get/cards/list', seller_id, 0.42, 200)
+        metrics.record_retry('content', '/content/v2/get/cards/list', seller_id)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, max_series: int = METRICS_MAX_SERIES):
+        """
+        Args:
+            max_series: Максимум серий (api_type, endpoint, seller)
+        """
+        if self._initialized:
+            return
+
+        self.max_series = max_series
+        self._series: Dict[SeriesKey, _Series] = {}
+        self._series_lock = threading.Lock()
+        self._initialized = True
+
+    def _get_series(self, api_type: str, endpoint: str, seller_id: Any) -> _Series:
+        key = (api_type or '', endpoint_label(endpoint or ''), '' if seller_id is None else str(seller_id))
+        series = self._series.get(key)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                key = (key[0], 'other', key[2])
+                series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+        return series
+
+    def observe_request(
+        self,
+        api_type: str,
+        endpoint: str,
+        seller_id: Any,
+        duration: float,
+        status: Union[int, str]
+    ) -> None:
+        """
+        Записать выполненный запрос
+
+        Args:
+            api_type: Тип API (content, statistics, ai, supplier, ...)
+            endpoint: Эндпоинт (ID в пути заменяются на {id})
+            seller_id: ID продавца (None — не указан)
+            duration: Длительность в секундах
+            status: HTTP-код или 'timeout' / 'error'
+        """
+        status = str(status)
+        with self._series_lock:
+            series = self._get_series(api_type, endpoint, seller_id)
+            series.buckets[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+            series.count += 1
+            series.sum += duration
+            series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def record_retry(self, api_type: str, endpoint: str, seller_id: Any, count: int = 1) -> None:
+        """Записать повтор(ы) запроса"""
+        if count <= 0:
+            return
+        with self._series_lock:
+            self._get_series(api_type, endpoint, seller_id).retries += count
+
+    def observe_limiter_wait(self, api_type: str, endpoint: str, seller_id: Any, wait: float) -> None:
+        """Записать ожидание в rate limiter перед запросом"""
+        with self._series_lock:
+            series = self._get_series(api_type, endpoint, seller_id)
+            series.limiter_waits += 1
+            series.limiter_wait += max(wait, 0.0)
+
+    def reset(self) -> None:
+        """Сбросить все метрики"""
+        with self._series_lock:
+            self._series.clear()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Сводка по сериям для админ-панели (самые медленные по сумме времени — первыми)"""
+        with self._series_lock:
+            items = [(key, series) for key, series in self._series.items()]
+            rows = []
+            for (api_type, endpoint, seller), series in items:
+                errors = sum(n for status, n in series.statuses.items() if _is_error(status))
+                rows.append({
+                    'api_type': api_type,
+                    'endpoint': endpoint,
+                    'seller': seller,
+                    'count': series.count,
+                    'errors': errors,
+                    'error_rate': round(errors / series.count, 3) if series.count else 0.0,
+                    'avg': round(series.sum / series.count, 3) if series.count else None,
+                    'p50': series.quantile(0.5),
+                    'p95': series.quantile(0.95),
+                    'total_time': round(series.sum, 3),
+                    'statuses': dict(sorted(series.statuses.items())),
+                    'retries': series.retries,
+                    'limiter_wait': round(series.limiter_wait, 3),
+                    'limiter_waits': series.limiter_waits,
+                })
+        rows.sort(key=lambda row: row['total_time'], reverse=True)
+        return rows
+
+    def render_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus (exposition format 0.0.4)"""
+        with self._series_lock:
+            items = sorted(self._series.items())
+            lines = [
+                '# HELP external_request_duration_seconds Duration of outgoing HTTP requests.',
+                '# TYPE external_request_duration_seconds histogram',
+            ]
+            for key, series in items:
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + (float('inf'),), series.buckets):
+                    cumulative += bucket_count
+                    lines.append(f'external_request_duration_seconds_bucket{{{labels},le="{_format_number(bound)}"}} '
+                                 f'{cumulative}')
+                lines.append(f'external_request_duration_seconds_sum{{{labels}}} {_format_number(series.sum)}')
+                lines.append(f'external_request_duration_seconds_count{{{labels}}} {series.count}')
+
+            lines += [
+                '# HELP external_requests_total Outgoing HTTP requests by response status.',
+                '# TYPE external_requests_total counter',
+            ]
+            for key, series in items:
+                labels = self._labels(key)
+                for status, count in sorted(series.statuses.items()):
+                    lines.append(f'external_requests_total{{{labels},status="{_escape(status)}"}} {count}')
+
+            lines += [
+                '# HELP external_request_retries_total Retries of outgoing HTTP requests.',
+                '# TYPE external_request_retries_total counter',
+            ]
+            lines += [f'external_request_retries_total{{{self._labels(key)}}} {series.retries}'
+                      for key, series in items if series.retries]
+
+            lines += [
+                '# HELP rate_limiter_wait_seconds_total Time spent waiting for the rate limiter.',
+                '# TYPE rate_limiter_wait_seconds_total counter',
+            ]
+            lines += [f'rate_limiter_wait_seconds_total{{{self._labels(key)}}} '
+                      f'{_format_number(series.limiter_wait)}'
+                      for key, series in items if series.limiter_waits]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(key: SeriesKey) -> str:
+        api_type, endpoint, seller = key
+        return f'api_type="{_escape(api_type)}",endpoint="{_escape(endpoint)}",seller="{_escape(seller)}"'
+
+
+def get_metrics() -> MetricsRegistry:
+    """Получить метрики процесса"""
+    return MetricsRegistry()
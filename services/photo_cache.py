@@ -433,6 +433,7 @@ class PhotoCacheManager:
         """
         import json
         from models import SupplierProduct, Supplier
+        from services.keyset import iterate_batches
 
         supplier = Supplier.query.get(supplier_id)
         if not supplier:
@@ -445,19 +446,15 @@ class PhotoCacheManager:
         # Собираем все задания на скачивание (без постановки в очередь)
         download_tasks = []
 
-        page = 1
-        batch_size = 200
-        while True:
-            products = SupplierProduct.query.filter_by(
-                supplier_id=supplier_id
-            ).filter(
-                SupplierProduct.photo_urls_json.isnot(None),
-                SupplierProduct.photo_urls_json != '[]'
-            ).limit(batch_size).offset((page - 1) * batch_size).all()
-
-            if not products:
-                break
-
+        # Пачки по id (WHERE id > :last_id) — без OFFSET, который на больших
+        # каталогах перечитывает все предыдущие строки
+        query = SupplierProduct.query.filter_by(
+            supplier_id=supplier_id
+        ).filter(
+            SupplierProduct.photo_urls_json.isnot(None),
+            SupplierProduct.photo_urls_json != '[]'
+        )
+        for products in iterate_batches(query, SupplierProduct.id, batch_size=200):
             for product in products:
                 try:
                     photo_urls = json.loads(product.photo_urls_json)
@@ -497,8 +494,6 @@ class PhotoCacheManager:
                         fallbacks
                     ))
 
-            page += 1
-
         to_queue = len(download_tasks)
 
         logger.info(
@@ -546,6 +541,7 @@ class PhotoCacheManager:
         """
         import json
         from models import SupplierProduct, Supplier
+        from services.keyset import iterate_batches
 
         supplier = Supplier.query.get(supplier_id)
         if not supplier:
@@ -555,31 +551,31 @@ class PhotoCacheManager:
         total = 0
         cached = 0
 
-        products = SupplierProduct.query.filter_by(
+        query = SupplierProduct.query.filter_by(
             supplier_id=supplier_id
         ).filter(
             SupplierProduct.photo_urls_json.isnot(None),
             SupplierProduct.photo_urls_json != '[]'
-        ).all()
-
-        for product in products:
-            try:
-                photo_urls = json.loads(product.photo_urls_json)
-            except (json.JSONDecodeError, TypeError):
-                continue
+        )
+        for products in iterate_batches(query, SupplierProduct.id, batch_size=200):
+            for product in products:
+                try:
+                    photo_urls = json.loads(product.photo_urls_json)
+                except (json.JSONDecodeError, TypeError):
+                    continue
 
-            external_id = product.external_id or ''
+                external_id = product.external_id or ''
 
-            for ph in photo_urls:
-                if not isinstance(ph, dict):
-                    continue
-                url = ph.get('sexoptovik') or ph.get('original') or ph.get('blur')
-                if not url:
-                    continue
+                for ph in photo_urls:
+                    if not isinstance(ph, dict):
+                        continue
+                    url = ph.get('sexoptovik') or ph.get('original') or ph.get('blur')
+                    if not url:
+                        continue
 
-                total += 1
-                if self.is_cached(supplier_type, external_id, url):
-                    cached += 1
+                    total += 1
+                    if self.is_cached(supplier_type, external_id, url):
+                        cached += 1
 
         pending = total - cached
         percent = round((cached / total * 100), 1) if total > 0 else 100.0
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновое отслеживание загрузок цен в WB
+
+WB применяет цены асинхронно: POST /api/v2/upload/task только ставит
+загрузку в очередь и возвращает её ID (uploadID), а итог по товарам
+появляется позже в /api/v2/history/tasks и /api/v2/history/goods/task.
+Раньше статус либо не проверялся вовсе (товары считались применёнными,
+как только WB принял запрос), либо опрашивался прямо в запросе пользователя.
+
+Теперь:
+- batch_apply отправляет цены, регистрирует uploadID (PriceUploadTask)
+  и сразу отвечает; принятые WB товары получают статус 'processing';
+- задача планировщика раз в PRICE_UPLOAD_POLL_INTERVAL секунд берёт
+  загрузки, для которых подошло время проверки, группирует их по продавцам
+  (один клиент на ключ) и опрашивает продавцов параллельно;
+- необработанная загрузка проверяется снова с растущей паузой
+  (PRICE_UPLOAD_FIRST_CHECK * 2^attempts, не больше PRICE_UPLOAD_BACKOFF_MAX);
+- по готовности обновляются PriceChangeItem (ошибки WB по товарам),
+  история цен и цены товаров; когда завершены все загрузки батча —
+  PriceChangeBatch получает итоговый статус, продавец — уведомление.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Период задачи планировщика (секунды)
+PRICE_UPLOAD_POLL_INTERVAL = int(os.environ.get('PRICE_UPLOAD_POLL_INTERVAL', '15'))
+
+# Первая проверка загрузки и потолок паузы между проверками (секунды)
+PRICE_UPLOAD_FIRST_CHECK = float(os.environ.get('PRICE_UPLOAD_FIRST_CHECK', '5'))
+PRICE_UPLOAD_BACKOFF_MAX = float(os.environ.get('PRICE_UPLOAD_BACKOFF_MAX', '300'))
+
+# Через сколько секунд перестать ждать результат загрузки
+PRICE_UPLOAD_TASK_TTL = int(os.environ.get('PRICE_UPLOAD_TASK_TTL', str(24 * 3600)))
+
+# Загрузок за один цикл и продавцов, опрашиваемых параллельно
+PRICE_UPLOAD_POLL_BATCH = int(os.environ.get('PRICE_UPLOAD_POLL_BATCH', '200'))
+PRICE_UPLOAD_POLL_WORKERS = int(os.environ.get('PRICE_UPLOAD_POLL_WORKERS', '4'))
+
+# Статусы обработанной загрузки WB -> статус PriceUploadTask
+WB_UPLOAD_STATUSES = {
+    3: 'completed',
+    4: 'cancelled',
+    5: 'partial',
+    6: 'failed',
+}
+
+# Статус товара в истории загрузки: есть ошибки, цена не обновилась
+WB_GOOD_STATUS_ERROR = 3
+
+HISTORY_GOODS_PAGE = 1000
+
+
+class UploadCheck(NamedTuple):
+    """Результат проверки загрузки (без обращений к БД)"""
+    task_id: int
+    wb_status: Optional[int]  # None — загрузка ещё в обработке
+    data: Dict[str, Any]
+    goods_errors: Dict[int, str]  # nmID -> текст ошибки WB
+    error: Optional[str] = None  # Ошибка запроса к WB
+
+
+def _default_client_factory(api_key: str):
+    from services.wb_api_client import WildberriesAPIClient
+    return WildberriesAPIClient(api_key)
+
+
+def register_upload_tasks(seller_id: int, batch_id: Optional[int], tasks: Iterable[Dict[str, Any]]) -> list:
+    """
+    Поставить загрузки WB на отслеживание (коммит — за вызывающим)
+
+    Args:
+        seller_id: ID продавца
+        batch_id: ID батча изменений цен
+        tasks: [{"upload_id": 123, "nm_ids": [...]}] из upload_prices_batch
+
+    Returns:
+        Созданные PriceUploadTask
+    """
+    from models import PriceUploadTask, db
+
+    first_check = datetime.utcnow() + timedelta(seconds=PRICE_UPLOAD_FIRST_CHECK)
+    created = []
+    for task in tasks:
+        upload_task = PriceUploadTask(
+            seller_id=seller_id,
+            batch_id=batch_id,
+            upload_id=task['upload_id'],
+            nm_ids=list(task['nm_ids']),
+            status='pending',
+            next_check_at=first_check
+        )
+        db.session.add(upload_task)
+        created.append(upload_task)
+    if created:
+        logger.info(f"📋 Tracking {len(created)} WB price uploads (seller {seller_id}, batch {batch_id})")
+    return created
+
+
+def apply_item_result(item, seller_id: int, error: Optional[str] = None) -> None:
+    """
+    Записать итог WB по элементу батча
+
+    Успех — статус 'applied', запись в истории цен и новая цена товара.
+
+    Args:
+        item: PriceChangeItem
+        seller_id: ID продавца
+        error: Текст ошибки WB (None — цена применена)
+    """
+    from models import PriceHistory, Product, db
+
+    if error is not None:
+        item.status = 'failed'
+        item.error_message = error
+        item.wb_status = 'error'
+        return
+
+    item.status = 'applied'
+    item.wb_status = 'processed'
+    item.wb_applied_at = datetime.utcnow()
+    db.session.add(PriceHistory(
+        product_id=item.product_id,
+        seller_id=seller_id,
+        old_price=item.old_price,
+        new_price=item.new_price,
+        price_change_percent=item.price_change_percent
+    ))
+    product = db.session.get(Product, item.product_id)
+    if product:
+        product.price = item.new_price
+
+
+def finalize_batch(batch, notify: bool = True) -> bool:
+    """
+    Подвести итог батча, если все его загрузки WB завершены
+
+    Args:
+        batch: PriceChangeBatch
+        notify: Создать уведомление продавцу
+
+    Returns:
+        True — батч получил итоговый статус
+    """
+    from models import Notification, PriceChangeItem, db
+
+    if batch.upload_tasks.filter_by(status='pending').count():
+        return False
+
+    counts = dict(
+        db.session.query(PriceChangeItem.status, db.func.count(PriceChangeItem.id))
+        .filter(PriceChangeItem.batch_id == batch.id)
+        .group_by(PriceChangeItem.status)
+        .all()
+    )
+    applied_count = counts.get('applied', 0)
+    failed_count = counts.get('failed', 0) + counts.get('skipped', 0)
+
+    batch.applied_count = applied_count
+    batch.failed_count = failed_count
+    batch.applied_at = datetime.utcnow()
+    if failed_count == 0:
+        batch.status = 'applied'
+    elif applied_count > 0:
+        batch.status = 'partially_applied'
+    else:
+        batch.status = 'failed'
+
+    if notify:
+        category = {'applied': 'success', 'partially_applied': 'warning'}.get(batch.status, 'error')
+        db.session.add(Notification(
+            seller_id=batch.seller_id,
+            category=category,
+            title=f"Изменение цен: {batch.name or f'#{batch.id}'}",
+            message=f"WB применил цены: {applied_count} товаров, ошибок: {failed_count}",
+            link=f'/prices/batch/{batch.id}'
+        ))
+    logger.info(f"✅ Price batch {batch.id} finished: {batch.status} "
+                f"({applied_count} applied, {failed_count} failed)")
+    return True
+
+
+class PriceUploadTracker:
+    """
+    Опрос статусов загрузок цен WB (общий для процесса)
+
+    Пример:
+        tracker = get_price_upload_tracker()
+        with app.app_context():
+            tracker.poll_once()
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[str], Any]] = None,
+        workers: Optional[int] = None
+    ):
+        """
+        Args:
+            client_factory: Создание клиента WB по API ключу
+            workers: Продавцов, опрашиваемых параллельно
+        """
+        if self._initialized:
+            return
+
+        self.client_factory = client_factory or _default_client_factory
+        self.workers = max(1, workers or PRICE_UPLOAD_POLL_WORKERS)
+        # Циклы не должны пересекаться (планировщик + ручной запуск)
+        self._cycle_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'cycles': 0, 'checks': 0, 'not_ready': 0, 'completed': 0,
+            'expired': 0, 'errors': 0, 'last_cycle_at': None,
+        }
+        self._initialized = True
+
+    # ------------------------------------------------------------------
+    # Запросы к WB (в потоках, без БД)
+    # ------------------------------------------------------------------
+
+    def _check_upload(self, client, task_id: int, upload_id: int) -> UploadCheck:
+        try:
+            data = client.get_price_upload_status(upload_id=upload_id).get('data') or {}
+        except Exception as e:
+            return UploadCheck(task_id, None, {}, {}, str(e))
+
+        wb_status = data.get('status')
+        if wb_status not in WB_UPLOAD_STATUSES:
+            return UploadCheck(task_id, None, data, {})
+
+        goods_errors: Dict[int, str] = {}
+        if wb_status in (5, 6):
+            offset = 0
+            try:
+                while True:
+                    goods = client.get_price_upload_goods(upload_id, limit=HISTORY_GOODS_PAGE, offset=offset)
+                    for good in goods:
+                        if good.get('status') == WB_GOOD_STATUS_ERROR:
+                            goods_errors[good.get('nmID')] = good.get('errorText') or 'Ошибка WB'
+                    if len(goods) < HISTORY_GOODS_PAGE:
+                        break
+                    offset += HISTORY_GOODS_PAGE
+            except Exception as e:
+                # Итог по товарам не получен — проверим загрузку ещё раз
+                return UploadCheck(task_id, None, data, {}, str(e))
+        return UploadCheck(task_id, wb_status, data, goods_errors)
+
+    def _check_seller(self, api_key: str, uploads: List[tuple]) -> List[UploadCheck]:
+        client = self.client_factory(api_key)
+        try:
+            return [self._check_upload(client, task_id, upload_id) for task_id, upload_id in uploads]
+        finally:
+            close = getattr(client, 'close', None)
+            if close is not None:
+                close()
+
+    # ------------------------------------------------------------------
+    # Цикл опроса
+    # ------------------------------------------------------------------
+
+    def poll_once(self) -> Dict[str, int]:
+        """
+        Проверить загрузки, для которых подошло время (нужен контекст приложения)
+
+        Returns:
+            {"checked": 5, "completed": 2, "expired": 0, "batches_finished": 1}
+        """
+        summary = {'checked': 0, 'completed': 0, 'expired': 0, 'batches_finished': 0}
+        if not self._cycle_lock.acquire(blocking=False):
+            return summary
+        try:
+            return self._poll(summary)
+        finally:
+            self._cycle_lock.release()
+
+    def _poll(self, summary: Dict[str, int]) -> Dict[str, int]:
+        from models import PriceChangeBatch, PriceUploadTask, Seller, db
+
+        now = datetime.utcnow()
+        due = (
+            PriceUploadTask.query
+            .filter(PriceUploadTask.status == 'pending', PriceUploadTask.next_check_at <= now)
+            .order_by(PriceUploadTask.next_check_at)
+            .limit(PRICE_UPLOAD_POLL_BATCH)
+            .all()
+        )
+        if not due:
+            return summary
+
+        tasks = {task.id: task for task in due}
+        by_seller: Dict[int, List[tuple]] = defaultdict(list)
+        for task in due:
+            by_seller[task.seller_id].append((task.id, task.upload_id))
+
+        sellers = {s.id: s for s in Seller.query.filter(Seller.id.in_(list(by_seller))).all()}
+        checks: List[UploadCheck] = []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(by_seller)),
+                                thread_name_prefix='price-upload') as executor:
+            futures = []
+            for seller_id, uploads in by_seller.items():
+                seller = sellers.get(seller_id)
+                if seller is None or not seller.wb_api_key:
+                    checks.extend(UploadCheck(task_id, None, {}, {}, 'API ключ не настроен')
+                                  for task_id, _ in uploads)
+                    continue
+                futures.append(executor.submit(self._check_seller, seller.wb_api_key, uploads))
+            for future in futures:
+                checks.extend(future.result())
+
+        batch_ids = set()
+        for check in checks:
+            task = tasks[check.task_id]
+            summary['checked'] += 1
+            if check.wb_status is not None:
+                self._complete(task, check)
+                summary['completed'] += 1
+            elif task.created_at <= now - timedelta(seconds=PRICE_UPLOAD_TASK_TTL):
+                self._expire(task, check.error)
+                summary['expired'] += 1
+            else:
+                task.attempts += 1
+                task.last_error = check.error
+                delay = min(PRICE_UPLOAD_BACKOFF_MAX, PRICE_UPLOAD_FIRST_CHECK * (2 ** task.attempts))
+                task.next_check_at = now + timedelta(seconds=delay)
+                continue
+            if task.batch_id:
+                batch_ids.add(task.batch_id)
+
+        db.session.flush()
+        for batch in PriceChangeBatch.query.filter(PriceChangeBatch.id.in_(list(batch_ids))).all():
+            if finalize_batch(batch):
+                summary['batches_finished'] += 1
+        db.session.commit()
+
+        with self._stats_lock:
+            self._stats['cycles'] += 1
+            self._stats['checks'] += summary['checked']
+            self._stats['completed'] += summary['completed']
+            self._stats['expired'] += summary['expired']
+            self._stats['not_ready'] += summary['checked'] - summary['completed'] - summary['expired']
+            self._stats['errors'] += sum(1 for check in checks if check.error)
+            self._stats['last_cycle_at'] = now.isoformat()
+        logger.info(f"📋 Price upload poll: {summary}")
+        return summary
+
+    def _task_items(self, task) -> list:
+        from models import PriceChangeItem
+
+        if not task.batch_id or not task.nm_ids:
+            return []
+        return PriceChangeItem.query.filter(
+            PriceChangeItem.batch_id == task.batch_id,
+            PriceChangeItem.nm_id.in_(task.nm_ids),
+            PriceChangeItem.status == 'processing'
+        ).all()
+
+    def _complete(self, task, check: UploadCheck) -> None:
+        task.status = WB_UPLOAD_STATUSES[check.wb_status]
+        task.wb_status = check.wb_status
+        task.total_goods = check.data.get('overAllGoodsNumber')
+        task.success_goods = check.data.get('successGoodsNumber')
+        task.completed_at = datetime.utcnow()
+        task.last_error = None
+
+        for item in self._task_items(task):
+            error = check.goods_errors.get(item.nm_id)
+            if error is None and check.wb_status == 4:
+                error = 'Загрузка отменена WB'
+            elif error is None and check.wb_status == 6:
+                error = 'Ошибка WB'
+            apply_item_result(item, task.seller_id, error)
+
+        if check.goods_errors and task.batch is not None:
+            grouped: Dict[str, List[int]] = defaultdict(list)
+            for nm_id, text in check.goods_errors.items():
+                grouped[text].append(nm_id)
+            task.batch.apply_errors = list(task.batch.apply_errors or []) + [
+                {'error': text, 'nm_ids': nm_ids} for text, nm_ids in grouped.items()
+            ]
+        logger.info(f"✅ WB price upload {task.upload_id}: {task.status}")
+
+    def _expire(self, task, error: Optional[str]) -> None:
+        task.status = 'expired'
+        task.last_error = error
+        task.completed_at = datetime.utcnow()
+        for item in self._task_items(task):
+            apply_item_result(item, task.seller_id, 'Результат загрузки WB не получен')
+        logger.warning(f"⚠️ WB price upload {task.upload_id} expired after {task.attempts} checks")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика опроса (в рамках процесса)"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+def get_price_upload_tracker() -> PriceUploadTracker:
+    """Получить трекер загрузок цен WB"""
+    return PriceUploadTracker()
@@ -87,6 +87,15 @@ def init_scheduler(flask_app):
         replace_existing=True
     )
 
+    # Обновление кэша справочников WB по сроку (каждый час; свежие справочники не запрашиваются)
+    scheduler.add_job(
+        func=lambda: refresh_wb_reference_cache(flask_app),
+        trigger=IntervalTrigger(hours=1),
+        id='wb_reference_cache_refresh',
+        name='Refresh stale WB reference directories',
+        replace_existing=True
+    )
+
     # Фоновая синхронизация брендов с WB (каждые 6 часов)
     scheduler.add_job(
         func=lambda: sync_brands_background(flask_app),
@@ -161,6 +170,16 @@ def init_scheduler(flask_app):
         replace_existing=True
     )
 
+    # Опрос результатов загрузок цен в WB
+    from services.price_upload_tracker import PRICE_UPLOAD_POLL_INTERVAL
+    scheduler.add_job(
+        func=lambda: poll_price_upload_tasks(flask_app),
+        trigger=IntervalTrigger(seconds=PRICE_UPLOAD_POLL_INTERVAL),
+        id='price_upload_tracker',
+        name='Poll WB price upload tasks',
+        replace_existing=True
+    )
+
     # Запускаем планировщик
     scheduler.start()
 
@@ -182,7 +201,7 @@ def check_and_sync_all_sellers(flask_app):
     """
     from models import Seller, ProductSyncSettings
     from seller_platform import _perform_product_sync_task
-    import threading
+    from services.sync_executor import get_sync_executor, PRIORITY_SCHEDULED
 
     with flask_app.app_context():
         try:
@@ -212,22 +231,19 @@ def check_and_sync_all_sellers(flask_app):
                     logger.info(f"⏰ Time for scheduled sync for seller {seller.id}")
 
                 if should_sync and seller.api_sync_status != 'syncing':
-                    # Запускаем синхронизацию в фоновом потоке
-                    logger.info(f"🚀 Starting background sync for seller {seller.id} ({seller.company_name})")
+                    # Ставим синхронизацию в очередь пула воркеров
+                    logger.info(f"🚀 Scheduling background sync for seller {seller.id} ({seller.company_name})")
 
                     # Обновляем next_sync_at
                     settings.next_sync_at = datetime.utcnow() + timedelta(minutes=settings.sync_interval_minutes)
                     from models import db
                     db.session.commit()
 
-                    # Запускаем синхронизацию
-                    thread = threading.Thread(
-                        target=_perform_product_sync_task,
+                    get_sync_executor().submit(
+                        seller.id, _perform_product_sync_task,
                         args=(seller.id, flask_app),
-                        daemon=True,
-                        name=f"sync-seller-{seller.id}"
+                        priority=PRIORITY_SCHEDULED
                     )
-                    thread.start()
                 elif seller.api_sync_status == 'syncing':
                     logger.debug(f"⏳ Seller {seller.id} sync already in progress")
 
@@ -340,6 +356,7 @@ def sync_blocked_cards_all_sellers(flask_app):
     """
     from models import Seller, BlockedCard, ShadowedCard, BlockedCardsSyncSettings, APILog, db
     from services.wb_api_client import WildberriesAPIClient
+    from services.wb_async_client import fetch_parallel
 
     with flask_app.app_context():
         try:
@@ -373,21 +390,31 @@ def sync_blocked_cards_all_sellers(flask_app):
                 try:
                     client = WildberriesAPIClient(
                         api_key=seller.wb_api_key,
-                        db_logger_callback=lambda **kwargs: APILog.log_request(**kwargs)
+                        db_logger_callback=APILog.log_request
                     )
 
+                    # Заблокированные и скрытые — разные методы с отдельными
+                    # лимитами, поэтому запрашиваем их параллельно
+                    fetched = fetch_parallel(client, {
+                        'blocked': ('get_blocked_cards', {
+                            'sort': 'nmId', 'order': 'asc',
+                            'log_to_db': True, 'seller_id': seller.id,
+                        }),
+                        'shadowed': ('get_shadowed_cards', {
+                            'sort': 'nmId', 'order': 'asc',
+                            'log_to_db': True, 'seller_id': seller.id,
+                        }),
+                    })
+                    for result in fetched.values():
+                        if isinstance(result, Exception):
+                            raise result
+
                     # --- Заблокированные ---
-                    blocked_api = client.get_blocked_cards(
-                        sort='nmId', order='asc',
-                        log_to_db=True, seller_id=seller.id
-                    )
+                    blocked_api = fetched['blocked']
                     _upsert_blocked_cards(seller.id, blocked_api, db)
 
                     # --- Скрытые ---
-                    shadowed_api = client.get_shadowed_cards(
-                        sort='nmId', order='asc',
-                        log_to_db=True, seller_id=seller.id
-                    )
+                    shadowed_api = fetched['shadowed']
                     _upsert_shadowed_cards(seller.id, shadowed_api, db)
 
                     sync_settings.last_sync_at = datetime.utcnow()
@@ -412,51 +439,66 @@ def sync_blocked_cards_all_sellers(flask_app):
             logger.exception(f"❌ Error in sync_blocked_cards_all_sellers: {e}")
 
 
-def _upsert_blocked_cards(seller_id, api_data, db):
-    """Обновить таблицу blocked_cards по данным из API"""
-    from models import BlockedCard
+def _upsert_banned_cards(model, seller_id, api_data, db, fields):
+    """
+    Пакетно обновить таблицу заблокированных/скрытых карточек по данным из API
 
-    now = datetime.utcnow()
-    api_nm_ids = set()
+    Существующие карточки загружаются одним запросом, новые вставляются,
+    остальные обновляются пачками (services.bulk_upsert). Поля, которых нет
+    в ответе API, у существующих карточек не перезаписываются.
 
+    Args:
+        model: BlockedCard или ShadowedCard
+        seller_id: ID продавца
+        api_data: Ответ API (список карточек)
+        db: SQLAlchemy db
+        fields: Соответствие полей API колонкам модели
+
+    Returns:
+        UpsertResult(created, updated)
+    """
+    from services.bulk_upsert import BulkUpserter
+
+    now = datetime.utcnow()
+    rows = {}
     for item in api_data:
         nm_id = item.get('nmId')
         if not nm_id:
             continue
-        api_nm_ids.add(nm_id)
-
-        existing = BlockedCard.query.filter_by(
-            seller_id=seller_id, nm_id=nm_id
-        ).first()
-
-        if existing:
-            existing.vendor_code = item.get('vendorCode', existing.vendor_code)
-            existing.title = item.get('title', existing.title)
-            existing.brand = item.get('brand', existing.brand)
-            existing.reason = item.get('reason', existing.reason)
-            existing.last_seen_at = now
-            existing.is_active = True
-        else:
-            card = BlockedCard(
-                seller_id=seller_id,
-                nm_id=nm_id,
-                vendor_code=item.get('vendorCode'),
-                title=item.get('title'),
-                brand=item.get('brand'),
-                reason=item.get('reason'),
-                first_seen_at=now,
-                last_seen_at=now,
-                is_active=True,
-            )
-            db.session.add(card)
+        row = {'seller_id': seller_id, 'nm_id': nm_id, 'first_seen_at': now,
+               'last_seen_at': now, 'is_active': True}
+        for api_field, column in fields.items():
+            if api_field in item:
+                row[column] = item[api_field]
+        rows[nm_id] = row
+
+    upserter = BulkUpserter(
+        db.session, model, ('nm_id',),
+        filters=(model.seller_id == seller_id,),
+        insert_only=('seller_id', 'nm_id', 'first_seen_at')
+    )
+    result = upserter.upsert(rows.values())
 
     # Помечаем карточки, которых нет в API, как неактивные (разблокированы)
-    BlockedCard.query.filter(
-        BlockedCard.seller_id == seller_id,
-        BlockedCard.is_active == True,
-        ~BlockedCard.nm_id.in_(api_nm_ids) if api_nm_ids else True
-    ).update({'is_active': False, 'last_seen_at': now}, synchronize_session='fetch')
+    model.query.filter(
+        model.seller_id == seller_id,
+        model.is_active == True,
+        ~model.nm_id.in_(list(rows)) if rows else True
+    ).update({'is_active': False, 'last_seen_at': now}, synchronize_session=False)
+
+    return result
+
+
+def _upsert_blocked_cards(seller_id, api_data, db):
+    """Обновить таблицу blocked_cards по данным из API"""
+    from models import BlockedCard
 
+    _upsert_banned_cards(BlockedCard, seller_id, api_data, db, {
+        'vendorCode': 'vendor_code',
+        'title': 'title',
+        'brand': 'brand',
+        'reason': 'reason',
+    })
     db.session.commit()
 
 
@@ -464,55 +506,28 @@ def _upsert_shadowed_cards(seller_id, api_data, db):
     """Обновить таблицу shadowed_cards по данным из API"""
     from models import ShadowedCard, Product
 
-    now = datetime.utcnow()
-    api_nm_ids = set()
-
-    for item in api_data:
-        nm_id = item.get('nmId')
-        if not nm_id:
-            continue
-        api_nm_ids.add(nm_id)
-
-        existing = ShadowedCard.query.filter_by(
-            seller_id=seller_id, nm_id=nm_id
-        ).first()
-
-        if existing:
-            existing.vendor_code = item.get('vendorCode', existing.vendor_code)
-            existing.title = item.get('title', existing.title)
-            existing.brand = item.get('brand', existing.brand)
-            existing.nm_rating = item.get('nmRating', existing.nm_rating)
-            existing.last_seen_at = now
-            existing.is_active = True
-        else:
-            card = ShadowedCard(
-                seller_id=seller_id,
-                nm_id=nm_id,
-                vendor_code=item.get('vendorCode'),
-                title=item.get('title'),
-                brand=item.get('brand'),
-                nm_rating=item.get('nmRating'),
-                first_seen_at=now,
-                last_seen_at=now,
-                is_active=True,
+    _upsert_banned_cards(ShadowedCard, seller_id, api_data, db, {
+        'vendorCode': 'vendor_code',
+        'title': 'title',
+        'brand': 'brand',
+        'nmRating': 'nm_rating',
+    })
+
+    # Обновляем nm_rating в таблице products (cross-update, одним bulk update)
+    ratings = {
+        item.get('nmId'): item.get('nmRating')
+        for item in api_data
+        if item.get('nmId') and item.get('nmRating') is not None
+    }
+    if ratings:
+        rating_updates = [
+            {'id': product_id, 'nm_rating': ratings[nm_id]}
+            for product_id, nm_id in db.session.query(Product.id, Product.nm_id).filter(
+                Product.seller_id == seller_id,
+                Product.nm_id.in_(list(ratings))
             )
-            db.session.add(card)
-
-    # Помечаем карточки, которых нет в API, как неактивные (разблокированы)
-    ShadowedCard.query.filter(
-        ShadowedCard.seller_id == seller_id,
-        ShadowedCard.is_active == True,
-        ~ShadowedCard.nm_id.in_(api_nm_ids) if api_nm_ids else True
-    ).update({'is_active': False, 'last_seen_at': now}, synchronize_session='fetch')
-
-    # Обновляем nm_rating в таблице products (cross-update)
-    for item in api_data:
-        nm_id = item.get('nmId')
-        nm_rating = item.get('nmRating')
-        if nm_id and nm_rating is not None:
-            Product.query.filter_by(
-                seller_id=seller_id, nm_id=nm_id
-            ).update({'nm_rating': nm_rating}, synchronize_session=False)
+        ]
+        db.session.bulk_update_mappings(Product, rating_updates)
 
     db.session.commit()
 
@@ -584,6 +599,57 @@ def sync_marketplaces(flask_app):
             logger.exception(f"❌ Error in sync_marketplaces: {e}")
 
 
+def get_wb_reference_client():
+    """
+    Клиент WB API для загрузки справочников (они не зависят от продавца)
+
+    Берётся ключ маркетплейса WB, а если его нет — ключ первого продавца с API ключом.
+
+    Returns:
+        WildberriesAPIClient или None
+    """
+    from models import Marketplace, Seller
+    from services.wb_api_client import WildberriesAPIClient
+
+    marketplace = Marketplace.query.filter_by(code='wb').first()
+    if marketplace and marketplace.api_key:
+        return WildberriesAPIClient(api_key=marketplace.api_key)
+    for seller in Seller.query.filter(Seller._wb_api_key_encrypted.isnot(None)).order_by(Seller.id):
+        if seller.has_valid_api_key():
+            return WildberriesAPIClient(api_key=seller.wb_api_key)
+    return None
+
+
+def refresh_wb_reference_cache(flask_app, force=False):
+    """Обновить устаревшие справочники WB в постоянном кэше"""
+    from services.wb_reference_cache import warmup
+
+    with flask_app.app_context():
+        try:
+            client = get_wb_reference_client()
+            if client is None:
+                logger.info("WB reference cache refresh skipped: no WB API key configured")
+                return None
+            with client:
+                return warmup(client, force=force)
+        except Exception as e:
+            logger.exception(f"❌ Error refreshing WB reference cache: {e}")
+            return None
+
+
+def poll_price_upload_tasks(flask_app):
+    """Проверить статусы загрузок цен в WB, для которых подошло время"""
+    from services.price_upload_tracker import get_price_upload_tracker
+
+    with flask_app.app_context():
+        try:
+            return get_price_upload_tracker().poll_once()
+        except Exception as e:
+            from models import db
+            db.session.rollback()
+            logger.exception(f"❌ Error polling WB price uploads: {e}")
+            return None
+
 
 def shutdown_scheduler():
     """Остановить планировщик"""
@@ -601,14 +667,37 @@ def get_scheduler_status():
     Получить статус планировщика
 
     Returns:
-        dict: Информация о планировщике и запланированных задачах
+        dict: Информация о планировщике, запланированных задачах, очереди
+        синхронизаций, конвейерах синхронизации (пропускная способность
+        и глубина очередей по стадиям), кэше ответов WB API, объединении
+        одинаковых запросов к WB API, кэше справочников WB, фоновой записи
+        логов API, circuit breaker хостов WB API, опросе загрузок цен
+        и фоновой записи в БД (очередь DBWriter и блокировка записи SQLite)
     """
     global scheduler
+    from services.api_log_writer import get_api_log_writer
+    from services.db_writer import get_db_writer
+    from services.sync_pipeline import get_pipeline_stats
+    from services.sync_executor import get_sync_executor
+    from services.wb_request_coalescer import get_request_coalescer
+    from services.wb_reference_cache import get_wb_reference_cache
+    from services.wb_response_cache import get_wb_response_cache
+    from services.wb_retry import get_circuit_breaker
+    from services.price_upload_tracker import get_price_upload_tracker
 
     if scheduler is None:
         return {
             'running': False,
-            'jobs': []
+            'jobs': [],
+            'sync_executor': get_sync_executor().get_stats(),
+            'pipelines': get_pipeline_stats(),
+            'wb_response_cache': get_wb_response_cache().get_stats(),
+            'wb_request_coalescing': get_request_coalescer().get_stats(),
+            'wb_reference_cache': get_wb_reference_cache().get_stats(),
+            'api_log_writer': get_api_log_writer().get_stats(),
+            'wb_circuit_breaker': get_circuit_breaker().get_stats(),
+            'price_upload_tracker': get_price_upload_tracker().get_stats(),
+            'db_writer': get_db_writer().get_stats()
         }
 
     jobs_info = []
@@ -621,7 +710,16 @@ def get_scheduler_status():
 
     return {
         'running': scheduler.running,
-        'jobs': jobs_info
+        'jobs': jobs_info,
+        'sync_executor': get_sync_executor().get_stats(),
+        'pipelines': get_pipeline_stats(),
+        'wb_response_cache': get_wb_response_cache().get_stats(),
+        'wb_request_coalescing': get_request_coalescer().get_stats(),
+        'wb_reference_cache': get_wb_reference_cache().get_stats(),
+        'api_log_writer': get_api_log_writer().get_stats(),
+        'wb_circuit_breaker': get_circuit_breaker().get_stats(),
+        'price_upload_tracker': get_price_upload_tracker().get_stats(),
+        'db_writer': get_db_writer().get_stats()
     }
 
 
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Полнотекстовый поиск по карточкам продавца и каталогу поставщика
+
+Поиск в списках товаров был набором ilike('%...%') по нескольким колонкам:
+такой фильтр не использует индексы (полный проход по товарам продавца на
+каждый запрос) и в SQLite не учитывает регистр кириллицы.
+
+SQLite: FTS5-таблицы products_fts и supplier_products_fts (rowid = id
+товара). Индекс поддерживают триггеры AFTER INSERT/UPDATE/DELETE на
+таблицах товаров, поэтому его обновляет любой писатель — синхронизация
+с WB, импорт каталога, ручное редактирование — в той же транзакции.
+Токенизатор unicode61 приводит регистр (в т.ч. кириллицы) и снимает
+диакритику, «ё» приводится к «е» в триггерах и в запросе.
+
+Морфология: стеммера для русского в FTS5 нет, поэтому у слов запроса
+отрезаются окончания (stem_word) и ищется префикс: «кружки» -> кружк*
+находит «кружка», «кружкой». Артикулы, nm_id и баркоды ищутся по
+префиксу. Результаты ранжируются bm25 с весами колонок: совпадение
+в артикуле или баркоде весомее, чем в названии.
+
+PostgreSQL: to_tsvector('russian', ...) по тем же колонкам с GIN-индексом
+по выражению, ранжирование ts_rank.
+
+Если индекс недоступен (SQLite без FTS5, индекс не создан), используется
+прежний ilike. Индексы создаёт ensure_search_indexes() при старте
+приложения; rebuild_search_index() перестраивает индекс по таблице.
+"""
+import logging
+import re
+import weakref
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import String, column, func, literal_column, or_, table
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких слов запроса (длинная строка не превращается в тяжёлый MATCH)
+SEARCH_MAX_TERMS = 8
+
+_FOLD_YO = "replace(replace({value}, 'ё', 'е'), 'Ё', 'Е')"
+
+# Баркоды карточки WB: sizes_json = [{"techSize": ..., "skus": ["2000..."]}, ...]
+_SQLITE_SKUS = (
+    "CASE WHEN json_valid({row}.sizes_json) AND json_type({row}.sizes_json) = 'array' THEN "
+    "(SELECT group_concat(sku.value, ' ') FROM json_each({row}.sizes_json) AS size, "
+    "json_each(size.value, '$.skus') AS sku WHERE size.type = 'object') END"
+)
+
+
+class SearchIndex(NamedTuple):
+    """Описание полнотекстового индекса таблицы товаров"""
+    table: str
+    fts_table: str
+    # (колонка индекса, SQL-выражение SQLite от строки {row}, вес bm25)
+    columns: Tuple[Tuple[str, str, float], ...]
+    # Колонки таблицы, изменение которых переиндексирует строку
+    source_columns: Tuple[str, ...]
+    # Колонки для ilike, если индекса нет
+    fallback_columns: Tuple[str, ...]
+    # Документ для to_tsvector в PostgreSQL
+    pg_document: str
+
+
+SEARCH_INDEXES: Dict[str, SearchIndex] = {
+    'products': SearchIndex(
+        table='products',
+        fts_table='products_fts',
+        columns=(
+            ('title', _FOLD_YO.format(value='{row}.title'), 1.0),
+            ('vendor_code', _FOLD_YO.format(value='{row}.vendor_code'), 4.0),
+            ('brand', _FOLD_YO.format(value='{row}.brand'), 2.0),
+            ('nm_id', '{row}.nm_id', 4.0),
+            ('barcodes', _SQLITE_SKUS, 4.0),
+        ),
+        source_columns=('title', 'vendor_code', 'brand', 'nm_id', 'sizes_json'),
+        fallback_columns=('vendor_code', 'title', 'brand', 'nm_id'),
+        pg_document=(
+            "coalesce(title, '') || ' ' || coalesce(vendor_code, '') || ' ' || "
+            "coalesce(brand, '') || ' ' || coalesce(nm_id::text, '') || ' ' || coalesce(sizes_json, '')"
+        ),
+    ),
+    'supplier_products': SearchIndex(
+        table='supplier_products',
+        fts_table='supplier_products_fts',
+        columns=(
+            ('title', _FOLD_YO.format(value='{row}.title'), 1.0),
+            ('vendor_code', _FOLD_YO.format(value='{row}.vendor_code'), 4.0),
+            ('external_id', '{row}.external_id', 4.0),
+            ('brand', _FOLD_YO.format(value='{row}.brand'), 2.0),
+            ('barcode', '{row}.barcode', 4.0),
+        ),
+        source_columns=('title', 'vendor_code', 'external_id', 'brand', 'barcode'),
+        fallback_columns=('title', 'external_id', 'vendor_code', 'brand'),
+        pg_document=(
+            "coalesce(title, '') || ' ' || coalesce(vendor_code, '') || ' ' || "
+            "coalesce(external_id, '') || ' ' || coalesce(brand, '') || ' ' || coalesce(barcode, '')"
+        ),
+    ),
+}
+
+# Окончания русских слов (прилагательные, существительные), длинные — первыми
+_RU_ENDINGS = sorted((
+    'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой',
+    'ую', 'юю', 'ых', 'их', 'ым', 'им', 'ом', 'ем', 'ами', 'ями', 'ов', 'ев', 'ей', 'ам', 'ям',
+    'ах', 'ях', 'ию', 'ия', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+_MIN_STEM = 3
+_CYRILLIC = re.compile(r'^[а-я]+$')
+_WORD = re.compile(r'\w+')
+
+# Движок -> {таблица: есть ли индекс}
+_ready = weakref.WeakKeyDictionary()
+
+
+def stem_word(word: str) -> str:
+    """
+    Основа русского слова для префиксного поиска
+
+    Отрезает самое длинное окончание, после которого остаётся не меньше
+    трёх букв; слова не на кириллице возвращаются как есть.
+    """
+    word = word.lower().replace('ё', 'е')
+    if not _CYRILLIC.match(word):
+        return word
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def search_terms(search: str) -> Sequence[str]:
+    """Основы слов запроса (не больше SEARCH_MAX_TERMS)"""
+    return [stem_word(word) for word in _WORD.findall(search or '')][:SEARCH_MAX_TERMS]
+
+
+def build_match_query(search: str) -> Optional[str]:
+    """
+    Запрос FTS5 MATCH: все слова запроса по префиксу
+
+    Returns:
+        Строка MATCH или None, если в запросе нет слов
+    """
+    terms = search_terms(search)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def build_tsquery(search: str) -> Optional[str]:
+    """Запрос to_tsquery('russian', ...) для PostgreSQL: все слова по префиксу"""
+    terms = search_terms(search)
+    if not terms:
+        return None
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _sqlite_columns(index: SearchIndex, row: str) -> str:
+    return ', '.join(expression.format(row=row) for _, expression, _ in index.columns)
+
+
+def _sqlite_ddl(index: SearchIndex) -> Sequence[str]:
+    names = ', '.join(name for name, _, _ in index.columns)
+    insert = (f"INSERT INTO {index.fts_table}(rowid, {names}) "
+              f"VALUES (new.id, {_sqlite_columns(index, 'new')});")
+    delete = f"DELETE FROM {index.fts_table} WHERE rowid = old.id;"
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {index.fts_table}_ai AFTER INSERT ON {index.table} "
+        f"BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index.fts_table}_ad AFTER DELETE ON {index.table} "
+        f"BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index.fts_table}_au "
+        f"AFTER UPDATE OF {', '.join(index.source_columns)} ON {index.table} "
+        f"BEGIN {delete} {insert} END",
+    )
+
+
+def _pg_vector(index: SearchIndex) -> str:
+    return f"to_tsvector('russian', translate({index.pg_document}, 'ёЁ', 'еЕ'))"
+
+
+def rebuild_search_index(connection, name: str) -> int:
+    """
+    Перестроить FTS-индекс SQLite по таблице товаров
+
+    Args:
+        connection: SQLAlchemy Connection (коммит — за вызывающим)
+        name: Ключ SEARCH_INDEXES
+
+    Returns:
+        Число проиндексированных строк
+    """
+    index = SEARCH_INDEXES[name]
+    names = ', '.join(column_name for column_name, _, _ in index.columns)
+    connection.exec_driver_sql(f"DELETE FROM {index.fts_table}")
+    connection.exec_driver_sql(
+        f"INSERT INTO {index.fts_table}(rowid, {names}) "
+        f"SELECT id, {_sqlite_columns(index, index.table)} FROM {index.table}"
+    )
+    return connection.exec_driver_sql(f"SELECT COUNT(*) FROM {index.fts_table}").scalar()
+
+
+def _ensure_sqlite(connection, index: SearchIndex) -> bool:
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (index.fts_table,)
+    ).scalar()
+    if not exists:
+        names = ', '.join(name for name, _, _ in index.columns)
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {index.fts_table} USING fts5("
+            f"{names}, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        weights = ', '.join(str(weight) for _, _, weight in index.columns)
+        connection.exec_driver_sql(
+            f"INSERT INTO {index.fts_table}({index.fts_table}, rank) VALUES ('rank', 'bm25({weights})')"
+        )
+    for ddl in _sqlite_ddl(index):
+        connection.exec_driver_sql(ddl)
+    if not exists:
+        count = rebuild_search_index(connection, index.table)
+        logger.info(f"🔎 Search index {index.fts_table} built: {count} rows")
+    return True
+
+
+def _ensure_postgresql(connection, index: SearchIndex) -> bool:
+    connection.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS idx_{index.table}_search ON {index.table} "
+        f"USING gin (({_pg_vector(index)}))"
+    )
+    return True
+
+
+def ensure_search_indexes(engine) -> Dict[str, bool]:
+    """
+    Создать индексы полнотекстового поиска (идемпотентно)
+
+    SQLite: FTS5-таблицы и триггеры; новая таблица сразу заполняется
+    из таблицы товаров. PostgreSQL: GIN-индексы по to_tsvector.
+
+    Args:
+        engine: Движок БД
+
+    Returns:
+        dict: таблица -> индекс доступен
+    """
+    from sqlalchemy import inspect
+
+    dialect = engine.dialect.name
+    tables = set(inspect(engine).get_table_names())
+    result = {}
+    for name, index in SEARCH_INDEXES.items():
+        if index.table not in tables or dialect not in ('sqlite', 'postgresql'):
+            result[name] = False
+            continue
+        try:
+            with engine.begin() as connection:
+                if dialect == 'sqlite':
+                    result[name] = _ensure_sqlite(connection, index)
+                else:
+                    result[name] = _ensure_postgresql(connection, index)
+        except Exception as e:
+            # Например, SQLite собран без FTS5 — поиск останется на ilike
+            logger.warning(f"⚠️ Search index for {index.table} is unavailable: {e}")
+            result[name] = False
+        _ready.setdefault(engine, {})[name] = result[name]
+    return result
+
+
+def _index_ready(bind, name: str) -> bool:
+    engine = bind.engine
+    known = _ready.setdefault(engine, {})
+    if name not in known:
+        # Индекс создан другим процессом (или ещё нет) — проверяем один раз
+        index = SEARCH_INDEXES[name]
+        with engine.connect() as connection:
+            if engine.dialect.name == 'sqlite':
+                sql, params = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (index.fts_table,)
+            else:
+                sql, params = "SELECT 1 FROM pg_indexes WHERE indexname = %s", (f'idx_{index.table}_search',)
+            known[name] = bool(connection.exec_driver_sql(sql, params).scalar())
+    return known[name]
+
+
+def _ilike(query, model, index: SearchIndex, search: str):
+    conditions = []
+    for name in index.fallback_columns:
+        attribute = getattr(model, name)
+        if not isinstance(attribute.type, String):
+            attribute = attribute.cast(String)
+        conditions.append(attribute.ilike(f'%{search}%'))
+    return query.filter(or_(*conditions))
+
+
+def apply_search(query, model, search: str):
+    """
+    Отфильтровать запрос товаров по строке поиска
+
+    Args:
+        query: Запрос по модели (Product.query..., SupplierProduct.query...)
+        model: Модель с индексом в SEARCH_INDEXES
+        search: Строка поиска
+
+    Returns:
+        (query, rank): rank — выражение для ORDER BY по релевантности
+        (меньше — релевантнее) или None, если поиск идёт через ilike
+    """
+    from models import db
+
+    name = model.__tablename__
+    index = SEARCH_INDEXES[name]
+    bind = db.session.get_bind()
+    dialect = bind.dialect.name
+
+    if dialect == 'sqlite':
+        match = build_match_query(search)
+        if match and _index_ready(bind, name):
+            fts = table(index.fts_table, column('rowid'), column('rank'))
+            query = query.join(fts, fts.c.rowid == model.id).filter(
+                literal_column(index.fts_table).op('MATCH')(match)
+            )
+            return query, fts.c.rank
+    elif dialect == 'postgresql':
+        tsquery = build_tsquery(search)
+        if tsquery and _index_ready(bind, name):
+            vector = literal_column(_pg_vector(index))
+            condition = func.to_tsquery(literal_column("'russian'"), tsquery)
+            query = query.filter(vector.op('@@')(condition))
+            return query, -func.ts_rank(vector, condition)
+
+    return _ilike(query, model, index, search), None
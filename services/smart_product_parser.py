@@ -1611,9 +1611,9 @@ class CharacteristicsValidator:
 
         # Применяем коррекции
         if auto_correct and corrections_to_apply and mp_data:
-            chars = mp_data.get('characteristics', {})
-            chars.update(corrections_to_apply)
-            mp_data['characteristics'] = chars
+            # mp_data — кэш товара, изменяем копию
+            chars = {**mp_data.get('characteristics', {}), **corrections_to_apply}
+            mp_data = {**mp_data, 'characteristics': chars}
             product.ai_marketplace_json = json.dumps(mp_data, ensure_ascii=False)
             db.session.commit()
             logger.info(
@@ -204,12 +204,13 @@ class EnrichmentService:
         Returns:
             {product_id: {'available': bool, 'imp_id': int|None, 'photo_count': int, 'has_description': bool}}
         """
-        from models import Product, ImportedProduct
+        from models import DEFERRED_DETAILS, Product, ImportedProduct, db
 
         result = {}
 
         # Оптимизация: сначала ищем по FK за один запрос
-        fk_matches = ImportedProduct.query.filter(
+        # (описание и характеристики — отложенные колонки, грузим их сразу)
+        fk_matches = ImportedProduct.query.options(db.undefer_group(DEFERRED_DETAILS)).filter(
             ImportedProduct.product_id.in_(product_ids),
         ).all()
         fk_map = {}
@@ -30,6 +30,8 @@ from models import (
     ImportedProduct, Seller, CategoryMapping,
     Notification, log_admin_action
 )
+from services.db_writer import commit_session, get_db_writer
+from services.metrics import get_metrics
 from services.pricing_engine import extract_supplier_product_id
 
 logger = logging.getLogger(__name__)
@@ -45,37 +47,54 @@ def _sanitize_wb_text(text: str) -> str:
     return _WB_FORBIDDEN_CHARS.sub('', text).strip()
 
 
-def _commit_with_retry(session, max_retries: int = 5, base_delay: float = 0.3):
-    """Коммит с retry для SQLite (database is locked).
+def _save_ai_job_progress(job_id: str, values: dict, only_active: bool = False) -> bool:
+    """Записать прогресс AI-задачи (выполняется в DBWriter, без commit).
 
-    При 'locked'/'busy' ошибках — rollback и повтор (данные остаются в сессии).
-    При невосстановимой ошибке сессии (prepared state) — remove() и raise
-    (данные потеряны, но сессия очищена для следующих операций).
+    Returns:
+        False если задачи нет или (only_active) она уже не выполняется
     """
-    for attempt in range(1, max_retries + 1):
-        try:
-            session.commit()
-            return
-        except Exception as e:
-            err_str = str(e).lower()
-            if 'locked' in err_str or 'busy' in err_str:
-                if attempt < max_retries:
-                    delay = base_delay * (2 ** (attempt - 1))
-                    logger.warning(f"SQLite locked, retry {attempt}/{max_retries} in {delay:.1f}s")
-                    try:
-                        session.rollback()
-                    except Exception:
-                        # Сессия сломана — remove() и прекращаем ретраи (данные потеряны)
-                        session.remove()
-                        raise
-                    time.sleep(delay)
-                    continue
-            # Не-locked ошибка или исчерпаны ретраи — cleanup и raise
-            try:
-                session.rollback()
-            except Exception:
-                session.remove()
-            raise
+    from models import AIParseJob
+
+    job = db.session.get(AIParseJob, job_id)
+    if not job or (only_active and job.status not in ('pending', 'running')):
+        return False
+    for key, value in values.items():
+        setattr(job, key, value)
+    return True
+
+
+def _finish_ai_job(job_id: str, values: dict) -> None:
+    """Завершить AI-задачу (done, если не отменена) — после прогресса в очереди DBWriter."""
+    from models import AIParseJob
+
+    job = db.session.get(AIParseJob, job_id)
+    if not job:
+        return
+    if job.status != 'cancelled':
+        job.status = 'done'
+    for key, value in values.items():
+        setattr(job, key, value)
+
+
+def _fetch_supplier_file(supplier: Supplier, url: str, kind: str, timeout: int) -> requests.Response:
+    """
+    Скачать файл поставщика (GET) с записью метрик
+
+    Метрики пишутся как api_type='supplier', endpoint='<код поставщика>/<kind>'.
+    Ошибки HTTP (raise_for_status) и сети пробрасываются вызывающему.
+    """
+    metrics = get_metrics()
+    endpoint = f"{supplier.code}/{kind}"
+    start = time.time()
+    try:
+        resp = requests.get(url, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        status = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'error'
+        metrics.observe_request('supplier', endpoint, None, time.time() - start, status)
+        raise
+    metrics.observe_request('supplier', endpoint, None, time.time() - start, resp.status_code)
+    resp.raise_for_status()
+    return resp
 
 
 def _get_marketplace_categories_block(supplier_id: int) -> str:
@@ -167,8 +186,7 @@ class SupplierCSVParser:
             return None
 
         try:
-            resp = requests.get(self.supplier.csv_source_url, timeout=60)
-            resp.raise_for_status()
+            resp = _fetch_supplier_file(self.supplier, self.supplier.csv_source_url, 'catalog_csv', timeout=60)
             return resp.content.decode(self.encoding, errors='replace')
         except Exception as e:
             logger.error(f"Ошибка загрузки CSV для {self.supplier.code}: {e}")
@@ -180,8 +198,7 @@ class SupplierCSVParser:
             logger.error(f"Supplier {self.supplier.code}: CSV URL не задан")
             return None
         try:
-            resp = requests.get(self.supplier.csv_source_url, timeout=60)
-            resp.raise_for_status()
+            resp = _fetch_supplier_file(self.supplier, self.supplier.csv_source_url, 'catalog_csv', timeout=60)
             return resp.content
         except Exception as e:
             logger.error(f"Ошибка загрузки CSV для {self.supplier.code}: {e}")
@@ -1075,8 +1092,7 @@ class SupplierService:
             # Проверяем обновление через INF файл (если не force)
             if not force and supplier.price_file_inf_url:
                 try:
-                    inf_resp = requests.get(supplier.price_file_inf_url, timeout=30)
-                    inf_resp.raise_for_status()
+                    inf_resp = _fetch_supplier_file(supplier, supplier.price_file_inf_url, 'price_inf', timeout=30)
                     import hashlib as _hl
                     new_hash = _hl.md5(inf_resp.content).hexdigest()
                     if new_hash == supplier.last_price_file_hash:
@@ -1094,8 +1110,7 @@ class SupplierService:
             delimiter = supplier.price_file_delimiter or ';'
 
             try:
-                resp = requests.get(supplier.price_file_url, timeout=120)
-                resp.raise_for_status()
+                resp = _fetch_supplier_file(supplier, supplier.price_file_url, 'price_file', timeout=120)
             except Exception as e:
                 result.success = False
                 result.error_messages.append(f"Ошибка загрузки файла цен: {str(e)[:200]}")
@@ -1243,8 +1258,7 @@ class SupplierService:
             # Обновляем hash INF файла
             if supplier.price_file_inf_url:
                 try:
-                    inf_resp = requests.get(supplier.price_file_inf_url, timeout=30)
-                    inf_resp.raise_for_status()
+                    inf_resp = _fetch_supplier_file(supplier, supplier.price_file_inf_url, 'price_inf', timeout=30)
                     import hashlib as _hl
                     supplier.last_price_file_hash = _hl.md5(inf_resp.content).hexdigest()
                 except Exception:
@@ -1373,8 +1387,14 @@ class SupplierService:
                      category: str = None, brand: str = None,
                      ai_validated: bool = None, has_photos: bool = None,
                      stock_status: str = None,
-                     sort_by: str = 'created_at', sort_dir: str = 'desc'):
-        """Получить товары поставщика с фильтрацией и пагинацией"""
+                     sort_by: str = 'created_at', sort_dir: str = 'desc',
+                     cursor: str = None):
+        """Получить товары поставщика с фильтрацией и пагинацией
+
+        Без поиска по релевантности страницы листаются по курсору
+        (next_cursor / prev_cursor, см. services/keyset.py); курсор
+        другой сортировки отбрасывается.
+        """
         q = SupplierProduct.query.filter_by(supplier_id=supplier_id)
 
         # Фильтры
@@ -1385,16 +1405,10 @@ class SupplierService:
             q = q.filter(db.or_(
                 SupplierProduct.supplier_quantity.is_(None),
                 SupplierProduct.supplier_quantity == 0))
+        search_rank = None
         if search:
-            search_term = f"%{search}%"
-            q = q.filter(
-                db.or_(
-                    SupplierProduct.title.ilike(search_term),
-                    SupplierProduct.external_id.ilike(search_term),
-                    SupplierProduct.vendor_code.ilike(search_term),
-                    SupplierProduct.brand.ilike(search_term),
-                )
-            )
+            from services.search_index import apply_search
+            q, search_rank = apply_search(q, SupplierProduct, search)
         if status:
             q = q.filter(SupplierProduct.status == status)
         if category:
@@ -1416,12 +1430,17 @@ class SupplierService:
 
         # Сортировка
         sort_column = getattr(SupplierProduct, sort_by, SupplierProduct.created_at)
-        if sort_dir == 'asc':
-            q = q.order_by(sort_column.asc())
-        else:
-            q = q.order_by(sort_column.desc())
+        if sort_by == 'relevance' and search_rank is not None:
+            q = q.order_by(search_rank, SupplierProduct.id.desc())
+            return q.paginate(page=page, per_page=per_page, error_out=False)
 
-        return q.paginate(page=page, per_page=per_page, error_out=False)
+        from services.keyset import InvalidCursor, keyset_paginate
+        descending = sort_dir != 'asc'
+        order = [(sort_column, descending), (SupplierProduct.id, descending)]
+        try:
+            return keyset_paginate(q, order, cursor=cursor, page=page, per_page=per_page)
+        except InvalidCursor:
+            return keyset_paginate(q, order, page=page, per_page=per_page)
 
     @staticmethod
     def get_product(product_id: int) -> Optional[SupplierProduct]:
@@ -2382,8 +2401,7 @@ class SupplierService:
         encoding = supplier.description_file_encoding or 'cp1251'
 
         try:
-            resp = requests.get(supplier.description_file_url, timeout=60)
-            resp.raise_for_status()
+            resp = _fetch_supplier_file(supplier, supplier.description_file_url, 'description_file', timeout=60)
             content = resp.content.decode(encoding, errors='replace')
         except Exception as e:
             supplier.last_description_sync_status = 'failed'
@@ -2649,7 +2667,7 @@ class SupplierService:
                 except Exception as e:
                     logger.warning(f"Failed to create notification for seller {conn.seller_id}: {e}")
 
-            _commit_with_retry(db.session)
+            commit_session(db.session)
             logger.info(
                 f"[AI Parse] Notifications sent to {len(connections)} sellers "
                 f"for supplier {supplier_id}"
@@ -2738,27 +2756,15 @@ class SupplierService:
                 stale-детекции при долгих AI-запросах (DeepSeek, two-pass)."""
                 with flask_app.app_context():
                     while not job_done.wait(timeout=30):
+                        with lock:
+                            values = dict(counters, heartbeat_at=datetime.utcnow())
                         try:
-                            job_hb = AIParseJob.query.get(job_id)
-                            if not job_hb or job_hb.status not in ('pending', 'running'):
+                            # Запись через DBWriter — по порядку с прогрессом воркеров
+                            if not get_db_writer().write(_save_ai_job_progress, job_id, values,
+                                                         only_active=True):
                                 break
-                            job_hb.heartbeat_at = datetime.utcnow()
-                            with lock:
-                                job_hb.processed = counters['processed']
-                                job_hb.succeeded = counters['succeeded']
-                                job_hb.failed = counters['failed']
-                            _commit_with_retry(db.session)
-                        except Exception:
-                            try:
-                                db.session.rollback()
-                            except Exception:
-                                pass
-                        finally:
-                            # Освобождаем соединение между heartbeat-ами (30 сек простоя)
-                            try:
-                                db.session.remove()
-                            except Exception:
-                                pass
+                        except Exception as e:
+                            logger.warning(f"[AI Parse] Job {job_id} heartbeat failed: {e}")
 
             # Запускаем фоновый heartbeat-поток
             heartbeat_thread = threading.Thread(
@@ -2769,29 +2775,12 @@ class SupplierService:
             heartbeat_thread.start()
 
             def _update_job_progress(current_title=None):
-                """Обновляет прогресс в БД (вызывается под lock из main thread)."""
-                try:
-                    job_ref = AIParseJob.query.get(job_id)
-                    if not job_ref:
-                        return
-                    job_ref.processed = counters['processed']
-                    job_ref.succeeded = counters['succeeded']
-                    job_ref.failed = counters['failed']
-                    job_ref.current_product_title = current_title
-                    job_ref.heartbeat_at = datetime.utcnow()
-                    job_ref.results = json.dumps(results[-100:], ensure_ascii=False)
-                    _commit_with_retry(db.session)
-                except Exception:
-                    try:
-                        db.session.rollback()
-                    except Exception:
-                        pass
-                finally:
-                    # Освобождаем соединение сразу после обновления прогресса
-                    try:
-                        db.session.remove()
-                    except Exception:
-                        pass
+                """Ставит прогресс в очередь DBWriter (main thread не ждёт записи)."""
+                with lock:
+                    values = dict(counters, current_product_title=current_title,
+                                  heartbeat_at=datetime.utcnow(),
+                                  results=json.dumps(results[-100:], ensure_ascii=False))
+                get_db_writer().submit(_save_ai_job_progress, job_id, values)
 
             def _check_cancelled():
                 """Проверяет не отменена ли задача."""
@@ -2885,7 +2874,7 @@ class SupplierService:
 
                                 product.updated_at = datetime.utcnow()
 
-                            _commit_with_retry(db.session)
+                            commit_session(db.session)
                         finally:
                             try:
                                 db.session.remove()
@@ -3001,25 +2990,17 @@ class SupplierService:
             job_done.set()
             heartbeat_thread.join(timeout=5)
 
-            # Завершение задачи
+            # Завершение задачи — через DBWriter, после уже поставленного прогресса
             try:
-                job_final = AIParseJob.query.get(job_id)
-                if job_final:
-                    if job_final.status != 'cancelled':
-                        job_final.status = 'done'
-                    job_final.processed = counters['processed']
-                    job_final.succeeded = counters['succeeded']
-                    job_final.failed = counters['failed']
-                    job_final.current_product_title = None
-                    job_final.heartbeat_at = datetime.utcnow()
-                    job_final.results = json.dumps(results[-100:], ensure_ascii=False)
-                    job_final.updated_at = datetime.utcnow()
-                    _commit_with_retry(db.session)
-            except Exception:
-                try:
-                    db.session.rollback()
-                except Exception:
-                    pass
+                get_db_writer().write(_finish_ai_job, job_id, dict(
+                    counters,
+                    current_product_title=None,
+                    heartbeat_at=datetime.utcnow(),
+                    results=json.dumps(results[-100:], ensure_ascii=False),
+                    updated_at=datetime.utcnow(),
+                ))
+            except Exception as e:
+                logger.error(f"[AI Parse] Job {job_id} final update failed: {e}")
             finally:
                 try:
                     db.session.remove()
@@ -3096,7 +3077,7 @@ class SupplierService:
                         }], ensure_ascii=False)
                         job.current_product_title = None
                         job.updated_at = datetime.utcnow()
-                        _commit_with_retry(db.session)
+                        commit_session(db.session)
                     return
 
                 with db.session.no_autoflush:
@@ -3160,7 +3141,7 @@ class SupplierService:
             if job:
                 job.current_product_title = None
                 job.updated_at = datetime.utcnow()
-                _commit_with_retry(db.session)
+                commit_session(db.session)
         except Exception:
             try:
                 db.session.rollback()
@@ -3332,7 +3313,7 @@ class SupplierService:
                 )
                 j.updated_at = datetime.utcnow()
                 try:
-                    _commit_with_retry(db.session)
+                    commit_session(db.session)
                 except Exception:
                     db.session.rollback()
                 # Не добавляем в active_jobs — она больше не активна
@@ -3997,7 +3978,7 @@ def _run_marketplace_aware_parse(product: SupplierProduct, parsed_data: dict, ai
         product.marketplace_fields_json = json.dumps(flat_fields, ensure_ascii=False)
 
         # Мержим AI-specific поля в ai_marketplace_json для валидатора
-        existing_mp = product.get_ai_marketplace_data()
+        existing_mp = dict(product.get_ai_marketplace_data())
         existing_mp.update(clean_fields)
         product.ai_marketplace_json = json.dumps(existing_mp, ensure_ascii=False)
 
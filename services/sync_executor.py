@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Центральный исполнитель синхронизаций продавцов
+
+Вместо отдельного потока на каждую синхронизацию задачи ставятся в очередь
+и выполняются ограниченным пулом воркеров (SYNC_WORKERS). Так перезапуск,
+после которого «пора синхронизироваться» всем продавцам сразу, не запускает
+десятки синхронизаций, конкурирующих за блокировку записи SQLite и лимиты WB.
+
+Порядок выполнения:
+- ручной запуск («Синхронизировать сейчас») — раньше запланированных;
+- у продавца в очереди/работе не больше одной задачи: повторная постановка
+  не дублирует задачу, а при ручном запуске поднимает её приоритет;
+- при равном приоритете первым идёт продавец, дольше всех ждавший своей
+  синхронизации (давно не синхронизировался), затем — по времени постановки.
+
+Очередь живёт в памяти процесса.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Количество одновременных синхронизаций в процессе
+SYNC_WORKERS = int(os.environ.get('SYNC_WORKERS', '2'))
+
+# Приоритеты (меньше — раньше)
+PRIORITY_MANUAL = 0
+PRIORITY_SCHEDULED = 10
+
+
+class SyncJob:
+    """Задача синхронизации продавца в очереди"""
+
+    def __init__(self, seq: int, seller_id: int, func: Callable, args: tuple, kwargs: Dict[str, Any],
+                 priority: int, description: str):
+        self.seq = seq
+        self.seller_id = seller_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.description = description
+        self.queued_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'seller_id': self.seller_id,
+            'description': self.description,
+            'priority': 'manual' if self.priority <= PRIORITY_MANUAL else 'scheduled',
+            'queued_at': self.queued_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+        }
+
+
+class SyncExecutor:
+    """
+    Пул воркеров синхронизации с приоритетной очередью
+
+    Пример:
+        get_sync_executor().submit(seller.id, _perform_product_sync_task,
+                                   args=(seller.id, app), priority=PRIORITY_MANUAL)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, max_workers: Optional[int] = None):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if self._initialized:
+            return
+
+        self.max_workers = max(1, max_workers or SYNC_WORKERS)
+        self._cond = threading.Condition()
+        self._queued: Dict[int, SyncJob] = {}
+        self._running: Dict[int, SyncJob] = {}
+        self._last_started: Dict[int, float] = {}
+        self._workers: List[threading.Thread] = []
+        self._seq = itertools.count()
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0}
+        self._initialized = True
+
+    # ------------------------------------------------------------------
+    # Постановка в очередь
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        seller_id: int,
+        func: Callable,
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_SCHEDULED,
+        description: str = 'product_sync'
+    ) -> Dict[str, Any]:
+        """
+        Поставить синхронизацию продавца в очередь
+
+        Args:
+            seller_id: ID продавца
+            func: Функция синхронизации
+            args: Позиционные аргументы функции
+            kwargs: Именованные аргументы функции
+            priority: PRIORITY_MANUAL или PRIORITY_SCHEDULED
+            description: Описание задачи (для статуса)
+
+        Returns:
+            {'state': 'queued' | 'running', 'deduplicated': bool, 'position': N | None}
+        """
+        kwargs = kwargs or {}
+        with self._cond:
+            running = self._running.get(seller_id)
+            if running:
+                self._stats['deduplicated'] += 1
+                return {'state': 'running', 'deduplicated': True, 'position': None}
+
+            queued = self._queued.get(seller_id)
+            if queued:
+                self._stats['deduplicated'] += 1
+                # Ручной запуск поднимает уже стоящую в очереди задачу
+                if priority < queued.priority:
+                    queued.priority = priority
+                    queued.args, queued.kwargs = args, kwargs
+                    queued.description = description
+                    self._cond.notify_all()
+                return {'state': 'queued', 'deduplicated': True, 'position': self._position(seller_id)}
+
+            self._queued[seller_id] = SyncJob(
+                next(self._seq), seller_id, func, args, kwargs, priority, description
+            )
+            self._stats['submitted'] += 1
+            self._ensure_workers()
+            self._cond.notify()
+            position = self._position(seller_id)
+
+        logger.info(f"📥 Sync queued for seller {seller_id} ({description}), position {position}")
+        return {'state': 'queued', 'deduplicated': False, 'position': position}
+
+    def _sort_key(self, job: SyncJob):
+        # Приоритет, затем справедливость: кто дольше не синхронизировался
+        return (job.priority, self._last_started.get(job.seller_id, 0.0), job.seq)
+
+    def _ordered_queue(self) -> List[SyncJob]:
+        return sorted(self._queued.values(), key=self._sort_key)
+
+    def _position(self, seller_id: int) -> Optional[int]:
+        for index, job in enumerate(self._ordered_queue(), start=1):
+            if job.seller_id == seller_id:
+                return index
+        return None
+
+    # ------------------------------------------------------------------
+    # Воркеры
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self) -> None:
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop, daemon=True,
+                name=f"sync-worker-{len(self._workers) + 1}"
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> SyncJob:
+        with self._cond:
+            while not self._queued:
+                self._cond.wait()
+            job = min(self._queued.values(), key=self._sort_key)
+            del self._queued[job.seller_id]
+            job.started_at = datetime.utcnow()
+            self._running[job.seller_id] = job
+            self._last_started[job.seller_id] = time.time()
+            return job
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._next_job()
+            logger.info(f"🚀 Sync worker {threading.current_thread().name} started {job.description} "
+                        f"for seller {job.seller_id}")
+            failed = False
+            try:
+                job.func(*job.args, **job.kwargs)
+            except Exception as e:
+                failed = True
+                logger.exception(f"❌ Sync job for seller {job.seller_id} failed: {e}")
+            finally:
+                with self._cond:
+                    self._running.pop(job.seller_id, None)
+                    self._stats['failed' if failed else 'completed'] += 1
+
+    # ------------------------------------------------------------------
+    # Статус
+    # ------------------------------------------------------------------
+
+    def get_seller_status(self, seller_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Состояние синхронизации продавца в исполнителе
+
+        Returns:
+            {'state': 'running' | 'queued', 'position': N | None, ...} или None
+        """
+        with self._cond:
+            running = self._running.get(seller_id)
+            if running:
+                return dict(running.to_dict(), state='running', position=None)
+            queued = self._queued.get(seller_id)
+            if queued:
+                return dict(queued.to_dict(), state='queued', position=self._position(seller_id),
+                            queue_length=len(self._queued))
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Сводка по пулу: воркеры, выполняющиеся и ожидающие задачи"""
+        with self._cond:
+            return {
+                'max_workers': self.max_workers,
+                'running': [job.to_dict() for job in self._running.values()],
+                'queued': [job.to_dict() for job in self._ordered_queue()],
+                **self._stats,
+            }
+
+
+def get_sync_executor() -> SyncExecutor:
+    """Получить исполнитель синхронизаций процесса"""
+    return SyncExecutor()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Конвейер синхронизации: стадии в отдельных потоках, связанные ограниченными очередями
+
+Источник (например, загрузка страниц карточек из WB API) и промежуточные
+стадии работают в своих потоках, последняя стадия (запись в БД) — в
+вызывающем потоке, где есть контекст приложения и сессия. Очереди между
+стадиями ограничены (PIPELINE_QUEUE_SIZE): если запись в БД не успевает,
+загрузка притормаживает, а не копит весь каталог в памяти. Сетевые
+задержки и запись в БД перекрываются.
+
+По каждой стадии собирается статистика (обработано, время работы,
+пропускная способность, глубина входной очереди) — по ней видно, что
+узкое место: WB API или SQLite. Статистика текущих и последних
+завершённых конвейеров — get_pipeline_stats().
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ёмкость очереди между стадиями (в пачках)
+PIPELINE_QUEUE_SIZE = int(os.environ.get('SYNC_PIPELINE_QUEUE_SIZE', '4'))
+
+# Сколько завершённых конвейеров хранить в статистике
+PIPELINE_HISTORY_SIZE = 20
+
+_END = object()
+
+
+class PipelineStopped(Exception):
+    """Конвейер остановлен из-за ошибки в другой стадии"""
+
+
+class StageStats:
+    """Статистика стадии конвейера"""
+
+    def __init__(self, name: str, input_queue: Optional[queue.Queue] = None):
+        self.name = name
+        self.input_queue = input_queue
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def record(self, batch: Any, busy: float) -> None:
+        self.batches += 1
+        self.items += _batch_size(batch)
+        self.busy_seconds += busy
+        if self.input_queue is not None:
+            self.max_queue_depth = max(self.max_queue_depth, self.input_queue.qsize())
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            'name': self.name,
+            'batches': self.batches,
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'elapsed_seconds': round(elapsed, 3),
+            # Пропускная способность по времени работы стадии (без ожидания очередей)
+            'items_per_second': round(self.items / self.busy_seconds, 1) if self.busy_seconds else None,
+            'utilization': round(self.busy_seconds / elapsed, 2) if elapsed else None,
+            'queue_depth': self.input_queue.qsize() if self.input_queue is not None else None,
+            'queue_max_depth': self.max_queue_depth if self.input_queue is not None else None,
+            'queue_size': self.input_queue.maxsize if self.input_queue is not None else None,
+        }
+
+
+def _batch_size(batch: Any) -> int:
+    """Размер пачки: len() для коллекций, 'size' для dict-пачек, иначе 1"""
+    if isinstance(batch, dict):
+        return int(batch.get('size', 1))
+    try:
+        return len(batch)
+    except TypeError:
+        return 1
+
+
+class SyncPipeline:
+    """
+    Конвейер из источника, промежуточных стадий и приёмника
+
+    Пример:
+        pipeline = SyncPipeline('product_sync:1')
+        pipeline.source('fetch', pages)          # итерируемый источник пачек
+        pipeline.stage('prices', attach_prices)  # пачка -> пачка
+        pipeline.sink('db_write', write_batch)   # пачка -> None
+        pipeline.run()
+
+    Ошибка в стадии останавливает стадии до неё; стадии после неё
+    дообрабатывают уже полученные пачки (например, записывают в БД
+    загруженные страницы — прерванная синхронизация продолжится с них).
+    Первая ошибка пробрасывается из run().
+    """
+
+    def __init__(self, name: str, queue_size: int = PIPELINE_QUEUE_SIZE):
+        """
+        Args:
+            name: Имя конвейера (для статистики), например 'product_sync:<seller_id>'
+            queue_size: Ёмкость очередей между стадиями
+        """
+        self.name = name
+        self.queue_size = max(1, queue_size)
+        self._source = None
+        self._stages: List[tuple] = []
+        self._sink = None
+        # Стадии с индексом меньше _halt_below останавливаются
+        # (0 — источник, далее промежуточные стадии, последним — приёмник)
+        self._halt_below = 0
+        self._errors: List[BaseException] = []
+        self._errors_lock = threading.Lock()
+        self.stats: List[StageStats] = []
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.status = 'pending'
+
+    def source(self, name: str, iterable: Iterable) -> 'SyncPipeline':
+        self._source = (name, iterable)
+        return self
+
+    def stage(self, name: str, func: Callable[[Any], Any]) -> 'SyncPipeline':
+        self._stages.append((name, func))
+        return self
+
+    def sink(self, name: str, func: Callable[[Any], None]) -> 'SyncPipeline':
+        self._sink = (name, func)
+        return self
+
+    # ------------------------------------------------------------------
+    # Очереди с учётом остановки
+    # ------------------------------------------------------------------
+
+    def _put(self, index: int, q: queue.Queue, item: Any) -> None:
+        while True:
+            if index < self._halt_below:
+                raise PipelineStopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, index: int, q: queue.Queue) -> Any:
+        while True:
+            if index < self._halt_below:
+                raise PipelineStopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _fail(self, index: int, error: BaseException, out_q: Optional[queue.Queue] = None) -> None:
+        """Остановить стадии до index; следующим — конец потока"""
+        if isinstance(error, PipelineStopped):
+            return
+        with self._errors_lock:
+            self._errors.append(error)
+            self._halt_below = max(self._halt_below, index)
+        if out_q is not None:
+            try:
+                self._put(index + 1, out_q, _END)
+            except PipelineStopped:
+                pass
+
+    # ------------------------------------------------------------------
+    # Потоки стадий
+    # ------------------------------------------------------------------
+
+    def _run_source(self, iterable: Iterable, out_q: queue.Queue, stats: StageStats) -> None:
+        stats.started_at = time.time()
+        try:
+            iterator = iter(iterable)
+            while True:
+                started = time.time()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    break
+                stats.record(batch, time.time() - started)
+                self._put(0, out_q, batch)
+            self._put(0, out_q, _END)
+        except BaseException as e:
+            self._fail(0, e, out_q)
+        finally:
+            stats.finished_at = time.time()
+
+    def _run_stage(self, index: int, func: Callable, in_q: queue.Queue, out_q: queue.Queue,
+                   stats: StageStats) -> None:
+        stats.started_at = time.time()
+        try:
+            while True:
+                batch = self._get(index, in_q)
+                if batch is _END:
+                    break
+                started = time.time()
+                result = func(batch)
+                stats.record(result, time.time() - started)
+                self._put(index, out_q, result)
+            self._put(index, out_q, _END)
+        except BaseException as e:
+            self._fail(index, e, out_q)
+        finally:
+            stats.finished_at = time.time()
+
+    def run(self) -> None:
+        """Запустить конвейер и дождаться обработки всех пачек"""
+        if self._source is None or self._sink is None:
+            raise ValueError('Pipeline needs a source and a sink')
+
+        self.started_at = datetime.utcnow()
+        self.status = 'running'
+        _register(self)
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self._stages) + 1)]
+        source_stats = StageStats(self._source[0])
+        self.stats = [source_stats]
+
+        threads = [threading.Thread(
+            target=self._run_source, args=(self._source[1], queues[0], source_stats),
+            daemon=True, name=f"{self.name}:{self._source[0]}"
+        )]
+        for index, (stage_name, func) in enumerate(self._stages):
+            stage_stats = StageStats(stage_name, queues[index])
+            self.stats.append(stage_stats)
+            threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(index + 1, func, queues[index], queues[index + 1], stage_stats),
+                daemon=True, name=f"{self.name}:{stage_name}"
+            ))
+
+        sink_name, sink_func = self._sink
+        sink_stats = StageStats(sink_name, queues[-1])
+        self.stats.append(sink_stats)
+
+        for thread in threads:
+            thread.start()
+
+        sink_index = len(self._stages) + 1
+        sink_stats.started_at = time.time()
+        try:
+            while True:
+                batch = self._get(sink_index, queues[-1])
+                if batch is _END:
+                    break
+                started = time.time()
+                sink_func(batch)
+                sink_stats.record(batch, time.time() - started)
+        except BaseException as e:
+            self._fail(sink_index, e)
+        finally:
+            sink_stats.finished_at = time.time()
+            self._halt_below = sink_index + 1
+            for thread in threads:
+                thread.join()
+            self.finished_at = datetime.utcnow()
+            self.status = 'failed' if self._errors else 'completed'
+
+        if self._errors:
+            raise self._errors[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'stages': [stats.to_dict() for stats in self.stats],
+        }
+
+
+# ============================================================================
+# СТАТИСТИКА КОНВЕЙЕРОВ ПРОЦЕССА
+# ============================================================================
+
+_registry_lock = threading.Lock()
+_pipelines: List[SyncPipeline] = []
+
+
+def _register(pipeline: SyncPipeline) -> None:
+    with _registry_lock:
+        _pipelines.append(pipeline)
+        finished = [p for p in _pipelines if p.status not in ('pending', 'running')]
+        for old in finished[:-PIPELINE_HISTORY_SIZE]:
+            _pipelines.remove(old)
+
+
+def get_pipeline_stats() -> List[Dict[str, Any]]:
+    """Статистика текущих и последних завершённых конвейеров (новые первыми)"""
+    with _registry_lock:
+        pipelines = list(_pipelines)
+    return [pipeline.to_dict() for pipeline in reversed(pipelines)]
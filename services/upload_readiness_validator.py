@@ -434,7 +434,7 @@ def _find_barcode_conflicts(product, barcodes: list) -> list:
 
     # 2. Проверяем Product записи (sizes_json содержит skus с баркодами)
     try:
-        products = Product.query.filter(
+        products = Product.query.with_entities(Product.nm_id, Product.sizes_json).filter(
             Product.seller_id == seller_id,
             Product.sizes_json.isnot(None),
         ).all()
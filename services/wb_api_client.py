@@ -1,20 +1,37 @@
 """
 Wildberries API Client с оптимизацией и кэшированием
 """
+import json
 import logging
+import os
+import threading
 import time
+from collections import deque
 from datetime import datetime, timedelta
-from functools import lru_cache, wraps
-from typing import Dict, List, Optional, Any
-from urllib.parse import urljoin
+from functools import wraps
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Any
+from urllib.parse import urljoin, urlsplit
 
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
+from services.api_log_writer import get_api_log_writer, serialize_request_body
+from services.metrics import get_metrics
+from services.wb_rate_limiter import get_shared_rate_limiter
+from services.wb_request_coalescer import get_request_coalescer
+from services.wb_response_cache import (
+    WBResponseCache, extract_nm_ids, get_wb_response_cache, resolve_cache_rule
+)
+from services.wb_retry import RetryPolicy, get_circuit_breaker, parse_retry_after
+
 # Настройка логирования
 logger = logging.getLogger('wb_api')
 
+# Один базовый URL вместо хостов WB для всех типов API — локальный стенд
+# (services/wb_fake_server.py) для нагрузочных прогонов и отладки
+WB_API_BASE_URL = os.environ.get('WB_API_BASE_URL', '').rstrip('/')
+
 
 def chunk_list(items: List, chunk_size: int) -> List[List]:
     """
@@ -49,11 +66,156 @@ class WBAuthException(WBAPIException):
 
 class WBRateLimitException(WBAPIException):
     """Превышен лимит запросов"""
-    pass
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        """
+        Args:
+            message: Текст ошибки
+            retry_after: Через сколько секунд WB разрешает повтор (из заголовков ответа)
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class WBCircuitOpenException(WBAPIException):
+    """API WB временно недоступен: circuit breaker хоста открыт после серии ошибок"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def raise_for_wb_status(
+    status_code: int,
+    response_text: str,
+    request_body_str: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> None:
+    """
+    Преобразовать HTTP-статус ответа WB API в исключение
+
+    Общая для синхронного и асинхронного клиентов логика: 401 → WBAuthException,
+    429 → WBRateLimitException, прочие 4xx/5xx → WBAPIException с текстом ошибки WB.
+
+    Args:
+        status_code: HTTP статус ответа
+        response_text: Тело ответа
+        request_body_str: Тело запроса (для подсказок по 400 Bad Request)
+        headers: Заголовки ответа (для паузы из X-Ratelimit-Retry / Retry-After)
+
+    Raises:
+        WBAuthException, WBRateLimitException, WBAPIException
+    """
+    if status_code == 401:
+        raise WBAuthException("Ошибка авторизации. Проверьте API ключ.")
+    elif status_code == 429:
+        raise WBRateLimitException("Превышен лимит запросов к API.", parse_retry_after(headers))
+    elif status_code >= 400:
+        error_msg = f"API Error {status_code}"
+        try:
+            error_data = json.loads(response_text)
+            # WB API возвращает ошибки в разных полях
+            wb_error = (
+                error_data.get('errorText')
+                or error_data.get('message')
+                or error_data.get('error')
+                or error_msg
+            )
+            # additionalErrors содержит детали по конкретным полям
+            additional = error_data.get('additionalErrors')
+            if additional:
+                if isinstance(additional, dict):
+                    details = '; '.join(f'{k}: {v}' for k, v in additional.items())
+                else:
+                    details = str(additional)
+                error_msg = f"{wb_error} | Детали: {details}"
+            else:
+                error_msg = str(wb_error) if wb_error != error_msg else error_msg
+
+            # Для 400 Bad Request без деталей — пытаемся дать подсказку
+            if status_code == 400 and error_msg in ('bad request', 'Bad Request', 'API Error 400'):
+                hints = []
+                # Анализируем request body для подсказок
+                if request_body_str:
+                    try:
+                        req_data = json.loads(request_body_str)
+                        if isinstance(req_data, list) and req_data:
+                            card = req_data[0] if isinstance(req_data[0], dict) else {}
+                            variants = card.get('variants', [])
+                            if variants:
+                                v = variants[0]
+                                chars = v.get('characteristics', [])
+                                if not chars:
+                                    hints.append('нет характеристик')
+                                if not v.get('brand'):
+                                    hints.append('не указан бренд')
+                                sizes = v.get('sizes', [])
+                                if sizes:
+                                    for s in sizes:
+                                        if not s.get('skus') or not s['skus'][0]:
+                                            hints.append('пустые баркоды (skus)')
+                                            break
+                                dims = v.get('dimensions', {})
+                                if not dims or not dims.get('length'):
+                                    hints.append('не указаны габариты')
+                            if not card.get('subjectID'):
+                                hints.append('не указан subjectID (категория)')
+                    except Exception:
+                        pass
+                if hints:
+                    error_msg = f"bad request (возможные причины: {', '.join(hints)})"
+
+            # Логируем полный ответ для отладки
+            logger.error(f"WB API {status_code} full response: {error_data}")
+            if request_body_str:
+                logger.error(f"WB API {status_code} request body: {request_body_str[:2000]}")
+        except Exception:
+            error_msg = response_text or error_msg
+        raise WBAPIException(error_msg)
+
+
+def _retry_count(response: requests.Response) -> int:
+    """Сколько повторов соединения urllib3 сделал для запроса (Retry.history)"""
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    return len(getattr(retries, 'history', None) or ())
+
+
+def _response_snapshot(response: requests.Response) -> Tuple:
+    """Неизменяемый снимок ответа (для кэша и ожидающих того же запроса)"""
+    return (response.status_code, dict(response.headers), response.content,
+            response.encoding, response.url)
+
+
+def _validate_card(card: Dict[str, Any]) -> Optional[str]:
+    """Проверка карточки перед /content/v2/cards/update (None — карточка корректна)"""
+    from services.wb_validators import validate_card_update
+
+    is_valid, validation_errors = validate_card_update(card)
+    if is_valid:
+        return None
+    return (f"Ошибка валидации карточки nmID={card.get('nmID', '?')} "
+            f"({card.get('vendorCode', '?')}): {'; '.join(validation_errors)}")
+
+
+def _response_from_cache(cached: Tuple) -> requests.Response:
+    """Восстановить requests.Response из кэша ответов (новый объект на каждое попадание)"""
+    status_code, headers, content, encoding, url = cached
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    response._content = content
+    response.encoding = encoding
+    response.url = url
+    return response
 
 
 class RateLimiter:
-    """Rate limiter для соблюдения лимитов API WB"""
+    """
+    Локальный rate limiter со скользящим окном (в рамках одного экземпляра)
+
+    Для запросов к API продавца используйте общий лимитер
+    services.wb_rate_limiter — он учитывает всех клиентов одного API ключа.
+    """
 
     def __init__(self, max_requests: int = 100, time_window: int = 60):
         """
@@ -63,27 +225,32 @@ class RateLimiter:
         """
         self.max_requests = max_requests
         self.time_window = time_window
-        self.requests_log: List[float] = []
+        self.requests_log: Deque[float] = deque()
+        self._lock = threading.Lock()
 
     def wait_if_needed(self):
         """Ожидание если достигнут лимит запросов"""
-        now = time.time()
+        with self._lock:
+            now = time.time()
 
-        # Очистка старых записей
-        self.requests_log = [
-            req_time for req_time in self.requests_log
-            if now - req_time < self.time_window
-        ]
+            # Очистка старых записей (лог упорядочен по времени)
+            while self.requests_log and now - self.requests_log[0] >= self.time_window:
+                self.requests_log.popleft()
 
-        # Проверка лимита
-        if len(self.requests_log) >= self.max_requests:
-            oldest_request = self.requests_log[0]
-            sleep_time = self.time_window - (now - oldest_request)
-            if sleep_time > 0:
-                logger.warning(f"Rate limit reached. Sleeping for {sleep_time:.2f}s")
-                time.sleep(sleep_time)
+            # Проверка лимита: резервируем слот освобождающегося запроса
+            sleep_time = 0.0
+            slot = now
+            if len(self.requests_log) >= self.max_requests:
+                oldest_request = self.requests_log.popleft()
+                slot = oldest_request + self.time_window
+                sleep_time = slot - now
+            if self.requests_log and self.requests_log[-1] > slot:
+                slot = self.requests_log[-1]
+            self.requests_log.append(slot)
 
-        self.requests_log.append(now)
+        if sleep_time > 0:
+            logger.warning(f"Rate limit reached. Sleeping for {sleep_time:.2f}s")
+            time.sleep(sleep_time)
 
 
 class WildberriesAPIClient:
@@ -93,8 +260,8 @@ class WildberriesAPIClient:
     Особенности:
     - Connection pooling для переиспользования соединений
     - Автоматические retry при временных ошибках
-    - Rate limiting для соблюдения лимитов API
-    - Кэширование результатов
+    - Общий (между потоками и воркерами) rate limiting по типам API
+    - Кэширование ответов справочников и цен (см. services/wb_response_cache.py)
     - Логирование всех запросов
     """
 
@@ -116,40 +283,63 @@ class WildberriesAPIClient:
         max_retries: int = 3,
         rate_limit: int = 100,
         timeout: int = 30,
-        db_logger_callback = None
+        db_logger_callback = None,
+        response_cache: bool = True,
+        cache_ttls: Optional[Dict[str, float]] = None,
+        coalesce_requests: bool = True,
+        base_url: Optional[str] = None
     ):
         """
         Args:
             api_key: API ключ Wildberries
             sandbox: Использовать sandbox-окружение
             max_retries: Максимальное количество повторов при ошибках
-            rate_limit: Максимальное количество запросов в минуту
+            rate_limit: Устарел — лимиты задаются по типам API в WB_RATE_LIMITS
             timeout: Таймаут запроса в секундах
             db_logger_callback: Функция для логирования в БД
+            response_cache: Использовать кэш ответов процесса
+            cache_ttls: Время жизни ответов по префиксам эндпоинтов
+                (вместо WB_RESPONSE_CACHE_RULES)
+            coalesce_requests: Объединять одинаковые одновременные GET-запросы
+            base_url: Базовый URL для всех типов API (по умолчанию WB_API_BASE_URL,
+                если не задан — хосты WB)
         """
         self.api_key = api_key
         self.sandbox = sandbox
+        self.base_url = (base_url or WB_API_BASE_URL).rstrip('/') or None
         self.timeout = timeout
         self.db_logger_callback = db_logger_callback
+        self.response_cache = get_wb_response_cache() if response_cache else None
+        self.cache_ttls = cache_ttls or {}
+        self.request_coalescer = get_request_coalescer() if coalesce_requests else None
 
-        # Rate limiter
-        self.rate_limiter = RateLimiter(max_requests=rate_limit, time_window=60)
+        # Общий rate limiter по (api_key, тип API)
+        self.rate_limiter = get_shared_rate_limiter()
+
+        # Повторы 429/5xx/таймаутов и общий circuit breaker по хостам WB
+        self.retry_policy = RetryPolicy(max_retries)
+        self.circuit_breaker = get_circuit_breaker()
 
         # Настройка сессии с connection pooling
         self.session = self._create_session(max_retries)
 
-        logger.info(f"WB API Client initialized (sandbox={sandbox})")
+        logger.info(f"WB API Client initialized (sandbox={sandbox}"
+                    + (f", base_url={self.base_url})" if self.base_url else ")"))
 
     def _create_session(self, max_retries: int) -> requests.Session:
-        """Создание сессии с retry-логикой и connection pooling"""
+        """Создание сессии с connection pooling"""
         session = requests.Session()
 
-        # Настройка retry-стратегии
+        # urllib3 повторяет только установку соединения (запрос ещё не отправлен);
+        # 429/5xx и таймауты обрабатывает RetryPolicy в _send_request
         retry_strategy = Retry(
-            total=max_retries,
-            backoff_factor=1,  # 1s, 2s, 4s, ...
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS", "POST", "PUT"]
+            total=None,
+            connect=max_retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.5,
+            raise_on_status=False
         )
 
         adapter = HTTPAdapter(
@@ -172,6 +362,8 @@ class WildberriesAPIClient:
 
     def _get_base_url(self, api_type: str) -> str:
         """Получить базовый URL для типа API"""
+        if self.base_url:
+            return self.base_url
         urls = {
             'content': self.CONTENT_API_SANDBOX if self.sandbox else self.CONTENT_API_URL,
             'statistics': self.STATISTICS_API_SANDBOX if self.sandbox else self.STATISTICS_API_URL,
@@ -188,6 +380,7 @@ class WildberriesAPIClient:
         endpoint: str,
         log_to_db: bool = False,
         seller_id: int = None,
+        use_cache: Optional[bool] = None,
         **kwargs
     ) -> requests.Response:
         """
@@ -197,7 +390,11 @@ class WildberriesAPIClient:
             method: HTTP метод (GET, POST, etc.)
             api_type: Тип API (content, statistics, marketplace)
             endpoint: Эндпоинт (без базового URL)
-            **kwargs: Дополнительные параметры для requests
+            use_cache: None — кэшировать GET-эндпоинты из WB_RESPONSE_CACHE_RULES,
+                True — также чтения через POST (список карточек), False — без кэша
+            **kwargs: Дополнительные параметры для requests. С stream=True тело
+                не читается (см. services/json_stream.py): такие запросы не
+                кэшируются, не объединяются и не пишутся в лог API
 
         Returns:
             Response object
@@ -207,171 +404,245 @@ class WildberriesAPIClient:
             WBRateLimitException: Превышен лимит запросов
             WBAPIException: Общая ошибка API
         """
-        # Rate limiting
-        self.rate_limiter.wait_if_needed()
+        # Кэш ответов: попадание не расходует лимит запросов
+        cache_rule = None
+        cache_key = None
+        streaming = kwargs.get('stream', False)
+        if self.response_cache is not None and not streaming:
+            cache_rule = resolve_cache_rule(method, endpoint, use_cache, self.cache_ttls)
+        if cache_rule is not None:
+            cache_key = self.response_cache.make_key(
+                self.api_key, method, endpoint, kwargs.get('params'), kwargs.get('json')
+            )
+            cached = self.response_cache.get(cache_key, cache_rule[0])
+            if cached is not None:
+                logger.debug(f"WB API cache hit: {method} {endpoint}")
+                return _response_from_cache(cached)
+
+        # Одинаковые одновременные GET выполняются одним запросом
+        if self.request_coalescer is not None and method.upper() == 'GET' and not streaming:
+            flight_key = cache_key or WBResponseCache.make_key(
+                self.api_key, method, endpoint, kwargs.get('params')
+            )
+            response, shared = self.request_coalescer.run(
+                flight_key,
+                lambda: self._send_request(method, api_type, endpoint, log_to_db, seller_id,
+                                           cache_key, cache_rule, **kwargs),
+                endpoint
+            )
+            # Ожидавшим — своя копия ответа
+            return _response_from_cache(_response_snapshot(response)) if shared else response
+
+        return self._send_request(method, api_type, endpoint, log_to_db, seller_id,
+                                  cache_key, cache_rule, **kwargs)
+
+    def _send_request(
+        self,
+        method: str,
+        api_type: str,
+        endpoint: str,
+        log_to_db: bool,
+        seller_id: Optional[int],
+        cache_key: Optional[Tuple],
+        cache_rule: Optional[Tuple],
+        **kwargs
+    ) -> requests.Response:
+        """
+        Выполнить запрос к WB (лимит, повторы, логирование, обработка ошибок, сохранение в кэш)
+
+        429 повторяется после паузы из заголовков WB — она передаётся в общий
+        rate limiter, и ждёт следующий acquire(). 5xx и таймауты повторяются для
+        идемпотентных запросов (см. services/wb_retry.py). Пока circuit breaker
+        хоста открыт, запрос не отправляется (WBCircuitOpenException).
+        """
+        metrics = get_metrics()
 
         # Формирование URL
         base_url = self._get_base_url(api_type)
         url = urljoin(base_url, endpoint)
+        host = urlsplit(base_url).netloc
 
         # Установка таймаута если не указан
         if 'timeout' not in kwargs:
             kwargs['timeout'] = self.timeout
 
-        # Логирование запроса
-        params_str = f" params={kwargs.get('params')}" if kwargs.get('params') else ""
-        logger.info(f"WB API Request: {method} {url}{params_str}")
-        logger.debug(f"API Key (first 10 chars): {self.api_key[:10]}...")
-        start_time = time.time()
+        # Логируем в БД если предоставлен callback (в фоне, тела сериализуются только при записи)
+        log_writer = None
+        if log_to_db and self.db_logger_callback and seller_id and not kwargs.get('stream'):
+            log_writer = get_api_log_writer()
 
-        # Сохраняем request body для логирования
-        request_body_str = None
-        if 'json' in kwargs and kwargs['json']:
+        attempt = 0
+        while True:
+            retry_in = self.circuit_breaker.before_request(host)
+            if retry_in:
+                raise WBCircuitOpenException(
+                    f"API Wildberries ({host}) временно недоступен, повтор через {retry_in:.0f}s",
+                    retry_in
+                )
+
+            # Rate limiting (общий бюджет ключа для данного типа API)
             try:
-                import json as json_module
-                request_body_str = json_module.dumps(kwargs['json'], ensure_ascii=False)
-            except:
-                request_body_str = str(kwargs['json'])
+                waited = self.rate_limiter.acquire(self.api_key, api_type, endpoint)
+            except BaseException:
+                self.circuit_breaker.release_probe(host)
+                raise
+            metrics.observe_limiter_wait(api_type, endpoint, seller_id, waited or 0.0)
+
+            # Логирование запроса
+            params_str = f" params={kwargs.get('params')}" if kwargs.get('params') else ""
+            logger.info(f"WB API Request: {method} {url}{params_str}")
+            logger.debug(f"API Key (first 10 chars): {self.api_key[:10]}...")
+            start_time = time.time()
 
-        try:
-            response = self.session.request(method, url, **kwargs)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                elapsed = time.time() - start_time
+                is_timeout = isinstance(e, requests.exceptions.Timeout)
+                metrics.observe_request(api_type, endpoint, seller_id, elapsed, 'timeout' if is_timeout else 'error')
+                if isinstance(e, requests.exceptions.SSLError):
+                    # Ошибка на нашей стороне, а не отказ хоста
+                    self.circuit_breaker.release_probe(host)
+                else:
+                    self.circuit_breaker.record_failure(host)
+
+                delay = self.retry_policy.retry_delay(method, endpoint, attempt, error=e)
+                if delay is not None:
+                    logger.warning(f"⚠️ {type(e).__name__} for {method} {endpoint}, "
+                                   f"retry {attempt + 1}/{self.retry_policy.max_retries} in {delay:.1f}s")
+                    metrics.record_retry(api_type, endpoint, seller_id)
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                raise self._transport_exception(e, url, method, endpoint, seller_id, elapsed, log_writer,
+                                                kwargs.get('json'))
+            except Exception as e:
+                self.circuit_breaker.release_probe(host)
+                logger.exception(f"Unexpected error for {url}: {e}")
+                raise WBAPIException(f"Неожиданная ошибка: {str(e)}")
+            except BaseException:
+                self.circuit_breaker.release_probe(host)
+                raise
 
             # Логирование времени выполнения
             elapsed = time.time() - start_time
-            logger.info(f"WB API Response: {response.status_code} ({elapsed:.2f}s)")
+            status = response.status_code
+            logger.info(f"WB API Response: {status} ({elapsed:.2f}s)")
+            metrics.observe_request(api_type, endpoint, seller_id, elapsed, status)
+            metrics.record_retry(api_type, endpoint, seller_id, _retry_count(response))
 
-            # Сохраняем response body для логирования
-            response_body_str = None
-            try:
-                response_body_str = response.text
-            except:
-                pass
-
-            # Логируем в БД если предоставлен callback
-            if log_to_db and self.db_logger_callback and seller_id:
-                try:
-                    self.db_logger_callback(
-                        seller_id=seller_id,
-                        endpoint=endpoint,
-                        method=method,
-                        status_code=response.status_code,
-                        response_time=elapsed,
-                        success=(response.status_code < 400),
-                        request_body=request_body_str,
-                        response_body=response_body_str
-                    )
-                except Exception as log_error:
-                    logger.warning(f"Failed to log to DB: {log_error}")
-
-            # Обработка ошибок
-            if response.status_code == 401:
-                raise WBAuthException("Ошибка авторизации. Проверьте API ключ.")
-            elif response.status_code == 429:
-                raise WBRateLimitException("Превышен лимит запросов к API.")
-            elif response.status_code >= 400:
-                error_msg = f"API Error {response.status_code}"
-                try:
-                    error_data = response.json()
-                    # WB API возвращает ошибки в разных полях
-                    wb_error = (
-                        error_data.get('errorText')
-                        or error_data.get('message')
-                        or error_data.get('error')
-                        or error_msg
-                    )
-                    # additionalErrors содержит детали по конкретным полям
-                    additional = error_data.get('additionalErrors')
-                    if additional:
-                        if isinstance(additional, dict):
-                            details = '; '.join(f'{k}: {v}' for k, v in additional.items())
-                        else:
-                            details = str(additional)
-                        error_msg = f"{wb_error} | Детали: {details}"
+            if status >= 500:
+                self.circuit_breaker.record_failure(host)
+            else:
+                self.circuit_breaker.record_success(host)
+
+            if status == 429 or status >= 500:
+                delay = self.retry_policy.retry_delay(method, endpoint, attempt, status=status,
+                                                      headers=response.headers)
+                if delay is not None:
+                    logger.warning(f"⚠️ WB API {status} for {method} {endpoint}, "
+                                   f"retry {attempt + 1}/{self.retry_policy.max_retries} in {delay:.1f}s")
+                    metrics.record_retry(api_type, endpoint, seller_id)
+                    attempt += 1
+                    if kwargs.get('stream'):
+                        response.close()  # Непрочитанное тело держит соединение
+                    if status == 429:
+                        # Ждёт следующий acquire() — и все остальные запросы этого бакета
+                        self.rate_limiter.penalize(self.api_key, api_type, endpoint, delay)
                     else:
-                        error_msg = str(wb_error) if wb_error != error_msg else error_msg
-
-                    # Для 400 Bad Request без деталей — пытаемся дать подсказку
-                    if response.status_code == 400 and error_msg in ('bad request', 'Bad Request', 'API Error 400'):
-                        hints = []
-                        # Анализируем request body для подсказок
-                        if request_body_str:
-                            try:
-                                import json as _json
-                                req_data = _json.loads(request_body_str)
-                                if isinstance(req_data, list) and req_data:
-                                    card = req_data[0] if isinstance(req_data[0], dict) else {}
-                                    variants = card.get('variants', [])
-                                    if variants:
-                                        v = variants[0]
-                                        chars = v.get('characteristics', [])
-                                        if not chars:
-                                            hints.append('нет характеристик')
-                                        if not v.get('brand'):
-                                            hints.append('не указан бренд')
-                                        sizes = v.get('sizes', [])
-                                        if sizes:
-                                            for s in sizes:
-                                                if not s.get('skus') or not s['skus'][0]:
-                                                    hints.append('пустые баркоды (skus)')
-                                                    break
-                                        dims = v.get('dimensions', {})
-                                        if not dims or not dims.get('length'):
-                                            hints.append('не указаны габариты')
-                                    if not card.get('subjectID'):
-                                        hints.append('не указан subjectID (категория)')
-                            except Exception:
-                                pass
-                        if hints:
-                            error_msg = f"bad request (возможные причины: {', '.join(hints)})"
-
-                    # Логируем полный ответ для отладки
-                    logger.error(f"WB API {response.status_code} full response: {error_data}")
-                    if request_body_str:
-                        logger.error(f"WB API {response.status_code} request body: {request_body_str[:2000]}")
-                except Exception:
-                    error_msg = response.text or error_msg
-                raise WBAPIException(error_msg)
-
-            return response
-
-        except requests.exceptions.Timeout as e:
-            elapsed = time.time() - start_time
+                        time.sleep(delay)
+                    continue
+
+            self._apply_rate_limit_headers(api_type, endpoint, response)
+            break
+
+        # Запись (даже неуспешная) сбрасывает закэшированные ответы по тем же nmID
+        if self.response_cache is not None and method.upper() != 'GET':
+            self.response_cache.invalidate_for_write(self.api_key, endpoint, kwargs.get('json'))
+
+        if log_writer is not None:
+            log_writer.submit(
+                self.db_logger_callback,
+                seller_id=seller_id,
+                endpoint=endpoint,
+                method=method,
+                status_code=response.status_code,
+                response_time=elapsed,
+                request_json=kwargs.get('json'),
+                response=response
+            )
+
+        # Обработка ошибок (тело декодируется только для ошибок)
+        if response.status_code >= 400:
+            raise_for_wb_status(response.status_code, response.text,
+                                serialize_request_body(kwargs.get('json')), response.headers)
+
+        if cache_key is not None:
+            self._cache_response(cache_key, cache_rule, response, kwargs)
+
+        return response
+
+    def _apply_rate_limit_headers(self, api_type: str, endpoint: str, response: requests.Response) -> None:
+        """
+        Передать в общий лимитер паузу, о которой сообщил WB
+
+        При 429 (повторы исчерпаны) и при исчерпанном остатке лимита
+        (X-Ratelimit-Remaining: 0) следующий запрос бакета ждёт время из
+        X-Ratelimit-Retry / Retry-After / X-Ratelimit-Reset.
+        """
+        headers = response.headers
+        if response.status_code != 429 and headers.get('X-Ratelimit-Remaining') != '0':
+            return
+        wait = parse_retry_after(headers)
+        if wait:
+            self.rate_limiter.penalize(self.api_key, api_type, endpoint, wait)
+
+    def _transport_exception(self, error: Exception, url: str, method: str, endpoint: str,
+                             seller_id: Optional[int], elapsed: float, log_writer,
+                             request_json: Any) -> WBAPIException:
+        """Исключение для таймаута / ошибки соединения (после исчерпания повторов)"""
+        if isinstance(error, requests.exceptions.Timeout):
             logger.error(f"Request timeout for {url} after {self.timeout}s")
 
             # Логируем timeout в БД
-            if log_to_db and self.db_logger_callback and seller_id:
-                try:
-                    self.db_logger_callback(
-                        seller_id=seller_id,
-                        endpoint=endpoint,
-                        method=method,
-                        status_code=None,
-                        response_time=elapsed,
-                        success=False,
-                        error_message=f"Timeout after {self.timeout}s",
-                        request_body=request_body_str
-                    )
-                except Exception as log_error:
-                    logger.warning(f"Failed to log timeout to DB: {log_error}")
-
-            raise WBAPIException(f"Timeout при запросе к API ({self.timeout}s). Попробуйте позже.")
-        except requests.exceptions.SSLError as e:
-            logger.error(f"SSL error for {url}: {e}")
-            raise WBAPIException(f"Ошибка SSL соединения: {str(e)}. Проверьте сетевое подключение.")
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error for {url}: {e}")
-            error_msg = str(e)
-            if "Name or service not known" in error_msg or "getaddrinfo failed" in error_msg:
-                raise WBAPIException("Не удалось разрешить имя хоста API Wildberries. Проверьте интернет-соединение.")
-            elif "Connection refused" in error_msg:
-                raise WBAPIException("Подключение отклонено сервером API Wildberries. Проверьте URL и доступность API.")
-            else:
-                raise WBAPIException(f"Ошибка соединения с API Wildberries: {error_msg}")
-        except (WBAuthException, WBRateLimitException, WBAPIException):
-            raise
-        except Exception as e:
-            logger.exception(f"Unexpected error for {url}: {e}")
-            raise WBAPIException(f"Неожиданная ошибка: {str(e)}")
+            if log_writer is not None:
+                log_writer.submit(
+                    self.db_logger_callback,
+                    seller_id=seller_id,
+                    endpoint=endpoint,
+                    method=method,
+                    status_code=None,
+                    response_time=elapsed,
+                    error_message=f"Timeout after {self.timeout}s",
+                    request_json=request_json
+                )
+
+            return WBAPIException(f"Timeout при запросе к API ({self.timeout}s). Попробуйте позже.")
+        if isinstance(error, requests.exceptions.SSLError):
+            logger.error(f"SSL error for {url}: {error}")
+            return WBAPIException(f"Ошибка SSL соединения: {str(error)}. Проверьте сетевое подключение.")
+
+        logger.error(f"Connection error for {url}: {error}")
+        error_msg = str(error)
+        if "Name or service not known" in error_msg or "getaddrinfo failed" in error_msg:
+            return WBAPIException("Не удалось разрешить имя хоста API Wildberries. Проверьте интернет-соединение.")
+        elif "Connection refused" in error_msg:
+            return WBAPIException("Подключение отклонено сервером API Wildberries. Проверьте URL и доступность API.")
+        return WBAPIException(f"Ошибка соединения с API Wildberries: {error_msg}")
+
+    def _cache_response(self, cache_key, cache_rule, response: requests.Response,
+                        request_kwargs: Dict[str, Any]) -> None:
+        """Сохранить успешный ответ в кэш (с nmID запроса и ответа для инвалидации)"""
+        prefix, rule = cache_rule
+        nm_ids = set()
+        if rule.by_nm_id:
+            nm_ids = extract_nm_ids(request_kwargs.get('params')) | extract_nm_ids(request_kwargs.get('json'))
+            try:
+                nm_ids |= extract_nm_ids(response.json())
+            except ValueError:
+                return
+        self.response_cache.put(cache_key, _response_snapshot(response), len(response.content),
+                                rule.ttl, prefix, nm_ids)
 
     # ==================== CONTENT API ====================
 
@@ -383,7 +654,9 @@ class WildberriesAPIClient:
         cursor_updated_at: Optional[str] = None,
         cursor_nm_id: Optional[int] = None,
         log_to_db: bool = False,
-        seller_id: int = None
+        seller_id: int = None,
+        ascending: Optional[bool] = None,
+        use_cache: bool = False
     ) -> Dict[str, Any]:
         """
         Получить список карточек товаров (Content API v2)
@@ -394,6 +667,10 @@ class WildberriesAPIClient:
             filter_nm_id: Фильтр по nmID (артикулу WB)
             cursor_updated_at: Для пагинации - updatedAt из предыдущего ответа
             cursor_nm_id: Для пагинации - nmID из предыдущего ответа
+            ascending: Сортировка по updatedAt (False — сначала недавно изменённые,
+                None — сортировка WB по умолчанию)
+            use_cache: Взять ответ из кэша ответов, если он свежий
+                (по умолчанию карточки всегда читаются из WB)
 
         Returns:
             Словарь с данными карточек
@@ -424,10 +701,14 @@ class WildberriesAPIClient:
         if filter_nm_id:
             body["settings"]["filter"]["textSearch"] = str(filter_nm_id)
 
+        if ascending is not None:
+            body["settings"]["sort"] = {"ascending": ascending}
+
         response = self._make_request(
             'POST', 'content', endpoint,
             log_to_db=log_to_db,
             seller_id=seller_id,
+            use_cache=use_cache,
             json=body
         )
         return response.json()
@@ -465,65 +746,86 @@ class WildberriesAPIClient:
 
         return cards[0]
 
-    def get_all_cards(self, batch_size: int = 100) -> List[Dict[str, Any]]:
+    def iter_cards(
+        self,
+        batch_size: int = 100,
+        cursor_updated_at: Optional[str] = None,
+        cursor_nm_id: Optional[int] = None,
+        log_to_db: bool = False,
+        seller_id: int = None,
+        ascending: Optional[bool] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
         """
-        Получить все карточки товаров с автоматической cursor-based пагинацией
+        Постранично получить карточки товаров (cursor-based пагинация)
 
-        Args:
-            batch_size: Размер пачки для одного запроса (макс 100)
+        В отличие от get_all_cards не держит весь каталог в памяти: каждая
+        страница отдаётся вызывающему сразу. Вместе со страницей отдаётся курсор
+        следующей страницы — его можно сохранить и позже продолжить обход
+        с этого места, передав cursor_updated_at / cursor_nm_id.
 
-        Returns:
-            Список всех карточек
+        Args:
+            batch_size: Размер страницы (макс 100)
+            cursor_updated_at: updatedAt курсора, с которого продолжить
+            cursor_nm_id: nmID курсора, с которого продолжить
+            ascending: Сортировка по updatedAt (см. get_cards_list)
 
-        Note:
-            API v2 использует cursor-based пагинацию вместо offset
+        Yields:
+            (карточки страницы, {'updatedAt': ..., 'nmID': ...} или None для последней страницы)
         """
-        all_cards = []
-        cursor_updated_at = None
-        cursor_nm_id = None
+        page_num = 0
 
         while True:
-            # Сохраняем текущий cursor перед запросом для проверки на зацикливание
-            prev_cursor_updated_at = cursor_updated_at
-            prev_cursor_nm_id = cursor_nm_id
-
-            # Запрос с cursor для пагинации
+            page_num += 1
             data = self.get_cards_list(
                 limit=batch_size,
                 cursor_updated_at=cursor_updated_at,
-                cursor_nm_id=cursor_nm_id
+                cursor_nm_id=cursor_nm_id,
+                log_to_db=log_to_db,
+                seller_id=seller_id,
+                ascending=ascending
             )
 
             cards = data.get('cards', [])
-
             if not cards:
-                logger.info(f"No more cards to load. Total: {len(all_cards)}")
-                break
+                logger.info(f"No more cards to load (page {page_num})")
+                return
 
-            all_cards.extend(cards)
-            logger.info(f"Loaded {len(all_cards)} cards so far...")
+            cursor = data.get('cursor') or {}
+            next_updated_at = cursor.get('updatedAt')
+            next_nm_id = cursor.get('nmID')
 
-            # Получаем cursor для следующей страницы
-            cursor = data.get('cursor')
-            if not cursor:
-                logger.info(f"No cursor in response. Total cards: {len(all_cards)}")
-                break
+            # Нет данных для курсора — это последняя страница
+            if not next_updated_at or not next_nm_id:
+                yield cards, None
+                return
 
-            # Если есть cursor, используем его для следующего запроса
-            cursor_updated_at = cursor.get('updatedAt')
-            cursor_nm_id = cursor.get('nmID')
+            # Проверка на зацикливание - новый cursor не должен совпадать с предыдущим
+            if cursor_updated_at == next_updated_at and cursor_nm_id == next_nm_id:
+                logger.warning(f"Cursor not changing on page {page_num}, stopping to avoid infinite loop")
+                yield cards, None
+                return
 
-            # Если нет данных для cursor, значит это последняя страница
-            if not cursor_updated_at or not cursor_nm_id:
-                logger.info(f"Pagination complete. Total cards: {len(all_cards)}")
-                break
+            yield cards, {'updatedAt': next_updated_at, 'nmID': next_nm_id}
+            cursor_updated_at = next_updated_at
+            cursor_nm_id = next_nm_id
 
-            # Проверка на зацикливание - новый cursor не должен совпадать с предыдущим
-            if (prev_cursor_updated_at is not None and
-                prev_cursor_updated_at == cursor_updated_at and
-                prev_cursor_nm_id == cursor_nm_id):
-                logger.warning(f"Cursor not changing, stopping to avoid infinite loop. Total: {len(all_cards)}")
-                break
+    def get_all_cards(self, batch_size: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получить все карточки товаров с автоматической cursor-based пагинацией
+
+        Args:
+            batch_size: Размер пачки для одного запроса (макс 100)
+
+        Returns:
+            Список всех карточек
+
+        Note:
+            Держит весь каталог в памяти. Для больших каталогов используйте iter_cards
+        """
+        all_cards = []
+        for cards, _ in self.iter_cards(batch_size=batch_size):
+            all_cards.extend(cards)
+            logger.info(f"Loaded {len(all_cards)} cards so far...")
 
         logger.info(f"Total cards loaded: {len(all_cards)}")
         return all_cards
@@ -549,11 +851,38 @@ class WildberriesAPIClient:
 
         Returns:
             Список строк отчёта реализации
+
+        Note:
+            Держит весь отчёт в памяти. Для обработки по мере загрузки
+            используйте iter_sales_report
         """
-        endpoint = "/api/v5/supplier/reportDetailByPeriod"
+        return list(self.iter_sales_report(date_from, date_to, limit))
 
-        all_rows: List[Dict[str, Any]] = []
+    def iter_sales_report(
+        self,
+        date_from: str,
+        date_to: Optional[str] = None,
+        limit: int = 100000,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Строки отчёта реализации по мере загрузки (Statistics API v5)
+
+        Ответ разбирается потоково (services/json_stream.py): в памяти
+        только текущий чанк, а не страница на 100000 строк целиком.
+
+        Args:
+            date_from: Дата начала в формате YYYY-MM-DD
+            date_to: Дата окончания (опционально)
+            limit: Макс. строк на запрос (до 100000)
+
+        Yields:
+            Строки отчёта реализации
+        """
+        from services.json_stream import NotJSONArrayError, iter_response_array
+
+        endpoint = "/api/v5/supplier/reportDetailByPeriod"
         rrdid = 0
+        total = 0
 
         while True:
             params = {
@@ -564,34 +893,38 @@ class WildberriesAPIClient:
             if date_to:
                 params['dateTo'] = date_to
 
-            response = self._make_request('GET', 'statistics', endpoint, params=params)
+            response = self._make_request('GET', 'statistics', endpoint, params=params, stream=True)
 
             # 204 = нет данных (конец пагинации или пустой отчёт)
             if response.status_code == 204:
+                response.close()
                 break
 
-            page = response.json()
-            if not isinstance(page, list) or not page:
+            page_rows = 0
+            last_rrd_id = 0
+            try:
+                for row in iter_response_array(response):
+                    page_rows += 1
+                    if isinstance(row, dict):
+                        last_rrd_id = row.get('rrd_id', 0)
+                    yield row
+            except NotJSONArrayError as e:
+                logger.warning(f"Sales report returned non-list: {e}")
                 break
-
-            all_rows.extend(page)
+            total += page_rows
 
             # Если страница неполная — данные кончились
-            if len(page) < limit:
+            if page_rows < limit:
                 break
 
             # Пагинация: берём rrd_id последней строки
-            last_rrd_id = page[-1].get('rrd_id', 0)
             if last_rrd_id and last_rrd_id != rrdid:
                 rrdid = last_rrd_id
-                # reportDetailByPeriod: макс 1 запрос/мин
-                logger.info(f"Pagination: fetched {len(all_rows)} rows, next rrdid={rrdid}, waiting 61s...")
-                time.sleep(61)
+                # reportDetailByPeriod: макс 1 запрос/мин — паузу выдержит общий rate limiter
+                logger.info(f"Pagination: fetched {total} rows, next rrdid={rrdid}")
             else:
                 break
 
-        return all_rows
-
     def get_orders(
         self,
         date_from: str,
@@ -905,28 +1238,28 @@ class WildberriesAPIClient:
             - Максимум 3000 карточек за раз
             - Максимальный размер запроса 10 МБ
             - Все карточки должны быть ПОЛНЫМИ (не частичные обновления)
+            - Для больших списков — update_cards_bulk (пачки по размеру)
         """
-        import sys
+        from services.wb_batcher import CARDS_UPDATE_MAX_BYTES, CARDS_UPDATE_MAX_ITEMS
 
-        if len(cards) > 3000:
+        if len(cards) > CARDS_UPDATE_MAX_ITEMS:
             raise WBAPIException(
                 f"Too many cards ({len(cards)}). "
-                f"Maximum 3000 cards per request. Use chunking."
+                f"Maximum {CARDS_UPDATE_MAX_ITEMS} cards per request. Use update_cards_bulk."
             )
 
         if not cards:
             logger.warning("⚠️ Empty cards list provided to update_cards_batch")
             return {'success': True, 'updated': 0}
 
-        # Проверка размера запроса
-        import json
-        size_bytes = sys.getsizeof(json.dumps(cards))
+        # Проверка размера запроса (тело — как его сериализует requests)
+        size_bytes = len(json.dumps(cards))
         size_mb = size_bytes / 1024 / 1024
 
-        if size_mb > 10:
+        if size_bytes > CARDS_UPDATE_MAX_BYTES:
             raise WBAPIException(
                 f"Request size too large ({size_mb:.2f} MB). "
-                f"Maximum 10 MB. Reduce batch size or remove heavy fields."
+                f"Maximum {CARDS_UPDATE_MAX_BYTES / 1024 / 1024:.0f} MB. Use update_cards_bulk."
             )
 
         logger.info(f"📤 Batch update: {len(cards)} cards, size: {size_mb:.2f} MB")
@@ -966,6 +1299,70 @@ class WildberriesAPIClient:
             logger.error(f"❌ Unexpected error in batch update: {str(e)}")
             raise
 
+    def _cards_update_batcher(self, log_to_db: bool, seller_id: Optional[int], validate: bool,
+                              workers: Optional[int]):
+        """WBBatcher для /content/v2/cards/update (лимиты WB по числу карточек и размеру)"""
+        from services.wb_batcher import CARDS_UPDATE_MAX_BYTES, CARDS_UPDATE_MAX_ITEMS, WBBatcher
+
+        validator = _validate_card if validate else None
+        return WBBatcher(
+            lambda batch: self.update_cards_batch(batch, log_to_db=log_to_db, seller_id=seller_id,
+                                                  validate=False),
+            max_items=CARDS_UPDATE_MAX_ITEMS,
+            max_bytes=CARDS_UPDATE_MAX_BYTES,
+            validate=validator,
+            workers=workers
+        )
+
+    def update_cards_bulk(
+        self,
+        cards: List[Dict[str, Any]],
+        log_to_db: bool = False,
+        seller_id: int = None,
+        validate: bool = True,
+        workers: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Обновить любое число карточек пачками максимального допустимого размера
+
+        Карточки упаковываются по числу и размеру тела запроса, пачки
+        отправляются параллельно; отклонённая WB пачка делится, пока ошибка не
+        сведётся к конкретным карточкам (см. services/wb_batcher.py).
+
+        Args:
+            cards: Подготовленные ПОЛНЫЕ карточки (как для update_cards_batch)
+            log_to_db: Логировать запросы в БД
+            seller_id: ID продавца для логирования
+            validate: Проверять карточки до отправки (невалидные не отправляются)
+            workers: Одновременных запросов (по умолчанию WB_BATCH_WORKERS)
+
+        Returns:
+            {
+                "total": 250,
+                "success": 249,
+                "failed": 1,
+                "errors": [{"error": "...", "nm_ids": [123]}],
+                "items": {nmID: {"success": bool, "error": str | None}}
+            }
+        """
+        return self._cards_update_batcher(log_to_db, seller_id, validate, workers).run(cards)
+
+    def iter_update_cards_batches(
+        self,
+        cards: List[Dict[str, Any]],
+        log_to_db: bool = False,
+        seller_id: int = None,
+        validate: bool = True,
+        workers: Optional[int] = None
+    ):
+        """
+        То же, что update_cards_bulk, но итоги пачек отдаются по мере готовности
+
+        Yields:
+            BatchOutcome(items, error, result): error=None — карточки пачки обновлены
+        """
+        return self._cards_update_batcher(log_to_db, seller_id, validate, workers).iter_batches(cards)
+
     def upload_photos_to_card(
         self,
         nm_id: int,
@@ -1333,81 +1730,69 @@ class WildberriesAPIClient:
         prices: List[Dict[str, Any]],
         batch_size: int = 1000,
         log_to_db: bool = False,
-        seller_id: int = None
+        seller_id: int = None,
+        workers: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Загрузить цены пачками (для больших списков)
 
+        Пачки собираются по числу товаров и размеру тела запроса и отправляются
+        параллельно; отклонённая WB пачка делится, пока ошибка не сведётся к
+        конкретным товарам (см. services/wb_batcher.py).
+
         Args:
             prices: Полный список обновлений цен
-            batch_size: Размер одной пачки (макс 1000)
+            batch_size: Максимальный размер пачки (не больше лимита WB — 1000)
             log_to_db: Логировать запросы в БД
             seller_id: ID продавца для логирования
+            workers: Одновременных запросов (по умолчанию WB_BATCH_WORKERS)
 
         Returns:
             {
                 "total": 1500,
                 "success": 1490,
                 "failed": 10,
-                "errors": [...]
+                "errors": [{"error": "...", "nm_ids": [...]}],
+                "items": {nmID: {"success": bool, "error": str | None}},
+                "tasks": [{"upload_id": 123, "nm_ids": [...]}]
             }
+            success — WB принял товары в загрузку; итог применения
+            по задачам tasks (см. services/price_upload_tracker.py).
         """
-        result = {
-            'total': len(prices),
-            'success': 0,
-            'failed': 0,
-            'errors': []
-        }
+        from services.wb_batcher import (
+            PRICES_BODY_OVERHEAD, PRICES_UPLOAD_MAX_BYTES, PRICES_UPLOAD_MAX_ITEMS, WBBatcher,
+        )
 
-        batches = chunk_list(prices, batch_size)
-        logger.info(f"📦 Uploading {len(prices)} prices in {len(batches)} batches")
+        def validate_price(item):
+            # Те же проверки, что в upload_prices_v2 (там невалидные отбрасываются молча)
+            nm_id = item.get('nmID')
+            price = item.get('price')
+            if not nm_id or not isinstance(nm_id, int) or nm_id <= 0:
+                return f"Некорректный nmID: {nm_id}"
+            if price is None or (isinstance(price, (int, float)) and price <= 0):
+                return f"Некорректная цена: {price}"
+            return None
 
-        for i, batch in enumerate(batches):
-            logger.info(f"  Batch {i+1}/{len(batches)}: {len(batch)} items")
-            try:
-                self.upload_prices_v2(
-                    batch,
-                    log_to_db=log_to_db,
-                    seller_id=seller_id
-                )
-                result['success'] += len(batch)
-            except WBAPIException as e:
-                error_str = str(e)
-                logger.error(f"  ❌ Batch {i+1} failed: {error_str}")
-
-                # Если батч упал целиком — пробуем отправить меньшими частями
-                # чтобы изолировать невалидные элементы от валидных
-                if len(batch) > 1:
-                    logger.info(f"  🔄 Retrying batch {i+1} in sub-batches of 100...")
-                    sub_batches = chunk_list(batch, 100)
-                    for si, sub_batch in enumerate(sub_batches):
-                        try:
-                            self.upload_prices_v2(
-                                sub_batch,
-                                log_to_db=False,
-                                seller_id=seller_id
-                            )
-                            result['success'] += len(sub_batch)
-                            logger.info(f"    Sub-batch {si+1}/{len(sub_batches)}: OK ({len(sub_batch)} items)")
-                        except WBAPIException as sub_e:
-                            # Суб-батч тоже упал — помечаем эти nmID как failed
-                            result['failed'] += len(sub_batch)
-                            result['errors'].append({
-                                'batch': i + 1,
-                                'sub_batch': si + 1,
-                                'error': str(sub_e),
-                                'nm_ids': [p.get('nmID') for p in sub_batch]
-                            })
-                            logger.error(f"    Sub-batch {si+1}/{len(sub_batches)}: FAILED ({len(sub_batch)} items)")
-                else:
-                    result['failed'] += len(batch)
-                    result['errors'].append({
-                        'batch': i + 1,
-                        'error': error_str,
-                        'nm_ids': [p.get('nmID') for p in batch]
-                    })
-
-        logger.info(f"📊 Upload complete: {result['success']}/{result['total']} success")
+        batcher = WBBatcher(
+            lambda batch: self.upload_prices_v2(batch, log_to_db=log_to_db, seller_id=seller_id),
+            max_items=min(batch_size, PRICES_UPLOAD_MAX_ITEMS),
+            max_bytes=PRICES_UPLOAD_MAX_BYTES,
+            overhead=PRICES_BODY_OVERHEAD,
+            validate=validate_price,
+            workers=workers
+        )
+        logger.info(f"📦 Uploading {len(prices)} prices")
+        result = batcher.run(prices)
+
+        # Задачи загрузки WB: цены применяются асинхронно, итог — get_price_upload_status
+        result['tasks'] = []
+        for accepted in result.pop('accepted'):
+            data = (accepted['result'] or {}).get('data') or {}
+            if data.get('id'):
+                result['tasks'].append({'upload_id': data['id'], 'nm_ids': accepted['nm_ids']})
+
+        logger.info(f"📊 Upload complete: {result['success']}/{result['total']} success, "
+                    f"{len(result['tasks'])} WB upload tasks")
         return result
 
     def get_price_upload_status(
@@ -1415,7 +1800,8 @@ class WildberriesAPIClient:
         limit: int = 100,
         offset: int = 0,
         log_to_db: bool = False,
-        seller_id: int = None
+        seller_id: int = None,
+        upload_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Получить статус обработанных загрузок цен (Prices API v2)
@@ -1425,28 +1811,32 @@ class WildberriesAPIClient:
             offset: Смещение для пагинации
             log_to_db: Логировать запрос в БД
             seller_id: ID продавца для логирования
+            upload_id: ID загрузки (data.id ответа upload_prices_v2)
 
         Returns:
             {
                 "data": {
                     "uploadID": 123,
-                    "status": 3,  # 3 = processed
+                    "status": 3,  # 3 = обработана, 4 = отменена, 5 = частично с ошибками, 6 = все с ошибками
                     "uploadDate": "2024-01-15T10:30:00Z",
                     "activationDate": "2024-01-15T10:35:00Z",
                     "overAllGoodsNumber": 100,
-                    "successGoodsNumber": 98,
-                    "failedGoods": [...]
+                    "successGoodsNumber": 98
                 }
             }
+            Пока загрузка в буфере (не обработана), status в data отсутствует.
         """
         endpoint = "/api/v2/history/tasks"
 
-        params = {
-            'limit': min(limit, 100),
-            'offset': offset
-        }
+        if upload_id is not None:
+            params = {'uploadID': upload_id}
+        else:
+            params = {
+                'limit': min(limit, 100),
+                'offset': offset
+            }
 
-        logger.info(f"📋 Getting price upload status (limit={limit})")
+        logger.info(f"📋 Getting price upload status ({params})")
 
         try:
             response = self._make_request(
@@ -1462,6 +1852,58 @@ class WildberriesAPIClient:
             logger.error(f"❌ Failed to get price upload status: {str(e)}")
             raise
 
+    def get_price_upload_goods(
+        self,
+        upload_id: int,
+        limit: int = 1000,
+        offset: int = 0,
+        log_to_db: bool = False,
+        seller_id: int = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Получить результат обработанной загрузки цен по товарам (Prices API v2)
+
+        Args:
+            upload_id: ID загрузки
+            limit: Количество записей (макс 1000)
+            offset: Смещение для пагинации
+            log_to_db: Логировать запрос в БД
+            seller_id: ID продавца для логирования
+
+        Returns:
+            [
+                {
+                    "nmID": 12345,
+                    "vendorCode": "abc",
+                    "price": 1500,
+                    "discount": 20,
+                    "status": 2,  # 2 = обновлено, 3 = ошибка
+                    "errorText": ""
+                },
+                ...
+            ]
+        """
+        endpoint = "/api/v2/history/goods/task"
+
+        params = {
+            'uploadID': upload_id,
+            'limit': min(limit, 1000),
+            'offset': offset
+        }
+
+        try:
+            response = self._make_request(
+                'GET', 'discounts', endpoint,
+                params=params,
+                log_to_db=log_to_db,
+                seller_id=seller_id
+            )
+            result = response.json()
+            return (result.get('data') or {}).get('historyGoods') or []
+        except Exception as e:
+            logger.error(f"❌ Failed to get price upload goods (uploadID={upload_id}): {str(e)}")
+            raise
+
     def get_price_buffer_status(
         self,
         limit: int = 100,
@@ -2077,49 +2519,24 @@ class WildberriesAPIClient:
         Returns:
             {"data": [{"id": 123, "name": "Brand Name"}, ...]}
         """
-        endpoint = "/api/content/v1/brands"
-        all_brands = {}  # id -> brand_data
+        from services.brand_harvest import BrandHarvester
 
         # Перебираем буквы алфавита для полноты покрытия
         patterns = list('абвгдежзиклмнопрстуфхцчшщэюя') + list('abcdefghijklmnopqrstuvwxyz') + list('0123456789')
+        all_brands = {}  # id -> brand_data
 
-        for pattern in patterns:
-            params = {
-                'subjectId': subject_id,
-                'top': top,
-                'pattern': pattern,
-                'locale': 'ru',
-            }
+        def collect(result):
+            for b in result.new_brands:
+                all_brands.setdefault(b['id'], b)
 
-            try:
-                response = self._make_request('GET', 'content', endpoint, params=params)
-                result = response.json()
-                brands = result.get('brands', [])
-                for b in brands:
-                    bid = b.get('id')
-                    if bid and bid not in all_brands:
-                        all_brands[bid] = b
-                time.sleep(0.3)
-            except WBRateLimitException:
-                logger.warning(f"Rate limited on brands subjectId={subject_id} pattern='{pattern}', waiting 60s")
-                time.sleep(60)
-                try:
-                    response = self._make_request('GET', 'content', endpoint, params=params)
-                    for b in response.json().get('brands', []):
-                        bid = b.get('id')
-                        if bid and bid not in all_brands:
-                            all_brands[bid] = b
-                except Exception:
-                    pass
-            except Exception as e:
-                logger.warning(f"Failed brands subjectId={subject_id} pattern='{pattern}': {e}")
+        BrandHarvester(self, top=top, patterns=patterns).run([subject_id], on_result=collect)
 
         brands_list = list(all_brands.values())
         logger.info(f"Found {len(brands_list)} unique brands for subjectId={subject_id}")
         return {'data': brands_list}
 
     def get_brands_by_subject_quick(self, subject_id: int, pattern: str = 'а',
-                                     top: int = 5000) -> Dict[str, Any]:
+                                     top: int = 5000, use_cache: Optional[bool] = None) -> Dict[str, Any]:
         """
         Быстрый запрос брендов для одной категории (один запрос).
 
@@ -2127,6 +2544,7 @@ class WildberriesAPIClient:
             subject_id: ID предмета (обязателен)
             pattern: строка поиска
             top: макс. результатов
+            use_cache: False — не использовать кэш ответов (массовый сбор брендов)
         """
         endpoint = "/api/content/v1/brands"
         params = {
@@ -2135,7 +2553,7 @@ class WildberriesAPIClient:
             'pattern': pattern,
             'locale': 'ru',
         }
-        response = self._make_request('GET', 'content', endpoint, params=params)
+        response = self._make_request('GET', 'content', endpoint, params=params, use_cache=use_cache)
         return response.json()
 
     def fetch_all_brands(self, subject_ids: list, top: int = 5000,
@@ -2143,72 +2561,28 @@ class WildberriesAPIClient:
         """
         Получить бренды из WB по списку категорий.
 
-        Для каждой категории перебирает несколько ключевых букв алфавита
-        (а, е, к, о, с, a, e, o, s, 1) как pattern для покрытия.
+        Категории обрабатываются параллельно (services/brand_harvest.py) в
+        пределах общего лимита content API; pattern выбираются адаптивно.
 
         Args:
             subject_ids: список ID предметов (subjectID)
             top: макс. результатов на один запрос
             progress_callback: callable(done, total, brands_so_far)
         """
-        endpoint = "/api/content/v1/brands"
-        all_brands = {}  # id -> brand_data
-        self._fetch_debug = None
-
-        # Ключевые буквы для покрытия (гласные + частые согласные + цифра)
-        key_patterns = list('аеиокстнрabcdemost1')
-        total = len(subject_ids)
-
-        for i, subject_id in enumerate(subject_ids):
-            for pattern in key_patterns:
-                params = {
-                    'subjectId': subject_id,
-                    'top': top,
-                    'pattern': pattern,
-                    'locale': 'ru',
-                }
+        from services.brand_harvest import BrandHarvester
 
-                try:
-                    response = self._make_request('GET', 'content', endpoint, params=params)
-
-                    # Диагностика первого успешного запроса
-                    if not self._fetch_debug:
-                        self._fetch_debug = {
-                            'url': response.url,
-                            'status': response.status_code,
-                            'raw_body': response.text[:500],
-                        }
+        all_brands = {}  # id -> brand_data
 
-                    result = response.json()
-                    brands = result.get('brands', [])
-                    for b in brands:
-                        bid = b.get('id')
-                        if bid and bid not in all_brands:
-                            all_brands[bid] = b
-                    time.sleep(0.3)
-                except WBRateLimitException:
-                    if not self._fetch_debug:
-                        self._fetch_debug = {'error': 'WBRateLimitException', 'pattern': pattern, 'subjectId': subject_id}
-                    logger.warning(f"Rate limited on brands, waiting 60s")
-                    time.sleep(60)
-                    try:
-                        response = self._make_request('GET', 'content', endpoint, params=params)
-                        for b in response.json().get('brands', []):
-                            bid = b.get('id')
-                            if bid and bid not in all_brands:
-                                all_brands[bid] = b
-                    except Exception:
-                        pass
-                except Exception as e:
-                    if not self._fetch_debug:
-                        self._fetch_debug = {'error': f'{type(e).__name__}: {str(e)[:300]}', 'pattern': pattern, 'subjectId': subject_id}
-                    logger.warning(f"Failed brands subjectId={subject_id} pattern='{pattern}': {e}")
+        def collect(result):
+            for b in result.new_brands:
+                all_brands.setdefault(b['id'], b)
 
-            if progress_callback:
-                progress_callback(i + 1, total, len(all_brands))
+        harvester = BrandHarvester(self, top=top)
+        harvester.run(subject_ids, on_result=collect, on_subject_done=progress_callback)
+        self._fetch_debug = harvester.debug
 
         brands_list = list(all_brands.values())
-        logger.info(f"Fetched {len(brands_list)} unique brands from {total} categories")
+        logger.info(f"Fetched {len(brands_list)} unique brands from {len(subject_ids)} categories")
         return {'data': brands_list}
 
     def search_brands(self, pattern: str, top: int = 50) -> Dict[str, Any]:
@@ -2291,7 +2665,6 @@ class WildberriesAPIClient:
                         if brand_id and brand_id not in seen_ids:
                             seen_ids.add(brand_id)
                             all_brands.append(brand)
-                    time.sleep(0.1)
                 except Exception as e:
                     logger.warning(f"   Brands for subjectId={sid} failed: {e}")
                     continue
@@ -2792,8 +3165,8 @@ class WildberriesAPIClient:
             if len(products) < page_size:
                 break
 
+            # Лимит 3 запроса в минуту выдерживает общий rate limiter (бакет analytics)
             offset += page_size
-            time.sleep(20)  # Лимит: 3 запроса в минуту, интервал 20 секунд
 
         logger.info(f"Loaded {len(all_products)} products from sales funnel")
         return all_products
@@ -2910,77 +3283,26 @@ class WildberriesAPIClient:
 
 class CachedWBAPIClient(WildberriesAPIClient):
     """
-    Клиент с кэшированием результатов
-    Использует LRU cache для часто запрашиваемых данных
+    Клиент, который берёт список карточек из кэша ответов
+
+    Кэш общий для процесса (services/wb_response_cache.py): ограничен по памяти,
+    разделён по API ключам и сбрасывается записью карточек с теми же nmID.
     """
 
     def __init__(self, *args, cache_size: int = 128, cache_ttl: int = 300, **kwargs):
         """
         Args:
-            cache_size: Размер кэша (количество элементов)
-            cache_ttl: Время жизни кэша в секундах
+            cache_size: Не используется — объём задаётся WB_RESPONSE_CACHE_MAX_ENTRIES/_MAX_BYTES
+            cache_ttl: Время жизни ответов списка карточек в секундах
         """
-        super().__init__(*args, **kwargs)
+        cache_ttls = dict(kwargs.pop('cache_ttls', None) or {})
+        cache_ttls.setdefault('/content/v2/get/cards/list', cache_ttl)
+        super().__init__(*args, cache_ttls=cache_ttls, **kwargs)
         self.cache_ttl = cache_ttl
-        self._cache_timestamps: Dict[str, float] = {}
 
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """Проверить актуальность кэша"""
-        if cache_key not in self._cache_timestamps:
-            return False
-
-        age = time.time() - self._cache_timestamps[cache_key]
-        return age < self.cache_ttl
-
-    @lru_cache(maxsize=128)
-    def _get_cards_list_cached(
-        self,
-        limit: int,
-        cursor_updated_at: Optional[str],
-        cursor_nm_id: Optional[int],
-        filter_nm_id: Optional[int],
-        timestamp: float  # Для инвалидации кэша по времени
-    ) -> Dict[str, Any]:
-        """Кэшированная версия get_cards_list"""
-        return super().get_cards_list(
-            limit=limit,
-            cursor_updated_at=cursor_updated_at,
-            cursor_nm_id=cursor_nm_id,
-            filter_nm_id=filter_nm_id
-        )
-
-    def get_cards_list(
-        self,
-        limit: int = 100,
-        offset: int = 0,
-        filter_nm_id: Optional[int] = None,
-        cursor_updated_at: Optional[str] = None,
-        cursor_nm_id: Optional[int] = None,
-        use_cache: bool = True
-    ) -> Dict[str, Any]:
+    def get_cards_list(self, *args, use_cache: bool = True, **kwargs) -> Dict[str, Any]:
         """Получить карточки с кэшированием (поддержка cursor-based пагинации)"""
-        if not use_cache:
-            return super().get_cards_list(
-                limit=limit,
-                offset=offset,
-                filter_nm_id=filter_nm_id,
-                cursor_updated_at=cursor_updated_at,
-                cursor_nm_id=cursor_nm_id
-            )
-
-        # Кэш-ключ теперь включает cursor параметры
-        cache_key = f"cards_{limit}_{cursor_updated_at}_{cursor_nm_id}_{filter_nm_id}"
-
-        # Проверка актуальности кэша
-        if not self._is_cache_valid(cache_key):
-            # Обновляем timestamp для инвалидации старого кэша
-            self._cache_timestamps[cache_key] = time.time()
-
-        # Получаем данные (из кэша или API)
-        timestamp = self._cache_timestamps.get(cache_key, time.time())
-        return self._get_cards_list_cached(
-            limit, cursor_updated_at, cursor_nm_id, filter_nm_id, timestamp
-        )
+        return super().get_cards_list(*args, use_cache=use_cache, **kwargs)
 
 
 # ==================== ПРИМЕРЫ ИСПОЛЬЗОВАНИЯ ====================
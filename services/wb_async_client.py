@@ -0,0 +1,774 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный клиент Wildberries API (httpx)
+
+Повторяет методы WildberriesAPIClient, но позволяет выполнять независимые
+страницы и эндпоинты конкурентно. Бюджет запросов общий с синхронным клиентом
+(services.wb_rate_limiter), поэтому параллельность не приводит к лишним 429:
+конкурентные запросы просто резервируют токены друг за другом.
+
+Ошибки маппятся так же, как в синхронном клиенте:
+WBAuthException / WBRateLimitException / WBAPIException. Повторы и circuit
+breaker — общие с синхронным клиентом (services/wb_retry.py).
+
+Методы, у которых нет нативной асинхронной версии (запись карточек, загрузка
+фото и т.п.), доступны с тем же именем — они выполняются синхронным клиентом
+в отдельном потоке.
+
+httpx — опциональная зависимость. Для фоновых задач используйте fetch_parallel():
+без httpx она выполняет вызовы последовательно синхронным клиентом.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from services.api_log_writer import get_api_log_writer, serialize_request_body
+from services.metrics import get_metrics
+from services.wb_api_client import (
+    WB_API_BASE_URL,
+    WildberriesAPIClient,
+    WBAPIException,
+    WBCircuitOpenException,
+    raise_for_wb_status,
+)
+from services.wb_rate_limiter import get_shared_rate_limiter, resolve_bucket
+from services.wb_retry import RetryPolicy, get_circuit_breaker
+
+logger = logging.getLogger('wb_api')
+
+# Сколько запросов одного клиента могут находиться в полёте одновременно
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Бакеты с лимитом не больше этого (запросов в минуту) читаются по одной странице:
+# параллельные запросы за концом выборки стоят там минуты квоты продавца
+SEQUENTIAL_PAGES_MAX_PER_MINUTE = 10
+
+
+class AsyncWildberriesAPIClient:
+    """
+    Асинхронный клиент для API Wildberries
+
+    Особенности:
+    - Общий с синхронным клиентом rate limiting по (api_key, тип API)
+    - Ограничение числа одновременных запросов (max_concurrency)
+    - Конкурентная offset-пагинация (цены, остатки, воронка продаж)
+    - Те же исключения, что и у WildberriesAPIClient
+
+    Пример:
+        async with AsyncWildberriesAPIClient(api_key) as client:
+            cards, prices = await asyncio.gather(
+                client.get_all_cards(),
+                client.get_all_goods_prices(),
+            )
+    """
+
+    CONTENT_API_URL = WildberriesAPIClient.CONTENT_API_URL
+    STATISTICS_API_URL = WildberriesAPIClient.STATISTICS_API_URL
+    MARKETPLACE_API_URL = WildberriesAPIClient.MARKETPLACE_API_URL
+    DISCOUNTS_API_URL = WildberriesAPIClient.DISCOUNTS_API_URL
+    ANALYTICS_API_URL = WildberriesAPIClient.ANALYTICS_API_URL
+    CONTENT_API_SANDBOX = WildberriesAPIClient.CONTENT_API_SANDBOX
+    STATISTICS_API_SANDBOX = WildberriesAPIClient.STATISTICS_API_SANDBOX
+
+    _get_base_url = WildberriesAPIClient._get_base_url
+    _apply_rate_limit_headers = WildberriesAPIClient._apply_rate_limit_headers
+
+    def __init__(
+        self,
+        api_key: str,
+        sandbox: bool = False,
+        max_retries: int = 3,
+        timeout: int = 30,
+        db_logger_callback=None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        transport=None,
+        base_url: Optional[str] = None
+    ):
+        """
+        Args:
+            api_key: API ключ Wildberries
+            sandbox: Использовать sandbox-окружение
+            max_retries: Максимальное количество повторов при 429/5xx и сетевых ошибках
+                (см. RetryPolicy)
+            timeout: Таймаут запроса в секундах
+            db_logger_callback: Функция для логирования в БД
+            max_concurrency: Максимум одновременных запросов клиента
+            transport: httpx transport (для тестов и локального стенда)
+            base_url: Базовый URL для всех типов API (см. WildberriesAPIClient)
+        """
+        import httpx  # опциональная зависимость
+
+        self._httpx = httpx
+        self.api_key = api_key
+        self.sandbox = sandbox
+        self.base_url = (base_url or WB_API_BASE_URL).rstrip('/') or None
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.db_logger_callback = db_logger_callback
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = get_shared_rate_limiter()
+        self.retry_policy = RetryPolicy(max_retries)
+        self.circuit_breaker = get_circuit_breaker()
+
+        self._transport = transport
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._sync_client: Optional[WildberriesAPIClient] = None
+        self._fetch_debug = None
+
+    @classmethod
+    def from_sync_client(cls, client: WildberriesAPIClient, **kwargs) -> 'AsyncWildberriesAPIClient':
+        """Создать асинхронный клиент с настройками синхронного"""
+        return cls(
+            api_key=client.api_key,
+            sandbox=client.sandbox,
+            timeout=client.timeout,
+            db_logger_callback=client.db_logger_callback,
+            base_url=client.base_url,
+            **kwargs
+        )
+
+    def _get_client(self):
+        """HTTP клиент создаётся лениво — внутри работающего event loop"""
+        if self._client is None:
+            limits = self._httpx.Limits(
+                max_connections=self.max_concurrency * 2,
+                max_keepalive_connections=self.max_concurrency
+            )
+            # Транспорт повторяет только установку соединения; остальное — RetryPolicy
+            transport = self._transport or self._httpx.AsyncHTTPTransport(
+                retries=self.max_retries, limits=limits
+            )
+            self._client = self._httpx.AsyncClient(
+                headers={
+                    'Authorization': self.api_key,
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json'
+                },
+                timeout=self.timeout,
+                transport=transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _make_request(
+        self,
+        method: str,
+        api_type: str,
+        endpoint: str,
+        log_to_db: bool = False,
+        seller_id: int = None,
+        **kwargs
+    ):
+        """
+        Базовый метод для выполнения запросов
+
+        Args:
+            method: HTTP метод (GET, POST, etc.)
+            api_type: Тип API (content, statistics, marketplace, discounts, analytics)
+            endpoint: Эндпоинт (без базового URL)
+            **kwargs: Дополнительные параметры для httpx (params, json)
+
+        Returns:
+            httpx.Response
+
+        Raises:
+            WBAuthException: Ошибка авторизации
+            WBRateLimitException: Превышен лимит запросов
+            WBAPIException: Общая ошибка API
+        """
+        client = self._get_client()
+        base_url = self._get_base_url(api_type)
+        url = urljoin(base_url, endpoint)
+        host = urlsplit(base_url).netloc
+
+        metrics = get_metrics()
+
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                retry_in = self.circuit_breaker.before_request(host)
+                if retry_in:
+                    raise WBCircuitOpenException(
+                        f"API Wildberries ({host}) временно недоступен, повтор через {retry_in:.0f}s",
+                        retry_in
+                    )
+
+                start_time = time.time()
+                try:
+                    # Rate limiting (общий бюджет ключа для данного типа API)
+                    delay = self.rate_limiter.reserve(self.api_key, api_type, endpoint)
+                    metrics.observe_limiter_wait(api_type, endpoint, seller_id, delay)
+                    if delay > 0:
+                        if delay >= 1:
+                            logger.info(f"WB rate limit ({api_type} {endpoint}): waiting {delay:.2f}s")
+                        await asyncio.sleep(delay)
+
+                    logger.info(f"WB API Request (async): {method} {url}")
+                    start_time = time.time()
+                    response = await client.request(method, url, **kwargs)
+                except self._httpx.TransportError as e:
+                    elapsed = time.time() - start_time
+                    is_timeout = isinstance(e, self._httpx.TimeoutException)
+                    metrics.observe_request(api_type, endpoint, seller_id, elapsed,
+                                            'timeout' if is_timeout else 'error')
+                    self.circuit_breaker.record_failure(host)
+                    retry_delay = self.retry_policy.retry_delay(method, endpoint, attempt, error=e)
+                    if retry_delay is not None:
+                        metrics.record_retry(api_type, endpoint, seller_id)
+                        attempt += 1
+                        await asyncio.sleep(retry_delay)
+                        continue
+                    if is_timeout:
+                        logger.error(f"Request timeout for {url} after {self.timeout}s")
+                        self._log_to_db(log_to_db, seller_id, endpoint, method, None, elapsed,
+                                        kwargs.get('json'), error_message=f"Timeout after {self.timeout}s")
+                        raise WBAPIException(f"Timeout при запросе к API ({self.timeout}s). Попробуйте позже.")
+                    logger.error(f"Connection error for {url}: {e}")
+                    raise WBAPIException(f"Ошибка соединения с API Wildberries: {e}")
+                except BaseException:
+                    # Отмена задачи или ошибка до ответа хоста — проба не должна зависнуть
+                    self.circuit_breaker.release_probe(host)
+                    raise
+
+                elapsed = time.time() - start_time
+                status = response.status_code
+                logger.info(f"WB API Response (async): {status} ({elapsed:.2f}s)")
+                metrics.observe_request(api_type, endpoint, seller_id, elapsed, status)
+
+                if status >= 500:
+                    self.circuit_breaker.record_failure(host)
+                else:
+                    self.circuit_breaker.record_success(host)
+
+                if status == 429 or status >= 500:
+                    retry_delay = self.retry_policy.retry_delay(method, endpoint, attempt, status=status,
+                                                                headers=response.headers)
+                    if retry_delay is not None:
+                        metrics.record_retry(api_type, endpoint, seller_id)
+                        attempt += 1
+                        if status == 429:
+                            # Пауза уходит в общий лимитер — её выждет следующий reserve()
+                            self.rate_limiter.penalize(self.api_key, api_type, endpoint, retry_delay)
+                        else:
+                            await asyncio.sleep(retry_delay)
+                        continue
+
+                self._apply_rate_limit_headers(api_type, endpoint, response)
+
+                self._log_to_db(log_to_db, seller_id, endpoint, method, status, elapsed,
+                                kwargs.get('json'), response=response)
+                if status >= 400:
+                    raise_for_wb_status(status, response.text,
+                                        serialize_request_body(kwargs.get('json')), response.headers)
+                return response
+
+    def _log_to_db(self, log_to_db, seller_id, endpoint, method, status_code, elapsed,
+                   request_json, response=None, error_message=None):
+        """Поставить запрос в фоновую запись логов (как в синхронном клиенте)"""
+        if not (log_to_db and self.db_logger_callback and seller_id):
+            return
+        get_api_log_writer().submit(
+            self.db_logger_callback,
+            seller_id=seller_id,
+            endpoint=endpoint,
+            method=method,
+            status_code=status_code,
+            response_time=elapsed,
+            error_message=error_message,
+            request_json=request_json,
+            response=response
+        )
+
+    def _page_window(self, api_type: str, endpoint: str) -> int:
+        """
+        Сколько страниц offset-пагинации запрашивать одновременно
+
+        Не больше burst бакета; для бакетов с единицами запросов в минуту
+        (аналитика, статистика) — по одной странице.
+        """
+        _, rule = resolve_bucket(api_type, endpoint)
+        if rule.per_minute <= SEQUENTIAL_PAGES_MAX_PER_MINUTE:
+            return 1
+        return max(1, min(self.max_concurrency, rule.burst))
+
+    async def _fetch_offset_pages(
+        self,
+        fetch_page: Callable[[int], Awaitable[List[Any]]],
+        page_size: int,
+        window: Optional[int] = None
+    ) -> List[Any]:
+        """
+        Загрузить все страницы offset-пагинации окнами по window страниц
+
+        Первая страница запрашивается отдельно: если она неполная, остальных
+        страниц нет и лишние запросы не тратят квоту. Дальше страницы окна
+        запрашиваются конкурентно; загрузка заканчивается на первой неполной
+        странице. Порядок элементов сохраняется.
+
+        Args:
+            fetch_page: Корутина, возвращающая элементы страницы по offset
+            page_size: Размер страницы
+            window: Страниц в окне (по умолчанию max_concurrency, см. _page_window)
+        """
+        window = max(1, window or self.max_concurrency)
+        items: List[Any] = list(await fetch_page(0))
+        if len(items) < page_size:
+            return items
+        offset = page_size
+        while True:
+            offsets = [offset + i * page_size for i in range(window)]
+            pages = await asyncio.gather(*(fetch_page(o) for o in offsets))
+            for page in pages:
+                items.extend(page)
+                if len(page) < page_size:
+                    return items
+            offset = offsets[-1] + page_size
+
+    # ==================== CONTENT API ====================
+
+    async def get_cards_list(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        filter_nm_id: Optional[int] = None,
+        cursor_updated_at: Optional[str] = None,
+        cursor_nm_id: Optional[int] = None,
+        log_to_db: bool = False,
+        seller_id: int = None,
+        ascending: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """Получить список карточек товаров (Content API v2), см. WildberriesAPIClient.get_cards_list"""
+        body = {
+            "settings": {
+                "cursor": {"limit": min(limit, 100)},
+                "filter": {"withPhoto": -1}
+            }
+        }
+        if cursor_updated_at and cursor_nm_id:
+            body["settings"]["cursor"]["updatedAt"] = cursor_updated_at
+            body["settings"]["cursor"]["nmID"] = cursor_nm_id
+        if filter_nm_id:
+            body["settings"]["filter"]["textSearch"] = str(filter_nm_id)
+        if ascending is not None:
+            body["settings"]["sort"] = {"ascending": ascending}
+
+        response = await self._make_request(
+            'POST', 'content', "/content/v2/get/cards/list",
+            log_to_db=log_to_db, seller_id=seller_id, json=body
+        )
+        return response.json()
+
+    async def iter_cards(
+        self,
+        batch_size: int = 100,
+        cursor_updated_at: Optional[str] = None,
+        cursor_nm_id: Optional[int] = None,
+        log_to_db: bool = False,
+        seller_id: int = None,
+        ascending: Optional[bool] = None
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+        """Постранично получить карточки, см. WildberriesAPIClient.iter_cards"""
+        while True:
+            data = await self.get_cards_list(
+                limit=batch_size,
+                cursor_updated_at=cursor_updated_at,
+                cursor_nm_id=cursor_nm_id,
+                log_to_db=log_to_db,
+                seller_id=seller_id,
+                ascending=ascending
+            )
+            cards = data.get('cards', [])
+            if not cards:
+                return
+
+            cursor = data.get('cursor') or {}
+            next_updated_at = cursor.get('updatedAt')
+            next_nm_id = cursor.get('nmID')
+            if not next_updated_at or not next_nm_id:
+                yield cards, None
+                return
+            if cursor_updated_at == next_updated_at and cursor_nm_id == next_nm_id:
+                logger.warning("Cursor not changing, stopping to avoid infinite loop")
+                yield cards, None
+                return
+
+            yield cards, {'updatedAt': next_updated_at, 'nmID': next_nm_id}
+            cursor_updated_at = next_updated_at
+            cursor_nm_id = next_nm_id
+
+    async def get_all_cards(self, batch_size: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получить все карточки товаров
+
+        Cursor-пагинация последовательна по своей природе; параллельность
+        достигается запуском вместе с другими запросами (см. fetch_parallel).
+        """
+        all_cards = []
+        async for cards, _ in self.iter_cards(batch_size=batch_size):
+            all_cards.extend(cards)
+
+        logger.info(f"Total cards loaded: {len(all_cards)}")
+        return all_cards
+
+    async def get_card_by_nm_id(
+        self,
+        nm_id: int,
+        log_to_db: bool = False,
+        seller_id: int = None
+    ) -> Optional[Dict[str, Any]]:
+        """Получить карточку по nmID (None если не найдена или ошибка)"""
+        try:
+            result = await self.get_cards_list(
+                limit=100, filter_nm_id=nm_id, log_to_db=log_to_db, seller_id=seller_id
+            )
+            for card in result.get('cards', []):
+                if card.get('nmID') == nm_id:
+                    return card
+            return None
+        except Exception as e:
+            logger.error(f"Failed to get card by nmID={nm_id}: {e}")
+            return None
+
+    async def get_subjects_list(
+        self,
+        name: Optional[str] = None,
+        limit: int = 1000,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """Получить список предметов (subjects)"""
+        params = {'limit': min(limit, 1000), 'offset': offset}
+        if name:
+            params['name'] = name
+        response = await self._make_request('GET', 'content', "/content/v2/object/all", params=params)
+        return response.json()
+
+    async def get_card_characteristics_config(self, subject_id: int) -> Dict[str, Any]:
+        """Получить конфигурацию характеристик для предмета"""
+        response = await self._make_request('GET', 'content', f"/content/v2/object/charcs/{subject_id}")
+        return response.json()
+
+    async def get_brands_by_subject_quick(self, subject_id: int, pattern: str = 'а',
+                                          top: int = 5000) -> Dict[str, Any]:
+        """Запрос брендов для одной категории (один запрос)"""
+        params = {
+            'subjectId': subject_id,
+            'top': top,
+            'pattern': pattern,
+            'locale': 'ru',
+        }
+        response = await self._make_request('GET', 'content', "/api/content/v1/brands", params=params)
+        return response.json()
+
+    async def fetch_all_brands(self, subject_ids: list, top: int = 5000,
+                               progress_callback=None) -> Dict[str, Any]:
+        """
+        Получить бренды из WB по списку категорий
+
+        Запросы (категория × pattern) выполняются конкурентно в рамках общего
+        бюджета content API. Набор pattern — как у WildberriesAPIClient.fetch_all_brands.
+
+        Args:
+            subject_ids: список ID предметов (subjectID)
+            top: макс. результатов на один запрос
+            progress_callback: callable(done, total, brands_so_far)
+        """
+        all_brands: Dict[Any, Dict] = {}
+        self._fetch_debug = None
+        key_patterns = list('аеиокстнрabcdemost1')
+        total = len(subject_ids)
+
+        async def fetch_pattern(subject_id, pattern):
+            try:
+                result = await self.get_brands_by_subject_quick(subject_id, pattern=pattern, top=top)
+            except Exception as e:
+                if not self._fetch_debug:
+                    self._fetch_debug = {'error': f'{type(e).__name__}: {str(e)[:300]}',
+                                         'pattern': pattern, 'subjectId': subject_id}
+                logger.warning(f"Failed brands subjectId={subject_id} pattern='{pattern}': {e}")
+                return
+            for b in result.get('brands', []) or []:
+                bid = b.get('id')
+                if bid and bid not in all_brands:
+                    all_brands[bid] = b
+
+        async def fetch_subject(subject_id):
+            await asyncio.gather(*(fetch_pattern(subject_id, p) for p in key_patterns))
+
+        done = 0
+        for finished in asyncio.as_completed([fetch_subject(sid) for sid in subject_ids]):
+            await finished
+            done += 1
+            if progress_callback:
+                progress_callback(done, total, len(all_brands))
+
+        brands_list = list(all_brands.values())
+        logger.info(f"Fetched {len(brands_list)} unique brands from {total} categories")
+        return {'data': brands_list}
+
+    # ==================== STATISTICS API ====================
+
+    async def get_orders(self, date_from: str, flag: int = 0) -> List[Dict[str, Any]]:
+        """Получить заказы (Statistics API)"""
+        params = {'dateFrom': date_from, 'flag': flag}
+        response = await self._make_request('GET', 'statistics', "/api/v1/supplier/orders", params=params)
+        return response.json()
+
+    async def get_stocks(self, date_from: str) -> List[Dict[str, Any]]:
+        """Получить остатки товаров (Statistics API)"""
+        params = {'dateFrom': date_from}
+        response = await self._make_request('GET', 'statistics', "/api/v1/supplier/stocks", params=params)
+        return response.json()
+
+    # ==================== MARKETPLACE API ====================
+
+    async def get_warehouse_stocks(self, skip: int = 0, take: int = 1000) -> Dict[str, Any]:
+        """Получить остатки по складам (Marketplace API)"""
+        body = {"skip": skip, "take": min(take, 1000)}
+        response = await self._make_request('POST', 'marketplace', "/api/v3/stocks/0", json=body)
+        return response.json()
+
+    async def get_all_warehouse_stocks(self, batch_size: int = 1000) -> List[Dict[str, Any]]:
+        """Получить все остатки по складам (страницы запрашиваются конкурентно)"""
+        async def fetch_page(skip):
+            data = await self.get_warehouse_stocks(skip=skip, take=batch_size)
+            return data.get('stocks', []) or []
+
+        all_stocks = await self._fetch_offset_pages(
+            fetch_page, batch_size, window=self._page_window('marketplace', "/api/v3/stocks/0")
+        )
+        logger.info(f"Total stock records loaded: {len(all_stocks)}")
+        return all_stocks
+
+    # ==================== PRICES API ====================
+
+    async def get_goods_prices(
+        self,
+        limit: int = 1000,
+        offset: int = 0,
+        filter_nm_id: Optional[int] = None,
+        log_to_db: bool = False,
+        seller_id: int = None
+    ) -> Dict[str, Any]:
+        """Получить информацию о ценах товаров (Prices API v2)"""
+        params = {'limit': min(limit, 1000), 'offset': offset}
+        if filter_nm_id:
+            params['filterNmID'] = filter_nm_id
+        response = await self._make_request(
+            'GET', 'discounts', "/api/v2/list/goods/filter",
+            params=params, log_to_db=log_to_db, seller_id=seller_id
+        )
+        return response.json()
+
+    async def get_all_goods_prices(
+        self,
+        batch_size: int = 1000,
+        log_to_db: bool = False,
+        seller_id: int = None
+    ) -> List[Dict[str, Any]]:
+        """Получить цены всех товаров (страницы запрашиваются конкурентно)"""
+        async def fetch_page(offset):
+            data = await self.get_goods_prices(
+                limit=batch_size, offset=offset, log_to_db=log_to_db, seller_id=seller_id
+            )
+            return (data.get('data') or {}).get('listGoods', []) or []
+
+        all_goods = await self._fetch_offset_pages(
+            fetch_page, batch_size, window=self._page_window('discounts', "/api/v2/list/goods/filter")
+        )
+        logger.info(f"Total goods prices loaded: {len(all_goods)}")
+        return all_goods
+
+    # ==================== ANALYTICS API ====================
+
+    async def _get_banned_products(self, kind: str, sort: str, order: str,
+                                   valid_sort: List[str], log_to_db: bool,
+                                   seller_id: Optional[int]) -> List[Dict[str, Any]]:
+        if sort not in valid_sort:
+            sort = 'nmId'
+        params = {'sort': sort, 'order': order if order in ('asc', 'desc') else 'asc'}
+        response = await self._make_request(
+            'GET', 'analytics', f"/api/v1/analytics/banned-products/{kind}",
+            params=params, log_to_db=log_to_db, seller_id=seller_id
+        )
+        return response.json().get('report') or []
+
+    async def get_blocked_cards(self, sort: str = 'nmId', order: str = 'asc',
+                                log_to_db: bool = True,
+                                seller_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Получить список заблокированных карточек"""
+        return await self._get_banned_products(
+            'blocked', sort, order, ['brand', 'nmId', 'title', 'vendorCode', 'reason'],
+            log_to_db, seller_id
+        )
+
+    async def get_shadowed_cards(self, sort: str = 'nmId', order: str = 'asc',
+                                 log_to_db: bool = True,
+                                 seller_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Получить список товаров, скрытых из каталога"""
+        return await self._get_banned_products(
+            'shadowed', sort, order, ['brand', 'nmId', 'title', 'vendorCode', 'nmRating'],
+            log_to_db, seller_id
+        )
+
+    async def get_sales_funnel_products(self, period_start: str, period_end: str,
+                                        past_period_start: Optional[str] = None,
+                                        past_period_end: Optional[str] = None,
+                                        nm_ids: Optional[List[int]] = None,
+                                        brand_names: Optional[List[str]] = None,
+                                        subject_ids: Optional[List[int]] = None,
+                                        order_by: Optional[Dict] = None,
+                                        limit: int = 50, offset: int = 0,
+                                        log_to_db: bool = True,
+                                        seller_id: Optional[int] = None) -> Dict[str, Any]:
+        """Статистика карточек товаров за период (воронка продаж v3)"""
+        body = {
+            'selectedPeriod': {'start': period_start, 'end': period_end},
+            'limit': limit,
+            'offset': offset,
+        }
+        if past_period_start and past_period_end:
+            body['pastPeriod'] = {'start': past_period_start, 'end': past_period_end}
+        if nm_ids:
+            body['nmIds'] = nm_ids
+        if brand_names:
+            body['brandNames'] = brand_names
+        if subject_ids:
+            body['subjectIds'] = subject_ids
+        if order_by:
+            body['orderBy'] = order_by
+
+        response = await self._make_request(
+            'POST', 'analytics', '/api/analytics/v3/sales-funnel/products',
+            json=body, log_to_db=log_to_db, seller_id=seller_id
+        )
+        return response.json()
+
+    async def get_sales_funnel_products_all(self, period_start: str, period_end: str,
+                                            past_period_start: Optional[str] = None,
+                                            past_period_end: Optional[str] = None,
+                                            nm_ids: Optional[List[int]] = None,
+                                            brand_names: Optional[List[str]] = None,
+                                            subject_ids: Optional[List[int]] = None,
+                                            log_to_db: bool = True,
+                                            seller_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Получить ВСЕ карточки из воронки продаж
+
+        Интервал между страницами (лимит 3 запроса/мин) выдерживает общий лимитер.
+        """
+        page_size = 50
+
+        async def fetch_page(offset):
+            result = await self.get_sales_funnel_products(
+                period_start=period_start, period_end=period_end,
+                past_period_start=past_period_start, past_period_end=past_period_end,
+                nm_ids=nm_ids, brand_names=brand_names, subject_ids=subject_ids,
+                limit=page_size, offset=offset, log_to_db=log_to_db, seller_id=seller_id
+            )
+            return (result.get('data') or {}).get('products', []) or []
+
+        all_products = await self._fetch_offset_pages(
+            fetch_page, page_size, window=self._page_window('analytics', '/api/analytics/v3/sales-funnel/products')
+        )
+        logger.info(f"Loaded {len(all_products)} products from sales funnel")
+        return all_products
+
+    # ==================== УТИЛИТЫ ====================
+
+    async def test_connection(self) -> bool:
+        """Проверить подключение к API"""
+        try:
+            await self.get_cards_list(limit=1)
+            return True
+        except WBAPIException as e:
+            logger.error(f"API connection test failed: {e}")
+            return False
+
+    def __getattr__(self, name: str):
+        """
+        Методы без нативной асинхронной версии выполняются синхронным
+        клиентом в отдельном потоке (тот же общий лимитер)
+        """
+        if name.startswith('_') or not callable(getattr(WildberriesAPIClient, name, None)):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        async def call_in_thread(*args, **kwargs):
+            if self._sync_client is None:
+                self._sync_client = WildberriesAPIClient(
+                    self.api_key, sandbox=self.sandbox, max_retries=self.max_retries,
+                    timeout=self.timeout, db_logger_callback=self.db_logger_callback,
+                    base_url=self.base_url
+                )
+            return await asyncio.to_thread(getattr(self._sync_client, name), *args, **kwargs)
+
+        call_in_thread.__name__ = name
+        return call_in_thread
+
+    async def close(self):
+        """Закрыть соединения"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+def fetch_parallel(
+    client: WildberriesAPIClient,
+    calls: Dict[str, Tuple[str, Dict[str, Any]]],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> Dict[str, Any]:
+    """
+    Выполнить независимые запросы к WB API параллельно (из синхронного кода)
+
+    Каждый вызов описывается именем метода клиента и его аргументами. Ошибка
+    одного вызова не прерывает остальные — вместо результата возвращается
+    исключение, решать что с ним делать должен вызывающий.
+
+    Без httpx вызовы выполняются последовательно переданным синхронным клиентом.
+
+    Args:
+        client: Синхронный клиент (источник api_key и настроек)
+        calls: {имя результата: (имя метода, kwargs)}
+        max_concurrency: Максимум одновременных запросов
+
+    Returns:
+        {имя результата: результат метода или исключение}
+
+    Example:
+        >>> results = fetch_parallel(client, {
+        ...     'cards': ('get_all_cards', {}),
+        ...     'prices': ('get_all_goods_prices', {}),
+        ... })
+    """
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        logger.info("httpx is not installed, WB requests run sequentially")
+        results = {}
+        for name, (method, kwargs) in calls.items():
+            try:
+                results[name] = getattr(client, method)(**kwargs)
+            except Exception as e:
+                results[name] = e
+        return results
+
+    async def run_all():
+        async with AsyncWildberriesAPIClient.from_sync_client(client, max_concurrency=max_concurrency) as aclient:
+            values = await asyncio.gather(
+                *(getattr(aclient, method)(**kwargs) for method, kwargs in calls.values()),
+                return_exceptions=True
+            )
+        return dict(zip(calls.keys(), values))
+
+    return asyncio.run(run_all())
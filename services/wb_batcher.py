@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная отправка карточек и цен в WB с учётом размера запроса
+
+WB ограничивает запросы записи и числом элементов, и размером тела
+(/content/v2/cards/update — 3000 карточек и 10 МБ, /api/v2/upload/task —
+1000 товаров). Раньше элементы резались на пачки фиксированной длины: пачка
+карточек с тяжёлыми характеристиками падала с 413/400, и вся пачка считалась
+ошибочной (или отправлялась заново целиком).
+
+WBBatcher:
+- упаковывает элементы в самые большие допустимые пачки — по числу элементов
+  и по размеру тела так, как его сериализует requests (json=);
+- отправляет независимые пачки в WB_BATCH_WORKERS потоках; темп задаёт общий
+  rate limiter (бакет content_write / discounts), так что квота не превышается;
+- если WB отклонил пачку, делит её пополам и отправляет половины, пока
+  ошибка не сведётся к конкретным элементам — остальные проходят;
+- возвращает результат по каждому элементу (ключ — nmID).
+
+Пример:
+    batcher = WBBatcher(lambda batch: client.update_cards_batch(batch, validate=False),
+                        max_items=CARDS_UPDATE_MAX_ITEMS, max_bytes=CARDS_UPDATE_MAX_BYTES)
+    report = batcher.run(cards)
+    report['items'][12345]  # {'success': False, 'error': 'bad request'}
+"""
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from services.wb_api_client import (
+    WBAPIException, WBAuthException, WBCircuitOpenException, WBRateLimitException,
+)
+
+logger = logging.getLogger('wb_api')
+
+# Одновременных запросов записи (темп всё равно задаёт общий rate limiter)
+WB_BATCH_WORKERS = int(os.environ.get('WB_BATCH_WORKERS', '3'))
+
+# Лимиты WB на запрос обновления карточек
+CARDS_UPDATE_MAX_ITEMS = int(os.environ.get('WB_CARDS_UPDATE_MAX_ITEMS', '3000'))
+CARDS_UPDATE_MAX_BYTES = int(os.environ.get('WB_CARDS_UPDATE_MAX_BYTES', str(10 * 1024 * 1024)))
+
+# Лимиты WB на задачу загрузки цен
+PRICES_UPLOAD_MAX_ITEMS = int(os.environ.get('WB_PRICES_UPLOAD_MAX_ITEMS', '1000'))
+PRICES_UPLOAD_MAX_BYTES = int(os.environ.get('WB_PRICES_UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+
+# Обёртка тела запроса: [...] для карточек, {"data": [...]} для цен
+LIST_BODY_OVERHEAD = len('[]')
+PRICES_BODY_OVERHEAD = len('{"data": []}')
+
+# Ошибки, при которых деление пачки не поможет (ключ, лимит, недоступность API)
+_NOT_SPLITTABLE = (WBAuthException, WBRateLimitException, WBCircuitOpenException)
+
+
+def item_size(item: Any) -> int:
+    """Размер элемента в теле запроса (как сериализует requests: ensure_ascii, разделитель ', ')"""
+    return len(json.dumps(item))
+
+
+def pack_batches(
+    items: List[Any],
+    max_items: int,
+    max_bytes: int,
+    overhead: int = LIST_BODY_OVERHEAD,
+    sizes: Optional[List[int]] = None
+) -> List[List[Any]]:
+    """
+    Упаковать элементы в пачки по порядку: не больше max_items и max_bytes в пачке
+
+    Элемент, который сам по себе больше max_bytes, попадает в отдельную пачку.
+
+    Args:
+        items: Элементы
+        max_items: Максимум элементов в пачке
+        max_bytes: Максимальный размер тела запроса
+        overhead: Размер обёртки тела запроса
+        sizes: Размеры элементов (если уже посчитаны)
+
+    Returns:
+        Список пачек
+    """
+    if sizes is None:
+        sizes = [item_size(item) for item in items]
+    separator = len(', ')
+
+    batches: List[List[Any]] = []
+    batch: List[Any] = []
+    batch_bytes = overhead
+    for item, size in zip(items, sizes):
+        extra = size + (separator if batch else 0)
+        if batch and (len(batch) >= max_items or batch_bytes + extra > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], overhead
+            extra = size
+        batch.append(item)
+        batch_bytes += extra
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BatchOutcome(NamedTuple):
+    """Итог отправки пачки: error=None — WB принял все элементы"""
+    items: List[Any]
+    error: Optional[Exception]
+    result: Any = None
+
+
+class WBBatcher:
+    """
+    Упаковка, параллельная отправка и дробление отклонённых пачек
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Any]], Any],
+        max_items: int,
+        max_bytes: int,
+        overhead: int = LIST_BODY_OVERHEAD,
+        key: Callable[[Any], Any] = lambda item: item.get('nmID'),
+        validate: Optional[Callable[[Any], Optional[str]]] = None,
+        workers: Optional[int] = None
+    ):
+        """
+        Args:
+            send: Отправка одной пачки (исключение — WB отклонил пачку)
+            max_items: Максимум элементов в запросе
+            max_bytes: Максимальный размер тела запроса
+            overhead: Размер обёртки тела запроса
+            key: Ключ элемента в карте результатов
+            validate: Проверка элемента до отправки: текст ошибки или None
+            workers: Одновременных запросов (по умолчанию WB_BATCH_WORKERS)
+        """
+        self.send = send
+        self.validate = validate
+        self.max_items = max(1, max_items)
+        self.max_bytes = max_bytes
+        self.overhead = overhead
+        self.key = key
+        self.workers = max(1, workers or WB_BATCH_WORKERS)
+        self.stats = {'requests': 0, 'splits': 0, 'oversized': 0, 'invalid': 0}
+
+    def iter_batches(self, items: Iterable[Any]) -> Iterator[BatchOutcome]:
+        """
+        Отправить элементы и отдавать итоги пачек по мере готовности
+
+        Итоги отдаются в потоке вызывающего (можно писать в БД). Отклонённая
+        пачка возвращается только после дробления: ошибка относится к одному
+        элементу либо к пачке, деление которой не помогает (ключ, лимит).
+        Элементы, не прошедшие validate, не отправляются.
+        """
+        items = list(items)
+        if self.validate is not None:
+            valid = []
+            for item in items:
+                error = self.validate(item)
+                if error is None:
+                    valid.append(item)
+                else:
+                    self.stats['invalid'] += 1
+                    yield BatchOutcome([item], WBAPIException(error))
+            items = valid
+        sizes = [item_size(item) for item in items]
+
+        queue: Deque[List[Any]] = deque()
+        for batch in pack_batches(items, self.max_items, self.max_bytes, self.overhead, sizes):
+            if len(batch) == 1 and self.overhead + item_size(batch[0]) > self.max_bytes:
+                self.stats['oversized'] += 1
+                yield BatchOutcome(batch, WBAPIException(
+                    f"Размер запроса превышает лимит WB ({self.max_bytes // 1024} КБ)"
+                ))
+                continue
+            queue.append(batch)
+
+        if not queue:
+            return
+
+        logger.info(f"📦 Sending {len(items)} items in {len(queue)} batches ({self.workers} workers)")
+        run_batch = self._with_app_context(self.send)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='wb-batch') as executor:
+            while queue or in_flight:
+                while queue and len(in_flight) < self.workers:
+                    batch = queue.popleft()
+                    in_flight[executor.submit(run_batch, batch)] = batch
+                    self.stats['requests'] += 1
+
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    batch = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if len(batch) > 1 and self._splittable(e):
+                            middle = len(batch) // 2
+                            self.stats['splits'] += 1
+                            logger.info(f"  🔄 Batch of {len(batch)} rejected ({e}), retrying halves")
+                            # Половины — в начало очереди, чтобы быстрее локализовать ошибку
+                            queue.appendleft(batch[middle:])
+                            queue.appendleft(batch[:middle])
+                            continue
+                        yield BatchOutcome(batch, e)
+                    else:
+                        yield BatchOutcome(batch, None, result)
+
+    def run(self, items: Iterable[Any]) -> Dict[str, Any]:
+        """
+        Отправить все элементы
+
+        Returns:
+            {
+                "total": 1500,
+                "success": 1490,
+                "failed": 10,
+                "errors": [{"error": "...", "nm_ids": [...]}],
+                "items": {nmID: {"success": bool, "error": str | None}},
+                "accepted": [{"nm_ids": [...], "result": <ответ send>}]
+            }
+        """
+        items = list(items)
+        report = {'total': len(items), 'success': 0, 'failed': 0, 'errors': [], 'items': {}, 'accepted': []}
+        for outcome in self.iter_batches(items):
+            error = str(outcome.error) if outcome.error is not None else None
+            for item in outcome.items:
+                report['items'][self.key(item)] = {'success': error is None, 'error': error}
+            if error is None:
+                report['success'] += len(outcome.items)
+                report['accepted'].append({
+                    'nm_ids': [self.key(item) for item in outcome.items], 'result': outcome.result,
+                })
+            else:
+                report['failed'] += len(outcome.items)
+                report['errors'].append({'error': error, 'nm_ids': [self.key(item) for item in outcome.items]})
+        logger.info(f"📊 Batch send complete: {report['success']}/{report['total']} success, {self.stats}")
+        return report
+
+    @staticmethod
+    def _splittable(error: Exception) -> bool:
+        return isinstance(error, WBAPIException) and not isinstance(error, _NOT_SPLITTABLE)
+
+    @staticmethod
+    def _with_app_context(func: Callable) -> Callable:
+        """Выполнять отправку в контексте Flask-приложения вызывающего (логи API в БД)"""
+        try:
+            from flask import current_app, has_app_context
+        except ImportError:
+            return func
+        if not has_app_context():
+            return func
+        app = current_app._get_current_object()
+
+        def wrapper(*args, **kwargs):
+            with app.app_context():
+                return func(*args, **kwargs)
+        return wrapper
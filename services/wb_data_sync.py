@@ -5,7 +5,7 @@
 Загружает сырые данные из WB Statistics API и Feedbacks API,
 сохраняет в таблицы wb_sales, wb_orders, wb_feedbacks, wb_realization_rows.
 
-Дедупликация:
+Дедупликация (INSERT ... ON CONFLICT по уникальному ключу, services/db_dialect.py):
 - Sales: по srid (уникальный ID операции)
 - Orders: по srid
 - Feedbacks: по wb_id (id отзыва)
@@ -17,17 +17,29 @@
 - Realization: dateFrom = max(rr_dt) - 7 дней (перекрытие для обновлений)
 """
 import logging
-import time
+import os
 import requests
 from datetime import datetime, timedelta, date
-from typing import Optional
+from typing import Any, Dict, Iterator, Optional
 
 from models import db, Seller, WBSale, WBOrder, WBFeedback, WBRealizationRow
+from services.db_dialect import upsert_rows
+from services.json_stream import NotJSONArrayError, iter_batches, iter_response_array
+from services.wb_rate_limiter import get_shared_rate_limiter
+from services.wb_retry import parse_retry_after
 
 logger = logging.getLogger('wb_data_sync')
 
-STATISTICS_API_URL = "https://statistics-api.wildberries.ru"
-FEEDBACKS_API_URL = "https://feedbacks-api.wildberries.ru"
+# WB_API_BASE_URL — локальный стенд вместо хостов WB (см. services/wb_fake_server.py)
+STATISTICS_API_URL = os.environ.get('WB_API_BASE_URL', '').rstrip('/') or "https://statistics-api.wildberries.ru"
+FEEDBACKS_API_URL = os.environ.get('WB_API_BASE_URL', '').rstrip('/') or "https://feedbacks-api.wildberries.ru"
+
+REALIZATION_ENDPOINT = "/api/v5/supplier/reportDetailByPeriod"
+# Сколько 429 подряд пережидаем, прежде чем отдать ошибку
+REALIZATION_MAX_THROTTLED = 3
+
+# Строк ответа на одну транзакцию: ответы разбираются потоково и пишутся пачками
+SYNC_STREAM_BATCH_SIZE = int(os.environ.get('WB_SYNC_STREAM_BATCH_SIZE', '500'))
 
 
 def _make_session(api_key: str) -> requests.Session:
@@ -39,6 +51,14 @@ def _make_session(api_key: str) -> requests.Session:
     return session
 
 
+def _stream_rows(resp: requests.Response, what: str) -> Iterator[Dict[str, Any]]:
+    """Строки JSON-массива ответа по мере загрузки (ответ запрошен с stream=True)"""
+    try:
+        yield from iter_response_array(resp)
+    except NotJSONArrayError as e:
+        logger.warning(f"{what} API returned non-list: {e}")
+
+
 # =============================================================================
 # Sales sync (/api/v1/supplier/sales)
 # =============================================================================
@@ -61,64 +81,55 @@ def sync_sales(seller: Seller) -> int:
     resp = session.get(
         f"{STATISTICS_API_URL}/api/v1/supplier/sales",
         params={'dateFrom': date_from},
-        timeout=60
+        timeout=60,
+        stream=True
     )
     resp.raise_for_status()
-    rows = resp.json()
-
-    if not isinstance(rows, list):
-        logger.warning(f"Sales API returned non-list: {type(rows)}")
-        return 0
 
     count = 0
+    total_rows = 0
+    for rows in iter_batches(_stream_rows(resp, 'Sales'), SYNC_STREAM_BATCH_SIZE):
+        total_rows += len(rows)
+        count += _upsert_sales(seller.id, rows)
+        db.session.commit()
+
+    logger.info(f"Sales sync done for seller={seller.id}: {count} new/updated from {total_rows} API rows")
+    return count
+
+
+def _upsert_sales(seller_id: int, rows: list) -> int:
+    """Upsert пачки строк продаж по srid (ON CONFLICT). Returns count of new/updated rows."""
+    values = []
     for r in rows:
         srid = r.get('srid')
         if not srid:
             continue
-
-        existing = WBSale.query.filter_by(seller_id=seller.id, srid=srid).first()
         sale_id = str(r.get('saleID', ''))
-        is_return = sale_id.startswith('R') or float(r.get('finishedPrice', 0) or 0) < 0
-
-        if existing:
-            # Обновляем, если last_change_date новее
-            new_lcd = r.get('lastChangeDate', '')
-            if new_lcd and existing.last_change_date:
-                try:
-                    new_dt = datetime.fromisoformat(new_lcd.replace('Z', '+00:00').replace('+00:00', ''))
-                    if new_dt > existing.last_change_date:
-                        existing.last_change_date = new_dt
-                        existing.finished_price = float(r.get('finishedPrice', 0) or 0)
-                        existing.for_pay = float(r.get('forPay', 0) or 0)
-                        existing.is_return = is_return
-                        count += 1
-                except (ValueError, TypeError):
-                    pass
-        else:
-            sale = WBSale(
-                seller_id=seller.id,
-                srid=srid,
-                sale_id=sale_id,
-                nm_id=r.get('nmId'),
-                date=_parse_dt(r.get('date')),
-                last_change_date=_parse_dt(r.get('lastChangeDate')),
-                supplier_article=r.get('supplierArticle', ''),
-                subject=r.get('subject', ''),
-                brand=r.get('brand', ''),
-                warehouse_name=r.get('warehouseName', ''),
-                region_name=r.get('regionName', ''),
-                country_name=r.get('countryName', ''),
-                finished_price=float(r.get('finishedPrice', 0) or 0),
-                price_with_disc=float(r.get('priceWithDisc', 0) or 0),
-                for_pay=float(r.get('forPay', 0) or 0),
-                is_return=is_return,
-            )
-            db.session.add(sale)
-            count += 1
-
-    db.session.commit()
-    logger.info(f"Sales sync done for seller={seller.id}: {count} new/updated from {len(rows)} API rows")
-    return count
+        values.append(dict(
+            seller_id=seller_id,
+            srid=srid,
+            sale_id=sale_id,
+            nm_id=r.get('nmId'),
+            date=_parse_dt(r.get('date')),
+            last_change_date=_parse_dt(r.get('lastChangeDate')),
+            supplier_article=r.get('supplierArticle', ''),
+            subject=r.get('subject', ''),
+            brand=r.get('brand', ''),
+            warehouse_name=r.get('warehouseName', ''),
+            region_name=r.get('regionName', ''),
+            country_name=r.get('countryName', ''),
+            finished_price=float(r.get('finishedPrice', 0) or 0),
+            price_with_disc=float(r.get('priceWithDisc', 0) or 0),
+            for_pay=float(r.get('forPay', 0) or 0),
+            is_return=sale_id.startswith('R') or float(r.get('finishedPrice', 0) or 0) < 0,
+        ))
+
+    # Существующая строка обновляется, только если last_change_date новее
+    return upsert_rows(
+        WBSale.__table__, values, ('seller_id', 'srid'),
+        update=('last_change_date', 'finished_price', 'for_pay', 'is_return'),
+        where=lambda t, new: new.last_change_date > t.last_change_date,
+    )
 
 
 # =============================================================================
@@ -142,67 +153,77 @@ def sync_orders(seller: Seller) -> int:
     resp = session.get(
         f"{STATISTICS_API_URL}/api/v1/supplier/orders",
         params={'dateFrom': date_from},
-        timeout=60
+        timeout=60,
+        stream=True
     )
     resp.raise_for_status()
-    rows = resp.json()
-
-    if not isinstance(rows, list):
-        logger.warning(f"Orders API returned non-list: {type(rows)}")
-        return 0
 
     count = 0
+    total_rows = 0
+    for rows in iter_batches(_stream_rows(resp, 'Orders'), SYNC_STREAM_BATCH_SIZE):
+        total_rows += len(rows)
+        count += _upsert_orders(seller.id, rows)
+        db.session.commit()
+
+    logger.info(f"Orders sync done for seller={seller.id}: {count} new/updated from {total_rows} API rows")
+    return count
+
+
+def _upsert_orders(seller_id: int, rows: list) -> int:
+    """Upsert пачки строк заказов по srid (ON CONFLICT). Returns count of new/updated rows."""
+    values = []
     for r in rows:
         srid = r.get('srid')
         if not srid:
             continue
+        values.append(dict(
+            seller_id=seller_id,
+            srid=srid,
+            nm_id=r.get('nmId'),
+            date=_parse_dt(r.get('date')),
+            last_change_date=_parse_dt(r.get('lastChangeDate')),
+            supplier_article=r.get('supplierArticle', ''),
+            subject=r.get('subject', ''),
+            brand=r.get('brand', ''),
+            warehouse_name=r.get('warehouseName', ''),
+            region_name=r.get('regionName', ''),
+            oblast_okrug_name=r.get('oblastOkrugName', ''),
+            country_name=r.get('countryName', ''),
+            total_price=float(r.get('totalPrice', 0) or 0),
+            finished_price=float(r.get('finishedPrice', 0) or 0),
+            is_cancel=bool(r.get('isCancel', False)),
+            cancel_dt=_parse_dt(r.get('cancelDate') or r.get('cancel_dt')),
+            order_type=r.get('orderType', ''),
+            sticker=r.get('sticker', ''),
+        ))
+
+    return upsert_rows(
+        WBOrder.__table__, values, ('seller_id', 'srid'),
+        update=_order_update, where=lambda t, new: _order_cancelled(t, new) | _order_changed(t, new),
+    )
 
-        existing = WBOrder.query.filter_by(seller_id=seller.id, srid=srid).first()
 
-        if existing:
-            # Обновляем статус отмены
-            new_lcd = r.get('lastChangeDate', '')
-            is_cancel = bool(r.get('isCancel', False))
-            if is_cancel and not existing.is_cancel:
-                existing.is_cancel = True
-                existing.cancel_dt = _parse_dt(r.get('cancelDate') or r.get('cancel_dt'))
-                existing.last_change_date = _parse_dt(new_lcd) or existing.last_change_date
-                count += 1
-            elif new_lcd:
-                try:
-                    new_dt = datetime.fromisoformat(new_lcd.replace('Z', '+00:00').replace('+00:00', ''))
-                    if existing.last_change_date and new_dt > existing.last_change_date:
-                        existing.last_change_date = new_dt
-                        existing.finished_price = float(r.get('finishedPrice', 0) or 0)
-                except (ValueError, TypeError):
-                    pass
-        else:
-            order = WBOrder(
-                seller_id=seller.id,
-                srid=srid,
-                nm_id=r.get('nmId'),
-                date=_parse_dt(r.get('date')),
-                last_change_date=_parse_dt(r.get('lastChangeDate')),
-                supplier_article=r.get('supplierArticle', ''),
-                subject=r.get('subject', ''),
-                brand=r.get('brand', ''),
-                warehouse_name=r.get('warehouseName', ''),
-                region_name=r.get('regionName', ''),
-                oblast_okrug_name=r.get('oblastOkrugName', ''),
-                country_name=r.get('countryName', ''),
-                total_price=float(r.get('totalPrice', 0) or 0),
-                finished_price=float(r.get('finishedPrice', 0) or 0),
-                is_cancel=bool(r.get('isCancel', False)),
-                cancel_dt=_parse_dt(r.get('cancelDate') or r.get('cancel_dt')),
-                order_type=r.get('orderType', ''),
-                sticker=r.get('sticker', ''),
-            )
-            db.session.add(order)
-            count += 1
+def _order_cancelled(t, new):
+    """Заказ отменён после прошлой загрузки"""
+    return new.is_cancel & ~db.func.coalesce(t.is_cancel, False)
 
-    db.session.commit()
-    logger.info(f"Orders sync done for seller={seller.id}: {count} new/updated from {len(rows)} API rows")
-    return count
+
+def _order_changed(t, new):
+    return new.last_change_date > t.last_change_date
+
+
+def _order_update(t, new) -> dict:
+    """Отмена: флаг, дата отмены и last_change_date; иначе — новая цена и last_change_date"""
+    cancelled = _order_cancelled(t, new)
+    return {
+        'is_cancel': db.case((cancelled, True), else_=t.is_cancel),
+        'cancel_dt': db.case((cancelled, new.cancel_dt), else_=t.cancel_dt),
+        'last_change_date': db.case(
+            (cancelled, db.func.coalesce(new.last_change_date, t.last_change_date)),
+            else_=new.last_change_date,
+        ),
+        'finished_price': db.case((cancelled, t.finished_price), else_=new.finished_price),
+    }
 
 
 # =============================================================================
@@ -299,9 +320,13 @@ def sync_realization(seller: Seller) -> int:
     logger.info(f"Sync realization for seller={seller.id}, dateFrom={date_from}")
 
     session = _make_session(seller.wb_api_key)
-    all_rows = []
+    # Метод — 1 запрос в минуту: бюджет общий с WildberriesAPIClient (тот же бакет)
+    rate_limiter = get_shared_rate_limiter()
     rrdid = 0
     limit = 100000
+    throttled = 0
+    count = 0
+    total_rows = 0
 
     while True:
         params = {
@@ -310,99 +335,93 @@ def sync_realization(seller: Seller) -> int:
             'limit': limit,
             'rrdid': rrdid,
         }
+        rate_limiter.acquire(seller.wb_api_key, 'statistics', REALIZATION_ENDPOINT)
         resp = session.get(
-            f"{STATISTICS_API_URL}/api/v5/supplier/reportDetailByPeriod",
+            f"{STATISTICS_API_URL}{REALIZATION_ENDPOINT}",
             params=params,
-            timeout=120
+            timeout=120,
+            stream=True
         )
         if resp.status_code == 204:
+            resp.close()
             break
 
-        resp.raise_for_status()
-        page = resp.json()
-
-        if not isinstance(page, list) or not page:
-            break
-
-        all_rows.extend(page)
+        if resp.status_code == 429 and throttled < REALIZATION_MAX_THROTTLED:
+            # Пауза из заголовков WB — её выждет следующий acquire()
+            throttled += 1
+            retry_after = parse_retry_after(resp.headers) or 60
+            resp.close()
+            rate_limiter.penalize(seller.wb_api_key, 'statistics', REALIZATION_ENDPOINT, retry_after)
+            continue
 
-        if len(page) < limit:
+        resp.raise_for_status()
+        throttled = 0
+
+        # Страница до 100000 строк разбирается потоково и пишется пачками
+        page_rows = 0
+        last_rrd_id = 0
+        for rows in iter_batches(_stream_rows(resp, 'Realization'), SYNC_STREAM_BATCH_SIZE):
+            page_rows += len(rows)
+            last_rrd_id = rows[-1].get('rrd_id', 0)
+            count += _upsert_realization_rows(seller.id, rows)
+            db.session.commit()
+        total_rows += page_rows
+
+        if page_rows < limit:
             break
 
-        last_rrd_id = page[-1].get('rrd_id', 0)
         if last_rrd_id and last_rrd_id != rrdid:
             rrdid = last_rrd_id
-            logger.info(f"Realization pagination: {len(all_rows)} rows, next rrdid={rrdid}, sleeping 61s...")
-            time.sleep(61)
+            logger.info(f"Realization pagination: {total_rows} rows, next rrdid={rrdid}")
         else:
             break
 
-    # Upsert по rrd_id
-    count = 0
-    existing_rrd_ids = set()
-    if all_rows:
-        rrd_ids = [r.get('rrd_id') for r in all_rows if r.get('rrd_id')]
-        if rrd_ids:
-            existing = db.session.query(WBRealizationRow.rrd_id).filter(
-                WBRealizationRow.seller_id == seller.id,
-                WBRealizationRow.rrd_id.in_(rrd_ids)
-            ).all()
-            existing_rrd_ids = {row[0] for row in existing}
-
-    for r in all_rows:
+    logger.info(f"Realization sync done for seller={seller.id}: {count} rows processed from {total_rows} API rows")
+    return count
+
+
+def _upsert_realization_rows(seller_id: int, rows: list) -> int:
+    """Upsert пачки строк реализации по rrd_id (ON CONFLICT). Returns count of processed rows."""
+    values = []
+    for r in rows:
         rrd_id_val = r.get('rrd_id')
         if not rrd_id_val:
             continue
-
-        if rrd_id_val in existing_rrd_ids:
-            # Обновляем финансовые поля (отчёт мог быть скорректирован)
-            db.session.query(WBRealizationRow).filter(
-                WBRealizationRow.seller_id == seller.id,
-                WBRealizationRow.rrd_id == rrd_id_val
-            ).update({
-                'ppvz_for_pay': float(r.get('ppvz_for_pay', 0) or 0),
-                'ppvz_sales_commission': float(r.get('ppvz_sales_commission', 0) or 0),
-                'delivery_rub': float(r.get('delivery_rub', 0) or 0),
-                'storage_fee': float(r.get('storage_fee', 0) or 0),
-                'penalty': float(r.get('penalty', 0) or 0),
-                'deduction': float(r.get('deduction', 0) or 0),
-            })
-            count += 1
-        else:
-            row = WBRealizationRow(
-                seller_id=seller.id,
-                rrd_id=rrd_id_val,
-                realizationreport_id=r.get('realizationreport_id'),
-                rr_dt=_parse_dt(r.get('rr_dt')),
-                date_from=_parse_date(r.get('date_from')),
-                date_to=_parse_date(r.get('date_to')),
-                nm_id=r.get('nm_id'),
-                sa_name=r.get('sa_name', ''),
-                subject_name=r.get('subject_name', ''),
-                brand_name=r.get('brand_name', ''),
-                supplier_oper_name=r.get('supplier_oper_name', ''),
-                doc_type_name=r.get('doc_type_name', ''),
-                retail_price_withdisc_rub=float(r.get('retail_price_withdisc_rub', 0) or 0),
-                retail_amount=float(r.get('retail_amount', 0) or 0),
-                ppvz_for_pay=float(r.get('ppvz_for_pay', 0) or 0),
-                ppvz_sales_commission=float(r.get('ppvz_sales_commission', 0) or 0),
-                commission_percent=float(r.get('commission_percent', 0) or 0),
-                delivery_rub=float(r.get('delivery_rub', 0) or 0),
-                rebill_logistic_cost=float(r.get('rebill_logistic_cost', 0) or 0),
-                storage_fee=float(r.get('storage_fee', 0) or 0),
-                penalty=float(r.get('penalty', 0) or 0),
-                deduction=float(r.get('deduction', 0) or 0),
-                acceptance=float(r.get('acceptance', 0) or 0),
-                additional_payment=float(r.get('additional_payment', 0) or 0),
-                return_amount=int(r.get('return_amount', 0) or 0),
-                delivery_amount=int(r.get('delivery_amount', 0) or 0),
-            )
-            db.session.add(row)
-            count += 1
-
-    db.session.commit()
-    logger.info(f"Realization sync done for seller={seller.id}: {count} rows processed from {len(all_rows)} API rows")
-    return count
+        values.append(dict(
+            seller_id=seller_id,
+            rrd_id=rrd_id_val,
+            realizationreport_id=r.get('realizationreport_id'),
+            rr_dt=_parse_dt(r.get('rr_dt')),
+            date_from=_parse_date(r.get('date_from')),
+            date_to=_parse_date(r.get('date_to')),
+            nm_id=r.get('nm_id'),
+            sa_name=r.get('sa_name', ''),
+            subject_name=r.get('subject_name', ''),
+            brand_name=r.get('brand_name', ''),
+            supplier_oper_name=r.get('supplier_oper_name', ''),
+            doc_type_name=r.get('doc_type_name', ''),
+            retail_price_withdisc_rub=float(r.get('retail_price_withdisc_rub', 0) or 0),
+            retail_amount=float(r.get('retail_amount', 0) or 0),
+            ppvz_for_pay=float(r.get('ppvz_for_pay', 0) or 0),
+            ppvz_sales_commission=float(r.get('ppvz_sales_commission', 0) or 0),
+            commission_percent=float(r.get('commission_percent', 0) or 0),
+            delivery_rub=float(r.get('delivery_rub', 0) or 0),
+            rebill_logistic_cost=float(r.get('rebill_logistic_cost', 0) or 0),
+            storage_fee=float(r.get('storage_fee', 0) or 0),
+            penalty=float(r.get('penalty', 0) or 0),
+            deduction=float(r.get('deduction', 0) or 0),
+            acceptance=float(r.get('acceptance', 0) or 0),
+            additional_payment=float(r.get('additional_payment', 0) or 0),
+            return_amount=int(r.get('return_amount', 0) or 0),
+            delivery_amount=int(r.get('delivery_amount', 0) or 0),
+        ))
+
+    # Отчёт мог быть скорректирован — финансовые поля обновляются всегда
+    return upsert_rows(
+        WBRealizationRow.__table__, values, ('seller_id', 'rrd_id'),
+        update=('ppvz_for_pay', 'ppvz_sales_commission', 'delivery_rub',
+                'storage_fee', 'penalty', 'deduction'),
+    )
 
 
 # =============================================================================
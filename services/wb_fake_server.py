@@ -0,0 +1,928 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный стенд WB API для нагрузочных прогонов и отладки
+
+Поднимает HTTP-сервер с теми же путями, что и API WB, которыми пользуются
+синхронизация товаров, мониторинг цен и импорт карточек:
+
+- Content API: список карточек (cursor-пагинация, textSearch, сортировка),
+  создание / обновление / объединение карточек, ошибки создания, медиа,
+  предметы, характеристики, справочники, бренды;
+- Prices API: список цен (limit/offset), загрузка цен и история загрузок;
+- Statistics API: остатки, заказы, продажи, отчёт реализации (rrdid).
+
+Данные — детерминированно сгенерированный каталог (FakeWBDataset.generate)
+или записанные ответы реального WB (FakeWBDataset.load, см.
+scripts/record_wb_fixtures.py). Поведение настраивается FakeWBConfig:
+задержка ответа, доля и шаг ответов 429 (с заголовками X-Ratelimit-*),
+размеры страниц, задержка появления созданных карточек и обработки цен.
+
+Клиенты направляются на стенд одним базовым URL:
+WildberriesAPIClient(api_key, base_url=server.url) или переменная
+окружения WB_API_BASE_URL (её читают и модули с собственными URL WB).
+
+Пример:
+    with FakeWBServer(FakeWBDataset.generate(cards=5000), FakeWBConfig(latency=0.05)) as server:
+        client = WildberriesAPIClient('key', base_url=server.url)
+        cards = client.get_all_cards()
+        print(server.get_stats())
+
+Запуск отдельным процессом:
+    python -m services.wb_fake_server --cards 5000 --port 8099 --latency 0.05
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Разделы набора данных (файл <раздел>.json в каталоге записанных ответов)
+DATASET_SECTIONS = (
+    'cards', 'prices', 'stocks', 'sales', 'orders', 'realization',
+    'subjects', 'parents', 'charcs', 'brands', 'directories',
+)
+
+# Начало «истории» сгенерированного каталога (фиксировано ради повторяемости)
+GENERATED_EPOCH = datetime(2024, 1, 1)
+
+_WB_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+_SUBJECTS = [
+    # (subjectID, название, parentID, родительская категория, есть размеры)
+    (105, 'Футболки', 1, 'Одежда', True),
+    (192, 'Платья', 1, 'Одежда', True),
+    (104, 'Брюки', 1, 'Одежда', True),
+    (3091, 'Кружки', 2, 'Дом', False),
+    (469, 'Подушки декоративные', 2, 'Дом', False),
+    (5067, 'Массажеры', 3, 'Здоровье', False),
+]
+_BRANDS = ['Nord', 'Вектор', 'Alba', 'Orion', 'Лето', 'Mira', 'Kappa Home', 'Сибирь', 'Zest', 'Polar']
+_COLORS = ['белый', 'черный', 'красный', 'синий', 'зеленый', 'бежевый', 'серый']
+_WAREHOUSES = ['Коледино', 'Подольск', 'Электросталь', 'Казань', 'Новосибирск']
+_SIZES = ['S', 'M', 'L', 'XL']
+
+
+def _wb_time(moment: datetime) -> str:
+    return moment.strftime(_WB_TIME_FORMAT)
+
+
+def _parse_time(value: Optional[str]) -> float:
+    """Метка времени WB -> секунды (для сравнения курсоров с разной точностью)"""
+    if not value:
+        return 0.0
+    text = str(value).replace('Z', '')
+    if '+' in text[10:]:
+        text = text[:10] + text[10:].split('+')[0]
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _parse_date_param(value: Optional[str]) -> str:
+    """dateFrom Statistics API -> строка для сравнения с датами строк"""
+    if not value:
+        return ''
+    return str(value)[:19]
+
+
+@dataclass
+class FakeWBConfig:
+    """Поведение стенда"""
+    # Задержка каждого ответа: latency + случайная добавка до latency_jitter (сек)
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # 429 на каждый N-й запрос (0 — выключено) и с вероятностью rate_limit_probability
+    rate_limit_every: int = 0
+    rate_limit_probability: float = 0.0
+    # Значение X-Ratelimit-Retry в ответе 429 (сек)
+    rate_limit_retry: float = 1.0
+    # Максимальные размеры страниц
+    cards_page_limit: int = 100
+    prices_page_limit: int = 1000
+    statistics_page_limit: int = 80000
+    # Через сколько секунд созданная карточка появится в списке
+    card_processing_delay: float = 0.0
+    # Через сколько секунд загрузка цен будет обработана
+    price_upload_delay: float = 0.0
+    # Требовать заголовок Authorization
+    require_auth: bool = True
+    seed: int = 42
+
+
+class FakeWBDataset:
+    """
+    Данные стенда: карточки, цены, остатки, отчёты и справочники
+
+    Все разделы — списки словарей в формате ответов WB, кроме charcs
+    (subjectID -> характеристики) и directories (имя справочника -> данные).
+    """
+
+    def __init__(self, **sections):
+        for name in DATASET_SECTIONS:
+            default = {} if name in ('charcs', 'directories') else []
+            setattr(self, name, sections.get(name) or default)
+
+    # ------------------------------------------------------------------
+    # Генерация
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def generate(cls, cards: int = 1000, seed: int = 42, sales_per_card: int = 2,
+                 realization_per_card: int = 3) -> 'FakeWBDataset':
+        """
+        Сгенерировать каталог (одинаковый при одинаковых аргументах)
+
+        Args:
+            cards: Количество карточек
+            seed: Зерно генератора
+            sales_per_card: Строк продаж и заказов на карточку
+            realization_per_card: Строк отчёта реализации на карточку
+        """
+        rng = random.Random(seed)
+        # Остатки запрашиваются с dateFrom ~ месяц назад — их даты относительно сегодняшнего дня
+        stocks_day = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        card_list, prices, stocks, sales, orders, realization = [], [], [], [], [], []
+        barcode = 2040000000000
+        chrt_id = 300000000
+
+        for i in range(cards):
+            nm_id = 100000000 + i
+            subject_id, subject_name, _, _, has_sizes = _SUBJECTS[i % len(_SUBJECTS)]
+            brand = _BRANDS[rng.randrange(len(_BRANDS))]
+            updated_at = GENERATED_EPOCH + timedelta(minutes=i * 7, seconds=rng.randrange(60))
+            vendor_code = f'FAKE-{i:06d}'
+            size_names = _SIZES[:rng.randint(2, len(_SIZES))] if has_sizes else ['0']
+
+            sizes = []
+            for size_name in size_names:
+                barcode += 1
+                chrt_id += 1
+                size = {'chrtID': chrt_id, 'techSize': size_name, 'skus': [str(barcode)]}
+                if has_sizes:
+                    size['wbSize'] = size_name
+                sizes.append(size)
+
+            card_list.append({
+                'nmID': nm_id,
+                'imtID': 200000000 + i // 3,  # по три цвета в объединённой карточке
+                'nmUUID': f'00000000-0000-4000-8000-{nm_id:012d}',
+                'subjectID': subject_id,
+                'subjectName': subject_name,
+                'vendorCode': vendor_code,
+                'brand': brand,
+                'title': f'{subject_name} {brand} {i}',
+                'description': f'{subject_name} {brand}. ' + 'Описание товара для стенда. ' * rng.randint(3, 12),
+                'photos': [
+                    {'big': f'https://example.invalid/{nm_id}/{n}.webp'} for n in range(rng.randint(1, 5))
+                ],
+                'dimensions': {'length': 30, 'width': 20, 'height': 5, 'weightBrutto': 0.3, 'isValid': True},
+                'characteristics': [
+                    {'id': 14177449, 'name': 'Цвет', 'value': [_COLORS[i % len(_COLORS)]]},
+                    {'id': 14177451, 'name': 'Страна производства', 'value': ['Россия']},
+                ],
+                'sizes': sizes,
+                'tags': [],
+                'createdAt': _wb_time(updated_at - timedelta(days=1)),
+                'updatedAt': _wb_time(updated_at),
+            })
+
+            price = rng.randrange(500, 10000, 10)
+            discount = rng.choice([0, 10, 15, 20, 30, 50])
+            prices.append({
+                'nmID': nm_id,
+                'vendorCode': vendor_code,
+                'sizes': [
+                    {'sizeID': s['chrtID'], 'price': price, 'discountedPrice': round(price * (100 - discount) / 100, 2),
+                     'clubDiscountedPrice': round(price * (100 - discount) / 100, 2), 'techSizeName': s['techSize']}
+                    for s in sizes
+                ],
+                'currencyIsoCode4217': 'RUB',
+                'discount': discount,
+                'clubDiscount': 0,
+                'editableSizePrice': has_sizes,
+            })
+
+            for warehouse in rng.sample(_WAREHOUSES, rng.randint(1, 3)):
+                quantity = rng.randrange(0, 50)
+                stocks.append({
+                    'lastChangeDate': (stocks_day - timedelta(days=rng.randrange(20))).strftime('%Y-%m-%dT%H:%M:%S'),
+                    'warehouseName': warehouse,
+                    'supplierArticle': vendor_code,
+                    'nmId': nm_id,
+                    'barcode': sizes[0]['skus'][0],
+                    'quantity': quantity,
+                    'inWayToClient': rng.randrange(0, 5),
+                    'inWayFromClient': rng.randrange(0, 3),
+                    'quantityFull': quantity + rng.randrange(0, 5),
+                    'category': subject_name,
+                    'subject': subject_name,
+                    'brand': brand,
+                    'techSize': sizes[0]['techSize'],
+                    'Price': price,
+                    'Discount': discount,
+                    'isSupply': True,
+                    'isRealization': False,
+                    'SCCode': 'Tech',
+                })
+
+            for n in range(sales_per_card):
+                moment = (updated_at + timedelta(hours=n * 5)).strftime('%Y-%m-%dT%H:%M:%S')
+                row = {
+                    'date': moment,
+                    'lastChangeDate': moment,
+                    'warehouseName': _WAREHOUSES[n % len(_WAREHOUSES)],
+                    'countryName': 'Россия',
+                    'oblastOkrugName': 'Центральный федеральный округ',
+                    'regionName': 'Московская',
+                    'supplierArticle': vendor_code,
+                    'nmId': nm_id,
+                    'barcode': sizes[0]['skus'][0],
+                    'category': subject_name,
+                    'subject': subject_name,
+                    'brand': brand,
+                    'techSize': sizes[0]['techSize'],
+                    'totalPrice': price,
+                    'discountPercent': discount,
+                    'finishedPrice': round(price * (100 - discount) / 100, 2),
+                    'priceWithDisc': round(price * (100 - discount) / 100, 2),
+                    'srid': f'fake.{nm_id}.{n}',
+                }
+                orders.append(dict(row, isCancel=False, cancelDate='0001-01-01T00:00:00', orderType='Клиентский'))
+                sales.append(dict(row, saleID=f'S{nm_id}{n}', forPay=round(row['finishedPrice'] * 0.8, 2)))
+
+            for n in range(realization_per_card):
+                realization.append({
+                    'realizationreport_id': 1000 + i // 500,
+                    'date_from': '2024-01-01T00:00:00Z',
+                    'date_to': '2024-12-31T00:00:00Z',
+                    'rrd_id': len(realization) + 1,
+                    'nm_id': nm_id,
+                    'sa_name': vendor_code,
+                    'brand_name': brand,
+                    'subject_name': subject_name,
+                    'doc_type_name': 'Продажа' if n else 'Возврат',
+                    'supplier_oper_name': 'Продажа' if n else 'Возврат',
+                    'rr_dt': updated_at.strftime('%Y-%m-%d'),
+                    'retail_price_withdisc_rub': round(price * (100 - discount) / 100, 2),
+                    'retail_amount': round(price * (100 - discount) / 100, 2),
+                    'ppvz_for_pay': round(price * 0.7, 2),
+                    'delivery_rub': 50,
+                    'srid': f'fake.{nm_id}.{n}',
+                })
+
+        subjects = [
+            {'subjectID': sid, 'subjectName': name, 'parentID': pid, 'parentName': pname}
+            for sid, name, pid, pname, _ in _SUBJECTS
+        ]
+        parents = sorted(
+            ({'id': pid, 'name': pname, 'isVisible': True} for _, _, pid, pname, _ in _SUBJECTS),
+            key=lambda p: p['id']
+        )
+        parents = [p for n, p in enumerate(parents) if n == 0 or p['id'] != parents[n - 1]['id']]
+        charcs = {}
+        for sid, name, _, _, has_sizes in _SUBJECTS:
+            charcs[sid] = [
+                {'charcID': 14177449, 'subjectName': name, 'subjectID': sid, 'name': 'Цвет',
+                 'required': False, 'unitName': '', 'maxCount': 3, 'popular': True, 'charcType': 1},
+                {'charcID': 14177451, 'subjectName': name, 'subjectID': sid, 'name': 'Страна производства',
+                 'required': False, 'unitName': '', 'maxCount': 1, 'popular': True, 'charcType': 1},
+            ]
+            if has_sizes:
+                charcs[sid].append({'charcID': 54337, 'subjectName': name, 'subjectID': sid, 'name': 'Размер',
+                                    'required': False, 'unitName': '', 'maxCount': 0, 'popular': False,
+                                    'charcType': 1})
+
+        return cls(
+            cards=card_list, prices=prices, stocks=stocks, sales=sales, orders=orders,
+            realization=realization, subjects=subjects, parents=parents, charcs=charcs,
+            brands=[{'id': 10000 + n, 'name': name, 'logoUrl': ''} for n, name in enumerate(_BRANDS)],
+            directories={
+                'colors': [{'name': color, 'parentName': color} for color in _COLORS],
+                'countries': [{'name': 'Россия', 'fullName': 'Российская Федерация'},
+                              {'name': 'Китай', 'fullName': 'Китайская Народная Республика'}],
+                'kinds': ['Мужской', 'Женский', 'Детский', 'Унисекс'],
+                'seasons': ['лето', 'зима', 'демисезон', 'круглогодичный'],
+                'vat': ['0', '10', '20', 'Без НДС'],
+                'tnved': [{'tnved': '6109100000', 'isKiz': True}],
+            },
+        )
+
+    # ------------------------------------------------------------------
+    # Записанные ответы
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def load(cls, path: str) -> 'FakeWBDataset':
+        """
+        Загрузить набор из каталога с записанными ответами (<раздел>.json)
+
+        Отсутствующие разделы остаются пустыми.
+        """
+        sections = {}
+        for name in DATASET_SECTIONS:
+            file_path = os.path.join(path, f'{name}.json')
+            if not os.path.exists(file_path):
+                continue
+            with open(file_path, encoding='utf-8') as f:
+                sections[name] = json.load(f)
+        # Ключи JSON-объекта — строки
+        sections['charcs'] = {int(k): v for k, v in (sections.get('charcs') or {}).items()}
+        logger.info(f"📂 Fake WB dataset loaded from {path}: "
+                    f"{len(sections.get('cards') or [])} cards")
+        return cls(**sections)
+
+    def save(self, path: str) -> None:
+        """Сохранить набор в каталог (формат load)"""
+        os.makedirs(path, exist_ok=True)
+        for name in DATASET_SECTIONS:
+            with open(os.path.join(path, f'{name}.json'), 'w', encoding='utf-8') as f:
+                json.dump(getattr(self, name), f, ensure_ascii=False)
+
+
+class FakeWBState:
+    """
+    Изменяемое состояние стенда (общее для потоков сервера)
+
+    Карточки индексируются по (updatedAt, nmID) — отсортированный список
+    ключей даёт страницы курсора за O(log n) на страницу.
+    """
+
+    def __init__(self, dataset: FakeWBDataset, config: FakeWBConfig):
+        self.dataset = dataset
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+
+        self.cards: Dict[int, Dict[str, Any]] = {}
+        self._keys: List[Tuple[float, int]] = []
+        self._key_by_nm: Dict[int, Tuple[float, int]] = {}
+        for card in dataset.cards:
+            self._put_card(card)
+        self.prices: Dict[int, Dict[str, Any]] = {p['nmID']: p for p in dataset.prices}
+        self.price_order: List[int] = [p['nmID'] for p in dataset.prices]
+        self.realization = sorted(dataset.realization, key=lambda r: r.get('rrd_id') or 0)
+        self.rrd_ids = [r.get('rrd_id') or 0 for r in self.realization]
+
+        self._pending_cards: List[Tuple[float, Dict[str, Any]]] = []
+        self.card_errors: List[Dict[str, Any]] = []
+        self.uploads: Dict[int, Dict[str, Any]] = {}
+        self._pending_uploads: List[int] = []
+        self._next_nm_id = max(self.cards, default=100000000) + 1
+        self._next_imt_id = max((c.get('imtID') or 0 for c in self.cards.values()), default=200000000) + 1
+        self._next_upload_id = 1
+
+        self.requests = 0
+        self.stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {'requests': 0, 'throttled': 0})
+
+    # ------------------------------------------------------------------
+    # Карточки
+    # ------------------------------------------------------------------
+
+    def _put_card(self, card: Dict[str, Any]) -> None:
+        nm_id = card['nmID']
+        old_key = self._key_by_nm.get(nm_id)
+        if old_key is not None:
+            del self._keys[bisect.bisect_left(self._keys, old_key)]
+        key = (_parse_time(card.get('updatedAt')), nm_id)
+        bisect.insort(self._keys, key)
+        self._key_by_nm[nm_id] = key
+        self.cards[nm_id] = card
+
+    def touch_card(self, card: Dict[str, Any]) -> None:
+        """Изменить карточку: новая updatedAt переносит её в конец курсора"""
+        card['updatedAt'] = _wb_time(datetime.utcnow())
+        self._put_card(card)
+
+    def promote(self) -> None:
+        """Показать созданные карточки и обработать загрузки цен, срок которых подошёл"""
+        now = time.time()
+        if self._pending_cards:
+            ready = [card for visible_at, card in self._pending_cards if visible_at <= now]
+            self._pending_cards = [(t, c) for t, c in self._pending_cards if t > now]
+            for card in ready:
+                self.touch_card(card)
+        if self._pending_uploads:
+            for upload_id in [u for u in self._pending_uploads if self.uploads[u]['ready_at'] <= now]:
+                self._pending_uploads.remove(upload_id)
+                self._process_upload(self.uploads[upload_id])
+
+    def page_cards(self, limit: int, cursor: Dict[str, Any], ascending: bool) -> List[Dict[str, Any]]:
+        if cursor.get('updatedAt') and cursor.get('nmID'):
+            key = (_parse_time(cursor['updatedAt']), int(cursor['nmID']))
+            if ascending:
+                start = bisect.bisect_right(self._keys, key)
+                keys = self._keys[start:start + limit]
+            else:
+                end = bisect.bisect_left(self._keys, key)
+                keys = self._keys[max(0, end - limit):end][::-1]
+        elif ascending:
+            keys = self._keys[:limit]
+        else:
+            keys = self._keys[-limit:][::-1] if limit else []
+        return [self.cards[nm_id] for _, nm_id in keys]
+
+    def search_cards(self, text: str, limit: int) -> List[Dict[str, Any]]:
+        """textSearch: артикул продавца, nmID или баркод (точное совпадение)"""
+        found = []
+        for card in self.cards.values():
+            if (card.get('vendorCode') == text or str(card['nmID']) == text
+                    or any(text in (size.get('skus') or []) for size in card.get('sizes') or [])):
+                found.append(card)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def create_cards(self, body: List[Dict[str, Any]]) -> None:
+        known_barcodes = {
+            sku for card in self.cards.values() for size in card.get('sizes') or [] for sku in size.get('skus') or []
+        }
+        known_vendor_codes = {card.get('vendorCode') for card in self.cards.values()}
+        visible_at = time.time() + self.config.card_processing_delay
+
+        for group in body:
+            imt_id = self._next_imt_id
+            self._next_imt_id += 1
+            for variant in group.get('variants') or []:
+                vendor_code = variant.get('vendorCode')
+                skus = [sku for size in variant.get('sizes') or [] for sku in size.get('skus') or []]
+                errors = []
+                if vendor_code in known_vendor_codes:
+                    errors.append(f'Артикул продавца {vendor_code} уже используется')
+                duplicates = [sku for sku in skus if sku in known_barcodes]
+                if duplicates:
+                    errors.append(f"Неуникальный баркод: {', '.join(duplicates)}")
+                if errors:
+                    self.card_errors.append({
+                        'batchUUID': f'fake-{len(self.card_errors) + 1}',
+                        'subjects': [group.get('subjectID')],
+                        'vendorCodes': [vendor_code],
+                        'errors': {vendor_code: errors},
+                        'updatedAt': _wb_time(datetime.utcnow()),
+                    })
+                    continue
+
+                nm_id = self._next_nm_id
+                self._next_nm_id += 1
+                sizes = []
+                for size in variant.get('sizes') or [{}]:
+                    sizes.append(dict(size, chrtID=nm_id * 10 + len(sizes), skus=list(size.get('skus') or [])))
+                subject_name = next((s['subjectName'] for s in self.dataset.subjects
+                                     if s.get('subjectID') == group.get('subjectID')), '')
+                card = dict(
+                    variant, nmID=nm_id, imtID=imt_id, subjectID=group.get('subjectID'),
+                    subjectName=subject_name, sizes=sizes, photos=[], createdAt=_wb_time(datetime.utcnow())
+                )
+                known_vendor_codes.add(vendor_code)
+                known_barcodes.update(skus)
+                self._pending_cards.append((visible_at, card))
+                # Новый товар сразу появляется в Prices API с нулевой ценой
+                self.prices[nm_id] = {
+                    'nmID': nm_id, 'vendorCode': vendor_code, 'currencyIsoCode4217': 'RUB',
+                    'discount': 0, 'clubDiscount': 0, 'editableSizePrice': False,
+                    'sizes': [{'sizeID': size['chrtID'], 'price': 0, 'discountedPrice': 0,
+                               'clubDiscountedPrice': 0, 'techSizeName': size.get('techSize', '0')}
+                              for size in sizes],
+                }
+                self.price_order.append(nm_id)
+
+    def update_cards(self, body: List[Dict[str, Any]]) -> None:
+        for update in body:
+            card = self.cards.get(update.get('nmID'))
+            if card is None:
+                self.card_errors.append({
+                    'object': update.get('vendorCode') or '', 'nmID': update.get('nmID'),
+                    'updatedAt': _wb_time(datetime.utcnow()), 'errors': ['Карточка не найдена'],
+                })
+                continue
+            card.update({k: v for k, v in update.items() if k not in ('nmID', 'imtID')})
+            self.touch_card(card)
+
+    def move_cards(self, target_imt: Optional[int], nm_ids: List[int]) -> None:
+        for nm_id in nm_ids:
+            card = self.cards.get(nm_id)
+            if card is None:
+                continue
+            if target_imt:
+                card['imtID'] = target_imt
+            else:
+                card['imtID'] = self._next_imt_id
+                self._next_imt_id += 1
+            self.touch_card(card)
+
+    # ------------------------------------------------------------------
+    # Цены
+    # ------------------------------------------------------------------
+
+    def create_upload(self, goods: List[Dict[str, Any]]) -> int:
+        upload_id = self._next_upload_id
+        self._next_upload_id += 1
+        now = time.time()
+        self.uploads[upload_id] = {
+            'id': upload_id, 'goods': goods, 'status': None, 'errors': {},
+            'uploaded_at': now, 'ready_at': now + self.config.price_upload_delay,
+        }
+        self._pending_uploads.append(upload_id)
+        return upload_id
+
+    def _process_upload(self, upload: Dict[str, Any]) -> None:
+        for good in upload['goods']:
+            nm_id = good.get('nmID')
+            price_item = self.prices.get(nm_id)
+            if price_item is None:
+                upload['errors'][nm_id] = 'Товар не найден'
+                continue
+            discount = good.get('discount', price_item.get('discount', 0)) or 0
+            price_item['discount'] = discount
+            for size in price_item.get('sizes') or []:
+                price = good.get('price') or size.get('price')
+                size['price'] = price
+                size['discountedPrice'] = round(price * (100 - discount) / 100, 2)
+        if not upload['errors']:
+            upload['status'] = 3
+        elif len(upload['errors']) < len(upload['goods']):
+            upload['status'] = 5
+        else:
+            upload['status'] = 6
+
+
+def create_fake_wb_app(state: FakeWBState):
+    """
+    Flask-приложение стенда
+
+    Args:
+        state: Состояние стенда (данные и настройки)
+    """
+    from flask import Flask, Response, g, jsonify, request
+
+    app = Flask('wb_fake_server')
+    config = state.config
+
+    def error(status: int, text: str):
+        return jsonify({'title': text, 'detail': text, 'status': status, 'statusText': text}), status
+
+    @app.before_request
+    def emulate_wb():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        with state.lock:
+            state.requests += 1
+            counter = state.stats[f'{request.method} {rule}']
+            counter['requests'] += 1
+            delay = config.latency + (state.rng.uniform(0, config.latency_jitter) if config.latency_jitter else 0)
+            throttled = (
+                (config.rate_limit_every and state.requests % config.rate_limit_every == 0)
+                or (config.rate_limit_probability and state.rng.random() < config.rate_limit_probability)
+            )
+            if throttled:
+                counter['throttled'] += 1
+            state.promote()
+        g.started_at = time.time()
+
+        if delay:
+            time.sleep(delay)
+        if config.require_auth and not request.headers.get('Authorization'):
+            return error(401, 'unauthorized')
+        if throttled:
+            response, status = error(429, 'too many requests')
+            response.headers['X-Ratelimit-Retry'] = str(config.rate_limit_retry)
+            response.headers['X-Ratelimit-Limit'] = '100'
+            response.headers['X-Ratelimit-Reset'] = str(config.rate_limit_retry)
+            return response, status
+        return None
+
+    # ------------------------------------------------------------------
+    # Content API
+    # ------------------------------------------------------------------
+
+    @app.route('/content/v2/get/cards/list', methods=['POST'])
+    def cards_list():
+        settings = (request.get_json(silent=True) or {}).get('settings') or {}
+        cursor = settings.get('cursor') or {}
+        card_filter = settings.get('filter') or {}
+        limit = max(0, min(int(cursor.get('limit') or 100), config.cards_page_limit))
+        ascending = bool((settings.get('sort') or {}).get('ascending', False))
+
+        with state.lock:
+            text = card_filter.get('textSearch')
+            if text:
+                cards = state.search_cards(str(text), limit)
+            else:
+                cards = state.page_cards(limit, cursor, ascending)
+            cards = [dict(card) for card in cards]
+
+        next_cursor = {'total': len(cards)}
+        if cards:
+            next_cursor.update(updatedAt=cards[-1]['updatedAt'], nmID=cards[-1]['nmID'])
+        return jsonify({'cards': cards, 'cursor': next_cursor})
+
+    @app.route('/content/v2/cards/upload', methods=['POST'])
+    def cards_upload():
+        body = request.get_json(silent=True)
+        if not isinstance(body, list):
+            return error(400, 'request body must be an array')
+        with state.lock:
+            state.create_cards(body)
+        return jsonify({'data': None, 'error': False, 'errorText': '', 'additionalErrors': {}})
+
+    @app.route('/content/v2/cards/update', methods=['POST'])
+    def cards_update():
+        body = request.get_json(silent=True)
+        if not isinstance(body, list):
+            return error(400, 'request body must be an array')
+        with state.lock:
+            state.update_cards(body)
+        return jsonify({'data': None, 'error': False, 'errorText': '', 'additionalErrors': {}})
+
+    @app.route('/content/v2/cards/moveNm', methods=['POST'])
+    def cards_move():
+        body = request.get_json(silent=True) or {}
+        with state.lock:
+            state.move_cards(body.get('targetIMT'), body.get('nmIDs') or [])
+        return jsonify({'data': None, 'error': False, 'errorText': '', 'additionalErrors': {}})
+
+    @app.route('/content/v2/cards/error/list', methods=['GET', 'POST'])
+    def cards_errors():
+        with state.lock:
+            items = list(state.card_errors)
+        if request.method == 'GET':
+            # Старый формат: плоский список ошибок по nmID
+            return jsonify({'data': [item for item in items if 'nmID' in item], 'error': False, 'errorText': ''})
+        return jsonify({
+            'data': {'items': [item for item in items if 'vendorCodes' in item], 'cursor': {'next': False}},
+            'error': False, 'errorText': '',
+        })
+
+    @app.route('/content/v3/media/save', methods=['POST'])
+    def media_save():
+        body = request.get_json(silent=True) or {}
+        with state.lock:
+            card = state.cards.get(body.get('nmId'))
+            if card is None:
+                return error(400, 'card not found')
+            card['photos'] = [{'big': url} for url in body.get('data') or []]
+            state.touch_card(card)
+        return jsonify({'data': None, 'error': False, 'errorText': '', 'additionalErrors': None})
+
+    @app.route('/content/v3/media/file', methods=['POST'])
+    def media_file():
+        return jsonify({'data': None, 'error': False, 'errorText': '', 'additionalErrors': None})
+
+    @app.route('/content/v2/object/all', methods=['GET'])
+    def subjects():
+        name = (request.args.get('name') or '').lower()
+        limit = request.args.get('limit', 1000, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        items = [s for s in state.dataset.subjects if name in (s.get('subjectName') or '').lower()]
+        return jsonify({'data': items[offset:offset + limit], 'error': False, 'errorText': ''})
+
+    @app.route('/content/v2/object/parent/all', methods=['GET'])
+    def parents():
+        return jsonify({'data': state.dataset.parents, 'error': False, 'errorText': ''})
+
+    @app.route('/content/v2/object/charcs/<int:subject_id>', methods=['GET'])
+    def charcs(subject_id):
+        return jsonify({'data': state.dataset.charcs.get(subject_id, []), 'error': False, 'errorText': ''})
+
+    @app.route('/content/v2/directory/<name>', methods=['GET'])
+    def directory(name):
+        if name not in state.dataset.directories:
+            return error(404, 'not found')
+        return jsonify({'data': state.dataset.directories[name], 'error': False, 'errorText': ''})
+
+    @app.route('/api/content/v1/brands', methods=['GET'])
+    def brands():
+        pattern = (request.args.get('pattern') or '').lower()
+        top = request.args.get('top', 100, type=int)
+        found = [b for b in state.dataset.brands if pattern in (b.get('name') or '').lower()]
+        return jsonify({'brands': found[:top], 'next': 0, 'total': len(found)})
+
+    # ------------------------------------------------------------------
+    # Prices API
+    # ------------------------------------------------------------------
+
+    @app.route('/api/v2/list/goods/filter', methods=['GET'])
+    def goods_filter():
+        limit = max(0, min(request.args.get('limit', 1000, type=int), config.prices_page_limit))
+        offset = request.args.get('offset', 0, type=int)
+        nm_filter = request.args.get('filterNmID', type=int)
+        with state.lock:
+            if nm_filter:
+                goods = [state.prices[nm_filter]] if nm_filter in state.prices else []
+            else:
+                goods = [state.prices[nm_id] for nm_id in state.price_order[offset:offset + limit]]
+            goods = json.loads(json.dumps(goods))
+        return jsonify({'data': {'listGoods': goods}, 'error': False, 'errorText': ''})
+
+    @app.route('/api/v2/upload/task', methods=['POST'])
+    def upload_task():
+        goods = (request.get_json(silent=True) or {}).get('data')
+        if not isinstance(goods, list) or not goods:
+            return jsonify({'data': None, 'error': True, 'errorText': 'Invalid request body'}), 400
+        if len(goods) > 1000:
+            return jsonify({'data': None, 'error': True, 'errorText': 'Too many goods'}), 400
+        with state.lock:
+            upload_id = state.create_upload(goods)
+        return jsonify({'data': {'id': upload_id, 'alreadyExists': False}, 'error': False, 'errorText': ''})
+
+    def _upload_summary(upload: Dict[str, Any]) -> Dict[str, Any]:
+        total = len(upload['goods'])
+        return {
+            'uploadID': upload['id'],
+            'status': upload['status'] or 1,
+            'uploadDate': _wb_time(datetime.utcfromtimestamp(upload['uploaded_at'])),
+            'activationDate': _wb_time(datetime.utcfromtimestamp(upload['uploaded_at'])),
+            'overAllGoodsNumber': total,
+            'successGoodsNumber': total - len(upload['errors']),
+        }
+
+    @app.route('/api/v2/history/tasks', methods=['GET'])
+    def history_tasks():
+        with state.lock:
+            upload = state.uploads.get(request.args.get('uploadID', type=int))
+            if upload is None or upload['status'] is None:
+                return jsonify({'data': None, 'error': False, 'errorText': ''})
+            return jsonify({'data': _upload_summary(upload), 'error': False, 'errorText': ''})
+
+    @app.route('/api/v2/buffer/tasks', methods=['GET'])
+    def buffer_tasks():
+        with state.lock:
+            upload = state.uploads.get(request.args.get('uploadID', type=int))
+            if upload is None or upload['status'] is not None:
+                return jsonify({'data': None, 'error': False, 'errorText': ''})
+            return jsonify({'data': _upload_summary(upload), 'error': False, 'errorText': ''})
+
+    @app.route('/api/v2/history/goods/task', methods=['GET'])
+    def history_goods():
+        limit = request.args.get('limit', 1000, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        with state.lock:
+            upload = state.uploads.get(request.args.get('uploadID', type=int))
+            if upload is None or upload['status'] is None:
+                return jsonify({'data': None, 'error': False, 'errorText': ''})
+            goods = []
+            for good in upload['goods'][offset:offset + limit]:
+                error_text = upload['errors'].get(good.get('nmID'))
+                goods.append({
+                    'nmID': good.get('nmID'), 'price': good.get('price'), 'discount': good.get('discount'),
+                    'status': 3 if error_text else 2, 'errorText': error_text or '',
+                })
+        return jsonify({'data': {'uploadID': upload['id'], 'historyGoods': goods}, 'error': False, 'errorText': ''})
+
+    # ------------------------------------------------------------------
+    # Statistics API
+    # ------------------------------------------------------------------
+
+    def _statistics_rows(rows: List[Dict[str, Any]]):
+        date_from = _parse_date_param(request.args.get('dateFrom'))
+        selected = [r for r in rows if str(r.get('lastChangeDate') or '')[:19] >= date_from]
+        selected.sort(key=lambda r: str(r.get('lastChangeDate') or ''))
+        return jsonify(selected[:config.statistics_page_limit])
+
+    @app.route('/api/v1/supplier/stocks', methods=['GET'])
+    def supplier_stocks():
+        return _statistics_rows(state.dataset.stocks)
+
+    @app.route('/api/v1/supplier/orders', methods=['GET'])
+    def supplier_orders():
+        return _statistics_rows(state.dataset.orders)
+
+    @app.route('/api/v1/supplier/sales', methods=['GET'])
+    def supplier_sales():
+        return _statistics_rows(state.dataset.sales)
+
+    @app.route('/api/v5/supplier/reportDetailByPeriod', methods=['GET'])
+    def report_detail():
+        limit = max(1, min(request.args.get('limit', 100000, type=int), config.statistics_page_limit))
+        rrd_id = request.args.get('rrdid', 0, type=int)
+        start = bisect.bisect_right(state.rrd_ids, rrd_id)
+        page = state.realization[start:start + limit]
+        if not page:
+            return Response(status=204)
+        return jsonify(page)
+
+    @app.route('/ping', methods=['GET'])
+    def ping():
+        return jsonify({'TS': _wb_time(datetime.utcnow()), 'Status': 'OK'})
+
+    return app
+
+
+class FakeWBServer:
+    """
+    Стенд WB API в фоновом потоке текущего процесса
+
+    Пример:
+        with FakeWBServer(FakeWBDataset.generate(cards=100)) as server:
+            client = WildberriesAPIClient('key', base_url=server.url)
+    """
+
+    def __init__(self, dataset: Optional[FakeWBDataset] = None, config: Optional[FakeWBConfig] = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            dataset: Данные (по умолчанию — сгенерированный каталог из 1000 карточек)
+            config: Поведение стенда
+            host: Адрес
+            port: Порт (0 — свободный)
+        """
+        self.config = config or FakeWBConfig()
+        self.dataset = dataset or FakeWBDataset.generate(seed=self.config.seed)
+        self.state = FakeWBState(self.dataset, self.config)
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Базовый URL для WildberriesAPIClient(base_url=...) / WB_API_BASE_URL"""
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> 'FakeWBServer':
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietRequestHandler(WSGIRequestHandler):
+            # Журнал каждого запроса заглушил бы вывод замера; счётчики — в get_stats()
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._server = make_server(self.host, self.port, create_fake_wb_app(self.state), threaded=True,
+                                   request_handler=QuietRequestHandler)
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name='wb-fake-server', daemon=True)
+        self._thread.start()
+        logger.info(f"🧪 Fake WB API server started at {self.url} ({len(self.state.cards)} cards)")
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join(timeout=5)
+            self._server = None
+            logger.info("🧪 Fake WB API server stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Запросы по эндпоинтам и число ответов 429"""
+        with self.state.lock:
+            endpoints = {name: dict(counter) for name, counter in sorted(self.state.stats.items())}
+            return {
+                'requests': self.state.requests,
+                'throttled': sum(int(c['throttled']) for c in endpoints.values()),
+                'endpoints': endpoints,
+                'cards': len(self.state.cards),
+                'price_uploads': len(self.state.uploads),
+            }
+
+    def __enter__(self) -> 'FakeWBServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Локальный стенд WB API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fixtures', help='Каталог с записанными ответами (scripts/record_wb_fixtures.py)')
+    parser.add_argument('--cards', type=int, default=1000, help='Карточек в сгенерированном каталоге')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, сек')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Случайная добавка к задержке, сек')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='429 на каждый N-й запрос')
+    parser.add_argument('--rate-limit-probability', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--rate-limit-retry', type=float, default=1.0, help='X-Ratelimit-Retry, сек')
+    parser.add_argument('--cards-page-limit', type=int, default=100)
+    parser.add_argument('--prices-page-limit', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    config = FakeWBConfig(
+        latency=args.latency, latency_jitter=args.jitter, rate_limit_every=args.rate_limit_every,
+        rate_limit_probability=args.rate_limit_probability, rate_limit_retry=args.rate_limit_retry,
+        cards_page_limit=args.cards_page_limit, prices_page_limit=args.prices_page_limit, seed=args.seed,
+    )
+    dataset = FakeWBDataset.load(args.fixtures) if args.fixtures else FakeWBDataset.generate(args.cards, args.seed)
+    server = FakeWBServer(dataset, config, host=args.host, port=args.port).start()
+    print(f"WB_API_BASE_URL={server.url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ from datetime import datetime
 
 from models import db, ImportedProduct, Product, Seller, PricingSettings, Marketplace, MarketplaceDirectory
 from services.wb_api_client import WildberriesAPIClient
+from services import wb_reference_cache
 from services.prohibited_words_filter import filter_prohibited_words
 from services.pricing_engine import calculate_price
 
@@ -71,6 +72,7 @@ class WBProductImporter:
     def __init__(self, seller: Seller):
         self.seller = seller
         self.api_client = WildberriesAPIClient(seller.wb_api_key) if seller.wb_api_key else None
+        self._wb_directories: Optional[Dict[str, list]] = None
 
     def import_product_to_wb(self, imported_product: ImportedProduct) -> Tuple[bool, Optional[str], Optional[Product]]:
         """
@@ -685,7 +687,7 @@ class WBProductImporter:
 
         # 2. Проверяем Product записи (sizes_json содержит skus)
         try:
-            products = Product.query.filter(
+            products = Product.query.with_entities(Product.nm_id, Product.sizes_json).filter(
                 Product.seller_id == self.seller.id,
                 Product.sizes_json.isnot(None),
             ).all()
@@ -823,8 +825,7 @@ class WBProductImporter:
             return False
 
         try:
-            chars_config = self.api_client.get_card_characteristics_config(wb_subject_id)
-            wb_chars = chars_config.get('data', [])
+            wb_chars = wb_reference_cache.get_characteristics_config(self.api_client, wb_subject_id)
 
             for char in wb_chars:
                 char_name = (char.get('name') or '').lower()
@@ -1391,8 +1392,11 @@ class WBProductImporter:
 
         # Получаем конфигурацию характеристик WB для данного предмета
         try:
-            chars_config = self.api_client.get_card_characteristics_config(imported_product.wb_subject_id)
-            wb_chars_list = chars_config.get('data', [])
+            # Копии записей: ниже в них подставляются справочники, а конфигурация общая (кэш)
+            wb_chars_list = [
+                dict(char) for char in
+                wb_reference_cache.get_characteristics_config(self.api_client, imported_product.wb_subject_id)
+            ]
         except Exception as e:
             logger.error(f"Не удалось получить конфигурацию характеристик: {e}")
             return []
@@ -1401,9 +1405,6 @@ class WBProductImporter:
             logger.warning(f"Пустая конфигурация характеристик для subject_id={imported_product.wb_subject_id}")
             return []
 
-        # Загружаем справочники WB из БД для характеристик с пустым dictionary
-        wb_directories = self._load_wb_directories()
-
         # Создаём словарь: name -> {id, type, dictionary, ...}
         wb_chars_by_name = {}
         for char in wb_chars_list:
@@ -1412,8 +1413,8 @@ class WBProductImporter:
                 # Если dictionary пуст — подставляем из справочника
                 if not char.get('dictionary'):
                     dir_type = self._get_directory_type_for_char(char_name)
-                    if dir_type and dir_type in wb_directories:
-                        dir_data = wb_directories[dir_type]
+                    dir_data = self._get_wb_directory(dir_type) if dir_type else None
+                    if dir_data:
                         # Преобразуем в формат dictionary: [{value: "..."}]
                         dict_items = []
                         for entry in dir_data:
@@ -1768,12 +1769,16 @@ class WBProductImporter:
     def _load_wb_directories(self) -> Dict[str, list]:
         """
         Загружает справочники WB из БД (MarketplaceDirectory).
-        Возвращает dict: directory_type -> list of entries.
+        Возвращает dict: directory_type -> list of entries (читается один раз на импортёр).
         """
+        if self._wb_directories is not None:
+            return self._wb_directories
+
         directories = {}
         try:
             marketplace = Marketplace.query.filter_by(code='wb').first()
             if not marketplace:
+                self._wb_directories = directories
                 return directories
             for md in MarketplaceDirectory.query.filter_by(marketplace_id=marketplace.id).all():
                 try:
@@ -1783,8 +1788,26 @@ class WBProductImporter:
                     pass
         except Exception as e:
             logger.warning(f"Не удалось загрузить справочники из БД: {e}")
+        self._wb_directories = directories
         return directories
 
+    def _get_wb_directory(self, directory_type: str) -> list:
+        """
+        Справочник WB: из БД, а если его там нет — из кэша справочников WB
+        (при первом обращении загружается из WB API и сохраняется на диск).
+        """
+        directories = self._load_wb_directories()
+        if directories.get(directory_type):
+            return directories[directory_type]
+        if not self.api_client or directory_type not in wb_reference_cache.WB_DIRECTORY_TYPES:
+            return []
+        try:
+            directories[directory_type] = wb_reference_cache.get_directory(self.api_client, directory_type)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить справочник WB '{directory_type}': {e}")
+            directories[directory_type] = []
+        return directories[directory_type]
+
     @staticmethod
     def _get_directory_type_for_char(char_name: str) -> Optional[str]:
         """Определяет тип справочника по названию характеристики."""
@@ -2541,12 +2564,15 @@ class WBProductImporter:
             f"{effective_workers} параллельных потоков"
         )
 
+        # Контекст приложения в потоки пула не передаётся — берём приложение здесь
+        from flask import current_app
+        app = current_app._get_current_object()
+
         def _import_one(product):
-            """Импорт одного товара (выполняется в потоке)."""
-            from flask import current_app
-            app = current_app._get_current_object()
+            """Импорт одного товара (выполняется в потоке, в своей сессии БД)."""
             with app.app_context():
                 try:
+                    product = db.session.get(ImportedProduct, product.id)
                     success, error, result_product = self.import_product_to_wb(product)
                     with stats_lock:
                         if success:
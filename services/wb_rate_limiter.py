@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Общий rate limiter для WB API (token bucket)
+
+Лимиты WB считаются на аккаунт продавца (API ключ) и отличаются по категориям
+API: контент, цены, статистика, аналитика, маркетплейс. Поэтому бюджет запросов
+ведётся в разрезе (api_key, bucket), а не на экземпляр клиента — синхронизация,
+мониторинг цен, загрузка брендов и импорт в разных потоках и gunicorn-воркерах
+расходуют один и тот же бюджет.
+
+Состояние бакетов хранится в небольшой SQLite-базе (WB_RATE_LIMIT_DB), которую
+видят все процессы. Если файл недоступен — используется бакет в памяти процесса.
+
+Алгоритм — token bucket с резервированием: запрос сразу списывает токен
+(баланс может уйти в минус), а вызывающий спит ровно столько, сколько нужно
+для погашения долга. Блокировка на время сна не держится.
+
+Если WB всё же ответил 429, пауза из заголовков ответа передаётся в penalize():
+баланс бакета уводится в минус так, чтобы следующий запрос любого потока или
+воркера с этим ключом дождался момента, названного WB.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger('wb_api')
+
+
+# ============================================================================
+# КОНФИГУРАЦИЯ
+# ============================================================================
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Файл с состоянием бакетов (общий для всех воркеров)
+WB_RATE_LIMIT_DB = os.environ.get(
+    'WB_RATE_LIMIT_DB',
+    os.path.join(_PROJECT_ROOT, 'data', 'wb_rate_limits.db')
+)
+
+
+class RateLimitRule(NamedTuple):
+    """Лимит WB: запросов в минуту и размер всплеска (burst)"""
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        """Скорость пополнения бакета (токенов в секунду)"""
+        return self.per_minute / 60.0
+
+
+# Лимиты по категориям API (см. docs/api_specs, таблицы «Лимит запросов»)
+WB_RATE_LIMITS: Dict[str, RateLimitRule] = {
+    'content': RateLimitRule(per_minute=100, burst=5),
+    'content_write': RateLimitRule(per_minute=10, burst=5),
+    'discounts': RateLimitRule(per_minute=100, burst=5),
+    'marketplace': RateLimitRule(per_minute=300, burst=20),
+    'statistics': RateLimitRule(per_minute=1, burst=1),
+    'analytics': RateLimitRule(per_minute=3, burst=3),
+}
+
+# Для этих категорий лимит считается на каждый метод отдельно
+PER_ENDPOINT_BUCKETS = {'statistics', 'analytics'}
+
+# Методы контента с отдельным (более жёстким) лимитом
+CONTENT_WRITE_ENDPOINTS = (
+    '/content/v2/cards/upload',
+    '/content/v2/cards/update',
+)
+
+
+def resolve_bucket(api_type: str, endpoint: str = '') -> Tuple[str, RateLimitRule]:
+    """
+    Определить бакет и лимит для запроса
+
+    Args:
+        api_type: Тип API (content, statistics, marketplace, discounts, analytics)
+        endpoint: Эндпоинт запроса
+
+    Returns:
+        (имя бакета, правило лимита)
+    """
+    if api_type == 'content' and endpoint.startswith(CONTENT_WRITE_ENDPOINTS):
+        return 'content_write', WB_RATE_LIMITS['content_write']
+
+    rule = WB_RATE_LIMITS.get(api_type, WB_RATE_LIMITS['content'])
+    if api_type in PER_ENDPOINT_BUCKETS and endpoint:
+        return f"{api_type}:{endpoint}", rule
+    return api_type, rule
+
+
+def _key_fingerprint(api_key: str) -> str:
+    """Короткий отпечаток API ключа (сам ключ на диск не пишем)"""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+
+# ============================================================================
+# SHARED RATE LIMITER
+# ============================================================================
+
+class SharedRateLimiter:
+    """
+    Token bucket лимитер, общий для всех клиентов WB API процесса и воркеров
+
+    Потокобезопасен; межпроцессная синхронизация — через транзакции SQLite
+    (BEGIN IMMEDIATE). Статистика ожиданий ведётся в памяти процесса.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, db_path: Optional[str] = None):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, db_path: Optional[str] = None):
+        if self._initialized:
+            return
+
+        self.db_path = db_path or WB_RATE_LIMIT_DB
+        self._local = threading.local()
+        self._memory_lock = threading.Lock()
+        self._memory_buckets: Dict[str, Tuple[float, float]] = {}
+        self._use_sqlite = True
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = self._get_connection()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_buckets ('
+                ' bucket_key TEXT PRIMARY KEY,'
+                ' tokens REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+        except Exception as e:
+            logger.warning(f"Shared rate limiter DB unavailable ({e}), falling back to in-process buckets")
+            self._use_sqlite = False
+
+        self._initialized = True
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """SQLite соединение для текущего потока (пересоздаётся после fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _refill(tokens: float, updated_at: float, now: float, rule: RateLimitRule) -> float:
+        """Пополнить бакет за прошедшее время (не выше burst)"""
+        elapsed = max(0.0, now - updated_at)
+        return min(float(rule.burst), tokens + elapsed * rule.rate)
+
+    def _reserve_sqlite(self, key: str, rule: RateLimitRule, tokens_needed: float) -> float:
+        conn = self._get_connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?', (key,)
+            ).fetchone()
+            tokens = float(rule.burst) if row is None else self._refill(row[0], row[1], now, rule)
+            tokens -= tokens_needed
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return max(0.0, -tokens / rule.rate)
+
+    def _reserve_memory(self, key: str, rule: RateLimitRule, tokens_needed: float) -> float:
+        with self._memory_lock:
+            now = time.time()
+            state = self._memory_buckets.get(key)
+            tokens = float(rule.burst) if state is None else self._refill(state[0], state[1], now, rule)
+            tokens -= tokens_needed
+            self._memory_buckets[key] = (tokens, now)
+        return max(0.0, -tokens / rule.rate)
+
+    def reserve(self, api_key: str, api_type: str, endpoint: str = '', tokens: float = 1.0) -> float:
+        """
+        Зарезервировать токен(ы) без ожидания
+
+        Args:
+            api_key: API ключ продавца
+            api_type: Тип API
+            endpoint: Эндпоинт запроса
+            tokens: Сколько токенов списать
+
+        Returns:
+            Сколько секунд нужно подождать перед запросом (0 — можно сразу)
+        """
+        bucket, rule = resolve_bucket(api_type, endpoint)
+        key = f"{_key_fingerprint(api_key)}:{bucket}"
+
+        if self._use_sqlite:
+            try:
+                delay = self._reserve_sqlite(key, rule, tokens)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared rate limiter DB error ({e}), using in-process bucket")
+                delay = self._reserve_memory(key, rule, tokens)
+        else:
+            delay = self._reserve_memory(key, rule, tokens)
+
+        self._record(bucket, delay)
+        return delay
+
+    def _penalize_sqlite(self, key: str, rule: RateLimitRule, floor: float) -> None:
+        conn = self._get_connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?', (key,)
+            ).fetchone()
+            tokens = float(rule.burst) if row is None else self._refill(row[0], row[1], now, rule)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, min(tokens, floor), now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _penalize_memory(self, key: str, rule: RateLimitRule, floor: float) -> None:
+        with self._memory_lock:
+            now = time.time()
+            state = self._memory_buckets.get(key)
+            tokens = float(rule.burst) if state is None else self._refill(state[0], state[1], now, rule)
+            self._memory_buckets[key] = (min(tokens, floor), now)
+
+    def penalize(self, api_key: str, api_type: str, endpoint: str, retry_after: float) -> None:
+        """
+        Учесть ответ 429: следующий запрос бакета не раньше чем через retry_after
+
+        Args:
+            api_key: API ключ продавца
+            api_type: Тип API
+            endpoint: Эндпоинт запроса
+            retry_after: Пауза из заголовков ответа WB (секунды)
+        """
+        bucket, rule = resolve_bucket(api_type, endpoint)
+        key = f"{_key_fingerprint(api_key)}:{bucket}"
+        # Следующий reserve() спишет токен и получит задержку ровно retry_after
+        floor = 1.0 - max(0.0, retry_after) * rule.rate
+
+        if self._use_sqlite:
+            try:
+                self._penalize_sqlite(key, rule, floor)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared rate limiter DB error ({e}), using in-process bucket")
+                self._penalize_memory(key, rule, floor)
+        else:
+            self._penalize_memory(key, rule, floor)
+
+        with self._stats_lock:
+            stats = self._stats.setdefault(bucket, {'requests': 0, 'throttled': 0, 'wait_seconds': 0.0})
+            stats['penalties'] = stats.get('penalties', 0) + 1
+        logger.info(f"WB rate limit ({api_type} {endpoint}): next request in {retry_after:.1f}s")
+
+    def acquire(self, api_key: str, api_type: str, endpoint: str = '', tokens: float = 1.0) -> float:
+        """
+        Дождаться разрешения на запрос
+
+        Returns:
+            Сколько секунд пришлось ждать
+        """
+        delay = self.reserve(api_key, api_type, endpoint, tokens)
+        if delay > 0:
+            if delay >= 1:
+                logger.info(f"WB rate limit ({api_type} {endpoint}): waiting {delay:.2f}s")
+            time.sleep(delay)
+        return delay
+
+    def _record(self, bucket: str, delay: float) -> None:
+        """Учесть запрос в статистике процесса"""
+        with self._stats_lock:
+            stats = self._stats.setdefault(bucket, {'requests': 0, 'throttled': 0, 'wait_seconds': 0.0})
+            stats['requests'] += 1
+            if delay > 0:
+                stats['throttled'] += 1
+                stats['wait_seconds'] += delay
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Статистика ожиданий по бакетам (в рамках процесса)"""
+        with self._stats_lock:
+            return {bucket: dict(stats) for bucket, stats in self._stats.items()}
+
+
+def get_shared_rate_limiter() -> SharedRateLimiter:
+    """Получить общий rate limiter WB API"""
+    return SharedRateLimiter()
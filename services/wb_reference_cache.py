@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+Постоянный кэш справочников WB (цвета, страны, пол, сезоны, НДС, ТНВЭД,
+родительские категории, предметы и конфигурации характеристик предметов)
+
+Справочники меняются редко, но раньше загружались заново после каждого
+перезапуска и в каждом процессе. Теперь они хранятся в SQLite-файле
+(WB_REFERENCE_CACHE_DB), общем для всех gunicorn-воркеров и контейнеров
+с общим томом data/:
+
+- у каждой записи есть версия — она растёт, только когда содержимое
+  справочника изменилось; процесс держит разобранную копию в памяти
+  и перечитывает её с диска только при смене версии;
+- запись старше WB_REFERENCE_CACHE_TTL отдаётся сразу, а обновляется
+  в фоне (один поток на справочник);
+- при отсутствии записи справочник загружается синхронно;
+- warmup() заполняет кэш заранее (команда `flask warmup-wb-reference`
+  и ежечасная задача планировщика).
+
+Справочники не зависят от продавца, поэтому ключ — только имя справочника.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger('wb_api')
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Файл кэша справочников (общий для всех воркеров)
+WB_REFERENCE_CACHE_DB = os.environ.get(
+    'WB_REFERENCE_CACHE_DB',
+    os.path.join(_PROJECT_ROOT, 'data', 'wb_reference_cache.db')
+)
+
+# Через сколько секунд справочник обновляется в фоне
+WB_REFERENCE_CACHE_TTL = int(os.environ.get('WB_REFERENCE_CACHE_TTL', str(24 * 3600)))
+
+# Версия формата записей: при изменении формата старые записи игнорируются
+REFERENCE_FORMAT_VERSION = 1
+
+# Справочники Content API (get_directory_<type>)
+WB_DIRECTORY_TYPES = ('colors', 'countries', 'kinds', 'seasons', 'vat', 'tnved')
+
+
+class ReferenceEntry(NamedTuple):
+    """Запись кэша справочников"""
+    data: Any
+    version: int
+    fetched_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+def _checksum(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+class WBReferenceCache:
+    """
+    Кэш справочников WB на диске
+
+    Пример:
+        colors = get_wb_reference_cache().get(
+            'directory:colors:ru',
+            fetch=lambda: client.get_directory_colors().get('data', [])
+        )
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, db_path: Optional[str] = None, ttl: Optional[int] = None):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[int] = None):
+        if self._initialized:
+            return
+
+        self.db_path = db_path or WB_REFERENCE_CACHE_DB
+        self.ttl = WB_REFERENCE_CACHE_TTL if ttl is None else ttl
+        self._local = threading.local()
+        self._memory: Dict[str, ReferenceEntry] = {}
+        self._memory_lock = threading.Lock()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._refreshing: set = set()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'refreshes': 0, 'refresh_errors': 0}
+        self._use_sqlite = True
+
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._get_connection().execute(
+                'CREATE TABLE IF NOT EXISTS wb_reference ('
+                ' name TEXT PRIMARY KEY,'
+                ' format_version INTEGER NOT NULL,'
+                ' version INTEGER NOT NULL,'
+                ' checksum TEXT NOT NULL,'
+                ' fetched_at REAL NOT NULL,'
+                ' data BLOB NOT NULL)'
+            )
+        except Exception as e:
+            logger.warning(f"WB reference cache DB unavailable ({e}), keeping directories in memory only")
+            self._use_sqlite = False
+
+        self._initialized = True
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """SQLite соединение для текущего потока (пересоздаётся после fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # ------------------------------------------------------------------
+    # Хранение
+    # ------------------------------------------------------------------
+
+    def _read(self, name: str) -> Optional[ReferenceEntry]:
+        with self._memory_lock:
+            cached = self._memory.get(name)
+        if not self._use_sqlite:
+            return cached
+
+        try:
+            conn = self._get_connection()
+            row = conn.execute(
+                'SELECT version, fetched_at FROM wb_reference WHERE name = ? AND format_version = ?',
+                (name, REFERENCE_FORMAT_VERSION)
+            ).fetchone()
+            if row is None:
+                return cached
+            version, fetched_at = row
+            if cached is not None and cached.version == version:
+                # Содержимое не менялось — берём разобранную копию из памяти
+                if cached.fetched_at != fetched_at:
+                    cached = cached._replace(fetched_at=fetched_at)
+                    self._remember(name, cached)
+                return cached
+
+            blob = conn.execute('SELECT data FROM wb_reference WHERE name = ?', (name,)).fetchone()[0]
+            entry = ReferenceEntry(json.loads(gzip.decompress(blob).decode('utf-8')), version, fetched_at)
+        except (sqlite3.Error, OSError, ValueError, TypeError) as e:
+            logger.warning(f"WB reference cache read failed for {name}: {e}")
+            return cached
+
+        self._remember(name, entry)
+        return entry
+
+    def _remember(self, name: str, entry: ReferenceEntry) -> None:
+        with self._memory_lock:
+            self._memory[name] = entry
+
+    def put(self, name: str, data: Any) -> ReferenceEntry:
+        """
+        Сохранить справочник (версия растёт только при изменении содержимого)
+
+        Args:
+            name: Имя справочника, например 'directory:colors:ru'
+            data: Данные справочника (JSON-совместимые)
+
+        Returns:
+            ReferenceEntry
+        """
+        payload = json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        checksum = _checksum(payload)
+        now = time.time()
+
+        with self._memory_lock:
+            previous = self._memory.get(name)
+        version = 1 if previous is None else previous.version + 1
+
+        if self._use_sqlite:
+            try:
+                conn = self._get_connection()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute(
+                        'SELECT version, checksum, format_version FROM wb_reference WHERE name = ?', (name,)
+                    ).fetchone()
+                    if row is not None and row[1] == checksum and row[2] == REFERENCE_FORMAT_VERSION:
+                        version = row[0]
+                        conn.execute('UPDATE wb_reference SET fetched_at = ? WHERE name = ?', (now, name))
+                    else:
+                        version = (row[0] + 1) if row is not None else 1
+                        conn.execute(
+                            'INSERT OR REPLACE INTO wb_reference '
+                            '(name, format_version, version, checksum, fetched_at, data) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (name, REFERENCE_FORMAT_VERSION, version, checksum, now, gzip.compress(payload))
+                        )
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                logger.warning(f"WB reference cache write failed for {name}: {e}")
+
+        entry = ReferenceEntry(data, version, now)
+        self._remember(name, entry)
+        return entry
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Удалить справочник (или все справочники) из кэша"""
+        with self._memory_lock:
+            if name:
+                self._memory.pop(name, None)
+            else:
+                self._memory.clear()
+        if self._use_sqlite:
+            try:
+                conn = self._get_connection()
+                if name:
+                    conn.execute('DELETE FROM wb_reference WHERE name = ?', (name,))
+                else:
+                    conn.execute('DELETE FROM wb_reference')
+            except sqlite3.Error as e:
+                logger.warning(f"WB reference cache invalidate failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Чтение с обновлением
+    # ------------------------------------------------------------------
+
+    def get(self, name: str, fetch: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Справочник из кэша; устаревший обновляется в фоне, отсутствующий — загружается
+
+        Args:
+            name: Имя справочника
+            fetch: Загрузка справочника из WB API
+            ttl: Возраст, после которого справочник обновляется (по умолчанию WB_REFERENCE_CACHE_TTL)
+
+        Returns:
+            Данные справочника
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._read(name)
+        if entry is None:
+            self._count('misses')
+            return self.refresh(name, fetch, only_if_missing=True).data
+
+        self._count('hits')
+        if entry.age_seconds > ttl:
+            self._count('stale')
+            self._refresh_in_background(name, fetch)
+        return entry.data
+
+    def refresh(self, name: str, fetch: Callable[[], Any], only_if_missing: bool = False) -> ReferenceEntry:
+        """
+        Загрузить справочник из WB и сохранить
+
+        Одновременные обновления одного справочника в процессе выполняют одну загрузку.
+
+        Args:
+            name: Имя справочника
+            fetch: Загрузка справочника из WB API
+            only_if_missing: Не загружать, если справочник появился, пока ждали блокировку
+        """
+        with self._memory_lock:
+            fetch_lock = self._fetch_locks.setdefault(name, threading.Lock())
+        with fetch_lock:
+            if only_if_missing:
+                entry = self._read(name)
+                if entry is not None:
+                    return entry
+            data = fetch()
+            entry = self.put(name, data)
+            self._count('refreshes')
+            logger.info(f"📚 WB reference {name} refreshed (version {entry.version})")
+            return entry
+
+    def _refresh_in_background(self, name: str, fetch: Callable[[], Any]) -> None:
+        with self._memory_lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+
+        def run():
+            try:
+                self.refresh(name, fetch)
+            except Exception as e:
+                self._count('refresh_errors')
+                logger.warning(f"⚠️ Background refresh of WB reference {name} failed: {e}")
+            finally:
+                with self._memory_lock:
+                    self._refreshing.discard(name)
+
+        threading.Thread(target=run, daemon=True, name=f"wb-reference-refresh:{name}").start()
+
+    def _count(self, name: str) -> None:
+        with self._memory_lock:
+            self._stats[name] += 1
+
+    # ------------------------------------------------------------------
+    # Статус
+    # ------------------------------------------------------------------
+
+    def get_info(self) -> List[Dict[str, Any]]:
+        """Справочники в кэше: версия, возраст, свежесть"""
+        if self._use_sqlite:
+            try:
+                rows = self._get_connection().execute(
+                    'SELECT name, version, fetched_at, length(data) FROM wb_reference '
+                    'WHERE format_version = ? ORDER BY name', (REFERENCE_FORMAT_VERSION,)
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"WB reference cache info failed: {e}")
+                rows = []
+        else:
+            with self._memory_lock:
+                rows = [(name, e.version, e.fetched_at, None) for name, e in sorted(self._memory.items())]
+
+        now = time.time()
+        return [{
+            'name': name,
+            'version': version,
+            'fetched_at': fetched_at,
+            'age_seconds': round(now - fetched_at, 1),
+            'fresh': now - fetched_at <= self.ttl,
+            'compressed_bytes': size,
+        } for name, version, fetched_at, size in rows]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._memory_lock:
+            return dict(self._stats)
+
+
+def get_wb_reference_cache() -> WBReferenceCache:
+    """Получить кэш справочников WB"""
+    return WBReferenceCache()
+
+
+# ============================================================================
+# СПРАВОЧНИКИ WB
+# ============================================================================
+
+def directory_name(directory_type: str, locale: str = 'ru') -> str:
+    return f"directory:{directory_type}:{locale}"
+
+
+def get_directory(client, directory_type: str, locale: str = 'ru') -> List[Any]:
+    """
+    Справочник Content API (colors, countries, kinds, seasons, vat, tnved)
+
+    Args:
+        client: WildberriesAPIClient (используется только при загрузке из WB)
+        directory_type: Тип справочника из WB_DIRECTORY_TYPES
+        locale: Язык
+
+    Returns:
+        Записи справочника (поле data ответа WB)
+    """
+    if directory_type not in WB_DIRECTORY_TYPES:
+        raise ValueError(f"Unknown WB directory: {directory_type}")
+    method = getattr(client, f'get_directory_{directory_type}')
+    return get_wb_reference_cache().get(
+        directory_name(directory_type, locale),
+        fetch=lambda: method(locale=locale).get('data', [])
+    )
+
+
+def get_parent_categories(client, locale: str = 'ru') -> List[Dict[str, Any]]:
+    """Родительские категории WB"""
+    return get_wb_reference_cache().get(
+        f"parent_categories:{locale}",
+        fetch=lambda: client.get_parent_categories(locale=locale).get('data', [])
+    )
+
+
+def _fetch_all_subjects(client) -> List[Dict[str, Any]]:
+    subjects: List[Dict[str, Any]] = []
+    offset, limit = 0, 1000
+    while True:
+        page = client.get_subjects_list(limit=limit, offset=offset).get('data') or []
+        subjects.extend(page)
+        if len(page) < limit:
+            return subjects
+        offset += limit
+
+
+def get_subjects(client) -> List[Dict[str, Any]]:
+    """Все предметы WB (все страницы /content/v2/object/all)"""
+    return get_wb_reference_cache().get('subjects', fetch=lambda: _fetch_all_subjects(client))
+
+
+def get_characteristics_config(client, subject_id: int) -> List[Dict[str, Any]]:
+    """Конфигурация характеристик предмета (поле data get_card_characteristics_config)"""
+    return get_wb_reference_cache().get(
+        f"charcs:{subject_id}",
+        fetch=lambda: client.get_card_characteristics_config(subject_id).get('data', [])
+    )
+
+
+def warmup(client, include_subjects: bool = True, force: bool = False) -> Dict[str, Any]:
+    """
+    Заполнить кэш справочников заранее
+
+    Args:
+        client: WildberriesAPIClient с действующим API ключом
+        include_subjects: Загружать также список предметов
+        force: Обновить и свежие справочники
+
+    Returns:
+        {'refreshed': [...], 'fresh': [...], 'failed': {name: error}}
+    """
+    cache = get_wb_reference_cache()
+    jobs: Dict[str, Callable[[], Any]] = {
+        directory_name(directory_type): (
+            lambda m=getattr(client, f'get_directory_{directory_type}'): m(locale='ru').get('data', [])
+        )
+        for directory_type in WB_DIRECTORY_TYPES
+    }
+    jobs['parent_categories:ru'] = lambda: client.get_parent_categories(locale='ru').get('data', [])
+    if include_subjects:
+        jobs['subjects'] = lambda: _fetch_all_subjects(client)
+
+    summary: Dict[str, Any] = {'refreshed': [], 'fresh': [], 'failed': {}}
+    for name, fetch in jobs.items():
+        entry = cache._read(name)
+        if not force and entry is not None and entry.age_seconds <= cache.ttl:
+            summary['fresh'].append(name)
+            continue
+        try:
+            cache.refresh(name, fetch)
+            summary['refreshed'].append(name)
+        except Exception as e:
+            logger.warning(f"⚠️ WB reference warmup failed for {name}: {e}")
+            summary['failed'][name] = str(e)
+
+    # Конфигурации характеристик, которые уже есть в кэше, обновляем по сроку
+    for info in cache.get_info():
+        name = info['name']
+        if not name.startswith('charcs:') or (info['fresh'] and not force):
+            continue
+        subject_id = int(name.split(':', 1)[1])
+        try:
+            cache.refresh(name, lambda s=subject_id: client.get_card_characteristics_config(s).get('data', []))
+            summary['refreshed'].append(name)
+        except Exception as e:
+            summary['failed'][name] = str(e)
+
+    logger.info(f"📚 WB reference warmup: {len(summary['refreshed'])} refreshed, "
+                f"{len(summary['fresh'])} fresh, {len(summary['failed'])} failed")
+    return summary
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Объединение одинаковых одновременных GET-запросов к WB API (single-flight)
+
+Воркеры AI-парсинга и потоки импорта часто одновременно запрашивают одно и то
+же: характеристики предмета, список предметов, справочник цветов. Первый
+запрос (ведущий) уходит в WB, остальные с тем же ключом (API ключ, эндпоинт,
+параметры) ждут его и получают тот же ответ или ту же ошибку. Лимит запросов
+расходуется один раз.
+
+Коэффициент объединения (coalesced / requests) показывает, какая доля
+запросов обошлась без обращения к WB.
+"""
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger('wb_api')
+
+# Числовые сегменты пути (например, /content/v2/object/charcs/123) — в метриках как {id}
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+class _Flight:
+    """Запрос в процессе выполнения"""
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Эндпоинт для метрик (без идентификаторов в пути)"""
+    return _ID_SEGMENT.sub('/{id}', endpoint)
+
+
+class RequestCoalescer:
+    """
+    Single-flight для запросов процесса
+
+    Пример:
+        response, shared = get_request_coalescer().run(key, lambda: session.get(url), endpoint)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self._stats = {'requests': 0, 'coalesced': 0}
+        self._endpoint_stats: Dict[str, Dict[str, int]] = {}
+        self._initialized = True
+
+    def run(self, key: Hashable, func: Callable[[], Any], endpoint: str = '') -> Tuple[Any, bool]:
+        """
+        Выполнить запрос или дождаться такого же, уже выполняющегося
+
+        Args:
+            key: Ключ запроса (одинаковые запросы — одинаковый ключ)
+            func: Выполнение запроса
+            endpoint: Эндпоинт (для метрик)
+
+        Returns:
+            (результат, True если результат получен от чужого запроса)
+
+        Raises:
+            Исключение ведущего запроса — всем ожидавшим
+        """
+        label = endpoint_label(endpoint)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+            self._count(label, coalesced=not leader)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+            if flight.waiters:
+                logger.debug(f"WB API single-flight: {flight.waiters} callers shared {label}")
+        return flight.result, False
+
+    def _count(self, label: str, coalesced: bool) -> None:
+        stats = self._endpoint_stats.setdefault(label, {'requests': 0, 'coalesced': 0})
+        for target in (self._stats, stats):
+            target['requests'] += 1
+            if coalesced:
+                target['coalesced'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Запросы, объединённые запросы и коэффициент объединения (всего и по эндпоинтам)"""
+        with self._flights_lock:
+            def with_rate(stats):
+                rate = stats['coalesced'] / stats['requests'] if stats['requests'] else None
+                return dict(stats, coalescing_rate=round(rate, 3) if rate is not None else None)
+
+            return {
+                **with_rate(self._stats),
+                'in_flight': len(self._flights),
+                'endpoints': {label: with_rate(stats) for label, stats in self._endpoint_stats.items()},
+            }
+
+
+def get_request_coalescer() -> RequestCoalescer:
+    """Получить single-flight процесса"""
+    return RequestCoalescer()
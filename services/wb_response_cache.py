@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш ответов WB API (TTL + LRU с ограничением по памяти)
+
+Один кэш на процесс для всех клиентов WildberriesAPIClient. Ключ — отпечаток
+API ключа, метод, эндпоинт и параметры запроса, поэтому ответы разных
+продавцов не смешиваются, а клиенты, созданные на время одной операции,
+пользуются ответами друг друга.
+
+- Время жизни задаётся по эндпоинтам (WB_RESPONSE_CACHE_RULES): справочники
+  живут часами, цены — минуту. Эндпоинты, которых нет в таблице, не кэшируются.
+- Чтения через POST (список карточек) кэшируются только по явному
+  use_cache=True — синхронизация и обновление карточек всегда читают WB.
+- Объём ограничен WB_RESPONSE_CACHE_MAX_BYTES / WB_RESPONSE_CACHE_MAX_ENTRIES,
+  при переполнении вытесняются давно не использованные записи.
+- Запись (обновление карточек, загрузка цен, объединение карточек)
+  сбрасывает закэшированные ответы с теми же nmID (WB_CACHE_INVALIDATIONS).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from services.wb_rate_limiter import _key_fingerprint
+
+logger = logging.getLogger('wb_api')
+
+# Ограничения кэша (на процесс)
+WB_RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('WB_RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+WB_RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('WB_RESPONSE_CACHE_MAX_ENTRIES', '2048'))
+
+# Ответы крупнее этой доли лимита не кэшируются (не вытесняют весь кэш)
+_MAX_ENTRY_SHARE = 4
+
+# Оценка накладных расходов на запись (ключ, метаданные)
+_ENTRY_OVERHEAD_BYTES = 512
+
+
+class CacheRule(NamedTuple):
+    """Правило кэширования эндпоинта"""
+    ttl: float  # время жизни ответа, секунды
+    by_nm_id: bool  # помечать запись nmID из запроса/ответа (для инвалидации записью)
+
+
+# GET-эндпоинты (префиксы) и время жизни их ответов
+WB_RESPONSE_CACHE_RULES: Dict[str, CacheRule] = {
+    '/content/v2/object/all': CacheRule(ttl=12 * 3600, by_nm_id=False),
+    '/content/v2/object/parent/all': CacheRule(ttl=12 * 3600, by_nm_id=False),
+    '/content/v2/object/charcs/': CacheRule(ttl=12 * 3600, by_nm_id=False),
+    '/content/v2/directory/': CacheRule(ttl=12 * 3600, by_nm_id=False),
+    '/api/content/v1/brands': CacheRule(ttl=3600, by_nm_id=False),
+    '/api/v2/list/goods/filter': CacheRule(ttl=60, by_nm_id=True),
+}
+
+# Чтения через POST — кэшируются только по явному use_cache=True
+WB_READ_POST_CACHE_RULES: Dict[str, CacheRule] = {
+    '/content/v2/get/cards/list': CacheRule(ttl=300, by_nm_id=True),
+}
+
+# Запись -> эндпоинты, закэшированные ответы которых она делает неактуальными
+WB_CACHE_INVALIDATIONS: Dict[str, Tuple[str, ...]] = {
+    '/content/v2/cards/update': ('/content/v2/get/cards/list',),
+    '/content/v2/cards/moveNm': ('/content/v2/get/cards/list',),
+    '/content/v2/cards/upload': ('/content/v2/get/cards/list',),
+    '/content/v3/media/save': ('/content/v2/get/cards/list',),
+    '/api/v2/upload/task': ('/api/v2/list/goods/filter',),
+    '/public/api/v1/prices': ('/api/v2/list/goods/filter',),
+}
+
+# Поля с nmID в запросах и ответах WB
+_NM_ID_FIELDS = ('nmID', 'nmId', 'filterNmID')
+_NM_ID_LIST_FIELDS = ('nmIDs', 'nmIds')
+
+# Глубина обхода JSON при поиске nmID (карточки лежат на 2-3 уровне)
+_NM_ID_SEARCH_DEPTH = 4
+
+
+def _match_prefix(table: Dict[str, Any], endpoint: str) -> Optional[str]:
+    for prefix in table:
+        if endpoint.startswith(prefix):
+            return prefix
+    return None
+
+
+def resolve_cache_rule(
+    method: str,
+    endpoint: str,
+    use_cache: Optional[bool] = None,
+    ttl_overrides: Optional[Dict[str, float]] = None
+) -> Optional[Tuple[str, CacheRule]]:
+    """
+    Правило кэширования запроса
+
+    Args:
+        method: HTTP метод
+        endpoint: Эндпоинт запроса
+        use_cache: None — по таблице GET-эндпоинтов, True — также чтения через POST,
+            False — не кэшировать
+        ttl_overrides: Время жизни по префиксам эндпоинтов (настройка клиента)
+
+    Returns:
+        (префикс эндпоинта, правило) или None
+    """
+    if use_cache is False:
+        return None
+    method = method.upper()
+    if method == 'GET':
+        table = WB_RESPONSE_CACHE_RULES
+    elif method == 'POST' and use_cache:
+        table = WB_READ_POST_CACHE_RULES
+    else:
+        return None
+
+    prefix = _match_prefix(table, endpoint)
+    if prefix is None:
+        return None
+    rule = table[prefix]
+    if ttl_overrides and prefix in ttl_overrides:
+        rule = rule._replace(ttl=ttl_overrides[prefix])
+    return prefix, rule
+
+
+def extract_nm_ids(payload: Any, depth: int = _NM_ID_SEARCH_DEPTH) -> Set[int]:
+    """
+    nmID, упомянутые в теле запроса/ответа или в параметрах
+
+    Ищет поля nmID/nmId/filterNmID и списки nmIDs; textSearch из цифр
+    (поиск карточки по nmID) тоже считается nmID.
+    """
+    found: Set[int] = set()
+
+    def add(value: Any) -> None:
+        try:
+            found.add(int(value))
+        except (TypeError, ValueError):
+            pass
+
+    def walk(node: Any, level: int) -> None:
+        if level > depth:
+            return
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in _NM_ID_FIELDS:
+                    add(value)
+                elif key in _NM_ID_LIST_FIELDS and isinstance(value, list):
+                    for item in value:
+                        add(item)
+                elif key == 'textSearch' and isinstance(value, str) and value.isdigit():
+                    add(value)
+                elif isinstance(value, (dict, list)):
+                    walk(value, level + 1)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, level + 1)
+
+    walk(payload, 0)
+    return found
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires_at: float
+    api_key_fp: str
+    endpoint_prefix: str
+    nm_ids: frozenset
+
+
+class WBResponseCache:
+    """
+    Кэш ответов WB API процесса
+
+    Пример:
+        cache = get_wb_response_cache()
+        key = cache.make_key(api_key, 'GET', endpoint, params=params)
+        value = cache.get(key, '/content/v2/directory/')
+        if value is None:
+            value = load()
+            cache.put(key, value, size, ttl=3600, endpoint_prefix='/content/v2/directory/')
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        if self._initialized:
+            return
+
+        self.max_bytes = max_bytes or WB_RESPONSE_CACHE_MAX_BYTES
+        self.max_entries = max_entries or WB_RESPONSE_CACHE_MAX_ENTRIES
+        self._entries: 'OrderedDict[Tuple, _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._entries_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidated': 0}
+        self._endpoint_stats: Dict[str, Dict[str, int]] = {}
+        self._initialized = True
+
+    # ------------------------------------------------------------------
+    # Чтение и запись
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def make_key(api_key: str, method: str, endpoint: str,
+                 params: Optional[Dict[str, Any]] = None, body: Any = None) -> Tuple[str, str, str, str]:
+        """Ключ кэша: отпечаток API ключа, метод, эндпоинт, параметры и тело запроса"""
+        request = json.dumps([params or {}, body], sort_keys=True, ensure_ascii=False, default=str)
+        return (_key_fingerprint(api_key), method.upper(), endpoint, request)
+
+    def get(self, key: Tuple, endpoint_prefix: str) -> Optional[Any]:
+        """
+        Закэшированный ответ (None — нет или устарел)
+
+        Args:
+            key: Ключ из make_key
+            endpoint_prefix: Префикс эндпоинта (для метрик)
+        """
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.time():
+                self._drop(key)
+                self._stats['expired'] += 1
+                entry = None
+
+            if entry is None:
+                self._count(endpoint_prefix, 'misses')
+                return None
+
+            self._entries.move_to_end(key)
+            self._count(endpoint_prefix, 'hits')
+            return entry.value
+
+    def put(self, key: Tuple, value: Any, size: int, ttl: float, endpoint_prefix: str,
+            nm_ids: Iterable[int] = ()) -> bool:
+        """
+        Сохранить ответ
+
+        Args:
+            key: Ключ из make_key
+            value: Ответ
+            size: Размер ответа в байтах (для лимита памяти)
+            ttl: Время жизни, секунды
+            endpoint_prefix: Префикс эндпоинта (для инвалидации и метрик)
+            nm_ids: nmID, к которым относится ответ
+
+        Returns:
+            True если ответ сохранён
+        """
+        size += _ENTRY_OVERHEAD_BYTES
+        if ttl <= 0 or size > self.max_bytes // _MAX_ENTRY_SHARE:
+            return False
+
+        entry = _Entry(value, size, time.time() + ttl, key[0], endpoint_prefix, frozenset(nm_ids))
+        with self._entries_lock:
+            self._drop(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats['evictions'] += 1
+        return True
+
+    def _drop(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _count(self, endpoint_prefix: str, name: str) -> None:
+        self._stats[name] += 1
+        stats = self._endpoint_stats.setdefault(endpoint_prefix, {'hits': 0, 'misses': 0})
+        stats[name] += 1
+
+    # ------------------------------------------------------------------
+    # Инвалидация
+    # ------------------------------------------------------------------
+
+    def invalidate(self, api_key: str, endpoint_prefixes: Iterable[str],
+                   nm_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Сбросить закэшированные ответы эндпоинтов продавца
+
+        Args:
+            api_key: API ключ продавца
+            endpoint_prefixes: Префиксы эндпоинтов (см. WB_RESPONSE_CACHE_RULES)
+            nm_ids: Только ответы с этими nmID (None или пусто — все ответы эндпоинтов)
+
+        Returns:
+            Количество сброшенных записей
+        """
+        api_key_fp = _key_fingerprint(api_key)
+        prefixes = set(endpoint_prefixes)
+        nm_ids = frozenset(nm_ids or ())
+
+        with self._entries_lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.api_key_fp == api_key_fp
+                and entry.endpoint_prefix in prefixes
+                and (not nm_ids or entry.nm_ids & nm_ids)
+            ]
+            for key in stale:
+                self._drop(key)
+            self._stats['invalidated'] += len(stale)
+
+        if stale:
+            logger.debug(f"WB response cache: invalidated {len(stale)} entries of {sorted(prefixes)}")
+        return len(stale)
+
+    def invalidate_for_write(self, api_key: str, endpoint: str, body: Any = None) -> int:
+        """
+        Сбросить ответы, которые устарели после запроса на запись
+
+        nmID берутся из тела запроса; если их нет (например, создание
+        карточек) — сбрасываются все ответы затронутых эндпоинтов продавца.
+
+        Returns:
+            Количество сброшенных записей
+        """
+        write_prefix = _match_prefix(WB_CACHE_INVALIDATIONS, endpoint)
+        if write_prefix is None:
+            return 0
+        return self.invalidate(api_key, WB_CACHE_INVALIDATIONS[write_prefix], extract_nm_ids(body))
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        with self._entries_lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ------------------------------------------------------------------
+    # Метрики
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Попадания/промахи (всего и по эндпоинтам), вытеснения, занятая память"""
+        with self._entries_lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else None,
+                **self._stats,
+                'endpoints': {prefix: dict(stats) for prefix, stats in self._endpoint_stats.items()},
+            }
+
+
+def get_wb_response_cache() -> WBResponseCache:
+    """Получить кэш ответов WB API процесса"""
+    return WBResponseCache()
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Повторы запросов к WB API и circuit breaker по хостам
+
+Раньше повторы делал urllib3 Retry(backoff_factor=1) для 429/5xx на любых
+методах, включая POST, а вызывающие код при WBRateLimitException спали
+фиксированные 60 секунд. Теперь:
+
+- 429 повторяется для любого метода (WB запрос не выполнил), пауза берётся
+  из заголовков X-Ratelimit-Retry / Retry-After / X-Ratelimit-Reset и
+  передаётся в общий rate limiter (SharedRateLimiter.penalize), поэтому ждут
+  ровно столько, сколько сказал WB, все потоки и воркеры с этим ключом;
+- 5xx и таймауты повторяются только для идемпотентных запросов (GET/PUT/
+  DELETE и POST-чтения из READ_ONLY_POST_ENDPOINTS) с экспоненциальной
+  паузой со случайным разбросом;
+- после CIRCUIT_FAILURE_THRESHOLD подряд 5xx/таймаутов хоста circuit breaker
+  открывается: запросы к хосту сразу получают WBCircuitOpenException, пока не
+  пройдёт пауза (растёт до CIRCUIT_MAX_COOLDOWN). Затем пропускается один
+  пробный запрос: успех закрывает breaker, ошибка снова открывает.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+logger = logging.getLogger('wb_api')
+
+# Максимальная пауза при 429, которую клиент ждёт сам (дольше — исключение вызывающему)
+WB_RATE_LIMIT_MAX_WAIT = float(os.environ.get('WB_RATE_LIMIT_MAX_WAIT', '120'))
+
+# Экспоненциальная пауза для 5xx/таймаутов: base * 2^attempt, не больше max
+WB_RETRY_BASE_DELAY = float(os.environ.get('WB_RETRY_BASE_DELAY', '1.0'))
+WB_RETRY_MAX_DELAY = float(os.environ.get('WB_RETRY_MAX_DELAY', '30'))
+
+# Ошибок подряд до открытия breaker и паузы открытого breaker (секунды)
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('WB_CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_COOLDOWN = float(os.environ.get('WB_CIRCUIT_COOLDOWN', '30'))
+CIRCUIT_MAX_COOLDOWN = float(os.environ.get('WB_CIRCUIT_MAX_COOLDOWN', '300'))
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+# POST-запросы WB, которые только читают данные (повтор безопасен)
+READ_ONLY_POST_ENDPOINTS = (
+    '/content/v2/get/cards/',
+    '/content/v2/cards/error/list',
+    '/content/v2/cards/limits',
+    '/api/v2/nm-report/',
+    '/api/v1/supplier/',
+)
+
+
+def _parse_seconds(value: Optional[str]) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    # Retry-After может быть HTTP-датой
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Пауза до повтора из заголовков ответа WB
+
+    Порядок: X-Ratelimit-Retry (через сколько секунд можно повторить),
+    Retry-After, X-Ratelimit-Reset (через сколько секунд восстановится лимит).
+
+    Returns:
+        Секунды или None, если заголовков нет
+    """
+    if not headers:
+        return None
+    for name in ('X-Ratelimit-Retry', 'Retry-After', 'X-Ratelimit-Reset'):
+        seconds = _parse_seconds(headers.get(name))
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def is_idempotent_request(method: str, endpoint: str) -> bool:
+    """Безопасно ли повторить запрос, результат которого неизвестен (5xx, таймаут)"""
+    method = method.upper()
+    if method in IDEMPOTENT_METHODS:
+        return True
+    return method == 'POST' and endpoint.startswith(READ_ONLY_POST_ENDPOINTS)
+
+
+class RetryPolicy:
+    """
+    Решение о повторе запроса и длительность паузы
+
+    Пример:
+        delay = policy.retry_delay('GET', endpoint, attempt, status=503, headers=response.headers)
+        if delay is not None:
+            time.sleep(delay)
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = WB_RETRY_BASE_DELAY,
+        max_delay: float = WB_RETRY_MAX_DELAY,
+        max_rate_limit_wait: float = WB_RATE_LIMIT_MAX_WAIT
+    ):
+        """
+        Args:
+            max_retries: Максимум повторов
+            base_delay: Базовая пауза для 5xx/таймаутов (секунды)
+            max_delay: Потолок паузы для 5xx/таймаутов
+            max_rate_limit_wait: Максимальная пауза при 429, которую стоит ждать
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_rate_limit_wait = max_rate_limit_wait
+
+    def backoff(self, attempt: int) -> float:
+        """Экспоненциальная пауза со случайным разбросом (full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def retry_delay(
+        self,
+        method: str,
+        endpoint: str,
+        attempt: int,
+        status: Optional[int] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        error: Optional[BaseException] = None
+    ) -> Optional[float]:
+        """
+        Пауза перед повтором
+
+        Args:
+            method: HTTP метод
+            endpoint: Эндпоинт
+            attempt: Номер уже выполненной попытки (0 — первая)
+            status: HTTP-код ответа (если ответ получен)
+            headers: Заголовки ответа
+            error: Исключение транспорта (таймаут, обрыв соединения)
+
+        Returns:
+            Секунды до повтора или None — не повторять
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        if status == 429:
+            wait = parse_retry_after(headers)
+            if wait is None:
+                wait = self.backoff(attempt)
+            return wait if wait <= self.max_rate_limit_wait else None
+
+        retryable = status in RETRYABLE_STATUSES or (error is not None and _is_transient_error(error))
+        if not retryable or not is_idempotent_request(method, endpoint):
+            return None
+
+        wait = parse_retry_after(headers)
+        return min(wait, self.max_delay) if wait is not None else self.backoff(attempt)
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    """
+    Стоит ли повторить запрос после ошибки транспорта
+
+    Ошибки установки соединения повторяет транспортный уровень (urllib3
+    Retry(connect=...) в синхронном клиенте, AsyncHTTPTransport(retries=...)
+    в асинхронном) — запрос при этом не был отправлен. Здесь остаются ошибки
+    уже отправленного запроса: таймаут чтения и обрыв ответа.
+    """
+    import requests
+
+    if isinstance(error, requests.exceptions.RequestException):
+        return isinstance(error, requests.exceptions.ReadTimeout)
+    # httpx (опциональная зависимость, сверяем по имени класса)
+    return type(error).__name__ in ('ReadTimeout', 'WriteTimeout', 'PoolTimeout',
+                                    'ReadError', 'RemoteProtocolError')
+
+
+class _HostState:
+    __slots__ = ('failures', 'opened_at', 'cooldown', 'probe_started_at', 'opened_total')
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.cooldown = CIRCUIT_COOLDOWN
+        self.probe_started_at: Optional[float] = None  # время начала пробного запроса
+        self.opened_total = 0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker по хостам WB API (общий для клиентов процесса)
+
+    Пример:
+        retry_in = breaker.before_request(host)
+        if retry_in:
+            raise WBCircuitOpenException(...)
+        ...
+        breaker.record_failure(host)  # 5xx / таймаут
+        breaker.record_success(host)
+        breaker.release_probe(host)  # запрос прерван без ответа хоста (SSL, отмена и т.п.)
+
+    Пробный запрос, который не завершился ни одним из этих вызовов,
+    считается потерянным через cooldown — после этого пробу берёт следующий запрос.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        cooldown: float = CIRCUIT_COOLDOWN,
+        max_cooldown: float = CIRCUIT_MAX_COOLDOWN
+    ):
+        """
+        Args:
+            failure_threshold: Ошибок подряд до открытия
+            cooldown: Начальная пауза открытого breaker (секунды)
+            max_cooldown: Максимальная пауза (удваивается после неудачной пробы)
+        """
+        if self._initialized:
+            return
+
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._hosts: Dict[str, _HostState] = {}
+        self._hosts_lock = threading.Lock()
+        self._initialized = True
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+            state.cooldown = self.cooldown
+        return state
+
+    def before_request(self, host: str) -> float:
+        """
+        Можно ли отправить запрос на хост
+
+        Returns:
+            0 — можно; иначе сколько секунд breaker ещё будет открыт
+        """
+        with self._hosts_lock:
+            state = self._state(host)
+            if state.opened_at is None:
+                return 0.0
+            remaining = state.opened_at + state.cooldown - time.time()
+            if remaining > 0:
+                return remaining
+            now = time.time()
+            if state.probe_started_at is not None and now - state.probe_started_at < state.cooldown:
+                # Пробный запрос уже выполняется — остальные ждут его результата
+                return min(self.cooldown, 1.0)
+            state.probe_started_at = now
+            return 0.0
+
+    def record_success(self, host: str) -> None:
+        """Хост ответил (не 5xx) — сбросить счётчик и закрыть breaker"""
+        with self._hosts_lock:
+            state = self._state(host)
+            if state.opened_at is not None:
+                logger.info(f"✅ Circuit breaker for {host} closed")
+            state.failures = 0
+            state.opened_at = None
+            state.probe_started_at = None
+            state.cooldown = self.cooldown
+
+    def record_failure(self, host: str) -> None:
+        """5xx или таймаут — учесть и при необходимости открыть breaker"""
+        with self._hosts_lock:
+            state = self._state(host)
+            state.failures += 1
+            if state.probe_started_at is not None:
+                # Неудачная проба — открываем снова с увеличенной паузой
+                state.probe_started_at = None
+                state.cooldown = min(state.cooldown * 2, self.max_cooldown)
+                state.opened_at = time.time()
+                state.opened_total += 1
+                logger.warning(f"⚡ Circuit breaker for {host} re-opened for {state.cooldown:.0f}s")
+            elif state.opened_at is None and state.failures >= self.failure_threshold:
+                state.opened_at = time.time()
+                state.opened_total += 1
+                logger.warning(f"⚡ Circuit breaker for {host} opened after {state.failures} failures, "
+                               f"pausing requests for {state.cooldown:.0f}s")
+
+    def release_probe(self, host: str) -> None:
+        """Запрос прерван до ответа хоста — освободить пробу, не меняя состояние breaker"""
+        with self._hosts_lock:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.probe_started_at = None
+
+    def reset(self, host: Optional[str] = None) -> None:
+        """Закрыть breaker хоста (или всех хостов)"""
+        with self._hosts_lock:
+            if host is None:
+                self._hosts.clear()
+            else:
+                self._hosts.pop(host, None)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние breaker по хостам"""
+        now = time.time()
+        with self._hosts_lock:
+            stats = {}
+            for host, state in self._hosts.items():
+                if state.opened_at is None:
+                    status = 'closed'
+                elif state.probe_started_at is not None or state.opened_at + state.cooldown <= now:
+                    status = 'half_open'
+                else:
+                    status = 'open'
+                stats[host] = {
+                    'state': status,
+                    'consecutive_failures': state.failures,
+                    'opened_total': state.opened_total,
+                    'retry_in': round(max(0.0, state.opened_at + state.cooldown - now), 1)
+                    if state.opened_at is not None else 0.0,
+                }
+            return stats
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Получить circuit breaker WB API процесса"""
+    return CircuitBreaker()
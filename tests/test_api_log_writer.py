@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты фоновой записи логов API (services/api_log_writer.py).
+"""
+import json
+
+import pytest
+import requests
+
+from services.api_log_writer import (
+    APILogWriter, LogRule, decode_response_body, resolve_log_rule, truncate_body,
+)
+from services.wb_api_client import WildberriesAPIClient
+
+
+@pytest.fixture
+def make_writer():
+    def factory(**kwargs):
+        APILogWriter._instance = None
+        kwargs.setdefault('flush_interval', 0.01)
+        return APILogWriter(**kwargs)
+
+    yield factory
+    APILogWriter._instance = None
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Seller, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def _response(status, payload):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    response.encoding = 'utf-8'
+    return response
+
+
+def test_truncation():
+    assert truncate_body('abc', 5) == 'abc'
+    assert truncate_body('abcdef', 3) == 'abc... [truncated, 6 chars total]'
+    assert decode_response_body('привет'.encode('utf-8'), 'utf-8', 10) == 'привет'
+    assert decode_response_body('привет'.encode('utf-8'), None, 3) == 'при... [truncated, 12 bytes total]'
+    assert decode_response_body(None, 'utf-8', 3) is None
+
+
+def test_resolve_log_rule_longest_prefix():
+    rules = {'/api/': LogRule(10, 1.0), '/api/v2/list/': LogRule(20, 0.5)}
+    assert resolve_log_rule('/api/v2/list/goods/filter', rules) == LogRule(20, 0.5)
+    assert resolve_log_rule('/api/v1/x', rules) == LogRule(10, 1.0)
+    assert resolve_log_rule('/content/v2/x', rules).sample_rate == 1.0
+
+
+def test_records_written_in_batches(app, make_writer):
+    from models import APILog
+
+    writer = make_writer(batch_size=50, rules={'/big': LogRule(max_body=8, sample_rate=1.0)})
+    for i in range(5):
+        writer.submit(APILog.log_request, seller_id=1, endpoint='/big', method='POST',
+                      status_code=200, response_time=0.1, request_json={'i': i},
+                      response=_response(200, {'data': 'x' * 100}))
+    assert writer.flush(5)
+
+    logs = APILog.query.order_by(APILog.id).all()
+    assert len(logs) == 5
+    assert logs[0].request_body == '{"i": 0}'
+    assert logs[0].response_body.startswith('{"data":') and 'truncated' in logs[0].response_body
+    stats = writer.get_stats()
+    assert stats['written'] == 5 and stats['failed'] == 0
+    assert stats['batches'] < 5
+
+
+def test_sampling_keeps_errors(make_writer):
+    calls = []
+    writer = make_writer(rules={'/list': LogRule(max_body=100, sample_rate=0.0)})
+    writer.submit(lambda **kw: calls.append(kw), seller_id=1, endpoint='/list', method='GET',
+                  status_code=200, response_time=0.1)
+    writer.submit(lambda **kw: calls.append(kw), seller_id=1, endpoint='/list', method='GET',
+                  status_code=500, response_time=0.1, response=_response(500, {'error': 'boom'}))
+    assert writer.flush(5)
+
+    assert [c['status_code'] for c in calls] == [500]
+    assert calls[0]['success'] is False and 'boom' in calls[0]['response_body']
+    assert writer.get_stats()['sampled_out'] == 1
+
+
+def test_full_queue_drops_records(make_writer, monkeypatch):
+    writer = make_writer(queue_size=1)
+    monkeypatch.setattr(writer, '_ensure_thread', lambda: None)
+    submit = dict(seller_id=1, endpoint='/x', method='GET', status_code=200, response_time=0.1)
+    assert writer.submit(print, **submit) is True
+    assert writer.submit(print, **submit) is False
+    assert writer.get_stats()['dropped'] == 1
+
+
+def test_client_logs_in_background(app, make_writer, monkeypatch):
+    from models import APILog
+
+    writer = make_writer()
+    client = WildberriesAPIClient('key', response_cache=False, coalesce_requests=False,
+                                  db_logger_callback=APILog.log_request)
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kw: 0.0)
+    monkeypatch.setattr(client.session, 'request',
+                        lambda method, url, **kw: _response(200, {'data': {'ok': True}}))
+
+    client._make_request('POST', 'content', '/content/v2/cards/update', log_to_db=True,
+                         seller_id=1, json=[{'nmID': 1}])
+    assert writer.flush(5)
+
+    log = APILog.query.one()
+    assert (log.endpoint, log.status_code, log.success) == ('/content/v2/cards/update', 200, True)
+    assert log.request_body == '[{"nmID": 1}]'
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты параллельного сбора брендов (services/brand_harvest.py) и
+возобновляемой синхронизации BrandEngine.sync_marketplace_brands.
+"""
+import threading
+
+import pytest
+
+from services.brand_harvest import BrandHarvester, DoneQuery, expand_pattern
+from services.wb_api_client import WBRateLimitException
+
+
+class FakeBrandsClient:
+    """Бренды категории: pattern совпадает с началом имени"""
+
+    def __init__(self, brands, top=3, fail=None):
+        self.brands = brands  # subject_id -> [names]
+        self.top = top
+        self.fail = dict(fail or {})  # (subject_id, pattern) -> ошибок до успеха
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_brands_by_subject_quick(self, subject_id, pattern='а', top=5000, use_cache=None):
+        assert use_cache is False
+        with self.lock:
+            self.calls.append((subject_id, pattern))
+            if self.fail.get((subject_id, pattern)):
+                self.fail[(subject_id, pattern)] -= 1
+                raise WBRateLimitException('429')
+        names = [n for n in self.brands.get(subject_id, []) if n.startswith(pattern)]
+        return {'brands': [{'id': hash(n) % 10 ** 9, 'name': n} for n in names[:self.top]]}
+
+
+def test_expand_pattern():
+    assert expand_pattern('a')[:3] == ['aa', 'ab', 'ac']
+    assert len(expand_pattern('к')) == 31
+    assert expand_pattern('1')[0] == '10'
+    assert expand_pattern('-') == []
+
+
+class TestBrandHarvester:
+    def test_expands_pattern_when_top_is_hit(self):
+        client = FakeBrandsClient({1: ['aa', 'ab', 'ac', 'ad', 'b']}, top=3)
+        results = []
+        harvester = BrandHarvester(client, top=3, workers=2, patterns='ab', saturation=100)
+        stats = harvester.run([1], on_result=results.append)
+
+        found = {b['name'] for r in results for b in r.new_brands}
+        assert found == {'aa', 'ab', 'ac', 'ad', 'b'}
+        assert stats['expanded_patterns'] == 26
+        assert (1, 'ad') in client.calls
+        assert any(r.pattern == 'a' and r.hit_top for r in results)
+
+    def test_saturated_subject_skips_remaining_patterns(self):
+        client = FakeBrandsClient({1: ['x']}, top=10)
+        harvester = BrandHarvester(client, top=10, workers=1, patterns='abcdefx', saturation=3)
+        stats = harvester.run([1])
+
+        assert client.calls == [(1, 'a'), (1, 'b'), (1, 'c')]
+        assert stats['skipped_patterns'] == 4
+
+    def test_resume_replays_saturation(self):
+        client = FakeBrandsClient({1: ['x']}, top=10)
+        done = {(1, p): DoneQuery(new_brands=0, hit_top=False) for p in 'ab'}
+        harvester = BrandHarvester(client, top=10, workers=1, patterns='abcx', saturation=2)
+        stats = harvester.run([1], done=done)
+
+        assert client.calls == []
+        assert stats['skipped_patterns'] == 2
+
+    def test_resume_skips_done_queries(self):
+        client = FakeBrandsClient({1: ['aa', 'ab', 'b'], 2: ['b']}, top=2)
+        done = {
+            (1, 'a'): DoneQuery(new_brands=2, hit_top=True),
+            (1, 'aa'): DoneQuery(new_brands=1, hit_top=False),
+            (2, 'a'): DoneQuery(new_brands=0, hit_top=False),
+            (2, 'b'): DoneQuery(new_brands=1, hit_top=False),
+        }
+        progress = []
+        harvester = BrandHarvester(client, top=2, workers=3, patterns='ab', saturation=100)
+        stats = harvester.run([1, 2], done=done, on_subject_done=lambda *args: progress.append(args))
+
+        assert (1, 'a') not in client.calls and (1, 'aa') not in client.calls
+        assert (1, 'ab') in client.calls and (1, 'b') in client.calls
+        assert not any(subject == 2 for subject, _ in client.calls)
+        assert stats['resumed_queries'] == 4
+        assert [p[:2] for p in progress] == [(1, 2), (2, 2)]
+
+    def test_rate_limited_queries_are_retried(self):
+        client = FakeBrandsClient({1: ['a']}, top=10, fail={(1, 'a'): 2, (1, 'b'): 5})
+        results = []
+        harvester = BrandHarvester(client, top=10, workers=2, patterns='ab')
+        stats = harvester.run([1], on_result=results.append)
+
+        assert [r.pattern for r in results] == ['a']
+        assert stats['retries'] == 4
+        assert stats['failed_queries'] == 1
+        assert harvester.debug['pattern'] == 'b'
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_engine_sync_resumes_from_checkpoints(app, monkeypatch):
+    from models import db, Brand, BrandHarvestCheckpoint, Marketplace, MarketplaceCategory
+    from services.brand_engine import BrandEngine
+
+    db.session.add(Marketplace(id=1, name='Wildberries', code='wb'))
+    db.session.add(MarketplaceCategory(marketplace_id=1, subject_id=10, subject_name='A', is_enabled=True))
+    db.session.add(MarketplaceCategory(marketplace_id=1, subject_id=20, subject_name='B', is_enabled=True))
+    db.session.commit()
+
+    monkeypatch.setattr('services.brand_harvest.BRAND_HARVEST_PATTERNS', 'ab')
+    engine = BrandEngine(app=app)
+    # Все попытки первого запуска для (20, 'b') неудачны
+    client = FakeBrandsClient({10: ['alpha'], 20: ['beta']}, top=10, fail={(20, 'b'): 3})
+
+    stats = engine.sync_marketplace_brands(1, client)
+    assert stats['failed_queries'] == 1
+    assert {b.name for b in Brand.query.all()} == {'alpha'}
+    # Сбор с ошибкой — чекпоинты остаются для продолжения
+    assert BrandHarvestCheckpoint.query.filter_by(marketplace_id=1, subject_id=10, pattern='a').count() == 1
+
+    client.calls.clear()
+    stats = engine.sync_marketplace_brands(1, client)
+    assert stats['failed_queries'] == 0
+    assert stats['resumed_queries'] == 3
+    assert client.calls == [(20, 'b')]
+    assert {b.name for b in Brand.query.all()} == {'alpha', 'beta'}
+    assert BrandHarvestCheckpoint.query.count() == 0
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты пакетного upsert (services/bulk_upsert.py).
+"""
+import pytest
+from flask import Flask
+
+from models import db, Seller, Product, ProductStock, User
+from services.bulk_upsert import BulkUpserter, aggregate_stocks
+
+
+@pytest.fixture
+def session():
+    """Flask-приложение с БД в памяти и одним продавцом."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        db.session.commit()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+
+def _product_upserter(session, batch_size=500):
+    return BulkUpserter(
+        session, Product, ('nm_id',),
+        filters=(Product.seller_id == 1,),
+        insert_only=('seller_id', 'nm_id', 'imt_id'),
+        batch_size=batch_size
+    )
+
+
+class TestBulkUpserter:
+    def test_inserts_and_updates(self, session):
+        session.add(Product(seller_id=1, nm_id=1, vendor_code='old', imt_id=10))
+        session.commit()
+
+        upserter = _product_upserter(session, batch_size=2)
+        result = upserter.upsert([
+            {'seller_id': 1, 'nm_id': nm_id, 'imt_id': 99, 'vendor_code': f'v{nm_id}'}
+            for nm_id in (1, 2, 3, 4)
+        ])
+        session.commit()
+
+        assert result == (3, 1)
+        products = {p.nm_id: p for p in Product.query.all()}
+        assert len(products) == 4
+        assert products[1].vendor_code == 'v1'
+        assert products[1].imt_id == 10  # insert_only не перезаписывается
+        assert products[4].imt_id == 99
+
+    def test_inserted_rows_are_updated_on_next_batch(self, session):
+        upserter = _product_upserter(session)
+        upserter.upsert([{'seller_id': 1, 'nm_id': 5, 'title': 'a'}])
+        result = upserter.upsert([{'seller_id': 1, 'nm_id': 5, 'title': 'b'}])
+        session.commit()
+
+        assert result == (0, 1)
+        assert Product.query.filter_by(nm_id=5).one().title == 'b'
+
+    def test_filters_limit_existing_rows(self, session):
+        session.add(Seller(id=2, user_id=2, company_name='Other'))
+        session.add(Product(seller_id=2, nm_id=7))
+        session.commit()
+
+        result = _product_upserter(session).upsert([{'seller_id': 1, 'nm_id': 7}])
+        session.commit()
+
+        assert result == (1, 0)
+        assert Product.query.filter_by(nm_id=7).count() == 2
+
+    def test_composite_key_and_duplicates(self, session):
+        product = Product(seller_id=1, nm_id=1)
+        session.add(product)
+        session.flush()
+        session.add_all([
+            ProductStock(product_id=product.id, warehouse_id=1, warehouse_name='A', quantity=1),
+            ProductStock(product_id=product.id, warehouse_id=2, warehouse_name='A', quantity=2),
+        ])
+        session.commit()
+
+        upserter = BulkUpserter(session, ProductStock, ('product_id', 'warehouse_name'))
+        assert len(upserter.duplicate_ids) == 1
+        assert upserter.delete_duplicates() == 1
+
+        result = upserter.upsert([
+            {'product_id': product.id, 'warehouse_id': 1, 'warehouse_name': 'A', 'quantity': 5},
+            {'product_id': product.id, 'warehouse_id': 3, 'warehouse_name': 'B', 'quantity': 7},
+        ])
+        session.commit()
+
+        assert result == (1, 1)
+        stocks = {s.warehouse_name: s.quantity for s in ProductStock.query.all()}
+        assert stocks == {'A': 5, 'B': 7}
+
+    def test_fingerprint_skip_and_touch(self, session):
+        session.add(Product(seller_id=1, nm_id=1, title='a', content_hash='h1', is_active=False))
+        session.add(Product(seller_id=1, nm_id=2, title='b', content_hash=None))
+        session.commit()
+
+        upserter = BulkUpserter(
+            session, Product, ('nm_id',),
+            filters=(Product.seller_id == 1,),
+            insert_only=('seller_id', 'nm_id'),
+            fingerprint_column='content_hash'
+        )
+        assert upserter.is_unchanged(1, 'h1')
+        assert not upserter.is_unchanged(1, 'h2')
+        assert not upserter.is_unchanged(2, None)
+        assert not upserter.is_unchanged(3, 'h1')
+
+        assert upserter.touch([1, 3], {'is_active': True}) == 1
+        upserter.upsert([{'seller_id': 1, 'nm_id': 2, 'title': 'c', 'content_hash': 'h3'}])
+        session.commit()
+
+        assert upserter.is_unchanged(2, 'h3')
+        first = Product.query.filter_by(nm_id=1).one()
+        assert first.is_active and first.title == 'a'
+        assert Product.query.filter_by(nm_id=2).one().content_hash == 'h3'
+
+
+def test_aggregate_stocks_sums_sizes():
+    stocks = aggregate_stocks([
+        {'nmId': 1, 'warehouseName': 'A', 'quantity': 2, 'quantityFull': 3, 'inWayToClient': 1},
+        {'nmId': 1, 'warehouseName': 'A', 'quantity': 4, 'quantityFull': 5, 'inWayFromClient': 2},
+        {'nmId': 1, 'warehouseName': 'B', 'quantity': 1},
+        {'warehouseName': 'A', 'quantity': 100},
+    ])
+    assert stocks[(1, 'A')] == {
+        'quantity': 6, 'quantity_full': 8, 'in_way_to_client': 1, 'in_way_from_client': 2,
+    }
+    assert stocks[(1, 'B')]['quantity'] == 1
+    assert len(stocks) == 2
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты снимков каталога продавца (services/catalog_snapshot.py).
+"""
+import threading
+import time
+
+import pytest
+
+from services.catalog_snapshot import CatalogSnapshotService
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    """Свежий экземпляр сервиса с отдельным каталогом."""
+    CatalogSnapshotService._instance = None
+    instance = CatalogSnapshotService(base_dir=str(tmp_path))
+    yield instance
+    CatalogSnapshotService._instance = None
+
+
+class TestCatalogSnapshotService:
+    def test_fetches_once_within_max_age(self, snapshots):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return [{'nmID': 1}]
+
+        first = snapshots.get(1, 'prices', fetch, max_age=60)
+        second = snapshots.get(1, 'prices', fetch, max_age=60)
+
+        assert len(calls) == 1
+        assert not first.from_cache and second.from_cache
+        assert second.data == [{'nmID': 1}]
+        assert snapshots.get_stats() == {'hits': 1, 'misses': 1}
+
+    def test_refetches_when_older_than_tolerance(self, snapshots):
+        snapshots.put(1, 'cards', ['old'], fetched_at=time.time() - 120)
+        assert list(snapshots.get(1, 'cards', lambda: ['new'], max_age=300).data) == ['old']
+        assert list(snapshots.get(1, 'cards', lambda: ['new'], max_age=60).data) == ['new']
+
+    def test_sellers_and_parts_are_independent(self, snapshots):
+        snapshots.put(1, 'prices', ['a'])
+        assert snapshots.peek(2, 'prices') is None
+        assert snapshots.peek(1, 'stocks') is None
+
+    def test_persisted_between_instances(self, snapshots, tmp_path):
+        snapshots.put(1, 'stocks', [{'nmId': 5, 'quantity': 3}])
+
+        CatalogSnapshotService._instance = None
+        other = CatalogSnapshotService(base_dir=str(tmp_path))
+        cached = other.peek(1, 'stocks', max_age=60)
+        assert cached is not None and cached.data == [{'nmId': 5, 'quantity': 3}]
+
+    def test_concurrent_refresh_fetches_once(self, snapshots):
+        calls = []
+        gate = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            gate.wait(5)
+            return ['data']
+
+        threads = [threading.Thread(target=snapshots.get, args=(1, 'prices', fetch, 60)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        gate.set()
+        for thread in threads:
+            thread.join(5)
+        assert len(calls) == 1
+
+    def test_invalidate_and_info(self, snapshots):
+        snapshots.put(1, 'cards', [1, 2, 3])
+        info = snapshots.get_info(1)
+        assert info['cards']['items'] == 3 and info['cards']['fresh']
+        assert info['prices'] is None
+
+        snapshots.invalidate(1)
+        assert snapshots.peek(1, 'cards') is None
+
+    def test_writer_keeps_card_fields_and_skips_duplicates(self, snapshots):
+        writer = snapshots.writer(1, 'cards', key='nmID')
+        writer.extend([{'nmID': 1, 'vendorCode': 'a', 'photos': ['x'] * 10}, {'nmID': 2, 'vendorCode': 'b'}])
+        writer.extend([{'nmID': 2, 'vendorCode': 'b'}])
+        assert snapshots.peek(1, 'cards') is None
+        assert writer.commit()
+
+        cached = snapshots.peek(1, 'cards')
+        assert len(cached.data) == 2
+        assert list(cached.data) == [{'nmID': 1, 'vendorCode': 'a'}, {'nmID': 2, 'vendorCode': 'b'}]
+
+    def test_full_write_drops_missing_cards(self, snapshots):
+        snapshots.put(1, 'cards', [{'nmID': 1}, {'nmID': 2}])
+        snapshots.put(1, 'cards', [{'nmID': 2}])
+        assert [card['nmID'] for card in snapshots.peek(1, 'cards').data] == [2]
+
+    def test_merge_previous_keeps_previous_age(self, snapshots):
+        fetched_at = time.time() - 120
+        snapshots.put(1, 'cards', [{'nmID': 1, 'title': 'old'}, {'nmID': 2, 'title': 'old'}], fetched_at=fetched_at)
+
+        writer = snapshots.writer(1, 'cards', key='nmID')
+        writer.add({'nmID': 2, 'title': 'new'})
+        assert writer.commit(merge_previous=True)
+
+        cached = snapshots.peek(1, 'cards')
+        assert cached.fetched_at == fetched_at
+        assert list(cached.data) == [{'nmID': 2, 'title': 'new'}, {'nmID': 1, 'title': 'old'}]
+
+    def test_merge_without_previous_is_skipped(self, snapshots):
+        writer = snapshots.writer(1, 'cards', key='nmID')
+        writer.add({'nmID': 1})
+        assert not writer.commit(merge_previous=True)
+        assert snapshots.peek(1, 'cards') is None
+
+    def test_discarded_writer_keeps_snapshot(self, snapshots):
+        snapshots.put(1, 'cards', [{'nmID': 1}])
+        writer = snapshots.writer(1, 'cards')
+        writer.add({'nmID': 2})
+        writer.discard()
+        assert list(snapshots.peek(1, 'cards').data) == [{'nmID': 1}]
+
+    def test_unknown_part(self, snapshots):
+        with pytest.raises(ValueError):
+            snapshots.put(1, 'orders', [])
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты поддержки SQLite/PostgreSQL (services/db_dialect.py) и путей, которые на неё переведены.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from services.db_dialect import (
+    engine_options, normalize_database_url, portable_ddl, rows_to_csv, time_bucket, upsert_rows,
+)
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Seller, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_sales_upsert_updates_only_newer_rows(app):
+    from models import WBSale, db
+
+    rows = [{'seller_id': 1, 'srid': 's1', 'last_change_date': datetime(2024, 2, 1), 'finished_price': 10.0}]
+    assert upsert_rows(WBSale.__table__, rows, ('seller_id', 'srid'), update=('last_change_date', 'finished_price'),
+                       where=lambda t, new: new.last_change_date > t.last_change_date) == 1
+
+    older = [dict(rows[0], last_change_date=datetime(2024, 1, 1), finished_price=5.0)]
+    newer = [dict(rows[0], last_change_date=datetime(2024, 3, 1), finished_price=20.0),
+             {'seller_id': 1, 'srid': 's2', 'last_change_date': datetime(2024, 3, 1), 'finished_price': 1.0}]
+    kwargs = dict(update=('last_change_date', 'finished_price'),
+                  where=lambda t, new: new.last_change_date > t.last_change_date)
+    assert upsert_rows(WBSale.__table__, older, ('seller_id', 'srid'), **kwargs) == 0
+    assert upsert_rows(WBSale.__table__, newer, ('seller_id', 'srid'), **kwargs) == 2
+    db.session.commit()
+
+    assert WBSale.query.count() == 2
+    assert WBSale.query.filter_by(srid='s1').one().finished_price == 20.0
+
+
+def test_orders_upsert_marks_cancellation(app):
+    from models import WBOrder, db
+    from services.wb_data_sync import _upsert_orders
+
+    base = {'srid': 'o1', 'lastChangeDate': '2024-02-01T10:00:00', 'finishedPrice': 100, 'isCancel': False}
+    assert _upsert_orders(1, [base, dict(base, srid='o2')]) == 2
+    # Повтор без изменений не считается
+    assert _upsert_orders(1, [base]) == 0
+    # Отмена без новой даты изменения
+    assert _upsert_orders(1, [dict(base, isCancel=True, cancelDate='2024-02-02T00:00:00', finishedPrice=1)]) == 1
+    # Новая дата изменения — новая цена
+    assert _upsert_orders(1, [dict(base, srid='o2', lastChangeDate='2024-02-05T00:00:00', finishedPrice=90)]) == 1
+    db.session.commit()
+
+    cancelled = WBOrder.query.filter_by(srid='o1').one()
+    assert cancelled.is_cancel and cancelled.cancel_dt == datetime(2024, 2, 2)
+    assert cancelled.finished_price == 100
+    assert WBOrder.query.filter_by(srid='o2').one().finished_price == 90
+
+
+def test_realization_upsert_counts_processed_rows(app):
+    from models import WBRealizationRow, db
+    from services.wb_data_sync import _upsert_realization_rows
+
+    rows = [{'rrd_id': 1, 'ppvz_for_pay': 10, 'date_from': '2024-01-01'}, {'rrd_id': 2, 'ppvz_for_pay': 20}]
+    assert _upsert_realization_rows(1, rows) == 2
+    assert _upsert_realization_rows(1, [dict(rows[0], ppvz_for_pay=15), rows[0]]) == 1
+    db.session.commit()
+    row = WBRealizationRow.query.filter_by(rrd_id=1).one()
+    assert row.ppvz_for_pay == 10 and row.date_from == date(2024, 1, 1)
+
+
+def test_upsert_compiles_on_conflict_for_postgresql():
+    from sqlalchemy.dialects.postgresql import insert
+    from models import WBSale
+    from services.db_dialect import _on_conflict
+
+    stmt = _on_conflict(insert(WBSale.__table__), WBSale.__table__, ('seller_id', 'srid'),
+                        ('finished_price',), lambda t, new: new.last_change_date > t.last_change_date)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (seller_id, srid) DO UPDATE SET finished_price = excluded.finished_price' in sql
+    assert 'WHERE excluded.last_change_date > wb_sales.last_change_date' in sql
+
+
+def test_time_bucket_per_dialect():
+    from models import CompetitorPriceSnapshot
+
+    column = CompetitorPriceSnapshot.__table__.c.created_at
+    assert 'date_trunc' in str(time_bucket(column, 'hour', 'postgresql').compile(dialect=postgresql.dialect()))
+    assert 'strftime' in str(time_bucket(column, 'day', 'sqlite'))
+    with pytest.raises(ValueError):
+        time_bucket(column, 'week', 'sqlite')
+
+
+def test_compact_old_snapshots(app):
+    from models import CompetitorPriceSnapshot, db
+    from services.competitor_monitor import CompetitorMonitorService
+
+    now = datetime.utcnow()
+    hour = (now - timedelta(days=10)).replace(minute=0, second=0, microsecond=0)
+    day = (now - timedelta(days=100)).replace(hour=0, minute=0, second=0, microsecond=0)
+    times = [hour + timedelta(minutes=m) for m in (1, 20, 40)] + [day + timedelta(hours=h) for h in (1, 5, 9)]
+    times.append(now)
+    for created_at in times:
+        db.session.add(CompetitorPriceSnapshot(product_id=1, seller_id=1, price=100, created_at=created_at))
+    db.session.commit()
+
+    CompetitorMonitorService.compact_old_snapshots(app)
+    left = sorted(s.created_at for s in CompetitorPriceSnapshot.query.all())
+    assert left == [times[5], times[2], now]
+
+
+def test_portable_ddl():
+    sql = ('CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, at DATETIME, '
+           'a BOOLEAN DEFAULT 0 NOT NULL, b BOOLEAN NOT NULL DEFAULT 1)')
+    assert portable_ddl(sql, 'sqlite') == sql
+    assert portable_ddl(sql, 'postgresql') == (
+        'CREATE TABLE t (id SERIAL PRIMARY KEY, at TIMESTAMP, '
+        'a BOOLEAN DEFAULT false NOT NULL, b BOOLEAN NOT NULL DEFAULT true)'
+    )
+
+
+def test_rows_to_csv_distinguishes_null_and_empty():
+    rows = [{'a': None, 'b': '', 'c': 'x"y,\nz', 'd': True, 'e': datetime(2024, 1, 2, 3, 4, 5), 'f': 1.5}]
+    assert rows_to_csv(list('abcdef'), rows).getvalue() == ',"","x""y,\nz",true,2024-01-02 03:04:05,1.5\n'
+
+
+def test_engine_options_per_dialect():
+    assert normalize_database_url('postgres://u:p@h/db') == 'postgresql://u:p@h/db'
+    assert 'connect_args' not in engine_options('postgresql://u:p@h/db')
+    assert engine_options('sqlite:////tmp/x.db')['connect_args']['check_same_thread'] is False
+
+
+def test_migration_script_copies_tables(tmp_path, capsys):
+    from sqlalchemy import create_engine, text
+    from models import Seller, User, WBSale, db
+    from scripts.migrate_sqlite_to_postgres import main
+
+    source_url = f"sqlite:///{tmp_path / 'source.db'}"
+    source = create_engine(source_url)
+    db.metadata.create_all(source)
+    with source.begin() as conn:
+        conn.execute(User.__table__.insert(), {'id': 5, 'username': 'u', 'email': 'u@example.com',
+                                               'password_hash': 'x'})
+        conn.execute(Seller.__table__.insert(), {'id': 3, 'user_id': 5, 'company_name': 'S'})
+        conn.execute(WBSale.__table__.insert(), [{'seller_id': 3, 'srid': srid} for srid in 'ab'])
+
+    target_url = f"sqlite:///{tmp_path / 'target.db'}"
+    assert main(['--source', source_url, '--target', target_url, '--batch-size', '1']) == 0
+    with create_engine(target_url).connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM wb_sales')).scalar() == 2
+        assert conn.execute(text('SELECT company_name FROM sellers WHERE id = 3')).scalar() == 'S'
+
+    # Повторный запуск без --truncate не затирает данные
+    assert main(['--source', source_url, '--target', target_url]) == 2
+    assert main(['--source', source_url, '--target', target_url, '--truncate']) == 0
+    assert '✅ wb_sales: 2/2' in capsys.readouterr().out
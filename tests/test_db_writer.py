@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты единственного писателя БД (services/db_writer.py).
+"""
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from services.db_writer import DBWriteLock, DBWriteLockTimeout, DBWriter, install_write_lock
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def writer():
+    DBWriter._instance = None
+    yield DBWriter(batch_size=50, flush_interval=0.2)
+    DBWriter._instance = None
+
+
+def _add_user(name, order=None):
+    from models import User, db
+
+    if order is not None:
+        order.append(name)
+    db.session.add(User(username=name, email=f'{name}@example.com', password_hash='x'))
+    return name
+
+
+def test_writes_are_ordered_batched_and_acknowledged(app, writer):
+    from models import User
+
+    order = []
+    futures = [writer.submit(_add_user, f'user{n}', order) for n in range(10)]
+
+    assert [f.result(timeout=5) for f in futures] == [f'user{n}' for n in range(10)]
+    assert order == [f'user{n}' for n in range(10)]
+    assert User.query.count() == 10
+    stats = writer.get_stats()
+    assert stats['completed'] == 10 and stats['failed'] == 0
+    assert stats['transactions'] < 10 and stats['max_batch'] > 1
+    assert stats['max_queue_latency_ms'] > 0
+
+
+def test_failed_write_is_isolated(app, writer):
+    from models import User
+
+    def broken():
+        raise ValueError('плохая запись')
+
+    futures = [writer.submit(_add_user, 'first'), writer.submit(broken), writer.submit(_add_user, 'second')]
+
+    assert futures[0].result(timeout=5) == 'first'
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 'second'
+    assert sorted(u.username for u in User.query.all()) == ['first', 'second']
+    assert writer.get_stats()['failed'] == 1 and writer.get_stats()['rollbacks'] == 1
+    assert writer.write(_add_user, 'third') == 'third'
+
+
+def test_write_lock_serializes_concurrent_writers(tmp_path):
+    # Короткий busy timeout: без блокировки записи писатели падали бы с «database is locked»
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={'timeout': 0.05},
+                           pool_size=10, max_overflow=0)
+    lock = install_write_lock(engine)
+    assert lock is not None and lock.path == str(tmp_path / 'app.db') + '.write.lock'
+    assert install_write_lock(engine) is lock
+
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE counter (value INTEGER)'))
+        conn.execute(text('CREATE TABLE events (worker INTEGER, n INTEGER)'))
+        conn.execute(text('INSERT INTO counter VALUES (0)'))
+
+    errors = []
+
+    def worker(worker_id):
+        try:
+            for n in range(20):
+                with engine.begin() as conn:
+                    conn.execute(text('UPDATE counter SET value = value + 1'))
+                    conn.execute(text('INSERT INTO events VALUES (:w, :n)'), {'w': worker_id, 'n': n})
+                    conn.execute(text('SELECT COUNT(*) FROM events')).scalar()
+        except Exception as e:  # pragma: no cover - ошибка попадёт в assert
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT value FROM counter')).scalar() == 160
+    stats = lock.get_stats()
+    assert stats['acquired'] >= 161 and stats['timeouts'] == 0
+    engine.dispose()
+
+
+def test_file_lock_excludes_other_holders(tmp_path):
+    path = str(tmp_path / 'db.write.lock')
+    first, second = DBWriteLock(path), DBWriteLock(path, timeout=0.05)
+
+    assert first.acquire()
+    with pytest.raises(DBWriteLockTimeout):
+        second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+    assert second.get_stats()['timeouts'] == 1
+
+
+def test_memory_database_has_no_write_lock():
+    assert install_write_lock(create_engine('sqlite://')) is None
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты отложенной загрузки тяжёлых колонок и кэша разобранного JSON (models.py).
+"""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Product, Seller, Supplier, SupplierProduct, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        db.session.add(Supplier(id=1, name='Поставщик', code='supplier'))
+        db.session.add(Product(
+            id=1, seller_id=1, nm_id=1001, title='Кружка', description='Длинное описание',
+            characteristics_json=json.dumps([{'id': 5, 'name': 'Цвет', 'value': ['белый']}]),
+            sizes_json=json.dumps([{'techSize': '0', 'skus': ['2000000000011']}]),
+        ))
+        db.session.add(SupplierProduct(
+            id=1, supplier_id=1, external_id='ext-1', title='Ночник',
+            characteristics_json=json.dumps([{'name': 'Материал', 'value': 'пластик'}]),
+            ai_marketplace_json=json.dumps({'characteristics': {'Цвет': 'белый'}}),
+            photo_urls_json='not json',
+        ))
+        db.session.commit()
+        db.session.expunge_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def _loaded(obj):
+    from sqlalchemy import inspect
+
+    return set(obj.__dict__) & set(inspect(type(obj)).column_attrs.keys())
+
+
+def test_list_query_skips_deferred_groups(app):
+    from models import Product, SupplierProduct, db
+
+    sql = str(Product.query.statement)
+    assert 'products.title' in sql
+    for name in ('description', 'characteristics_json', 'sizes_json', 'dimensions_json'):
+        assert f'products.{name}' not in sql
+
+    product = db.session.get(Product, 1)
+    assert 'title' in _loaded(product) and 'description' not in _loaded(product)
+
+    supplier_product = db.session.get(SupplierProduct, 1)
+    assert not {'characteristics_json', 'ai_marketplace_json', 'original_data_json'} & _loaded(supplier_product)
+    assert 'photo_urls_json' in _loaded(supplier_product)
+
+
+def test_access_loads_whole_group(app):
+    from models import Product, db
+
+    product = db.session.get(Product, 1)
+    assert product.description == 'Длинное описание'
+    assert {'characteristics_json', 'sizes_json', 'dimensions_json'} <= _loaded(product)
+
+
+def test_undefer_group_loads_in_one_query(app):
+    from sqlalchemy import event
+    from models import DEFERRED_DETAILS, Product, db
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        product = Product.query.options(db.undefer_group(DEFERRED_DETAILS)).filter_by(id=1).one()
+        assert product.get_characteristics()[0]['name'] == 'Цвет'
+        assert json.loads(product.sizes_json)[0]['skus'] == ['2000000000011']
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(statements) == 1
+
+
+def test_cached_json_reuses_and_invalidates(app):
+    from models import SupplierProduct, db
+
+    product = db.session.get(SupplierProduct, 1)
+    first = product.get_ai_marketplace_data()
+    assert first == {'characteristics': {'Цвет': 'белый'}}
+    assert product.get_ai_marketplace_data() is first
+
+    product.ai_marketplace_json = json.dumps({'characteristics': {}})
+    assert product.get_ai_marketplace_data() == {'characteristics': {}}
+
+    # Пустые колонки и битый JSON — значение по умолчанию
+    assert product.get_photos() == []
+    assert product.get_ai_parsed_data() == {}
+    assert product.get_characteristics() == [{'name': 'Материал', 'value': 'пластик'}]
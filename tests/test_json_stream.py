@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты потокового разбора JSON-массивов (services/json_stream.py).
+"""
+import io
+import json
+
+import pytest
+import requests
+
+from services import json_stream
+from services.json_stream import NotJSONArrayError, iter_json_array
+from services.wb_api_client import WildberriesAPIClient
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _stream_response(payload, status=200):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    return response
+
+
+ROWS = [
+    {'rrd_id': i, 'sa_name': 'Платье },{', 'text': 'кавычка "},{" внутри', 'nested': {'a': [i, {'b': None}]}}
+    for i in range(1, 200)
+]
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def backend(request, monkeypatch):
+    if request.param == 'stdlib':
+        monkeypatch.setattr(json_stream, 'orjson', None)
+    elif json_stream.orjson is None:
+        pytest.skip('orjson не установлен')
+    return request.param
+
+
+class TestIterJsonArray:
+    @pytest.mark.parametrize('chunk_size', [1, 3, 64, 4096, 10 ** 6])
+    def test_rows_match_json_loads(self, backend, chunk_size):
+        data = json.dumps(ROWS, ensure_ascii=False).encode('utf-8')
+        assert list(iter_json_array(_chunks(data, chunk_size))) == ROWS
+
+    @pytest.mark.parametrize('document', [b'', b' [ ] ', b'[12345]', b'[1, 2.5, "a", null, [1], {"a": 1}]'])
+    def test_scalars_and_empty(self, backend, document):
+        expected = json.loads(document) if document.strip() else []
+        for size in (1, 2, 100):
+            assert list(iter_json_array(_chunks(document, size))) == expected
+
+    @pytest.mark.parametrize('document', [b'[1, 2', b'[1 2]', b'[{"a": 1}] x', b'[{"a": 1},'])
+    def test_broken_document_raises(self, backend, document):
+        with pytest.raises(ValueError):
+            list(iter_json_array(_chunks(document, 2)))
+
+    def test_not_array(self, backend):
+        with pytest.raises(NotJSONArrayError):
+            list(iter_json_array([b'{"errors": ["bad token"]}']))
+
+    def test_rows_yielded_before_document_ends(self, backend):
+        def chunks():
+            yield b'[{"id": 1}, {"id": 2}, {"i'
+            raise RuntimeError('соединение оборвалось')
+
+        rows = iter_json_array(chunks())
+        assert [next(rows), next(rows)] == [{'id': 1}, {'id': 2}]
+        with pytest.raises(RuntimeError):
+            next(rows)
+
+
+def test_sales_report_streams_pages(monkeypatch):
+    client = WildberriesAPIClient('key', response_cache=False, coalesce_requests=False)
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kwargs: 0.0)
+    pages = [
+        _stream_response([{'rrd_id': 1}, {'rrd_id': 2}]),
+        _stream_response([{'rrd_id': 3}]),
+    ]
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append((kwargs['params']['rrdid'], kwargs.get('stream')))
+        return pages.pop(0)
+
+    monkeypatch.setattr(client.session, 'request', fake_request)
+    rows = client.get_sales_report('2024-01-01', limit=2)
+
+    assert [r['rrd_id'] for r in rows] == [1, 2, 3]
+    assert calls == [(0, True), (2, True)]
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Seller, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_sync_sales_upserts_in_batches(app, monkeypatch):
+    from models import Seller, WBSale, db
+    from services import wb_data_sync
+
+    db.session.add(WBSale(seller_id=1, srid='s1', sale_id='S1', finished_price=10,
+                          last_change_date=wb_data_sync._parse_dt('2024-01-01T00:00:00')))
+    db.session.commit()
+
+    rows = [{'srid': f's{i}', 'saleID': f'S{i}', 'finishedPrice': 100,
+             'lastChangeDate': '2024-02-01T00:00:00'} for i in range(1, 8)]
+    rows.append({'srid': 's7', 'saleID': 'S7', 'finishedPrice': 100, 'lastChangeDate': '2024-02-01T00:00:00'})
+
+    class FakeSession:
+        def get(self, url, **kwargs):
+            assert kwargs['stream'] is True
+            return _stream_response(rows)
+
+    monkeypatch.setattr(wb_data_sync, '_make_session', lambda api_key: FakeSession())
+    monkeypatch.setattr(wb_data_sync, 'SYNC_STREAM_BATCH_SIZE', 3)
+
+    assert wb_data_sync.sync_sales(db.session.get(Seller, 1)) == 7
+    assert WBSale.query.count() == 7
+    assert WBSale.query.filter_by(srid='s1').one().finished_price == 100
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты keyset-пагинации (services/keyset.py).
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from services.keyset import InvalidCursor, decode_cursor, encode_cursor, iterate_batches, keyset_paginate
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Product, Seller, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        # Повторы и NULL в ключе сортировки
+        prices = [100, None, 50, 100, 75, None, 100, 20, 50, 5, None]
+        for n, price in enumerate(prices, start=1):
+            db.session.add(Product(id=n, seller_id=1, nm_id=1000 + n, price=price,
+                                   updated_at=datetime(2024, 1, 1 + n % 4)))
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def _walk(query, order, per_page):
+    pages, cursor = [], None
+    while True:
+        pagination = keyset_paginate(query, order, cursor=cursor, per_page=per_page)
+        pages.append([p.id for p in pagination.items])
+        if not pagination.has_next:
+            return pages, pagination
+        cursor = pagination.next_cursor
+
+
+@pytest.mark.parametrize('column, descending', [('price', True), ('price', False), ('updated_at', True)])
+def test_walk_matches_offset_order(app, column, descending):
+    from models import Product
+
+    query = Product.query.filter_by(seller_id=1)
+    order = [(getattr(Product, column), descending), (Product.id, descending)]
+    expected = [p.id for p in keyset_paginate(query, order, per_page=100).items]
+    assert len(expected) == 11
+
+    pages, last = _walk(query, order, per_page=3)
+    assert [i for page in pages for i in page] == expected
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert last.total == 11 and last.has_prev
+
+    # Назад от последней страницы — те же страницы в обратном порядке
+    back, cursor = [], last.prev_cursor
+    while cursor:
+        pagination = keyset_paginate(query, order, cursor=cursor, per_page=3)
+        back.append([p.id for p in pagination.items])
+        assert pagination.has_next
+        cursor = pagination.prev_cursor
+    assert back == pages[-2::-1]
+
+
+def test_page_number_without_cursor_uses_offset(app):
+    from models import Product
+
+    order = [(Product.id, False)]
+    pagination = keyset_paginate(Product.query, order, page=2, per_page=4)
+    assert [p.id for p in pagination.items] == [5, 6, 7, 8]
+    assert pagination.has_prev and pagination.has_next and pagination.pages == 3
+    assert keyset_paginate(Product.query, order, cursor=pagination.next_cursor, per_page=4,
+                           count=False).total is None
+
+
+def test_cursor_roundtrip_and_validation():
+    from models import Product
+
+    order = [(Product.updated_at, True), (Product.id, True)]
+    values = [datetime(2024, 5, 1, 12, 30), 42]
+    cursor = encode_cursor(values, order)
+    assert decode_cursor(cursor, order) == (values, 'next')
+    assert decode_cursor(encode_cursor([Decimal('9.90'), 1], order, 'prev'), order) == ([Decimal('9.90'), 1], 'prev')
+
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, [(Product.price, True), (Product.id, True)])
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not-a-cursor', order)
+
+
+def test_iterate_batches(app):
+    from models import Product
+
+    batches = list(iterate_batches(Product.query.filter(Product.id > 2), Product.id, batch_size=4))
+    assert [[p.id for p in batch] for batch in batches] == [[3, 4, 5, 6], [7, 8, 9, 10], [11]]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты метрик внешних запросов (services/metrics.py).
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from services.metrics import MetricsRegistry
+from services.wb_api_client import WBAPIException, WildberriesAPIClient
+
+
+@pytest.fixture
+def metrics():
+    MetricsRegistry._instance = None
+    instance = MetricsRegistry()
+    yield instance
+    MetricsRegistry._instance = None
+
+
+class TestMetricsRegistry:
+    def test_histogram_and_status_counters(self, metrics):
+        metrics.observe_request('content', '/content/v2/object/charcs/7', 1, 0.1, 200)
+        metrics.observe_request('content', '/content/v2/object/charcs/8', 1, 3.0, 429)
+        metrics.observe_request('content', '/content/v2/object/charcs/9', 1, 200.0, 'timeout')
+
+        [row] = metrics.snapshot()
+        assert row['endpoint'] == '/content/v2/object/charcs/{id}'
+        assert row['count'] == 3
+        assert row['errors'] == 2
+        assert row['statuses'] == {'200': 1, '429': 1, 'timeout': 1}
+        assert row['p50'] == 5.0
+        assert row['p95'] == float('inf')
+
+    def test_prometheus_format(self, metrics):
+        metrics.observe_request('content', '/x', None, 0.3, 200)
+        metrics.record_retry('content', '/x', None, 2)
+        metrics.observe_limiter_wait('content', '/x', None, 1.5)
+        text = metrics.render_prometheus()
+
+        labels = 'api_type="content",endpoint="/x",seller=""'
+        assert '# TYPE external_request_duration_seconds histogram' in text
+        assert f'external_request_duration_seconds_bucket{{{labels},le="0.25"}} 0' in text
+        assert f'external_request_duration_seconds_bucket{{{labels},le="0.5"}} 1' in text
+        assert f'external_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+        assert f'external_request_duration_seconds_count{{{labels}}} 1' in text
+        assert f'external_requests_total{{{labels},status="200"}} 1' in text
+        assert f'external_request_retries_total{{{labels}}} 2' in text
+        assert f'rate_limiter_wait_seconds_total{{{labels}}} 1.5' in text
+
+    def test_series_limit(self, metrics):
+        metrics.max_series = 2
+        for i in range(5):
+            metrics.observe_request('content', f'/endpoint-{i}', None, 0.1, 200)
+        endpoints = {row['endpoint']: row['count'] for row in metrics.snapshot()}
+        assert endpoints == {'/endpoint-0': 1, '/endpoint-1': 1, 'other': 3}
+
+
+def test_client_records_metrics(metrics, monkeypatch):
+    client = WildberriesAPIClient('key', response_cache=False, coalesce_requests=False)
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kw: 0.25)
+
+    def fake_request(method, url, **kwargs):
+        if url.endswith('/fail'):
+            raise requests.exceptions.ConnectionError('reset')
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'data': []}).encode('utf-8')
+        response.raw = SimpleNamespace(retries=SimpleNamespace(history=('429', '503')))
+        return response
+
+    monkeypatch.setattr(client.session, 'request', fake_request)
+    client._make_request('GET', 'content', '/content/v2/object/all', seller_id=3)
+    with pytest.raises(WBAPIException):
+        client._make_request('GET', 'content', '/fail')
+
+    rows = {row['endpoint']: row for row in metrics.snapshot()}
+    ok = rows['/content/v2/object/all']
+    assert (ok['seller'], ok['count'], ok['retries'], ok['limiter_wait']) == ('3', 1, 2, 0.25)
+    assert rows['/fail']['statuses'] == {'error': 1}
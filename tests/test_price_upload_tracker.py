@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты фонового отслеживания загрузок цен WB (services/price_upload_tracker.py).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.price_upload_tracker import PriceUploadTracker, register_upload_tasks
+from services.wb_api_client import WildberriesAPIClient
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Seller, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        seller = Seller(id=1, user_id=user.id, company_name='Seller')
+        seller.wb_api_key = 'key'
+        db.session.add(seller)
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+class FakeClient:
+    """WB отвечает заготовленными статусами загрузок"""
+
+    def __init__(self, statuses, goods):
+        self.statuses = statuses
+        self.goods = goods
+        self.calls = []
+
+    def get_price_upload_status(self, upload_id=None, **kwargs):
+        self.calls.append(upload_id)
+        return {'data': self.statuses.get(upload_id) or {}}
+
+    def get_price_upload_goods(self, upload_id, limit=1000, offset=0, **kwargs):
+        return self.goods.get(upload_id, [])[offset:offset + limit]
+
+
+@pytest.fixture
+def make_tracker():
+    def factory(client):
+        PriceUploadTracker._instance = None
+        return PriceUploadTracker(client_factory=lambda api_key: client, workers=2)
+
+    yield factory
+    PriceUploadTracker._instance = None
+
+
+def _batch_with_processing_items(nm_ids):
+    from models import db, PriceChangeBatch, PriceChangeItem, Product
+
+    batch = PriceChangeBatch(seller_id=1, name='Осень', change_type='percent',
+                             status='applying', total_items=len(nm_ids))
+    db.session.add(batch)
+    db.session.flush()
+    for nm_id in nm_ids:
+        product = Product(seller_id=1, nm_id=nm_id, vendor_code=f'v{nm_id}', price=100)
+        db.session.add(product)
+        db.session.flush()
+        db.session.add(PriceChangeItem(batch_id=batch.id, product_id=product.id, nm_id=nm_id,
+                                       old_price=100, new_price=120, status='processing'))
+    db.session.flush()
+    return batch
+
+
+def _make_due(task):
+    task.next_check_at = datetime.utcnow() - timedelta(seconds=1)
+
+
+def test_poll_backoff_then_partial_result(app, make_tracker):
+    from models import db, Notification, PriceHistory, Product
+
+    batch = _batch_with_processing_items([11, 12, 13])
+    task, = register_upload_tasks(1, batch.id, [{'upload_id': 500, 'nm_ids': [11, 12, 13]}])
+    db.session.commit()
+
+    client = FakeClient(statuses={}, goods={})
+    tracker = make_tracker(client)
+
+    # Время проверки ещё не подошло
+    assert tracker.poll_once()['checked'] == 0
+
+    # Загрузка ещё в буфере WB — следующая проверка позже
+    _make_due(task)
+    db.session.commit()
+    assert tracker.poll_once() == {'checked': 1, 'completed': 0, 'expired': 0, 'batches_finished': 0}
+    assert task.status == 'pending' and task.attempts == 1
+    assert task.next_check_at > datetime.utcnow() + timedelta(seconds=5)
+
+    client.statuses[500] = {'uploadID': 500, 'status': 5, 'overAllGoodsNumber': 3, 'successGoodsNumber': 2}
+    client.goods[500] = [
+        {'nmID': 11, 'status': 2}, {'nmID': 12, 'status': 3, 'errorText': 'Цена ниже минимальной'},
+        {'nmID': 13, 'status': 2},
+    ]
+    _make_due(task)
+    db.session.commit()
+    assert tracker.poll_once()['batches_finished'] == 1
+
+    assert (task.status, task.wb_status, task.success_goods) == ('partial', 5, 2)
+    items = {item.nm_id: item for item in batch.items.all()}
+    assert items[11].status == 'applied' and items[13].status == 'applied'
+    assert (items[12].status, items[12].error_message) == ('failed', 'Цена ниже минимальной')
+    assert (batch.status, batch.applied_count, batch.failed_count) == ('partially_applied', 2, 1)
+    assert batch.apply_errors == [{'error': 'Цена ниже минимальной', 'nm_ids': [12]}]
+    assert PriceHistory.query.count() == 2
+    assert float(Product.query.filter_by(nm_id=11).one().price) == 120
+    assert float(Product.query.filter_by(nm_id=12).one().price) == 100
+
+    notification = Notification.query.one()
+    assert notification.category == 'warning' and notification.link == f'/prices/batch/{batch.id}'
+
+
+def test_batch_waits_for_all_uploads_and_expires(app, make_tracker, monkeypatch):
+    from models import db
+
+    batch = _batch_with_processing_items([21, 22])
+    done, stuck = register_upload_tasks(1, batch.id, [
+        {'upload_id': 601, 'nm_ids': [21]}, {'upload_id': 602, 'nm_ids': [22]},
+    ])
+    _make_due(done)
+    _make_due(stuck)
+    db.session.commit()
+
+    client = FakeClient(statuses={601: {'status': 3}}, goods={})
+    tracker = make_tracker(client)
+    assert tracker.poll_once()['batches_finished'] == 0
+    assert sorted(client.calls) == [601, 602]
+    assert batch.status == 'applying'
+
+    # Результат второй загрузки так и не появился
+    monkeypatch.setattr('services.price_upload_tracker.PRICE_UPLOAD_TASK_TTL', 0)
+    _make_due(stuck)
+    db.session.commit()
+    assert tracker.poll_once()['expired'] == 1
+    assert stuck.status == 'expired'
+    assert (batch.status, batch.applied_count, batch.failed_count) == ('partially_applied', 1, 1)
+
+
+def test_upload_prices_batch_reports_upload_tasks(monkeypatch):
+    client = WildberriesAPIClient('key', response_cache=False, coalesce_requests=False)
+
+    def upload(batch, log_to_db=False, seller_id=None):
+        return {'data': {'id': 1000 + batch[0]['nmID'], 'alreadyExists': False}, 'error': False}
+
+    monkeypatch.setattr(client, 'upload_prices_v2', upload)
+    result = client.upload_prices_batch([{'nmID': i, 'price': 100} for i in range(1, 6)], batch_size=2)
+
+    assert sorted((t['upload_id'], tuple(t['nm_ids'])) for t in result['tasks']) == [
+        (1001, (1, 2)), (1003, (3, 4)), (1005, (5,)),
+    ]
+    assert 'accepted' not in result
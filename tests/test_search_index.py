@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты полнотекстового поиска по товарам (services/search_index.py).
+"""
+import json
+
+import pytest
+
+from services.search_index import build_match_query, build_tsquery, ensure_search_indexes, stem_word
+
+
+@pytest.fixture
+def app():
+    from flask import Flask
+    from models import db, Seller, Supplier, User
+
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='seller', email='seller@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Seller(id=1, user_id=user.id, company_name='Seller'))
+        db.session.add(Supplier(id=1, name='Поставщик', code='supplier'))
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+def _product(nm_id, title, vendor_code='', brand='', skus=()):
+    from models import Product, db
+
+    product = Product(seller_id=1, nm_id=nm_id, title=title, vendor_code=vendor_code, brand=brand,
+                      sizes_json=json.dumps([{'techSize': '0', 'skus': list(skus)}]) if skus else None)
+    db.session.add(product)
+    return product
+
+
+def _search(text):
+    from models import Product
+    from services.search_index import apply_search
+
+    query, rank = apply_search(Product.query.filter_by(seller_id=1), Product, text)
+    if rank is not None:
+        query = query.order_by(rank)
+    return [p.nm_id for p in query.all()], rank
+
+
+def test_stemming_and_match_query():
+    assert stem_word('Кружки') == 'кружк'
+    assert stem_word('красная') == 'красн'
+    assert stem_word('Зелёный') == 'зелен'
+    assert stem_word('чай') == 'чай'
+    assert stem_word('ABC') == 'abc'
+    assert build_match_query('Кружки ABC-12') == '"кружк"* "abc"* "12"*'
+    assert build_match_query(' — ') is None
+    assert build_tsquery('красные кружки') == 'красн:* & кружк:*'
+
+
+def test_existing_rows_are_indexed_and_searched_by_morphology(app):
+    from models import db
+
+    _product(101, 'Кружка керамическая', 'MUG-01', 'Дом')
+    _product(102, 'Красная футболка', 'TS-RED', 'Ёлка')
+    _product(103, 'Чашка', 'CUP-7', skus=['2000000012345'])
+    db.session.commit()
+
+    assert ensure_search_indexes(db.engine) == {'products': True, 'supplier_products': True}
+    assert ensure_search_indexes(db.engine)['products'] is True  # повторный вызов безопасен
+
+    assert _search('кружки')[0] == [101]
+    assert _search('КРАСНЫЕ футболки')[0] == [102]
+    assert _search('елка')[0] == [102]
+    assert _search('mug')[0] == [101]
+    assert _search('2000000012')[0] == [103]
+    assert sorted(_search('10')[0]) == [101, 102, 103]  # префикс nm_id
+    assert _search('кружки чашки')[0] == []
+
+
+def test_triggers_keep_index_in_sync(app):
+    from models import db
+
+    ensure_search_indexes(db.engine)
+    product = _product(201, 'Платье летнее')
+    db.session.commit()
+    assert _search('платья')[0] == [201]
+
+    product.title = 'Сарафан'
+    product.price = 100  # колонка вне индекса
+    db.session.commit()
+    assert _search('платья')[0] == []
+    assert _search('сарафаны')[0] == [201]
+
+    product.sizes_json = json.dumps([{'skus': ['4600001']}])
+    db.session.commit()
+    assert _search('4600001')[0] == [201]
+
+    db.session.delete(product)
+    db.session.commit()
+    assert _search('сарафан')[0] == []
+
+
+def test_identifier_match_ranks_above_title(app):
+    from models import db
+
+    ensure_search_indexes(db.engine)
+    _product(301, 'Набор для рисования ART', 'PEN-1')
+    _product(302, 'Карандаш', 'ART-5000')
+    db.session.commit()
+
+    ids, rank = _search('art')
+    assert rank is not None
+    assert ids == [302, 301]
+
+
+def test_falls_back_to_ilike_without_index(app):
+    from models import db
+
+    _product(401, 'Mug classic', 'M-1')
+    _product(412345, 'Другое')
+    db.session.commit()
+
+    ids, rank = _search('classic')
+    assert rank is None and ids == [401]
+    assert _search('1234')[0] == [412345]
+
+
+def test_supplier_products_search(app):
+    from models import SupplierProduct, db
+    from services.supplier_service import SupplierService
+
+    ensure_search_indexes(db.engine)
+    db.session.add_all([
+        SupplierProduct(supplier_id=1, external_id='ext-77', vendor_code='V-1', title='Ночник детский'),
+        SupplierProduct(supplier_id=1, external_id='ext-78', title='Светильник', barcode='4601234567890'),
+    ])
+    db.session.commit()
+
+    def titles(search, **kwargs):
+        pagination = SupplierService.get_products(1, search=search, **kwargs)
+        return [p.title for p in pagination.items]
+
+    assert titles('детские ночники', sort_by='relevance') == ['Ночник детский']
+    assert sorted(titles('ext')) == ['Ночник детский', 'Светильник']
+    assert titles('4601234') == ['Светильник']
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты исполнителя синхронизаций (services/sync_executor.py).
+"""
+import threading
+import time
+
+import pytest
+
+from services.sync_executor import SyncExecutor, PRIORITY_MANUAL, PRIORITY_SCHEDULED
+
+
+@pytest.fixture
+def executor():
+    """Исполнитель с одним воркером, занятым блокирующей задачей."""
+    SyncExecutor._instance = None
+    instance = SyncExecutor(max_workers=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    instance.submit(0, blocker)
+    assert started.wait(5)
+    yield instance, release
+    release.set()
+    SyncExecutor._instance = None
+
+
+def _wait_idle(instance, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        stats = instance.get_stats()
+        if not stats['running'] and not stats['queued']:
+            return
+        time.sleep(0.01)
+    raise AssertionError('executor did not drain')
+
+
+class TestSyncExecutor:
+    def test_manual_runs_before_scheduled(self, executor):
+        instance, release = executor
+        order = []
+        instance.submit(1, order.append, args=(1,), priority=PRIORITY_SCHEDULED)
+        instance.submit(2, order.append, args=(2,), priority=PRIORITY_SCHEDULED)
+        instance.submit(3, order.append, args=(3,), priority=PRIORITY_MANUAL)
+
+        assert instance.get_seller_status(3)['position'] == 1
+        assert instance.get_seller_status(2)['position'] == 3
+
+        release.set()
+        _wait_idle(instance)
+        assert order == [3, 1, 2]
+
+    def test_dedup_and_priority_bump(self, executor):
+        instance, release = executor
+        calls = []
+        first = instance.submit(1, calls.append, args=('scheduled',))
+        instance.submit(2, calls.append, args=('other',))
+        again = instance.submit(1, calls.append, args=('manual',), priority=PRIORITY_MANUAL)
+
+        assert not first['deduplicated']
+        assert again['deduplicated'] and again['position'] == 1
+        assert instance.get_stats()['deduplicated'] == 1
+
+        release.set()
+        _wait_idle(instance)
+        assert calls == ['manual', 'other']
+
+    def test_running_seller_is_not_queued_twice(self, executor):
+        instance, release = executor
+        result = instance.submit(0, lambda: None)
+        assert result['state'] == 'running'
+        assert instance.get_seller_status(0)['state'] == 'running'
+        assert instance.get_stats()['queued'] == []
+
+    def test_fairness_prefers_least_recently_synced(self, executor):
+        instance, release = executor
+        order = []
+        release.set()
+        instance.submit(1, lambda: None)
+        _wait_idle(instance)
+
+        # Продавец 1 уже синхронизировался — продавец 2 (ещё ни разу) идёт первым
+        gate = threading.Event()
+        blocked = threading.Event()
+
+        def blocker():
+            blocked.set()
+            gate.wait(5)
+
+        instance.submit(9, blocker)
+        assert blocked.wait(5)
+        instance.submit(1, order.append, args=(1,))
+        instance.submit(2, order.append, args=(2,))
+        assert instance.get_seller_status(2)['position'] == 1
+
+        gate.set()
+        _wait_idle(instance)
+        assert order == [2, 1]
+
+    def test_failed_job_frees_worker(self, executor):
+        instance, release = executor
+        done = threading.Event()
+
+        def fail():
+            raise RuntimeError('boom')
+
+        instance.submit(1, fail)
+        instance.submit(2, done.set)
+        release.set()
+        assert done.wait(5)
+        _wait_idle(instance)
+        assert instance.get_stats()['failed'] == 1
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты конвейера синхронизации (services/sync_pipeline.py).
+"""
+import threading
+
+import pytest
+
+from services.sync_pipeline import SyncPipeline, get_pipeline_stats
+
+
+class TestSyncPipeline:
+    def test_batches_flow_through_stages_in_order(self):
+        written = []
+        SyncPipeline('test:order', queue_size=1) \
+            .source('fetch', ([i, i + 1] for i in range(0, 20, 2))) \
+            .stage('double', lambda batch: [x * 2 for x in batch]) \
+            .sink('write', written.extend) \
+            .run()
+        assert written == [x * 2 for x in range(20)]
+
+    def test_stages_run_in_separate_threads(self):
+        threads = {}
+
+        def remember(name):
+            def func(batch):
+                threads[name] = threading.current_thread().name
+                return batch
+            return func
+
+        SyncPipeline('test:threads') \
+            .source('fetch', [[1]]) \
+            .stage('prices', remember('prices')) \
+            .sink('write', remember('write')) \
+            .run()
+        assert threads['write'] == threading.current_thread().name
+        assert threads['prices'] != threads['write']
+
+    def test_source_error_keeps_fetched_batches(self):
+        written = []
+
+        def pages():
+            yield [1]
+            yield [2]
+            raise RuntimeError('page 3 failed')
+
+        pipeline = SyncPipeline('test:source-error') \
+            .source('fetch', pages()) \
+            .stage('noop', lambda batch: batch) \
+            .sink('write', written.extend)
+        with pytest.raises(RuntimeError, match='page 3'):
+            pipeline.run()
+        assert written == [1, 2]
+        assert pipeline.status == 'failed'
+
+    def test_sink_error_stops_source(self):
+        produced = []
+
+        def pages():
+            for i in range(1000):
+                produced.append(i)
+                yield [i]
+
+        def write(batch):
+            raise ValueError('db locked')
+
+        with pytest.raises(ValueError):
+            SyncPipeline('test:sink-error', queue_size=2) \
+                .source('fetch', pages()) \
+                .sink('write', write) \
+                .run()
+        assert len(produced) < 1000
+
+    def test_stats(self):
+        SyncPipeline('test:stats') \
+            .source('fetch', [{'size': 3}, {'size': 2}]) \
+            .stage('prices', lambda batch: batch) \
+            .sink('write', lambda batch: None) \
+            .run()
+
+        stats = next(p for p in get_pipeline_stats() if p['name'] == 'test:stats')
+        assert stats['status'] == 'completed'
+        stages = {stage['name']: stage for stage in stats['stages']}
+        assert list(stages) == ['fetch', 'prices', 'write']
+        assert stages['write']['items'] == 5
+        assert stages['write']['batches'] == 2
+        assert stages['fetch']['queue_depth'] is None
+        assert stages['prices']['queue_size'] == stages['write']['queue_size']
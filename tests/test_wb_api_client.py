@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты для синхронного клиента WB API (без сети).
+"""
+import pytest
+
+from services.wb_api_client import (
+    WildberriesAPIClient, WBAPIException, WBAuthException, WBRateLimitException, raise_for_wb_status
+)
+
+
+PAGES = {
+    None: {'cards': [{'nmID': 1}, {'nmID': 2}], 'cursor': {'updatedAt': 't1', 'nmID': 2}},
+    2: {'cards': [{'nmID': 3}, {'nmID': 4}], 'cursor': {'updatedAt': 't2', 'nmID': 4}},
+    4: {'cards': [{'nmID': 5}], 'cursor': {'updatedAt': 't3', 'nmID': 5}},
+    5: {'cards': [], 'cursor': {}},
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    instance = WildberriesAPIClient('key')
+    requested = []
+
+    def fake_get_cards_list(limit=100, cursor_updated_at=None, cursor_nm_id=None, **kwargs):
+        requested.append(cursor_nm_id)
+        return PAGES[cursor_nm_id]
+
+    monkeypatch.setattr(instance, 'get_cards_list', fake_get_cards_list)
+    instance.requested = requested
+    return instance
+
+
+class TestIterCards:
+    def test_yields_pages_with_next_cursor(self, client):
+        pages = list(client.iter_cards())
+        assert [[c['nmID'] for c in cards] for cards, _ in pages] == [[1, 2], [3, 4], [5]]
+        assert pages[0][1] == {'updatedAt': 't1', 'nmID': 2}
+        assert pages[-1][1] == {'updatedAt': 't3', 'nmID': 5}
+
+    def test_resume_from_cursor(self, client):
+        pages = list(client.iter_cards(cursor_updated_at='t2', cursor_nm_id=4))
+        assert [c['nmID'] for cards, _ in pages for c in cards] == [5]
+        assert client.requested == [4, 5]
+
+    def test_is_lazy(self, client):
+        iterator = client.iter_cards()
+        next(iterator)
+        assert client.requested == [None]
+
+    def test_get_all_cards(self, client):
+        assert [c['nmID'] for c in client.get_all_cards()] == [1, 2, 3, 4, 5]
+
+
+class TestRaiseForWbStatus:
+    def test_ok(self):
+        raise_for_wb_status(200, '{}')
+
+    def test_auth(self):
+        with pytest.raises(WBAuthException):
+            raise_for_wb_status(401, '')
+
+    def test_rate_limit(self):
+        with pytest.raises(WBRateLimitException):
+            raise_for_wb_status(429, '')
+
+    def test_additional_errors(self):
+        with pytest.raises(WBAPIException, match='Детали: title: too long'):
+            raise_for_wb_status(400, '{"errorText": "Invalid", "additionalErrors": {"title": "too long"}}')
+
+    def test_non_json_body(self):
+        with pytest.raises(WBAPIException, match='gateway down'):
+            raise_for_wb_status(502, 'gateway down')
+
+
+class TestGetCardsListSort:
+    def _capture(self, monkeypatch):
+        instance = WildberriesAPIClient('key')
+        captured = {}
+
+        class FakeResponse:
+            def json(self):
+                return {'cards': []}
+
+        def fake_make_request(method, api_type, endpoint, **kwargs):
+            captured.update(kwargs['json'])
+            return FakeResponse()
+
+        monkeypatch.setattr(instance, '_make_request', fake_make_request)
+        return instance, captured
+
+    def test_default_sort_not_sent(self, monkeypatch):
+        client, body = self._capture(monkeypatch)
+        client.get_cards_list()
+        assert 'sort' not in body['settings']
+
+    def test_newest_first(self, monkeypatch):
+        client, body = self._capture(monkeypatch)
+        client.get_cards_list(ascending=False)
+        assert body['settings']['sort'] == {'ascending': False}
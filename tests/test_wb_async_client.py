@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты для асинхронного клиента WB API (httpx.MockTransport, без сети).
+"""
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from services.wb_api_client import WBAPIException, WBAuthException, WBRateLimitException, WildberriesAPIClient
+from services.wb_async_client import AsyncWildberriesAPIClient, fetch_parallel
+from services.wb_rate_limiter import SharedRateLimiter
+from services.wb_retry import CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def limiter(tmp_path):
+    """Изолированный лимитер без ограничений по времени"""
+    SharedRateLimiter._instance = None
+    instance = SharedRateLimiter(db_path=str(tmp_path / 'limits.db'))
+    instance.reserve = lambda *args, **kwargs: 0.0
+    yield instance
+    SharedRateLimiter._instance = None
+
+
+def make_client(handler, **kwargs):
+    return AsyncWildberriesAPIClient('key', transport=httpx.MockTransport(handler), **kwargs)
+
+
+def run(coro_factory):
+    async def main():
+        return await coro_factory()
+    return asyncio.run(main())
+
+
+class TestErrorMapping:
+    @pytest.mark.parametrize('status, exc', [
+        (401, WBAuthException),
+        (429, WBRateLimitException),
+        (400, WBAPIException),
+    ])
+    def test_status_mapping(self, status, exc):
+        client = make_client(lambda request: httpx.Response(status, json={'errorText': 'boom'}), max_retries=0)
+        with pytest.raises(exc):
+            run(lambda: client.get_cards_list())
+
+    def test_error_text_from_wb(self):
+        client = make_client(lambda request: httpx.Response(400, json={'errorText': 'Неверный фильтр'}))
+        with pytest.raises(WBAPIException, match='Неверный фильтр'):
+            run(lambda: client.get_cards_list())
+
+    def test_retry_on_server_error(self, monkeypatch):
+        calls = []
+
+        def handler(request):
+            calls.append(1)
+            if len(calls) == 1:
+                return httpx.Response(503)
+            return httpx.Response(200, json={'cards': []})
+
+        async def no_sleep(_):
+            return None
+
+        monkeypatch.setattr('services.wb_async_client.asyncio.sleep', no_sleep)
+        client = make_client(handler)
+        assert run(lambda: client.get_cards_list()) == {'cards': []}
+        assert len(calls) == 2
+
+    def test_probe_released_on_unexpected_error(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('services.wb_retry.time.time', lambda: now[0])
+        CircuitBreaker._instance = None
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=30)
+        calls = []
+
+        def handler(request):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+            return httpx.Response(200, json={'cards': []})
+
+        try:
+            client = make_client(handler)
+            breaker.record_failure(urlsplit(client._get_base_url('content')).netloc)
+            now[0] += 30
+            with pytest.raises(RuntimeError):
+                run(lambda: client.get_cards_list())
+            assert run(lambda: client.get_cards_list()) == {'cards': []}
+        finally:
+            CircuitBreaker._instance = None
+
+
+class TestPagination:
+    def test_all_goods_prices_concurrent_pages(self):
+        total = 2500
+
+        def handler(request):
+            offset = int(request.url.params['offset'])
+            limit = int(request.url.params['limit'])
+            goods = [{'nmID': i} for i in range(offset, min(offset + limit, total))]
+            return httpx.Response(200, json={'data': {'listGoods': goods}})
+
+        client = make_client(handler, max_concurrency=2)
+        goods = run(lambda: client.get_all_goods_prices(batch_size=1000))
+        assert [g['nmID'] for g in goods] == list(range(total))
+
+    def test_single_page_fetched_once(self):
+        offsets = []
+
+        def handler(request):
+            offsets.append(int(request.url.params['offset']))
+            return httpx.Response(200, json={'data': {'listGoods': [{'nmID': 1}]}})
+
+        client = make_client(handler, max_concurrency=8)
+        goods = run(lambda: client.get_all_goods_prices(batch_size=1000))
+        assert [g['nmID'] for g in goods] == [1]
+        assert offsets == [0]
+
+    def test_sales_funnel_pages_sequential(self):
+        offsets = []
+
+        def handler(request):
+            offset = json.loads(request.content)['offset']
+            offsets.append(offset)
+            products = [{'nmId': i} for i in range(offset, min(offset + 50, 70))]
+            return httpx.Response(200, json={'data': {'products': products}})
+
+        client = make_client(handler, max_concurrency=8)
+        products = run(lambda: client.get_sales_funnel_products_all('2024-01-01', '2024-01-07', log_to_db=False))
+        assert len(products) == 70
+        assert offsets == [0, 50]
+
+    def test_all_cards_cursor(self):
+        pages = {
+            None: {'cards': [{'nmID': 1}, {'nmID': 2}], 'cursor': {'updatedAt': 't1', 'nmID': 2}},
+            2: {'cards': [{'nmID': 3}], 'cursor': {'updatedAt': 't2', 'nmID': 3}},
+            3: {'cards': [], 'cursor': {}},
+        }
+
+        def handler(request):
+            cursor = json.loads(request.content)['settings']['cursor']
+            return httpx.Response(200, json=pages[cursor.get('nmID')])
+
+        client = make_client(handler)
+        cards = run(lambda: client.get_all_cards())
+        assert [c['nmID'] for c in cards] == [1, 2, 3]
+
+
+class TestFetchParallel:
+    def test_collects_results_and_errors(self, monkeypatch):
+        async def get_all_cards(self, batch_size=100):
+            return [{'nmID': 1}]
+
+        async def get_stocks(self, date_from):
+            raise WBAPIException('stocks down')
+
+        monkeypatch.setattr(AsyncWildberriesAPIClient, 'get_all_cards', get_all_cards)
+        monkeypatch.setattr(AsyncWildberriesAPIClient, 'get_stocks', get_stocks)
+
+        results = fetch_parallel(WildberriesAPIClient('key'), {
+            'cards': ('get_all_cards', {}),
+            'stocks': ('get_stocks', {'date_from': '2024-01-01'}),
+        })
+        assert results['cards'] == [{'nmID': 1}]
+        assert isinstance(results['stocks'], WBAPIException)
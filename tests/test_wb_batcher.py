@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты пакетной отправки в WB (services/wb_batcher.py).
+"""
+import json
+import threading
+
+from services.wb_api_client import WBAPIException, WBAuthException, WildberriesAPIClient
+from services.wb_batcher import WBBatcher, item_size, pack_batches
+
+
+def _cards(count, text_size=10):
+    return [{'nmID': i, 'description': 'x' * text_size} for i in range(1, count + 1)]
+
+
+class TestPackBatches:
+    def test_limits_by_count_and_bytes(self):
+        cards = _cards(10)
+        size = item_size(cards[0])
+        # Тело из 3 карточек: [a, b, c]
+        three = 2 + 3 * size + 2 * 2
+        batches = pack_batches(cards, max_items=100, max_bytes=three)
+        assert [len(b) for b in batches] == [3, 3, 3, 1]
+        assert all(len(json.dumps(b)) <= three for b in batches)
+
+        assert [len(b) for b in pack_batches(cards, max_items=4, max_bytes=10 ** 6)] == [4, 4, 2]
+
+    def test_oversized_item_goes_alone(self):
+        cards = [{'nmID': 1}, {'nmID': 2, 'description': 'x' * 500}, {'nmID': 3}]
+        assert [len(b) for b in pack_batches(cards, max_items=10, max_bytes=100)] == [1, 1, 1]
+
+    def test_size_matches_requests_body(self):
+        # requests сериализует json= с ensure_ascii: кириллица занимает \\uXXXX
+        card = {'nmID': 1, 'title': 'Платье'}
+        assert item_size(card) == len(json.dumps(card).encode('utf-8'))
+        assert item_size(card) > len(json.dumps(card, ensure_ascii=False).encode('utf-8'))
+
+
+class TestWBBatcher:
+    def test_failing_items_isolated(self):
+        sent = []
+        lock = threading.Lock()
+
+        def send(batch):
+            with lock:
+                sent.append([c['nmID'] for c in batch])
+            if any(c['nmID'] in (3, 7) for c in batch):
+                raise WBAPIException('bad request')
+            return {'error': False}
+
+        report = WBBatcher(send, max_items=8, max_bytes=10 ** 6, workers=2).run(_cards(10))
+
+        assert (report['success'], report['failed']) == (8, 2)
+        assert report['items'][3] == {'success': False, 'error': 'bad request'}
+        assert report['items'][4] == {'success': True, 'error': None}
+        assert sorted(nm for e in report['errors'] for nm in e['nm_ids']) == [3, 7]
+        # Каждый успешный элемент отправлен успешно ровно один раз
+        ok = [nm for batch in sent for nm in batch if not {3, 7} & set(batch)]
+        assert sorted(ok) == [1, 2, 4, 5, 6, 8, 9, 10]
+
+    def test_auth_error_not_split(self):
+        calls = []
+
+        def send(batch):
+            calls.append(len(batch))
+            raise WBAuthException('401')
+
+        report = WBBatcher(send, max_items=10, max_bytes=10 ** 6).run(_cards(6))
+        assert calls == [6]
+        assert report['failed'] == 6 and len(report['errors']) == 1
+
+    def test_invalid_and_oversized_items_not_sent(self):
+        calls = []
+        batcher = WBBatcher(lambda batch: calls.append(batch), max_items=10, max_bytes=100,
+                            validate=lambda c: 'нет nmID' if c['nmID'] == 2 else None)
+        report = batcher.run([{'nmID': 1}, {'nmID': 2}, {'nmID': 3, 'description': 'x' * 200}])
+        assert [[c['nmID'] for c in b] for b in calls] == [[1]]
+        assert report['items'][2]['error'] == 'нет nmID'
+        assert 'превышает лимит' in report['items'][3]['error']
+        assert batcher.stats['invalid'] == 1 and batcher.stats['oversized'] == 1
+
+
+def test_upload_prices_batch_per_item_results(monkeypatch):
+    client = WildberriesAPIClient('key', response_cache=False, coalesce_requests=False)
+    uploaded = []
+
+    def upload(batch, log_to_db=False, seller_id=None):
+        if any(p['nmID'] == 5 for p in batch):
+            raise WBAPIException('API Error: invalid price')
+        uploaded.extend(p['nmID'] for p in batch)
+        return {'error': False}
+
+    monkeypatch.setattr(client, 'upload_prices_v2', upload)
+    prices = [{'nmID': i, 'price': 100} for i in range(1, 9)] + [{'nmID': 9, 'price': 0}]
+    result = client.upload_prices_batch(prices, batch_size=4)
+
+    assert (result['total'], result['success'], result['failed']) == (9, 7, 2)
+    assert sorted(uploaded) == [1, 2, 3, 4, 6, 7, 8]
+    assert result['items'][5]['error'] == 'API Error: invalid price'
+    assert result['items'][9]['error'] == 'Некорректная цена: 0'
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты локального стенда WB API (services/wb_fake_server.py) с настоящим клиентом.
+"""
+import asyncio
+
+import pytest
+
+from services.wb_api_client import WildberriesAPIClient
+from services.wb_async_client import AsyncWildberriesAPIClient
+from services.wb_fake_server import FakeWBConfig, FakeWBDataset, FakeWBServer
+from services.wb_rate_limiter import get_shared_rate_limiter
+
+
+@pytest.fixture
+def run_server():
+    servers = []
+
+    def factory(cards=20, **config):
+        server = FakeWBServer(FakeWBDataset.generate(cards=cards, seed=7), FakeWBConfig(**config)).start()
+        servers.append(server)
+        return server
+
+    yield factory
+    for server in servers:
+        server.stop()
+
+
+def _client(server, monkeypatch):
+    client = WildberriesAPIClient('key', base_url=server.url, response_cache=False, coalesce_requests=False)
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kwargs: 0.0)
+    return client
+
+
+def test_generated_dataset_is_repeatable():
+    first, second = FakeWBDataset.generate(cards=30, seed=3), FakeWBDataset.generate(cards=30, seed=3)
+    assert first.cards == second.cards and first.prices == second.prices
+    assert len({c['vendorCode'] for c in first.cards}) == 30
+
+
+def test_cards_cursor_pagination(run_server, monkeypatch):
+    server = run_server(cards=23, cards_page_limit=5)
+    client = _client(server, monkeypatch)
+
+    pages = list(client.iter_cards(batch_size=100))
+    assert [len(cards) for cards, _ in pages] == [5, 5, 5, 5, 3]
+    nm_ids = [card['nmID'] for cards, _ in pages for card in cards]
+    assert len(set(nm_ids)) == 23
+    # По умолчанию — от недавно изменённых к старым
+    assert nm_ids == sorted(nm_ids, reverse=True)
+
+    ascending = [c['nmID'] for cards, _ in client.iter_cards(ascending=True) for c in cards]
+    assert ascending == sorted(nm_ids)
+
+    # Продолжение с сохранённого курсора
+    cursor = pages[1][1]
+    rest = [c['nmID'] for cards, _ in client.iter_cards(cursor_updated_at=cursor['updatedAt'],
+                                                          cursor_nm_id=cursor['nmID']) for c in cards]
+    assert rest == nm_ids[10:]
+
+
+def test_rate_limit_injection_is_retried(run_server, monkeypatch):
+    server = run_server(cards=50, prices_page_limit=10, rate_limit_every=3, rate_limit_retry=0.01)
+    client = _client(server, monkeypatch)
+
+    goods = client.get_all_goods_prices(batch_size=10)
+    assert len({g['nmID'] for g in goods}) == 50
+    stats = server.get_stats()
+    assert stats['throttled'] >= 2
+    assert stats['endpoints']['GET /api/v2/list/goods/filter']['requests'] == stats['requests']
+
+
+def test_card_upload_and_price_upload(run_server, monkeypatch):
+    server = run_server(cards=3)
+    client = _client(server, monkeypatch)
+
+    variant = {'vendorCode': 'NEW-1', 'brand': 'Nord', 'title': 'Кружка',
+               'sizes': [{'price': 0, 'skus': ['4600000000011']}]}
+    client.create_product_card(subject_id=3091, variants=[variant])
+    card = client.get_card_by_vendor_code('NEW-1')
+    assert card['subjectID'] == 3091 and card['sizes'][0]['chrtID']
+
+    # Повтор артикула попадает в список ошибок создания
+    client.create_product_card(subject_id=3091, variants=[variant])
+    errors = client.get_cards_errors_list()['data']['items']
+    assert errors[0]['vendorCodes'] == ['NEW-1']
+
+    result = client.upload_prices_batch([{'nmID': card['nmID'], 'price': 990, 'discount': 10}])
+    upload_id = result['tasks'][0]['upload_id']
+    assert client.get_price_upload_status(upload_id=upload_id)['data']['status'] == 3
+    price = client.get_goods_prices(filter_nm_id=card['nmID'])['data']['listGoods'][0]
+    assert price['sizes'][0]['price'] == 990 and price['discount'] == 10
+
+
+def test_realization_report_pages_by_rrd_id(run_server, monkeypatch):
+    server = run_server(cards=10)
+    client = _client(server, monkeypatch)
+
+    rows = client.get_sales_report('2024-01-01', limit=7)
+    assert [r['rrd_id'] for r in rows] == list(range(1, 31))
+
+
+def test_async_client_fallback_uses_base_url(run_server, monkeypatch):
+    pytest.importorskip('httpx')
+    server = run_server(cards=5)
+    monkeypatch.setattr(get_shared_rate_limiter(), 'acquire', lambda *args, **kwargs: 0.0)
+    vendor_code = server.dataset.cards[0]['vendorCode']
+
+    async def main():
+        async with AsyncWildberriesAPIClient('key', base_url=server.url) as client:
+            # get_card_by_vendor_code нет в асинхронном клиенте — вызов идёт через синхронный
+            return await client.get_card_by_vendor_code(vendor_code)
+
+    assert asyncio.run(main())['vendorCode'] == vendor_code
+    assert server.get_stats()['requests'] >= 1
+
+
+def test_dataset_round_trip(tmp_path):
+    dataset = FakeWBDataset.generate(cards=5)
+    dataset.save(str(tmp_path))
+    loaded = FakeWBDataset.load(str(tmp_path))
+    assert loaded.cards == dataset.cards
+    assert loaded.charcs == dataset.charcs
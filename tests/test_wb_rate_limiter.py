@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты для общего rate limiter WB API (token bucket).
+"""
+import pytest
+
+from services.wb_rate_limiter import SharedRateLimiter, resolve_bucket, WB_RATE_LIMITS
+from services.wb_api_client import RateLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    """Свежий экземпляр лимитера с отдельной БД."""
+    SharedRateLimiter._instance = None
+    instance = SharedRateLimiter(db_path=str(tmp_path / 'limits.db'))
+    yield instance
+    SharedRateLimiter._instance = None
+
+
+class TestResolveBucket:
+    def test_content_read(self):
+        bucket, rule = resolve_bucket('content', '/content/v2/get/cards/list')
+        assert bucket == 'content'
+        assert rule == WB_RATE_LIMITS['content']
+
+    def test_content_write_has_own_bucket(self):
+        bucket, rule = resolve_bucket('content', '/content/v2/cards/update')
+        assert bucket == 'content_write'
+        assert rule.per_minute == 10
+
+    def test_cards_error_list_is_content_read(self):
+        bucket, _ = resolve_bucket('content', '/content/v2/cards/error/list')
+        assert bucket == 'content'
+
+    def test_statistics_per_endpoint(self):
+        bucket_a, _ = resolve_bucket('statistics', '/api/v1/supplier/orders')
+        bucket_b, _ = resolve_bucket('statistics', '/api/v1/supplier/stocks')
+        assert bucket_a != bucket_b
+
+    def test_unknown_type_falls_back_to_content(self):
+        _, rule = resolve_bucket('unknown', '/x')
+        assert rule == WB_RATE_LIMITS['content']
+
+
+class TestSharedRateLimiter:
+    def test_burst_is_free(self, limiter):
+        burst = WB_RATE_LIMITS['content'].burst
+        delays = [limiter.reserve('key', 'content', '/x') for _ in range(burst)]
+        assert all(d == 0 for d in delays)
+
+    def test_delay_after_burst(self, limiter):
+        rule = WB_RATE_LIMITS['content']
+        for _ in range(rule.burst):
+            limiter.reserve('key', 'content', '/x')
+        first = limiter.reserve('key', 'content', '/x')
+        second = limiter.reserve('key', 'content', '/x')
+        assert first == pytest.approx(1 / rule.rate, rel=0.1)
+        assert second == pytest.approx(2 / rule.rate, rel=0.1)
+
+    def test_keys_are_independent(self, limiter):
+        for _ in range(WB_RATE_LIMITS['content'].burst):
+            limiter.reserve('key-a', 'content', '/x')
+        assert limiter.reserve('key-b', 'content', '/x') == 0
+
+    def test_api_types_are_independent(self, limiter):
+        for _ in range(WB_RATE_LIMITS['content'].burst):
+            limiter.reserve('key', 'content', '/x')
+        assert limiter.reserve('key', 'discounts', '/api/v2/list/goods/filter') == 0
+
+    def test_state_shared_between_instances(self, tmp_path):
+        """Два экземпляра на одной БД (как два воркера) делят один бюджет."""
+        db_path = str(tmp_path / 'shared.db')
+        SharedRateLimiter._instance = None
+        first = SharedRateLimiter(db_path=db_path)
+        SharedRateLimiter._instance = None
+        second = SharedRateLimiter(db_path=db_path)
+        SharedRateLimiter._instance = None
+
+        for _ in range(WB_RATE_LIMITS['content'].burst):
+            first.reserve('key', 'content', '/x')
+        assert second.reserve('key', 'content', '/x') > 0
+
+    def test_memory_fallback(self, limiter):
+        limiter._use_sqlite = False
+        rule = WB_RATE_LIMITS['content']
+        for _ in range(rule.burst):
+            assert limiter.reserve('key', 'content', '/x') == 0
+        assert limiter.reserve('key', 'content', '/x') > 0
+
+    def test_stats(self, limiter):
+        for _ in range(WB_RATE_LIMITS['content'].burst + 1):
+            limiter.reserve('key', 'content', '/x')
+        stats = limiter.get_stats()['content']
+        assert stats['requests'] == WB_RATE_LIMITS['content'].burst + 1
+        assert stats['throttled'] == 1
+
+
+class TestLocalRateLimiter:
+    def test_no_wait_within_limit(self):
+        limiter = RateLimiter(max_requests=5, time_window=60)
+        for _ in range(5):
+            limiter.wait_if_needed()
+        assert len(limiter.requests_log) == 5
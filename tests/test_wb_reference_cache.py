@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты постоянного кэша справочников WB (services/wb_reference_cache.py).
+"""
+import time
+
+import pytest
+
+from services import wb_reference_cache
+from services.wb_reference_cache import WBReferenceCache
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    db_path = str(tmp_path / 'reference.db')
+
+    def factory(ttl=3600):
+        # Новый экземпляр — как другой процесс с тем же файлом
+        WBReferenceCache._instance = None
+        return WBReferenceCache(db_path=db_path, ttl=ttl)
+
+    yield factory
+    WBReferenceCache._instance = None
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.colors = [{'name': 'красный'}]
+
+    def _directory(self, name, data):
+        self.calls.append(name)
+        return {'data': data}
+
+    def get_directory_colors(self, locale='ru'):
+        return self._directory('colors', self.colors)
+
+    def __getattr__(self, item):
+        if item.startswith('get_directory_'):
+            return lambda locale='ru': self._directory(item[len('get_directory_'):], [])
+        raise AttributeError(item)
+
+    def get_parent_categories(self, locale='ru'):
+        return self._directory('parent_categories', [{'id': 1}])
+
+    def get_subjects_list(self, limit=1000, offset=0):
+        self.calls.append(f'subjects:{offset}')
+        total = 1500
+        return {'data': [{'subjectID': i} for i in range(offset, min(offset + limit, total))]}
+
+    def get_card_characteristics_config(self, subject_id):
+        return self._directory(f'charcs:{subject_id}', [{'name': 'Цвет'}])
+
+
+class TestReferenceCache:
+    def test_persisted_between_processes(self, make_cache):
+        client = FakeClient()
+        make_cache()
+        assert wb_reference_cache.get_directory(client, 'colors') == [{'name': 'красный'}]
+        assert wb_reference_cache.get_directory(client, 'colors') == [{'name': 'красный'}]
+        assert client.calls == ['colors']
+
+        make_cache()
+        assert wb_reference_cache.get_directory(client, 'colors') == [{'name': 'красный'}]
+        assert client.calls == ['colors']
+
+    def test_version_changes_only_with_content(self, make_cache):
+        cache = make_cache()
+        assert cache.put('directory:colors:ru', ['a']).version == 1
+        assert cache.put('directory:colors:ru', ['a']).version == 1
+        assert cache.put('directory:colors:ru', ['b']).version == 2
+
+        # Другой процесс видит новую версию
+        other = make_cache()
+        other.put('directory:colors:ru', ['c'])
+        assert other._read('directory:colors:ru') == (['c'], 3, pytest.approx(time.time(), abs=5))
+
+    def test_stale_entry_served_and_refreshed_in_background(self, make_cache):
+        cache = make_cache(ttl=0)
+        client = FakeClient()
+        cache.put('directory:colors:ru', ['old'])
+
+        assert wb_reference_cache.get_directory(client, 'colors') == ['old']
+        deadline = time.time() + 5
+        while cache._read('directory:colors:ru').data == ['old'] and time.time() < deadline:
+            time.sleep(0.01)
+        assert cache._read('directory:colors:ru').data == [{'name': 'красный'}]
+        assert cache.get_stats()['stale'] == 1
+
+    def test_unknown_directory(self, make_cache):
+        make_cache()
+        with pytest.raises(ValueError):
+            wb_reference_cache.get_directory(FakeClient(), 'unknown')
+
+    def test_subjects_loaded_page_by_page(self, make_cache):
+        make_cache()
+        client = FakeClient()
+        subjects = wb_reference_cache.get_subjects(client)
+        assert len(subjects) == 1500
+        assert client.calls == ['subjects:0', 'subjects:1000']
+
+    def test_warmup(self, make_cache):
+        cache = make_cache()
+        client = FakeClient()
+        wb_reference_cache.get_characteristics_config(client, 7)
+
+        summary = wb_reference_cache.warmup(client)
+        assert 'directory:colors:ru' in summary['refreshed']
+        assert 'subjects' in summary['refreshed']
+        assert summary['failed'] == {}
+        # Свежая конфигурация характеристик не перезапрашивается
+        assert client.calls.count('charcs:7') == 1
+
+        summary = wb_reference_cache.warmup(client)
+        assert summary['refreshed'] == []
+        assert len(summary['fresh']) == len(wb_reference_cache.WB_DIRECTORY_TYPES) + 2
+
+        names = {info['name'] for info in cache.get_info()}
+        assert {'directory:tnved:ru', 'parent_categories:ru', 'subjects', 'charcs:7'} <= names
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты объединения одинаковых одновременных запросов (services/wb_request_coalescer.py).
+"""
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from services.wb_api_client import WildberriesAPIClient
+from services.wb_request_coalescer import RequestCoalescer, endpoint_label
+
+
+@pytest.fixture
+def coalescer():
+    RequestCoalescer._instance = None
+    instance = RequestCoalescer()
+    yield instance
+    RequestCoalescer._instance = None
+
+
+def _run_concurrently(count, target):
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_waiters(coalescer, key, count):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        flight = coalescer._flights.get(key)
+        if flight is not None and flight.waiters >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError('waiters did not join the flight')
+
+
+class TestRequestCoalescer:
+    def test_concurrent_calls_share_one_execution(self, coalescer):
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        threads, results, errors = _run_concurrently(
+            4, lambda: coalescer.run('key', slow, '/content/v2/object/charcs/7')
+        )
+        _wait_for_waiters(coalescer, 'key', 3)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in results) == [False, True, True, True]
+        assert all(result == 'result' for result, _ in results)
+
+        stats = coalescer.get_stats()
+        assert (stats['requests'], stats['coalesced'], stats['in_flight']) == (4, 3, 0)
+        assert stats['coalescing_rate'] == 0.75
+        assert stats['endpoints']['/content/v2/object/charcs/{id}']['coalesced'] == 3
+
+    def test_error_is_shared(self, coalescer):
+        release = threading.Event()
+
+        def failing():
+            release.wait(5)
+            raise ValueError('boom')
+
+        threads, results, errors = _run_concurrently(3, lambda: coalescer.run('key', failing))
+        _wait_for_waiters(coalescer, 'key', 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == []
+        assert len(errors) == 3 and all(isinstance(e, ValueError) for e in errors)
+
+    def test_sequential_calls_are_not_coalesced(self, coalescer):
+        assert coalescer.run('key', lambda: 1) == (1, False)
+        assert coalescer.run('key', lambda: 2) == (2, False)
+        assert coalescer.get_stats()['coalesced'] == 0
+
+
+def test_endpoint_label():
+    assert endpoint_label('/content/v2/object/charcs/123') == '/content/v2/object/charcs/{id}'
+    assert endpoint_label('/api/v3/stocks/0') == '/api/v3/stocks/{id}'
+    assert endpoint_label('/content/v2/object/all') == '/content/v2/object/all'
+
+
+def test_client_coalesces_identical_gets(coalescer, monkeypatch):
+    client = WildberriesAPIClient('key', response_cache=False)
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kw: 0.0)
+    release = threading.Event()
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        release.wait(5)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'data': [{'id': 1}]}).encode('utf-8')
+        return response
+
+    monkeypatch.setattr(client.session, 'request', fake_request)
+
+    threads, results, errors = _run_concurrently(3, lambda: client.get_card_characteristics_config(5))
+    deadline = time.time() + 5
+    while coalescer.get_stats()['coalesced'] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(calls) == 1
+    assert len(results) == 3
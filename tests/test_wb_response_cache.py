@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты кэша ответов WB API (services/wb_response_cache.py).
+"""
+import json
+
+import pytest
+import requests
+
+from services.wb_api_client import CachedWBAPIClient, WildberriesAPIClient
+from services.wb_response_cache import WBResponseCache, extract_nm_ids, resolve_cache_rule
+
+
+@pytest.fixture
+def cache():
+    WBResponseCache._instance = None
+    instance = WBResponseCache(max_bytes=64 * 1024, max_entries=4)
+    yield instance
+    WBResponseCache._instance = None
+
+
+def _response(payload, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload).encode('utf-8')
+    response.url = 'https://example.test'
+    return response
+
+
+def _client(cache, monkeypatch, responder, client_cls=WildberriesAPIClient, **kwargs):
+    client = client_cls('key', **kwargs)
+    calls = []
+
+    def fake_request(method, url, **request_kwargs):
+        calls.append((method, url, request_kwargs))
+        return _response(responder(method, url, request_kwargs))
+
+    monkeypatch.setattr(client.session, 'request', fake_request)
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kw: 0.0)
+    client.calls = calls
+    return client
+
+
+class TestResponseCache:
+    def test_ttl_and_hit_miss_metrics(self, cache, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('services.wb_response_cache.time.time', lambda: now[0])
+        key = cache.make_key('key', 'GET', '/content/v2/directory/colors')
+
+        assert cache.get(key, '/content/v2/directory/') is None
+        cache.put(key, 'colors', 10, ttl=60, endpoint_prefix='/content/v2/directory/')
+        assert cache.get(key, '/content/v2/directory/') == 'colors'
+
+        now[0] += 61
+        assert cache.get(key, '/content/v2/directory/') is None
+
+        stats = cache.get_stats()
+        assert (stats['hits'], stats['misses'], stats['expired']) == (1, 2, 1)
+        assert stats['endpoints']['/content/v2/directory/'] == {'hits': 1, 'misses': 2}
+        assert stats['entries'] == 0 and stats['bytes'] == 0
+
+    def test_lru_eviction_by_entries_and_bytes(self, cache):
+        keys = [cache.make_key('key', 'GET', f'/e/{i}') for i in range(6)]
+        for key in keys[:4]:
+            cache.put(key, 'v', 10, ttl=60, endpoint_prefix='/e/')
+        cache.get(keys[0], '/e/')  # keys[0] — недавно использованный
+        cache.put(keys[4], 'v', 10, ttl=60, endpoint_prefix='/e/')
+
+        assert cache.get(keys[1], '/e/') is None
+        assert cache.get(keys[0], '/e/') == 'v'
+
+        # Запись почти на весь допустимый размер вытесняет старые записи
+        cache.put(keys[5], 'big', 15 * 1024, ttl=60, endpoint_prefix='/e/')
+        assert cache.get_stats()['bytes'] <= cache.max_bytes
+        assert cache.get_stats()['evictions'] >= 1
+        # Слишком большой ответ не кэшируется
+        assert not cache.put(keys[1], 'huge', 32 * 1024, ttl=60, endpoint_prefix='/e/')
+
+    def test_keys_scoped_by_api_key(self, cache):
+        first = cache.make_key('key-1', 'GET', '/content/v2/directory/colors')
+        second = cache.make_key('key-2', 'GET', '/content/v2/directory/colors')
+        assert first != second
+        assert 'key-1' not in repr(first)
+
+    def test_invalidate_by_nm_ids(self, cache):
+        prefix = '/content/v2/get/cards/list'
+        a = cache.make_key('key', 'POST', prefix, body={'n': 1})
+        b = cache.make_key('key', 'POST', prefix, body={'n': 2})
+        other = cache.make_key('other', 'POST', prefix, body={'n': 1})
+        cache.put(a, 'a', 1, 60, prefix, nm_ids=[1, 2])
+        cache.put(b, 'b', 1, 60, prefix, nm_ids=[3])
+        cache.put(other, 'o', 1, 60, prefix, nm_ids=[1])
+
+        assert cache.invalidate_for_write('key', '/content/v2/cards/update', [{'nmID': 2}]) == 1
+        assert cache.get(a, prefix) is None
+        assert cache.get(b, prefix) == 'b'
+        assert cache.get(other, prefix) == 'o'
+
+        # Без nmID в запросе сбрасываются все ответы эндпоинта продавца
+        assert cache.invalidate_for_write('key', '/content/v2/cards/upload', [{'subjectID': 1}]) == 1
+        assert cache.get(other, prefix) == 'o'
+
+
+def test_extract_nm_ids():
+    assert extract_nm_ids([{'nmID': 1, 'sizes': [{'price': 1}]}]) == {1}
+    assert extract_nm_ids({'targetIMT': 5, 'nmIDs': [2, 3]}) == {2, 3}
+    assert extract_nm_ids({'data': [{'nmID': 4}, {'nmID': '5'}]}) == {4, 5}
+    assert extract_nm_ids({'settings': {'filter': {'textSearch': '77'}}}) == {77}
+    assert extract_nm_ids({'settings': {'filter': {'textSearch': 'ABC-1'}}}) == set()
+    assert extract_nm_ids({'filterNmID': 9, 'limit': 10}) == {9}
+
+
+def test_resolve_cache_rule():
+    assert resolve_cache_rule('GET', '/content/v2/object/charcs/123')[0] == '/content/v2/object/charcs/'
+    assert resolve_cache_rule('GET', '/api/v1/supplier/orders') is None
+    assert resolve_cache_rule('GET', '/content/v2/directory/colors', use_cache=False) is None
+    assert resolve_cache_rule('POST', '/content/v2/get/cards/list') is None
+    prefix, rule = resolve_cache_rule('POST', '/content/v2/get/cards/list', True,
+                                      {'/content/v2/get/cards/list': 5})
+    assert rule.ttl == 5
+
+
+class TestClientIntegration:
+    def test_get_directory_is_cached(self, cache, monkeypatch):
+        client = _client(cache, monkeypatch, lambda *a: {'data': [{'name': 'red'}]})
+
+        assert client.get_directory_colors() == {'data': [{'name': 'red'}]}
+        assert client.get_directory_colors() == {'data': [{'name': 'red'}]}
+        assert len(client.calls) == 1
+
+        # Другой клиент того же продавца пользуется тем же кэшем
+        other = _client(cache, monkeypatch, lambda *a: {'data': []})
+        assert other.get_directory_colors() == {'data': [{'name': 'red'}]}
+        assert other.calls == []
+
+    def test_cards_list_not_cached_by_default(self, cache, monkeypatch):
+        client = _client(cache, monkeypatch, lambda *a: {'cards': [{'nmID': 1}]})
+        client.get_cards_list()
+        client.get_cards_list()
+        assert len(client.calls) == 2
+
+    def test_write_invalidates_cached_cards(self, cache, monkeypatch):
+        def responder(method, url, kwargs):
+            if url.endswith('/cards/list'):
+                return {'cards': [{'nmID': 10}, {'nmID': 11}], 'cursor': {}}
+            return {'error': False}
+
+        client = _client(cache, monkeypatch, responder, client_cls=CachedWBAPIClient, cache_ttl=600)
+        client.get_cards_list()
+        client.get_cards_list()
+        assert len(client.calls) == 1
+
+        client.merge_cards(target_imt_id=1, nm_ids=[11])
+        client.get_cards_list()
+        assert len(client.calls) == 3
+        assert cache.get_stats()['invalidated'] == 1
+
+    def test_errors_are_not_cached(self, cache, monkeypatch):
+        client = WildberriesAPIClient('key')
+        monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kw: 0.0)
+        monkeypatch.setattr(client.session, 'request',
+                            lambda *a, **kw: _response({'errorText': 'fail'}, status_code=500))
+        for _ in range(2):
+            with pytest.raises(Exception):
+                client.get_directory_colors()
+        assert cache.get_stats()['entries'] == 0
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Тесты повторов WB API и circuit breaker (services/wb_retry.py).
+"""
+import json
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+from services.wb_api_client import (
+    WBAPIException, WBCircuitOpenException, WBRateLimitException, WildberriesAPIClient,
+)
+from services.wb_rate_limiter import SharedRateLimiter
+from services.wb_retry import CircuitBreaker, RetryPolicy, parse_retry_after
+
+
+@pytest.fixture
+def breaker():
+    CircuitBreaker._instance = None
+    instance = CircuitBreaker(failure_threshold=2, cooldown=30, max_cooldown=120)
+    yield instance
+    CircuitBreaker._instance = None
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    SharedRateLimiter._instance = None
+    instance = SharedRateLimiter(db_path=str(tmp_path / 'limits.db'))
+    yield instance
+    SharedRateLimiter._instance = None
+
+
+def _response(status, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(payload or {}).encode('utf-8')
+    response.headers.update(headers or {})
+    return response
+
+
+def make_client(monkeypatch, responses, **kwargs):
+    """Клиент, отвечающий заготовленными ответами; возвращает (client, calls, sleeps, penalties)"""
+    client = WildberriesAPIClient('key', response_cache=False, coalesce_requests=False, **kwargs)
+    calls, sleeps, penalties = [], [], []
+    monkeypatch.setattr(client.rate_limiter, 'acquire', lambda *args, **kw: 0.0)
+    monkeypatch.setattr(client.rate_limiter, 'penalize', lambda *args: penalties.append(args[-1]))
+    monkeypatch.setattr('services.wb_api_client.time.sleep', sleeps.append)
+
+    def fake_request(method, url, **kw):
+        calls.append((method, url))
+        item = responses.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    monkeypatch.setattr(client.session, 'request', fake_request)
+    return client, calls, sleeps, penalties
+
+
+class TestRetryPolicy:
+    def test_parse_retry_after(self):
+        assert parse_retry_after({'X-Ratelimit-Retry': '7', 'Retry-After': '30'}) == 7.0
+        assert parse_retry_after({'Retry-After': '2.5'}) == 2.5
+        assert parse_retry_after({'X-Ratelimit-Reset': '12'}) == 12.0
+        assert parse_retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0.0
+        assert parse_retry_after({'Retry-After': 'soon'}) is None
+        assert parse_retry_after({}) is None
+
+    def test_retry_decisions(self):
+        policy = RetryPolicy(max_retries=2, max_rate_limit_wait=60)
+        headers = {'X-Ratelimit-Retry': '5'}
+        # 429 повторяется для любого метода, пауза — из заголовков
+        assert policy.retry_delay('POST', '/content/v2/cards/update', 0, status=429, headers=headers) == 5.0
+        assert policy.retry_delay('POST', '/x', 0, status=429, headers={'Retry-After': '600'}) is None
+        # 5xx — только для идемпотентных запросов
+        assert policy.retry_delay('GET', '/x', 0, status=503) is not None
+        assert policy.retry_delay('POST', '/content/v2/get/cards/list', 0, status=502) is not None
+        assert policy.retry_delay('POST', '/content/v2/cards/update', 0, status=502) is None
+        assert policy.retry_delay('GET', '/x', 0, status=400) is None
+        assert policy.retry_delay('GET', '/x', 2, status=503) is None
+        # Таймаут чтения повторяется, ошибка соединения — уже повторена urllib3
+        assert policy.retry_delay('GET', '/x', 0, error=requests.exceptions.ReadTimeout()) is not None
+        assert policy.retry_delay('GET', '/x', 0, error=requests.exceptions.ConnectionError()) is None
+
+
+class TestCircuitBreaker:
+    def test_opens_probes_and_closes(self, breaker, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('services.wb_retry.time.time', lambda: now[0])
+
+        breaker.record_failure('wb')
+        assert breaker.before_request('wb') == 0
+        breaker.record_failure('wb')
+        assert breaker.before_request('wb') == 30
+        assert breaker.get_stats()['wb']['state'] == 'open'
+
+        # После паузы пропускается один пробный запрос
+        now[0] += 30
+        assert breaker.before_request('wb') == 0
+        assert breaker.before_request('wb') > 0
+        breaker.record_failure('wb')
+        assert breaker.before_request('wb') == 60
+
+        now[0] += 60
+        assert breaker.before_request('wb') == 0
+        breaker.record_success('wb')
+        assert breaker.before_request('wb') == 0
+        assert breaker.get_stats()['wb'] == {
+            'state': 'closed', 'consecutive_failures': 0, 'opened_total': 2, 'retry_in': 0.0,
+        }
+
+    def test_lost_probe_expires_and_release_frees_it(self, breaker, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('services.wb_retry.time.time', lambda: now[0])
+        breaker.record_failure('wb')
+        breaker.record_failure('wb')
+
+        now[0] += 30
+        assert breaker.before_request('wb') == 0
+        assert breaker.before_request('wb') > 0
+        breaker.release_probe('wb')
+        assert breaker.before_request('wb') == 0
+
+        # Проба так и не завершилась — через cooldown её берёт следующий запрос
+        now[0] += 29
+        assert breaker.before_request('wb') > 0
+        now[0] += 1
+        assert breaker.before_request('wb') == 0
+        assert breaker.get_stats()['wb']['state'] == 'half_open'
+
+
+class TestClientRetries:
+    def test_429_waits_through_limiter(self, breaker, monkeypatch):
+        client, calls, sleeps, penalties = make_client(monkeypatch, [
+            _response(429, headers={'X-Ratelimit-Retry': '3'}),
+            _response(200, {'data': []}),
+        ])
+        client._make_request('POST', 'content', '/content/v2/cards/update', json=[{'nmID': 1}])
+        assert len(calls) == 2
+        assert penalties == [3.0]
+        assert sleeps == []
+
+    def test_429_exhausted_raises_with_retry_after(self, breaker, monkeypatch):
+        client, calls, _, penalties = make_client(monkeypatch, [
+            _response(429, headers={'Retry-After': '4'}),
+        ], max_retries=0)
+        with pytest.raises(WBRateLimitException) as exc_info:
+            client._make_request('GET', 'content', '/content/v2/object/all')
+        assert exc_info.value.retry_after == 4.0
+        assert penalties == [4.0]
+
+    def test_server_error_retried_only_for_idempotent(self, breaker, monkeypatch):
+        client, calls, sleeps, _ = make_client(monkeypatch, [
+            _response(503), _response(200, {'data': []}),
+        ])
+        client._make_request('GET', 'content', '/content/v2/object/all')
+        assert len(calls) == 2 and len(sleeps) == 1
+
+        client, calls, _, _ = make_client(monkeypatch, [_response(502)])
+        with pytest.raises(WBAPIException):
+            client._make_request('POST', 'content', '/content/v2/cards/update', json=[])
+        assert len(calls) == 1
+
+    def test_open_circuit_short_circuits_requests(self, breaker, monkeypatch):
+        client, calls, _, _ = make_client(monkeypatch, [_response(500), _response(500)], max_retries=1)
+        with pytest.raises(WBAPIException):
+            client._make_request('GET', 'content', '/content/v2/object/all')
+        assert len(calls) == 2
+
+        with pytest.raises(WBCircuitOpenException) as exc_info:
+            client._make_request('GET', 'content', '/content/v2/object/all')
+        assert exc_info.value.retry_after > 0
+        assert len(calls) == 2
+
+    @pytest.mark.parametrize('error', [
+        requests.exceptions.SSLError('certificate verify failed'),
+        ValueError('unexpected'),
+    ])
+    def test_probe_released_when_request_fails_without_response(self, breaker, monkeypatch, error):
+        now = [1000.0]
+        monkeypatch.setattr('services.wb_retry.time.time', lambda: now[0])
+        client, calls, _, _ = make_client(monkeypatch, [error, _response(200, {'data': []})], max_retries=0)
+        host = urlsplit(client._get_base_url('content')).netloc
+        breaker.record_failure(host)
+        breaker.record_failure(host)
+        now[0] += 30
+
+        with pytest.raises(WBAPIException) as exc_info:
+            client._make_request('GET', 'content', '/content/v2/object/all')
+        assert not isinstance(exc_info.value, WBCircuitOpenException)
+
+        client._make_request('GET', 'content', '/content/v2/object/all')
+        assert len(calls) == 2
+        assert breaker.get_stats()[host]['state'] == 'closed'
+
+    def test_probe_released_when_limiter_fails(self, breaker, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('services.wb_retry.time.time', lambda: now[0])
+        client, calls, _, _ = make_client(monkeypatch, [_response(200, {'data': []})])
+        host = urlsplit(client._get_base_url('content')).netloc
+        breaker.record_failure(host)
+        breaker.record_failure(host)
+        now[0] += 30
+
+        def broken_acquire(*args, **kwargs):
+            raise RuntimeError('limiter down')
+
+        monkeypatch.setattr(client.rate_limiter, 'acquire', broken_acquire)
+        with pytest.raises(RuntimeError):
+            client._make_request('GET', 'content', '/content/v2/object/all')
+        assert breaker.before_request(host) == 0
+
+
+def test_penalize_delays_next_request(limiter):
+    assert limiter.reserve('key', 'content', '/content/v2/object/all') == 0
+    limiter.penalize('key', 'content', '/content/v2/object/all', 6)
+    assert limiter.reserve('key', 'content', '/content/v2/object/all') == pytest.approx(6, abs=0.05)
+    assert limiter.get_stats()['content']['penalties'] == 1